@@ -0,0 +1,85 @@
+"""Acknowledged writes versus write-without-response with notify acks, against the fake GATT server.
+
+For each mode, reports how long send() holds up the caller, how long until
+the light applied the color, retransmits when writes are lost, and the
+estimated airtime per color and per idle hour of heartbeats (180 s fixed
+versus 80% of the advertised 300 s idle timeout).
+"""
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.ble_transport import IDLE_TIMEOUT_PREFIX, MANUFACTURER_ID, BleTransport
+from busylight.fake_bleak import FakeBleak
+
+ADDRESS = "AA:BB:CC:DD:EE:01"
+FRAMES = 200
+CONNECTION_INTERVAL = 0.015  # An acknowledged write needs a request and a response, a connection event each
+IDLE_TIMEOUT = 300  # MAX_IDLE_TIME in the firmware
+LEGACY_HEARTBEAT = 180
+
+# Bytes on air per packet at LE 1M: preamble 1 + access address 4 + header 2 + CRC 3, plus L2CAP 4
+PACKET_OVERHEAD = 14
+ATT_HEADER = 3
+FRAME = 8
+
+
+def airtime_us(*att_payloads):
+    return sum((PACKET_OVERHEAD + size) * 8 for size in att_payloads)  # 1 bit per microsecond
+
+
+async def run(acks, drop_rate):
+    radio = FakeBleak(write_time=2 * CONNECTION_INTERVAL, command_time=0.001, command_delivery=CONNECTION_INTERVAL / 2, ack_delay=CONNECTION_INTERVAL / 2, drop_rate=drop_rate)
+    manufacturer_data = {MANUFACTURER_ID: IDLE_TIMEOUT_PREFIX + IDLE_TIMEOUT.to_bytes(2, "little")}
+    device = radio.add_device("busy_light_2A1c", ADDRESS, manufacturer_data=manufacturer_data, acks=True)
+    transport = BleTransport(binary=True, acks=acks, bleak=radio)
+    await transport.connect()
+    send_times, applied_times = [], []
+    for i in range(FRAMES):
+        color = "255,0,0" if i % 2 else "0,255,0"
+        applied = len(device.writes)
+        start = time.perf_counter()
+        await transport.send(color)
+        send_times.append(time.perf_counter() - start)
+        while len(device.writes) == applied or (acks and transport._unacked is not None):
+            await asyncio.sleep(0.0005)
+        applied_times.append(device.writes[applied][0] - start)
+    await transport.disconnect()
+    return send_times, applied_times, transport.retransmits, device.dropped, transport.heartbeat_interval
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    print(f"{'mode':<28} {'send() ms':>10} {'applied ms':>11} {'p95 applied':>12} {'lost':>5} {'resent':>7}")
+    heartbeat = None
+    for label, acks, drop_rate in (
+        ("acknowledged write", False, 0.0),
+        ("no response + acks", True, 0.0),
+        ("no response + acks, 5% lost", True, 0.05),
+    ):
+        send_times, applied_times, retransmits, dropped, heartbeat = asyncio.run(run(acks, drop_rate))
+        applied_sorted = sorted(applied_times)
+        print(
+            f"{label:<28} {statistics.median(send_times) * 1000:>10.2f} {statistics.median(applied_times) * 1000:>11.2f}"
+            f" {applied_sorted[int(len(applied_sorted) * 0.95)] * 1000:>12.2f} {dropped:>5} {retransmits:>7}"
+        )
+
+    acked_write = airtime_us(ATT_HEADER + FRAME, 1)  # Write request + write response
+    command_and_ack = airtime_us(ATT_HEADER + FRAME, ATT_HEADER + FRAME)  # Write command + ack notification
+    legacy_per_hour = 3600 / LEGACY_HEARTBEAT * acked_write
+    derived_acked_per_hour = 3600 / heartbeat * acked_write
+    derived_per_hour = 3600 / heartbeat * command_and_ack
+    print()
+    print(f"airtime per color: acknowledged write {acked_write} us, write command + ack {command_and_ack} us")
+    print(f"heartbeat interval: {LEGACY_HEARTBEAT} s fixed -> {heartbeat:.0f} s from the advertised {IDLE_TIMEOUT} s timeout")
+    print(f"idle heartbeat airtime per hour, 180 s acknowledged writes: {legacy_per_hour / 1000:.2f} ms")
+    for label, per_hour in (("derived, acknowledged writes", derived_acked_per_hour), ("derived, write command + ack", derived_per_hour)):
+        print(f"  {label}: {per_hour / 1000:.2f} ms ({(1 - per_hour / legacy_per_hour) * 100:.0f}% saved)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Time-to-first-color at startup and after a link drop, against the fake bleak radio."""
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.ble_transport import BleTransport
+from busylight.core import BusyLight
+from busylight.fake_bleak import FakeBleak
+
+ADDRESS = "AA:BB:CC:DD:EE:01"
+SCAN_TIME = 1.0  # Shortened from bleak's 5 s default to keep the run quick
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def run(cached_address):
+    radio = FakeBleak(scan_time=SCAN_TIME)
+    radio.add_device("busy_light_2A1c", ADDRESS)
+    light = BusyLight(BleTransport(address=cached_address, bleak=radio), auto_reconnect=True)
+    light.submit(light.connect()).result()
+
+    # Drop the link and bring the device back after 200 ms
+    light.loop.call_soon_threadsafe(radio.drop, ADDRESS)
+    time.sleep(0.2)
+    radio.devices[ADDRESS].in_range = True
+    wait_for(lambda: "reconnect" in light.time_to_first_color)
+
+    clients = len(radio.clients)
+    light.submit(light.disconnect()).result()
+    return light.time_to_first_color, radio.scans, clients
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    for label, cached_address in (("scan first (no cached address)", None), ("cached address", ADDRESS)):
+        timings, scans, clients = run(cached_address)
+        print(label)
+        print(f"  startup: {timings['startup'] * 1000:.0f} ms")
+        print(f"  after link drop (device gone for 200 ms): {timings['reconnect'] * 1000:.0f} ms")
+        print(f"  scans: {scans}, BleakClient instances: {clients}")
+
+
+if __name__ == "__main__":
+    main()
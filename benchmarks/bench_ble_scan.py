@@ -0,0 +1,56 @@
+"""Scan-to-match latency: full discover() versus the streaming scan, on the fake bleak radio."""
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.ble_transport import SERVICE_UUID, BleTransport
+from busylight.fake_bleak import FakeBleak
+
+RUNS = 20
+SCAN_TIME = 5.0  # bleak's default discover() timeout
+
+
+async def legacy_find_device(transport):
+    """The discover()-then-filter loop find_device used to run."""
+    devices = await transport._bleak.BleakScanner.discover()
+    for device in devices:
+        if device.name and transport.name_filter in device.name:
+            return device.address
+
+
+async def measure(find):
+    radio = FakeBleak(scan_time=SCAN_TIME)
+    radio.add_device("busy_light_door", "AA:00:00:00:00:01", rssi=-80, service_uuids=[SERVICE_UUID])
+    radio.add_device("busy_light_desk", "AA:00:00:00:00:02", rssi=-45, service_uuids=[SERVICE_UUID])
+    radio.add_device("headphones", "BB:00:00:00:00:01", rssi=-40)
+    transport = BleTransport(bleak=radio)
+    start = time.perf_counter()
+    address = await find(transport)
+    return time.perf_counter() - start, address
+
+
+async def main():
+    logging.disable(logging.CRITICAL)
+    print(f"legacy discover(): {(await measure(legacy_find_device))[0] * 1000:.0f} ms")
+
+    latencies = []
+    for _ in range(RUNS):
+        elapsed, address = await measure(lambda transport: transport.find_device(use_cache=False))
+        latencies.append(elapsed)
+    print(f"streaming scan: median {statistics.median(latencies) * 1000:.0f} ms, max {max(latencies) * 1000:.0f} ms (picked {address})")
+
+    radio = FakeBleak()
+    radio.add_device("busy_light_desk", "AA:00:00:00:00:02")
+    transport = BleTransport(bleak=radio)
+    await transport.find_device()
+    start = time.perf_counter()
+    await transport.find_device()
+    print(f"cached advertisement: {(time.perf_counter() - start) * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+"""Publish-to-light latency with 1 and 128 subscribers over loopback, by multicast and through the relay.
+
+One publisher BusyLight flips between busy and idle. Every subscriber is
+a BusyLight with its own in-memory light. For each flip, the latency runs
+from set_mic_in_use() on the publisher to the write on each subscriber's
+light. All subscribers share one event loop here, so with 128 of them
+even the first light waits while every datagram is handled. The single
+subscriber run is the latency one machine sees. With 128, the spread is
+the cost of the fan-out, which is paid on one machine here; on a real
+network each machine handles only its own datagram.
+
+Also checked:
+- A subscriber that joins late shows the current state at once, by replay,
+  instead of after up to REPUBLISH_INTERVAL.
+- A replayed old datagram (a duplicate, or one that arrives late) changes
+  no light.
+"""
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.broadcast import REPUBLISH_INTERVAL, Publisher, Relay, Subscriber
+from busylight.core import DEFAULT_IDLE_COLOR, DEFAULT_MIC_COLOR, BusyLight
+from busylight.transport import MemoryTransport
+
+SUBSCRIBER_COUNTS = [1, 128]
+FLIPS = 40
+GAP = 0.02  # Seconds between the last light applying a flip and the next flip
+TOPIC = "alice"
+GROUP = "239.255.66.76"
+PORT = 47921  # Away from the default, so a running subscriber is not disturbed
+RELAY_PORT = 47922
+INTERFACE = "127.0.0.1"
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            raise TimeoutError
+        time.sleep(0.001)
+
+
+def shows(transport, color, since):
+    return any(written >= since and sent == color for written, sent in transport.sent[-2:])
+
+
+def add_subscriber(options):
+    transport = MemoryTransport()
+    light = BusyLight(transport)
+    light.submit(light.connect()).result()
+    subscriber = Subscriber(light, [TOPIC], **options)
+    subscriber.start()
+    return transport, subscriber
+
+
+def run(mode, count):
+    options = {"group": GROUP, "port": PORT, "interface": INTERFACE}
+    relay = None
+    if mode == "relay":
+        relay = Relay("127.0.0.1", RELAY_PORT)
+        BusyLight().submit(relay.start()).result()
+        options["relay"] = ("127.0.0.1", RELAY_PORT)
+    publisher_light = BusyLight()
+    publisher = Publisher(publisher_light, TOPIC, **options)
+    publisher.start()
+    subscribers = [add_subscriber(options) for _ in range(count)]
+    wait_until(lambda: all(transport.sent and transport.sent[-1][1] == DEFAULT_IDLE_COLOR for transport, _ in subscribers))
+
+    first, median, last = [], [], []
+    for flip in range(FLIPS):
+        busy = flip % 2 == 0
+        color = DEFAULT_MIC_COLOR if busy else DEFAULT_IDLE_COLOR
+        started = time.perf_counter()
+        publisher_light.set_mic_in_use(busy)
+        wait_until(lambda: all(shows(transport, color, started) for transport, _ in subscribers))
+        latencies = sorted(next(written for written, sent in reversed(transport.sent) if sent == color) - started for transport, _ in subscribers)
+        first.append(latencies[0])
+        median.append(statistics.median(latencies))
+        last.append(latencies[-1])
+        time.sleep(GAP)
+
+    # A late joiner: the state arrives by replay, not at the next republish
+    joined_at = time.perf_counter()
+    late_transport, late = add_subscriber(options)
+    wait_until(lambda: late_transport.sent and late_transport.sent[-1][1] == publisher.state[0] and late.applied)
+    late_ms = (time.perf_counter() - joined_at) * 1000
+
+    # A stale datagram: the first flip again, long after newer ones
+    stale = publisher.datagram[:8] + (1).to_bytes(4, "big") + publisher.datagram[12:]
+    writes_before = sum(len(transport.sent) for transport, _ in subscribers)
+    publisher_light.loop.call_soon_threadsafe(publisher.send, stale)
+    time.sleep(0.2)
+    writes_after = sum(len(transport.sent) for transport, _ in subscribers)
+
+    for _, subscriber in subscribers + [(late_transport, late)]:
+        subscriber.stop()
+    publisher.stop()
+    if relay:
+        publisher_light.loop.call_soon_threadsafe(relay.close)
+    time.sleep(0.1)  # Let the sockets close before the next run binds the ports
+    return first, median, last, late_ms, writes_after - writes_before, publisher.sent
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    print(f"{FLIPS} flips; latency from set_mic_in_use to each light's write, median over the flips")
+    print(f"{'mode':<10} {'subs':>5} {'first ms':>9} {'median ms':>10} {'last ms p50/max':>16} {'late joiner ms':>15} {'stale writes':>13} {'sent':>5}")
+    for count in SUBSCRIBER_COUNTS:
+        for mode in ("multicast", "relay"):
+            first, median, last, late_ms, stale_writes, sent = run(mode, count)
+            print(f"{mode:<10} {count:>5} {statistics.median(first) * 1000:>9.2f} {statistics.median(median) * 1000:>10.2f} "
+                  f"{statistics.median(last) * 1000:>8.2f} / {max(last) * 1000:<5.2f} {late_ms:>15.1f} {stale_writes:>13} {sent:>5}")
+    print(f"(without the replay a late joiner waits for the next republish, up to {REPUBLISH_INTERVAL} s)")
+
+
+if __name__ == "__main__":
+    main()
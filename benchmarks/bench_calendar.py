@@ -0,0 +1,126 @@
+"""Build, refresh and query the meeting index for calendars with 10k+ recurring instances.
+
+The calendars are generated in the shape of a real export, in a DST zone:
+- daily standups on weekdays
+- weekly and fortnightly 1:1s
+- monthly reviews on the nth weekday
+- a few one-off meetings
+Moved and cancelled occurrences, and excluded dates, are included.
+Reported:
+- The cost of building the index from scratch.
+- The cost of refreshing after one meeting is edited, which expands only
+  that series again.
+- The cost of the check when the file has not changed.
+- The time for one "busy now / next change" query, against a linear scan
+  over every instance.
+The index and the scan are checked to agree at random times.
+"""
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.meetings import Calendar
+
+SEED = 3
+SERIES_COUNTS = [100, 400, 1600]
+HORIZON_DAYS = 365
+QUERIES = 20000
+ZONE = "Europe/Berlin"
+START = datetime.datetime(2026, 1, 5, 0, 0)  # A Monday; the clock is pinned here
+
+
+def stamp(moment):
+    return moment.strftime("%Y%m%dT%H%M%S")
+
+
+def vevent(uid, start, minutes, rule=None, extra=()):
+    lines = ["BEGIN:VEVENT", f"UID:{uid}", f"SUMMARY:Meeting {uid}", f"DTSTART;TZID={ZONE}:{stamp(start)}", f"DURATION:PT{minutes}M"]
+    if rule:
+        lines.append(f"RRULE:{rule}")
+    lines.extend(extra)
+    lines += ["BEGIN:VALARM", "TRIGGER:-PT10M", "ACTION:DISPLAY", "END:VALARM", "END:VEVENT"]
+    return lines
+
+
+def build_calendar(series, rng):
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//bench//EN"]
+    for i in range(series):
+        kind = rng.random()
+        start = START - datetime.timedelta(days=rng.randrange(400)) + datetime.timedelta(hours=rng.randrange(8, 18), minutes=rng.choice((0, 30)))
+        uid = f"series-{i}@bench"
+        if kind < 0.2:
+            lines += vevent(uid, start, 15, "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR", [f"EXDATE;TZID={ZONE}:{stamp(start + datetime.timedelta(days=7))}"])
+        elif kind < 0.6:
+            lines += vevent(uid, start, 30, f"FREQ=WEEKLY;INTERVAL={rng.choice((1, 2))}")
+            moved = start + datetime.timedelta(weeks=60)
+            lines += ["BEGIN:VEVENT", f"UID:{uid}", f"RECURRENCE-ID;TZID={ZONE}:{stamp(moved)}",
+                      f"DTSTART;TZID={ZONE}:{stamp(moved + datetime.timedelta(hours=2))}", "DURATION:PT30M", "END:VEVENT"]
+        elif kind < 0.8:
+            lines += vevent(uid, start, 60, f"FREQ=MONTHLY;BYDAY={rng.choice((1, 2, 3, -1))}{rng.choice(('MO', 'TU', 'WE', 'TH'))}")
+        else:
+            lines += vevent(uid, START + datetime.timedelta(days=rng.randrange(HORIZON_DAYS), hours=rng.randrange(8, 18)), 45)
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def linear_state(intervals, t):
+    """What the index answers, by scanning every instance."""
+    busy_until = None
+    next_start = None
+    for start, end in intervals:
+        if start <= t < end:
+            busy_until = max(busy_until or end, end)
+        elif start > t and (next_start is None or start < next_start):
+            next_start = start
+    return busy_until is not None, busy_until, next_start
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    now = START.astimezone().timestamp()
+    print(f"{'series':>6} {'instances':>9} {'build ms':>9} {'edit refresh ms':>16} {'unchanged us':>13} {'index us/query':>15} {'scan us/query':>14}")
+    for series in SERIES_COUNTS:
+        rng = random.Random(SEED)
+        path = os.path.join(tempfile.mkdtemp(), "calendar.ics")
+        text = build_calendar(series, rng)
+        with open(path, "w", newline="") as f:
+            f.write(text)
+
+        calendar = Calendar(path, HORIZON_DAYS, clock=lambda: now)
+        build_ms, _ = timed(calendar.refresh)
+        unchanged_ms, changed = timed(calendar.refresh)
+        assert not changed
+
+        # Move one series by an hour, as editing a meeting in the calendar app would
+        edited = text.replace("SUMMARY:Meeting series-0@bench", "SUMMARY:Moved\r\nCOMMENT:edited", 1)
+        with open(path, "w", newline="") as f:
+            f.write(edited)
+        edit_ms, _ = timed(calendar.refresh)
+        assert calendar.expanded == 1, calendar.expanded
+
+        intervals = [interval for _, series_intervals in calendar._groups.values() for interval in series_intervals]
+        times = [now + rng.uniform(0, HORIZON_DAYS * 86400) for _ in range(QUERIES)]
+        index_ms, answers = timed(lambda: [calendar.state(t) for t in times])
+        sample = times[:200]
+        scan_ms, scanned = timed(lambda: [linear_state(intervals, t) for t in sample])
+        for (busy, change), (scan_busy, busy_until, next_start) in zip(answers, scanned):
+            assert busy == scan_busy
+            if not busy:
+                assert change == next_start
+            else:
+                assert change >= busy_until  # Back-to-back meetings merge into one busy stretch
+        print(f"{series:>6} {calendar.instances:>9} {build_ms:>9.1f} {edit_ms:>16.1f} {unchanged_ms * 1000:>13.0f} "
+              f"{index_ms / QUERIES * 1000:>15.2f} {scan_ms / len(sample) * 1000:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Request-to-LED latency and throughput of the daemon status API under a 1,000 updates/s burst."""
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.core import BusyLight
+from busylight.daemon import StatusServer
+from busylight.transport import MemoryTransport
+
+RATE = 1000  # Updates per second
+DURATION = 2  # Seconds
+WRITE_LATENCY = 0.005  # Simulated link write time
+
+
+async def producer(path, sent_at):
+    reader, writer = await asyncio.open_unix_connection(path)
+    interval = 1 / RATE
+    start = time.perf_counter()
+    replies = 0
+    for i in range(RATE * DURATION):
+        color = f"{i % 250},{(i // 250) % 250},7"  # Unique per request so writes can be matched up
+        sent_at[color] = time.perf_counter()
+        writer.write(json.dumps({"source": "bench", "color": color}).encode() + b"\n")
+        # Keep to the target rate
+        delay = start + (i + 1) * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    await writer.drain()
+    while replies < RATE * DURATION:
+        await reader.readline()
+        replies += 1
+    elapsed = time.perf_counter() - start
+    writer.close()
+    return elapsed
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    transport = MemoryTransport(latency=WRITE_LATENCY)
+    light = BusyLight(transport)
+    light.submit(light.connect()).result()
+    path = os.path.join(tempfile.mkdtemp(), "busylight.sock")
+    server = StatusServer(light, path)
+    light.submit(server.start()).result()
+
+    sent_at = {}
+    elapsed = asyncio.run(producer(path, sent_at))
+    time.sleep(0.1)
+
+    latencies = sorted(written - sent_at[color] for written, color in transport.sent if color in sent_at)
+    print(f"requests: {server.requests} in {elapsed:.2f} s ({server.requests / elapsed:.0f}/s)")
+    print(f"LED writes: {len(latencies)} (the rest coalesced while a {WRITE_LATENCY * 1000:.0f} ms write was in flight)")
+    print(f"request-to-LED median: {statistics.median(latencies) * 1000:.2f} ms, p99: {latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f} ms")
+    light.submit(server.stop()).result()
+
+
+if __name__ == "__main__":
+    main()
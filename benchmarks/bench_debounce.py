@@ -0,0 +1,119 @@
+"""Replay flapping microphone traces through StateFilter on a virtual clock.
+
+Reports the light writes the raw detector output would cause, how many the
+filter avoids, and the latency it adds to the changes it does report.
+Traces are generated from a fixed seed so every run sees the same input.
+"""
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.debounce import DEFAULT_DEBOUNCE, StateFilter
+
+SEED = 42
+CONFIGS = [
+    ("grace 0.5s", {"grace": 0.5, "min_on": 0, "min_off": 0}),
+    ("grace 1s", {"grace": 1.0, "min_on": 0, "min_off": 0}),
+    ("default", DEFAULT_DEBOUNCE),
+    ("grace 2s, dwell 10s", {"grace": 2.0, "min_on": 10, "min_off": 10}),
+]
+
+
+def blip(trace, at, length):
+    trace.append((at, True))
+    trace.append((at + length, False))
+
+
+def probes_trace(rng):
+    """An hour of device probes: 0.1-0.6 s grabs every 20-90 s."""
+    trace, t = [(0, False)], 0
+    while t < 3600:
+        t += rng.uniform(20, 90)
+        blip(trace, t, rng.uniform(0.1, 0.6))
+    return trace
+
+
+def meetings_trace(rng):
+    """Back-to-back calls with join chimes before each, and short releases while muting."""
+    trace, t = [(0, False)], 60
+    for _ in range(6):
+        for _ in range(rng.randint(1, 3)):
+            blip(trace, t, rng.uniform(0.2, 0.8))  # Chime / probe
+            t += rng.uniform(1, 3)
+        trace.append((t, True))
+        end = t + rng.uniform(600, 1800)
+        while True:
+            t += rng.uniform(30, 300)
+            if t >= end:
+                break
+            trace.append((t, False))  # Mic released for a moment by a mute toggle
+            t += rng.uniform(0.1, 0.9)
+            trace.append((t, True))
+        trace.append((end, False))
+        t = end + rng.uniform(5, 120)
+    return trace
+
+
+def flapping_trace(rng):
+    """A browser tab grabbing and releasing the mic every 0.2-2 s for five minutes, then a real call."""
+    trace, t, state = [(0, False)], 0, False
+    while t < 300:
+        t += rng.uniform(0.2, 2.0)
+        state = not state
+        trace.append((t, state))
+    trace.append((t + 1, True))
+    trace.append((t + 901, False))
+    return trace
+
+
+def replay(trace, settings):
+    reported = []
+    filt = StateFilter.from_settings(settings, on_change=lambda in_use: reported.append(in_use))
+    latencies = []
+    raw_changed_at = None
+    last_raw = None
+    for t, in_use in trace:
+        while filt.deadline is not None and filt.deadline <= t:
+            due, before = filt.deadline, len(reported)
+            filt.poll(due)
+            if len(reported) > before:
+                latencies.append(due - raw_changed_at)
+        if in_use != last_raw:
+            raw_changed_at, last_raw = t, in_use
+        before = len(reported)
+        filt.update(in_use, t)
+        if len(reported) > before and before:
+            latencies.append(0.0)
+    while filt.deadline is not None:
+        due = filt.deadline
+        filt.poll(due)
+        latencies.append(due - raw_changed_at)
+    return len(reported) - 1, latencies  # The first report is the initial state, not a change
+
+
+def raw_writes(trace):
+    changes, last = 0, trace[0][1]
+    for _, in_use in trace[1:]:
+        if in_use != last:
+            changes, last = changes + 1, in_use
+    return changes
+
+
+def main():
+    rng = random.Random(SEED)
+    traces = [("probes", probes_trace(rng)), ("meetings", meetings_trace(rng)), ("flapping", flapping_trace(rng))]
+    print(f"{'trace':<10} {'config':<20} {'raw':>5} {'writes':>7} {'avoided':>8} {'median +s':>10} {'max +s':>8}")
+    for trace_name, trace in traces:
+        raw = raw_writes(trace)
+        for config_name, settings in CONFIGS:
+            writes, latencies = replay(trace, settings)
+            avoided = (raw - writes) / raw * 100 if raw else 0
+            median = statistics.median(latencies) if latencies else 0
+            worst = max(latencies) if latencies else 0
+            print(f"{trace_name:<10} {config_name:<20} {raw:>5} {writes:>7} {avoided:>7.1f}% {median:>10.2f} {worst:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Measure detect latency (state flip -> on_change callback) with the fake detector backend."""
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.detector import FakeBackend, MicrophoneDetector
+
+ITERATIONS = 200
+
+
+def main():
+    backend = FakeBackend()
+    seen = threading.Event()
+    latencies = []
+
+    def on_change(in_use):
+        if backend.changed_at is not None:
+            latencies.append(time.perf_counter() - backend.changed_at)
+        seen.set()
+
+    detector = MicrophoneDetector(backend, on_change)
+    detector.start()
+    seen.wait(1)
+    for i in range(ITERATIONS):
+        seen.clear()
+        backend.set_in_use(i % 2 == 0)
+        seen.wait(1)
+    detector.stop()
+
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    print(f"changes: {len(latencies_ms)}")
+    print(f"median: {statistics.median(latencies_ms):.3f} ms")
+    print(f"p99: {latencies_ms[int(len(latencies_ms) * 0.99) - 1]:.3f} ms")
+    print(f"max: {latencies_ms[-1]:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
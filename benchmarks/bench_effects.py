@@ -0,0 +1,59 @@
+"""Frame rate and jitter of the effects engine over MemoryTransport.
+
+Each effect plays for a few seconds at several target rates; a second pass
+adds a per-frame write time longer than the frame interval to show the
+scheduler dropping frames instead of drifting.
+"""
+import asyncio
+import logging
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+
+from busylight.effects import NUM_PIXELS, EffectPlayer, create
+from busylight.transport import MemoryTransport
+
+DURATION = 3.0
+RATES = [30, 60, 120]
+SLOW_WRITE = 0.025  # Slower than a 60 fps frame interval
+EFFECTS = [
+    ("breathe", {"period": 2.0}),
+    ("blink", {"period": 0.5}),
+    ("countdown", {"duration": DURATION}),
+]
+
+
+async def play(name, options, fps, latency=0.0):
+    transport = MemoryTransport(latency=latency)
+    await transport.connect()
+    player = EffectPlayer(transport, create(name, "255,0,0", **options), fps)
+    await player.run(DURATION)
+    return player
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    frame = np.zeros((NUM_PIXELS, 3), dtype=np.uint8)
+    print("render cost per frame:")
+    for name, options in EFFECTS:
+        effect = create(name, "255,0,0", **options)
+        per_frame = timeit.timeit(lambda: effect(1.234, frame), number=5000) / 5000
+        print(f"  {name:<10} {per_frame * 1e6:6.1f} us")
+
+    print(f"\n{'effect':<10} {'target':>6} {'write ms':>8} {'fps':>7} {'sent':>5} {'same':>5} {'dropped':>8} {'jitter ms':>10}")
+    for latency in (0.0, SLOW_WRITE):
+        for name, options in EFFECTS:
+            for fps in RATES:
+                player = asyncio.run(play(name, options, fps, latency))
+                achieved, jitter = player.stats()
+                print(
+                    f"{name:<10} {fps:>6} {latency * 1000:>8.0f} {achieved:>7.1f} {player.sent:>5} {player.unchanged:>5}"
+                    f" {player.dropped:>8} {jitter * 1000:>10.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""End-to-end fan-out latency from set_mic_in_use() to the last healthy light, with 1-50 fake devices.
+
+Every run includes one dead device whose writes take 2 s, to show it does not
+hold the others back.
+"""
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.core import BusyLight
+from busylight.transport import MemoryTransport
+
+DEVICE_COUNTS = [1, 5, 10, 25, 50]
+WRITE_LATENCY = 0.010  # Per-device write time
+DEAD_WRITE_LATENCY = 2.0
+CHANGES = 20
+
+
+def run(count):
+    light = BusyLight()
+    healthy = [MemoryTransport(latency=WRITE_LATENCY) for _ in range(count)]
+    for i, transport in enumerate(healthy):
+        light.add_device(transport, name=f"light{i}")
+    light.add_device(MemoryTransport(latency=DEAD_WRITE_LATENCY), name="dead")
+    light.submit(light.connect()).result()
+    time.sleep(0.05)
+
+    latencies = []
+    for i in range(CHANGES):
+        before = [len(transport.sent) for transport in healthy]
+        start = time.perf_counter()
+        light.set_mic_in_use(i % 2 == 0)
+        while any(len(transport.sent) == n for transport, n in zip(healthy, before)):
+            time.sleep(0.0005)
+        latencies.append(max(transport.sent[-1][0] for transport in healthy) - start)
+        time.sleep(0.02)
+    light.submit(light.disconnect()).result()
+    return latencies
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    print(f"{'devices':>8} {'median ms':>10} {'max ms':>8}")
+    for count in DEVICE_COUNTS:
+        latencies = run(count)
+        print(f"{count:>8} {statistics.median(latencies) * 1000:>10.2f} {max(latencies) * 1000:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Tray icon swap cost: the old draw-save-reload path versus the in-memory LRU.
+
+Uses pystray's Linux backend for the final icon assignment when it can be
+imported; otherwise only the icon preparation is timed.
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PIL import Image, ImageDraw
+
+from busylight.icons import BUSY, DISCONNECTED, IDLE, IconCache
+
+ITERATIONS = 2000
+STATES = [(BUSY, "255,0,0"), (IDLE, "0,255,0"), (DISCONNECTED, None)]
+
+
+def legacy_icon(path):
+    """What create_icon did on every call: draw, write tray_icon.ico, load it back."""
+    image = Image.new("RGB", (64, 64), "blue")
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((16, 16, 48, 48), fill="red")
+    image.save(path)
+    with Image.open(path) as icon:
+        icon.load()
+        return icon
+
+
+def per_swap_us(func):
+    return timeit.timeit(func, number=ITERATIONS) / ITERATIONS * 1e6
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), "tray_icon.ico")
+    cache = IconCache()
+    counter = iter(range(10 ** 9))
+
+    def cached_swap():
+        return cache.get(*STATES[next(counter) % len(STATES)])
+
+    def uncached_swap():
+        cache.clear()
+        return cache.get(*STATES[next(counter) % len(STATES)])
+
+    print(f"legacy draw + .ico round trip: {per_swap_us(lambda: legacy_icon(path)):8.1f} us")
+    print(f"in-memory render (cache miss): {per_swap_us(uncached_swap):8.1f} us")
+    print(f"cache hit:                     {per_swap_us(cached_swap):8.2f} us")
+
+    try:
+        import pystray
+
+        tray = pystray.Icon("Busylight", cache.get(IDLE, "0,255,0"))
+    except Exception as e:
+        print(f"pystray backend unavailable, skipped tray assignment ({e.__class__.__name__})")
+        return
+
+    def tray_swap():
+        tray.icon = cached_swap()
+
+    print(f"cache hit + pystray assignment: {per_swap_us(tray_swap):7.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Caller-side cost of the logging calls in the hot loops, and how much ends up in the file.
+
+Compares the old synchronous basicConfig(filename=..., level=DEBUG) setup
+with the queued, throttled pipeline from busylight.logs, for the detector's
+repeated "Microphone status" line and for distinct messages.
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.logs import setup_logging
+
+CALLS = 20000
+
+
+def repeated(i):
+    logging.debug(f"Microphone status: {'Not in Use'}")
+
+
+def distinct(i):
+    logging.debug(f"light: sent color {i % 256},0,0")
+
+
+def measure(setup, workload, directory):
+    path = os.path.join(directory, f"{setup}-{workload.__name__}.log")
+    root = logging.getLogger()
+    if setup == "sync file":
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        handler = logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+        root.addHandler(handler)
+        root.setLevel(logging.DEBUG)
+        pipeline = None
+    else:
+        pipeline = setup_logging(path, level=logging.DEBUG if setup == "pipeline" else logging.WARNING)
+    start = time.perf_counter()
+    for i in range(CALLS):
+        workload(i)
+    elapsed = time.perf_counter() - start
+    if pipeline:
+        pipeline.stop()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    return elapsed / CALLS * 1e6, size
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    print(f"{'setup':<18} {'workload':<9} {'us/call':>8} {'file bytes':>11}")
+    for workload in (repeated, distinct):
+        for setup in ("sync file", "pipeline", "pipeline WARNING"):
+            per_call, size = measure(setup, workload, directory)
+            print(f"{setup:<18} {workload.__name__:<9} {per_call:>8.2f} {size:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Per-stage latency from the fake detector to a MemoryTransport, read back from the metrics registry.
+
+Also times one histogram observation (the cost added to every stage) and
+scrapes the HTTP endpoint once to check the exposition output.
+"""
+import logging
+import os
+import sys
+import time
+import timeit
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight import metrics
+from busylight.core import BusyLight
+from busylight.detector import FakeBackend
+from busylight.transport import MemoryTransport
+
+CHANGES = 200
+WRITE_LATENCY = 0.005
+OBSERVATIONS = 200000
+SCRAPE_PORT = 19477
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    histogram = metrics.Histogram("bench_seconds", "")
+    per_observe = timeit.timeit(lambda: histogram.observe(0.003, "light"), number=OBSERVATIONS) / OBSERVATIONS
+    print(f"observe(): {per_observe * 1e9:.0f} ns")
+
+    light = BusyLight()
+    transport = MemoryTransport(latency=WRITE_LATENCY)
+    light.add_device(transport, name="light")
+    light.submit(light.connect()).result()
+    backend = FakeBackend()
+    light.start_monitoring(backend)
+    for i in range(CHANGES):
+        sent = len(transport.sent)
+        backend.set_in_use(i % 2 == 0)
+        while len(transport.sent) == sent:
+            time.sleep(0.0005)
+        light.set_mic_in_use(light.mic_in_use)  # Same color again: suppressed by dedup
+        time.sleep(0.002)
+    light.stop_monitoring()
+
+    print(f"{'stage':<10} {'count':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    for stage, histogram, label in [
+        ("scan", metrics.scan_seconds, None),
+        ("queue", metrics.queue_seconds, "light"),
+        ("write", metrics.write_seconds, "light"),
+    ]:
+        p50, p95 = histogram.quantile(0.5, label), histogram.quantile(0.95, label)
+        print(f"{stage:<10} {histogram.count(label):>6} {p50 * 1000:>8.2f} {p95 * 1000:>8.2f}")
+    print(f"writes: {metrics.writes.value('light')}, suppressed: {metrics.writes_suppressed.value('light')}")
+
+    server = light.submit(metrics.registry.serve(port=SCRAPE_PORT)).result()
+    with urllib.request.urlopen(f"http://127.0.0.1:{SCRAPE_PORT}/metrics") as response:
+        body = response.read().decode()
+    light.loop.call_soon_threadsafe(server.close)
+    light.submit(light.disconnect()).result()
+    print(f"scrape: {len(body.splitlines())} lines, {len(body)} bytes")
+    print("\n".join(line for line in body.splitlines() if line.startswith("busylight_write_seconds_")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Bytes per update of delta / run-length pixel frames against whole-strip frames.
+
+First pass: every frame of a few workloads is encoded three ways (delta
+against the previous frame, run-length with no base, every pixel spelled
+out) and decoded again with the reference decoder to check it round-trips.
+Second pass: the effects stream over FakeBleak with acks, where the delta
+base is the last acked frame, with and without lost writes, at the default
+and a negotiated MTU.
+"""
+import asyncio
+import logging
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+
+from busylight.ble_transport import BleTransport
+from busylight.effects import NUM_PIXELS, EffectPlayer, create
+from busylight.fake_bleak import FakeBleak
+from busylight.pixels import FrameBuffer, PixelDecoder, encode_pixels, full_frame_size
+
+FPS = 30
+FRAMES = 300
+ADDRESS = "AA:BB:CC:DD:EE:01"
+
+
+def cursor(frames):
+    """One lit pixel walking along the strip."""
+    buffer = FrameBuffer()
+    for i in range(frames):
+        buffer.clear()
+        buffer.set_pixel(i % NUM_PIXELS, (0, 0, 255))
+        yield buffer.pixels
+
+
+def sparkle(frames, rng=np.random.default_rng(1)):
+    """Three random pixels change color per frame."""
+    buffer = FrameBuffer()
+    for _ in range(frames):
+        for index in rng.integers(0, NUM_PIXELS, 3):
+            buffer.set_pixel(index, rng.integers(0, 256, 3))
+        yield buffer.pixels
+
+
+def noise(frames, rng=np.random.default_rng(2)):
+    """Every pixel a new random color: the worst case."""
+    for _ in range(frames):
+        yield rng.integers(0, 256, (NUM_PIXELS, 3), dtype=np.uint8)
+
+
+def effect_frames(name, frames, **options):
+    effect = create(name, "255,0,0", **options)
+    frame = np.zeros((NUM_PIXELS, 3), dtype=np.uint8)
+    for i in range(frames):
+        effect(i / FPS, frame)
+        yield frame
+
+
+WORKLOADS = [
+    ("breathe", lambda: effect_frames("breathe", FRAMES, period=2.0)),
+    ("blink", lambda: effect_frames("blink", FRAMES, period=0.5)),
+    ("countdown", lambda: effect_frames("countdown", FRAMES, duration=FRAMES / FPS)),
+    ("cursor", lambda: cursor(FRAMES)),
+    ("sparkle", lambda: sparkle(FRAMES)),
+    ("noise", lambda: noise(FRAMES)),
+]
+
+
+def encode_workload(frames):
+    decoder = PixelDecoder()
+    previous = None
+    delta_bytes = rle_bytes = updates = 0
+    for pixels in frames:
+        if previous is not None and np.array_equal(pixels, previous):
+            continue  # EffectPlayer doesn't send unchanged frames
+        sequence = updates & 0xFF
+        chunks = encode_pixels(pixels, sequence, previous, (sequence - 1) & 0xFF)
+        for chunk in chunks:
+            shown = decoder.feed(chunk)
+        assert shown is not None and np.array_equal(shown[1], pixels), "delta frame did not round-trip"
+        delta_bytes += sum(map(len, chunks))
+        rle_bytes += sum(map(len, encode_pixels(pixels, sequence)))
+        updates += 1
+        previous = pixels.copy()
+    return updates, delta_bytes / updates, rle_bytes / updates
+
+
+async def stream(name, options, drop_rate, mtu_size):
+    radio = FakeBleak(connect_time=0.001, drop_rate=drop_rate, mtu_size=mtu_size)
+    device = radio.add_device("busy_light_bench", ADDRESS, acks=True)
+    transport = BleTransport(address=ADDRESS, bleak=radio, acks=True, pixel_frames=True)
+    await transport.connect()
+    effect = create(name, "255,0,0", **options)
+    player = EffectPlayer(transport, effect, FPS)
+    await player.run(3.0)
+    await asyncio.sleep(0.5)  # Let the last retries land
+    await transport.disconnect()
+    return player, transport, device
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    full = full_frame_size(NUM_PIXELS)
+    print(f"{NUM_PIXELS} pixels; every pixel spelled out: {full} bytes; one solid color frame: 8 bytes\n")
+    print(f"{'workload':<10} {'updates':>7} {'delta B':>8} {'rle B':>7} {'full B':>7} {'saved':>6}")
+    for name, frames in WORKLOADS:
+        updates, delta, rle = encode_workload(frames())
+        print(f"{name:<10} {updates:>7} {delta:>8.1f} {rle:>7.1f} {full:>7} {1 - delta / full:>6.0%}")
+
+    countdown = list(effect_frames("countdown", 2, duration=10))
+    base, pixels = countdown[0].copy(), countdown[1].copy()
+    per_frame = timeit.timeit(lambda: encode_pixels(pixels, 1, base, 0), number=5000) / 5000
+    print(f"\nencode cost: {per_frame * 1e6:.1f} us per countdown delta")
+    chunks = encode_pixels(pixels, 1, base, 0)
+    decoder = PixelDecoder()
+    decoder.frames[0] = base
+    per_frame = timeit.timeit(lambda: decoder.feed(chunks[0]), number=5000) / 5000
+    print(f"decode cost: {per_frame * 1e6:.1f} us per countdown delta")
+
+    print(f"\nover FakeBleak with acks, {FPS} fps for 3 s (delta base = last acked frame):")
+    print(f"{'effect':<10} {'mtu':>4} {'drop':>5} {'frames':>6} {'B/frame':>8} {'retx':>5} {'matches':>8}")
+    for mtu_size in (247, 23):
+        for drop_rate in (0.0, 0.05):
+            for name, options in (("countdown", {"duration": 3.0}), ("breathe", {"period": 2.0})):
+                player, transport, device = asyncio.run(stream(name, options, drop_rate, mtu_size))
+                shown = device.decoder.pixels if device.decoder else None
+                sent = transport.pixel_bytes / max(1, player.sent)
+                # The strip ends on the last frame the light acked
+                last = transport._acked_pixels
+                matches = last is not None and shown is not None and np.array_equal(shown, last[1])
+                print(f"{name:<10} {mtu_size:>4} {drop_rate:>5.0%} {player.sent:>6} {sent:>8.1f} {transport.retransmits:>5} {str(matches):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Bytes on air and encode cost per update: legacy ASCII versus binary frames."""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.protocol import FRAME_SIZE, FrameEncoder, decode, encode_ascii
+
+ATT_WRITE_OVERHEAD = 3 + 4  # ATT opcode + handle, L2CAP header
+COLORS = ["255,0,0", "0,255,0", "255,255,255", "12,34,56"]
+ITERATIONS = 200000
+
+
+def main():
+    print("bytes on air per update (payload + ATT/L2CAP headers)")
+    for color in COLORS:
+        print(f"  {color:>12}: ascii {len(encode_ascii(color)) + ATT_WRITE_OVERHEAD:>3}, binary {FRAME_SIZE + ATT_WRITE_OVERHEAD:>3}")
+
+    encoder = FrameEncoder()
+    encoder.precompute(COLORS)
+    cold = FrameEncoder()
+    print("encode cost per update")
+    print(f"  ascii:              {timeit.timeit(lambda: encode_ascii('255,0,0'), number=ITERATIONS) / ITERATIONS * 1e9:>7.0f} ns")
+    print(f"  binary precomputed: {timeit.timeit(lambda: encoder.encode('255,0,0'), number=ITERATIONS) / ITERATIONS * 1e9:>7.0f} ns")
+    print(f"  binary uncached:    {timeit.timeit(lambda: (cold._bodies.clear(), cold.encode('255,0,0')), number=ITERATIONS) / ITERATIONS * 1e9:>7.0f} ns")
+    print(f"  decode (reference): {timeit.timeit(lambda: decode(encoder.encode('255,0,0')), number=ITERATIONS) / ITERATIONS * 1e9:>7.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
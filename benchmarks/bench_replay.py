@@ -0,0 +1,48 @@
+"""Replay the canned traces through the detector, debounce and dedup on a virtual clock.
+
+Each trace runs with registry notifications and with 3 s polling, with and
+without the default debounce. Latency is from the registry change to the
+write that showed it; "hidden" changes never reached the light. CPU is the
+replay's own process time scaled to one simulated hour. Regenerate the
+traces with make_traces.py.
+"""
+import glob
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.debounce import DEFAULT_DEBOUNCE
+from busylight.replay import Replayer
+
+TRACE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces")
+CONFIGS = [
+    ("notify", None),
+    ("notify", DEFAULT_DEBOUNCE),
+    ("poll", None),
+    ("poll", DEFAULT_DEBOUNCE),
+]
+
+
+def ms(value):
+    return "-" if value is None else f"{value * 1000:.0f}"
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    print(
+        f"{'trace':<13} {'mode':<6} {'debounce':<8} {'hours':>5} {'events':>6} {'changes':>7} {'writes':>6} {'hidden':>6}"
+        f" {'p50 ms':>7} {'p95 ms':>7} {'scans':>6} {'cpu ms/h':>8} {'speedup':>8}"
+    )
+    for path in sorted(glob.glob(os.path.join(TRACE_DIR, "*.jsonl.gz"))):
+        for mode, debounce in CONFIGS:
+            result = Replayer(path, mode=mode, debounce=debounce).run()
+            print(
+                f"{result.name:<13} {mode:<6} {'on' if debounce else 'off':<8} {result.duration / 3600:>5.1f} {result.events:>6}"
+                f" {result.changes:>7} {result.writes:>6} {result.hidden:>6} {ms(result.latency(0.5)):>7} {ms(result.latency(0.95)):>7}"
+                f" {result.scans:>6} {result.cpu_per_hour * 1000:>8.1f} {result.speedup:>7.0f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
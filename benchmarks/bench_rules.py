@@ -0,0 +1,97 @@
+"""Compare matching every app rule on each poll with the compiled RuleTable.
+
+The naive resolver globs every present app against every rule on each
+poll, which is what applying the rules straight from the settings would
+do. RuleTable matches an app once and caches the result, so a poll with
+the same apps present is one dict lookup. Also reports how long compiling
+the table takes, which is what a settings reload costs.
+"""
+import fnmatch
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.rules import RuleTable
+from busylight.scanner import DEFAULT_CAPABILITIES, Presence
+
+SEED = 7
+RULE_COUNTS = [4, 40, 400]
+POLLS = 20000
+APPS = [
+    ("microphone", "MSTeams_8wekyb3d8bbwe"),
+    ("webcam", "MSTeams_8wekyb3d8bbwe"),
+    ("microphone", "NonPackaged\\C:#Program Files#obs-studio#bin#64bit#obs64.exe"),
+    ("microphone", "NonPackaged\\C:#Program Files#Google#Chrome#Application#chrome.exe"),
+    ("screen", "NonPackaged\\C:#Users#me#AppData#Roaming#Zoom#bin#Zoom.exe"),
+    ("microphone", "MicrosoftWindows.Client.CBS_cw5n1h2txyewy"),
+]
+
+
+def build_rules(count, rng):
+    rules = [
+        {"app": "*teams*", "color": "255,0,0"},
+        {"app": "*obs64.exe", "color": "128,0,128", "priority": 10},
+        {"app": "*chrome.exe", "color": "255,191,0", "capability": "microphone"},
+        {"app": "microsoftwindows.client.cbs_*", "ignore": True},
+    ]
+    while len(rules) < count:
+        rules.append({"app": f"*tool{rng.randrange(10 ** 6)}.exe", "color": f"{rng.randrange(256)},0,0"})
+    return rules
+
+
+def naive_resolve(rules, capability_colors, presence, default):
+    """Glob every app against every rule, in priority order, on every call."""
+    ranked = sorted(
+        ((rule.get("priority", 0), -index, rule) for index, rule in enumerate(rules) if not rule.get("ignore")),
+        key=lambda item: item[:2], reverse=True,
+    )
+    best, color = None, None
+    for item in presence:
+        for priority, order, rule in ranked:
+            if rule.get("capability") in (None, item.capability) and fnmatch.fnmatch(item.app.lower(), rule["app"].lower()):
+                if best is None or (priority, order) > best:
+                    best, color = (priority, order), rule["color"]
+                break
+        else:
+            if item.capability in capability_colors and best is None:
+                best, color = (-1, 0), capability_colors[item.capability]
+    return color or default
+
+
+def presences(rng):
+    """Polls over a day: mostly the same few apps, now and then a different combination."""
+    current = tuple(Presence(*app) for app in rng.sample(APPS, 2))
+    for _ in range(POLLS):
+        if rng.random() < 0.01:
+            current = tuple(Presence(*app) for app in sorted(rng.sample(APPS, rng.randint(0, 3))))
+        yield current
+
+
+def main():
+    capability_colors = {"webcam": "255,128,0"}
+    print(f"{'rules':>6} {'compile ms':>10} {'naive us/poll':>13} {'table us/poll':>13} {'speedup':>8}")
+    for count in RULE_COUNTS:
+        rng = random.Random(SEED)
+        rules = build_rules(count, rng)
+        polls = list(presences(rng))
+
+        start = time.perf_counter()
+        table = RuleTable(rules, capability_colors, DEFAULT_CAPABILITIES)
+        compile_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        naive = [naive_resolve(rules, capability_colors, presence, "255,0,0") for presence in polls]
+        naive_us = (time.perf_counter() - start) / POLLS * 1e6
+
+        start = time.perf_counter()
+        compiled = [table.resolve(presence)[0] or "255,0,0" for presence in polls]
+        table_us = (time.perf_counter() - start) / POLLS * 1e6
+
+        assert naive == compiled, "The compiled table disagrees with the naive resolver"
+        print(f"{count:>6} {compile_ms:>10.3f} {naive_us:>13.2f} {table_us:>13.3f} {naive_us / table_us:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
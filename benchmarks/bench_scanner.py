@@ -0,0 +1,89 @@
+"""Compare the legacy full ConsentStore scan with the incremental scanner on a fake registry.
+
+The second table scans the microphone, webcam and screen capture stores in
+one pass, and with the notification path's targeted rescan of just the
+store that changed, against the microphone store alone.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.fake_winreg import FakeWinreg
+from busylight.scanner import DEFAULT_CAPABILITIES, MIC_USAGE_KEYS, ConsentStoreScanner, capability_keys
+
+ENTRY_COUNTS = [10, 100, 1000, 10000]
+POLLS = 20
+
+
+def build_registry(entries, capabilities=("microphone",)):
+    registry = FakeWinreg()
+    for capability in capabilities:
+        keys = capability_keys(capability)
+        for i in range(entries):
+            registry.set_value(f"{keys[i % 2]}\\app{i}", "LastUsedTimeStop", 133000000000000000 + i)
+    return registry
+
+
+def legacy_scan(winreg):
+    """The loop check_microphone_usage used to run on every poll (handles left open)."""
+    found_in_use = False
+    for root_key in MIC_USAGE_KEYS:
+        reg_key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, root_key)
+        i = 0
+        while True:
+            try:
+                subkey_name = winreg.EnumKey(reg_key, i)
+                subkey = winreg.OpenKey(winreg.HKEY_CURRENT_USER, f"{root_key}\\{subkey_name}")
+                last_used_time_stop, _ = winreg.QueryValueEx(subkey, "LastUsedTimeStop")
+                if last_used_time_stop == 0:
+                    found_in_use = True
+                    break
+            except FileNotFoundError:
+                pass
+            except OSError:
+                break
+            i += 1
+    return found_in_use
+
+
+def measure(registry, scan):
+    """Per-poll milliseconds and registry calls while one microphone app changes between polls."""
+    scan()  # Warm up (the scanner opens its handles here)
+    registry.reset_counters()
+    start = time.perf_counter()
+    for poll in range(POLLS):
+        # One app changes between polls, like a real ConsentStore
+        registry.set_value(f"{MIC_USAGE_KEYS[0]}\\app0", "LastUsedTimeStop", poll + 1)
+        scan()
+    elapsed = time.perf_counter() - start
+    return elapsed / POLLS * 1000, registry.calls / POLLS
+
+
+def main():
+    print(f"{'entries':>8} {'legacy ms':>10} {'legacy calls':>13} {'cached ms':>10} {'cached calls':>13} {'open handles':>13}")
+    for entries in ENTRY_COUNTS:
+        registry = build_registry(entries)
+        legacy_ms, legacy_calls = measure(registry, lambda: legacy_scan(registry))
+
+        registry = build_registry(entries)
+        scanner = ConsentStoreScanner(["microphone"], winreg=registry)
+        cached_ms, cached_calls = measure(registry, scanner.scan)
+        open_handles = registry.open_handles
+        scanner.close()
+        print(f"{entries:>8} {legacy_ms:>10.3f} {legacy_calls:>13.0f} {cached_ms:>10.3f} {cached_calls:>13.0f} {open_handles:>13}")
+
+    print(f"\n{len(DEFAULT_CAPABILITIES)} stores with the same number of apps each")
+    print(f"{'entries':>8} {'mic ms':>8} {'mic calls':>10} {'all ms':>8} {'all calls':>10} {'changed ms':>11} {'changed calls':>14}")
+    for entries in ENTRY_COUNTS:
+        registry = build_registry(entries, DEFAULT_CAPABILITIES)
+        results = []
+        for capabilities, changed in ((["microphone"], None), (DEFAULT_CAPABILITIES, None), (DEFAULT_CAPABILITIES, {"microphone"})):
+            scanner = ConsentStoreScanner(capabilities, winreg=registry)
+            results.extend(measure(registry, lambda: scanner.scan(changed)))
+            scanner.close()
+        print(f"{entries:>8} {results[0]:>8.3f} {results[1]:>10.0f} {results[2]:>8.3f} {results[3]:>10.0f} {results[4]:>11.3f} {results[5]:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Count timer wakeups and CPU for an idle hour: separate timer loops against the coalescing scheduler.
+
+The separate loops are the timers the Bluetooth front-end used to run, each
+on its own: the 3 s detector poll, the 1 s Tk status tick, the 2 s link
+check and the heartbeat, started at unrelated moments like the threads
+they were. The scheduler runs the real BusyLight with a polling detector
+(the worst case; with registry notifications the detector only wakes on a
+change or the 60 s fallback), a light whose link can only be polled, a
+heartbeat and the 2 s metrics overlay refresh, on mains power, on battery,
+and on battery with the user away.
+
+Everything runs on the replay's virtual clock, so an hour takes well under
+a second; a wakeup is one time the loop would have slept until a timer.
+CPU is this process's time per simulated hour, which leaves out what each
+wakeup costs the OS. On mains the 3 s poll runs early to share the 2 s
+wakeups, so it scans more often than the separate loop did.
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.core import BusyLight
+from busylight.detector import POLL_INTERVAL, PollingBackend
+from busylight.fake_winreg import FakeWinreg
+from busylight.replay import VirtualTimeLoop
+from busylight.scanner import ConsentStoreScanner, capability_keys
+from busylight.transport import LINK_CHECK_INTERVAL, MemoryTransport
+
+SEED = 3
+HOUR = 3600
+HEARTBEAT_INTERVAL = 180
+UI_TICK = 1  # The old Tk update_status tick
+METRICS_REFRESH = 2
+
+
+class PolledLinkTransport(MemoryTransport):
+    """A light whose link can only be checked by polling is_connected, like a serial port."""
+
+    name = "polled"
+    link_check_interval = LINK_CHECK_INTERVAL
+
+    async def wait_disconnected(self):
+        while self._connected:
+            await asyncio.sleep(LINK_CHECK_INTERVAL)
+
+
+class FakePower:
+    def __init__(self, on_battery=False, idle_seconds=None):
+        self.battery = on_battery
+        self.idle = idle_seconds
+
+    def on_battery(self):
+        return self.battery
+
+    def idle_seconds(self):
+        return self.idle
+
+
+def build_registry():
+    registry = FakeWinreg()
+    for capability in ("microphone", "webcam"):
+        keys = capability_keys(capability)
+        for i in range(40):
+            registry.set_value(f"{keys[i % 2]}\\app{i}", "LastUsedTimeStop", 133_400_000_000_000_000 + i)
+    return registry
+
+
+class CountingScanner(ConsentStoreScanner):
+    scans = 0
+
+    def scan(self, capabilities=None):
+        self.scans += 1
+        return super().scan(capabilities)
+
+
+def run(loop, main):
+    started_at = time.process_time()
+    loop.run_until_complete(main())
+    cpu = time.process_time() - started_at
+    loop.close()
+    return loop.wakeups, cpu
+
+
+def separate_loops():
+    loop = VirtualTimeLoop()
+    rng = random.Random(SEED)
+    scanner = CountingScanner(("microphone", "webcam"), winreg=build_registry())
+    transport = PolledLinkTransport()
+
+    async def every(interval, work):
+        await asyncio.sleep(rng.uniform(0, interval))  # Each loop started on its own thread, at its own moment
+        while True:
+            work()
+            await asyncio.sleep(interval)
+
+    async def main():
+        await transport.connect()
+        tasks = [
+            asyncio.ensure_future(every(POLL_INTERVAL, scanner.scan)),
+            asyncio.ensure_future(every(UI_TICK, lambda: transport.is_connected)),
+            asyncio.ensure_future(every(LINK_CHECK_INTERVAL, lambda: transport.is_connected)),
+            asyncio.ensure_future(every(HEARTBEAT_INTERVAL, lambda: transport.sent.append((0, "0,255,0")))),
+        ]
+        await asyncio.sleep(HOUR)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    wakeups, cpu = run(loop, main)
+    return wakeups, cpu, scanner.scans, len(transport.sent)
+
+
+def scheduled(power):
+    loop = VirtualTimeLoop()
+    scanner = CountingScanner(("microphone", "webcam"), winreg=build_registry(), clock=loop.time)
+    light = BusyLight(PolledLinkTransport(), resend_interval=HEARTBEAT_INTERVAL, loop=loop)
+    light.device.clock = loop.time
+
+    async def main():
+        light.scheduler.watch_power(power)
+        await light.connect()
+        light.start_monitoring(PollingBackend(scanner.scan, scanner=scanner))
+        light.scheduler.every("metrics-refresh", METRICS_REFRESH, lambda: None)
+        await asyncio.sleep(HOUR)
+        light.stop_monitoring()
+        await light.disconnect()
+
+    wakeups, cpu = run(loop, main)
+    return wakeups, cpu, scanner.scans, len(light.device.transport.sent) - 1  # The first write is the startup color
+
+
+def main():
+    print(f"{'timers':<28} {'wakeups/min':>11} {'cpu ms/idle h':>13} {'scans':>6} {'heartbeats':>10}")
+    results = [("separate loops", separate_loops())]
+    for label, power in [
+        ("scheduler, mains", FakePower()),
+        ("scheduler, battery", FakePower(on_battery=True)),
+        ("scheduler, battery + away", FakePower(on_battery=True, idle_seconds=HOUR)),
+    ]:
+        results.append((label, scheduled(power)))
+    for label, (wakeups, cpu, scans, heartbeats) in results:
+        print(f"{label:<28} {wakeups / 60:>11.1f} {cpu * 1000:>13.1f} {scans:>6} {heartbeats:>10}")
+
+
+if __name__ == "__main__":
+    main()
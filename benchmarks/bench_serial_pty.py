@@ -0,0 +1,68 @@
+"""Drive SerialTransport against a fake firmware on a pty loopback port (Linux/macOS).
+
+Reports how long the calling ("UI") thread is blocked per color change, how
+many commands were coalesced, and the write-to-echo round trip.
+"""
+import os
+import pty
+import statistics
+import sys
+import threading
+import time
+import tty
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.core import BusyLight
+from busylight.serial_transport import SerialTransport
+
+CHANGES = 500
+FIRMWARE_DELAY = 0.010  # The firmware's delay(10) after each echo
+
+
+def fake_firmware(master_fd, stop):
+    """Echo each command letter back the way busy_light_usb_xiao_esp3c3.ino does."""
+    while not stop.is_set():
+        try:
+            data = os.read(master_fd, 64)
+        except OSError:
+            return
+        for command in data.decode(errors="replace"):
+            os.write(master_fd, f"Received: {command}\r\n".encode())
+            time.sleep(FIRMWARE_DELAY)
+
+
+def main():
+    master_fd, slave_fd = pty.openpty()
+    tty.setraw(slave_fd)
+    stop = threading.Event()
+    threading.Thread(target=fake_firmware, args=(master_fd, stop), daemon=True).start()
+
+    light = BusyLight(SerialTransport(port=os.ttyname(slave_fd)))
+    if not light.submit(light.connect()).result():
+        sys.exit("Could not open the pty port")
+
+    stalls = []
+    for i in range(CHANGES):
+        start = time.perf_counter()
+        light.set_mic_in_use(i % 2 == 0)
+        stalls.append(time.perf_counter() - start)
+        time.sleep(0.001)
+    time.sleep(0.5)
+
+    writer = light.transport.writer
+    round_trips = sorted(writer.round_trips)
+    stalls.sort()
+    print(f"color changes: {CHANGES}")
+    print(f"UI-thread stall median: {statistics.median(stalls) * 1000:.3f} ms, max: {stalls[-1] * 1000:.3f} ms")
+    print(f"commands coalesced: {writer.coalesced}")
+    if round_trips:
+        print(f"round trip median: {statistics.median(round_trips) * 1000:.3f} ms, max: {round_trips[-1] * 1000:.3f} ms ({len(round_trips)} echoes)")
+
+    light.submit(light.disconnect()).result()
+    stop.set()
+    os.close(master_fd)
+    os.close(slave_fd)
+
+
+if __name__ == "__main__":
+    main()
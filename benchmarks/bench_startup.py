@@ -0,0 +1,65 @@
+"""Cold-start time of the CLI entry points.
+
+Run with --record to append the results to startup_history.csv so start-up
+time can be compared across releases.
+"""
+import csv
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from busylight.core import BusyLight
+from busylight.daemon import StatusServer
+from busylight.transport import MemoryTransport
+
+RUNS = 10
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_history.csv")
+
+
+def time_command(args):
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    light = BusyLight(MemoryTransport())
+    path = os.path.join(tempfile.mkdtemp(), "busylight.sock")
+    server = StatusServer(light, path)
+    light.submit(server.start()).result()
+
+    cases = {
+        "python": ["-c", "pass"],
+        "import busylight.core": ["-c", "import busylight.core"],
+        "busylight --help": ["-m", "busylight", "--help"],
+        "busylight status": ["-m", "busylight", "--socket", path, "status"],
+        "busylight set-color": ["-m", "busylight", "--socket", path, "set-color", "255,0,0"],
+    }
+    results = {name: time_command(args) for name, args in cases.items()}
+    light.submit(server.stop()).result()
+
+    for name, seconds in results.items():
+        print(f"{name:>24}: {seconds * 1000:7.1f} ms")
+
+    if "--record" in sys.argv:
+        revision = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        new_file = not os.path.exists(HISTORY_FILE)
+        with open(HISTORY_FILE, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(["date", "revision", *results])
+            writer.writerow([time.strftime("%Y-%m-%d"), revision, *(f"{seconds * 1000:.1f}" for seconds in results.values())])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Idle wakeups and UI-thread CPU: the old 1 s window.after poll versus the push dispatcher.
+
+Uses a real Tk window when a display is available, otherwise a minimal
+single-threaded stand-in with the same after()/bind()/event_generate()
+surface. Each mode idles for IDLE_SECONDS, then takes a burst of detector
+changes from another thread.
+"""
+import heapq
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.ui import UiDispatcher
+
+IDLE_SECONDS = 5
+BURST = 200
+POLL_MS = 1000
+
+
+class HeadlessWindow:
+    """Just enough of a Tk root for the dispatcher: timers, virtual events and a mainloop."""
+
+    def __init__(self):
+        self._bindings = {}
+        self._events = []
+        self._timers = []
+        self._condition = threading.Condition()
+        self._running = False
+        self._order = 0
+
+    def bind(self, name, func):
+        self._bindings[name] = func
+
+    def event_generate(self, name, when=None):
+        with self._condition:
+            self._events.append(name)
+            self._condition.notify()
+
+    def after(self, ms, func):
+        with self._condition:
+            self._order += 1
+            heapq.heappush(self._timers, (time.monotonic() + ms / 1000, self._order, func))
+            self._condition.notify()
+
+    def quit(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    def mainloop(self):
+        self._running = True
+        while True:
+            with self._condition:
+                while self._running and not self._events and not (self._timers and self._timers[0][0] <= time.monotonic()):
+                    self._condition.wait(self._timers[0][0] - time.monotonic() if self._timers else None)
+                if not self._running:
+                    return
+                events, self._events = self._events, []
+                due = []
+                while self._timers and self._timers[0][0] <= time.monotonic():
+                    due.append(heapq.heappop(self._timers)[2])
+            for name in events:
+                self._bindings[name]()
+            for func in due:
+                func()
+
+
+def make_window():
+    if os.environ.get("DISPLAY") or sys.platform == "win32":
+        import tkinter as tk
+
+        window = tk.Tk()
+        window.withdraw()
+        return window, "tk"
+    return HeadlessWindow(), "stand-in"
+
+
+def run(mode):
+    window, kind = make_window()
+    state = {"mic_in_use": False, "renders": 0, "wakeups": 0}
+    cpu = {}
+
+    def render(snapshot=None):
+        state["renders"] += 1
+        f"Microphone Status: {'In Use' if state['mic_in_use'] else 'Idle'}"  # Stands in for the label updates
+
+    if mode == "poll":
+
+        def update_status():
+            state["wakeups"] += 1
+            render()
+            window.after(POLL_MS, update_status)
+
+        window.after(POLL_MS, update_status)
+        notify = lambda: None
+    else:
+        dispatcher = UiDispatcher(window, render=render, snapshot=lambda: state["mic_in_use"])
+        notify = dispatcher.request_redraw
+
+    def wakeups():
+        return state["wakeups"] if mode == "poll" else dispatcher.wakeups
+
+    def measure_cpu(label):
+        cpu[label] = (time.thread_time(), wakeups())
+
+    def driver():
+        time.sleep(0.2)
+        window.after(0, lambda: measure_cpu("idle start"))
+        time.sleep(IDLE_SECONDS)
+        window.after(0, lambda: measure_cpu("idle end"))
+        time.sleep(0.1)
+        for i in range(BURST):
+            state["mic_in_use"] = i % 2 == 0
+            notify()
+        time.sleep(0.3)
+        window.after(0, window.quit)
+
+    threading.Thread(target=driver, daemon=True).start()
+    window.mainloop()
+    idle_cpu = cpu["idle end"][0] - cpu["idle start"][0]
+    idle_wakeups = cpu["idle end"][1] - cpu["idle start"][1]
+    burst_wakeups = wakeups() - cpu["idle end"][1]
+    return kind, idle_wakeups, idle_cpu, burst_wakeups, state["renders"]
+
+
+def main():
+    per_minute = 60 / IDLE_SECONDS
+    print(f"{'mode':<10} {'window':<9} {'idle wakeups/min':>17} {'idle UI CPU ms/min':>19} {'burst wakeups':>14} {'renders':>8}")
+    for mode in ("poll", "dispatch"):
+        kind, idle_wakeups, idle_cpu, burst_wakeups, renders = run(mode)
+        print(f"{mode:<10} {kind:<9} {idle_wakeups * per_minute:>17.0f} {idle_cpu * 1000 * per_minute:>19.3f} {burst_wakeups:>14} {renders:>8}")
+    print(f"(burst: {BURST} state changes posted from another thread)")
+
+
+if __name__ == "__main__":
+    main()
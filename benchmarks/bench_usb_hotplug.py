@@ -0,0 +1,142 @@
+"""Pull and replug a USB light on pty-backed fake ports, and time how fast the color comes back (Linux/macOS).
+
+The fake port list has a dock's serial port and a CH340 adapter next to the
+light, so the old rule (the only port with "USB" in its description) finds
+nothing. Each cycle closes the light's pty like a pulled cable, then brings
+it back on a new pty with the same serial number, the way a replugged board
+returns as ttyACM1. Reported: how long until the pull is noticed, and from
+the replug until the fake firmware receives the current color again.
+
+"udev" stands in for the udev monitor by reporting the replug to the
+manager the way the udev callback does; "poll" relies on re-listing the
+ports every HOTPLUG_POLL_INTERVAL.
+"""
+import logging
+import os
+import pty
+import select
+import statistics
+import sys
+import threading
+import time
+import tty
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from serial.tools.list_ports_common import ListPortInfo
+
+from busylight.core import BusyLight
+from busylight.serial_transport import SerialTransport
+from busylight.usb_ports import ESPRESSIF_VID, USB_SERIAL_JTAG_PID, UsbPortManager
+
+CYCLES = 10
+UNPLUGGED_FOR = 0.3  # Seconds between the pull and the replug
+LIGHT_SERIAL_NUMBER = "34:85:18:00:AB:CD"
+
+
+def fake_port(device, vid, pid, serial_number, description):
+    port = ListPortInfo(device, skip_link_detection=True)
+    port.vid, port.pid, port.serial_number, port.description = vid, pid, serial_number, description
+    return port
+
+
+class FakeBoard:
+    """The light on a pty: echoes each command like the USB firmware and notes when it arrived."""
+
+    def __init__(self):
+        self.master_fd, self.slave_fd = pty.openpty()
+        tty.setraw(self.slave_fd)
+        self.device = os.ttyname(self.slave_fd)
+        self.received = []  # (time.perf_counter(), command)
+        self._stop_r, self._stop_w = os.pipe()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            ready, _, _ = select.select([self.master_fd, self._stop_r], [], [])
+            if self._stop_r in ready:
+                return
+            try:
+                data = os.read(self.master_fd, 64)
+            except OSError:
+                return
+            for command in data.decode(errors="replace"):
+                self.received.append((time.perf_counter(), command))
+                os.write(self.master_fd, f"Received: {command}\r\n".encode())
+
+    def pull(self):
+        # A read blocked on the master would keep the pty up, so the thread ends first
+        os.write(self._stop_w, b"x")
+        self._thread.join()
+        for fd in (self.master_fd, self.slave_fd, self._stop_r, self._stop_w):
+            os.close(fd)
+
+
+class FakePorts:
+    def __init__(self):
+        self.others = [
+            fake_port("/dev/ttyUSB7", 0x0BDA, 0x8153, None, "USB Serial Port (dock)"),
+            fake_port("/dev/ttyUSB8", 0x1A86, 0x7523, None, "USB-SERIAL CH340"),
+        ]
+        self.board = None
+
+    def list(self):
+        ports = list(self.others)
+        if self.board is not None:
+            ports.append(fake_port(self.board.device, ESPRESSIF_VID, USB_SERIAL_JTAG_PID, LIGHT_SERIAL_NUMBER, "USB JTAG/serial debug unit"))
+        return ports
+
+
+def wait_until(predicate, timeout=10):
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            raise TimeoutError
+        time.sleep(0.0005)
+    return time.perf_counter()
+
+
+def run(mode):
+    ports = FakePorts()
+    ports.board = FakeBoard()
+    manager = UsbPortManager(list_ports=ports.list)
+    light = BusyLight(SerialTransport(manager=manager), auto_reconnect=True)
+    light.set_mic_in_use(True)
+    if not light.submit(light.connect()).result():
+        sys.exit("Could not open the fake light")
+    if mode == "udev":
+        manager.watching = True  # Events come from changed() below instead of a udev monitor
+
+    noticed, restored = [], []
+    for _ in range(CYCLES):
+        wait_until(lambda: ports.board.received)
+        pulled_at = time.perf_counter()
+        ports.board.pull()
+        ports.board = None
+        noticed.append(wait_until(lambda: not light.connected) - pulled_at)
+        time.sleep(UNPLUGGED_FOR)
+
+        ports.board = FakeBoard()
+        plugged_at = time.perf_counter()
+        if mode == "udev":
+            manager.changed()
+        board = ports.board
+        restored.append(wait_until(lambda: board.received) - plugged_at)
+
+    light.submit(light.disconnect()).result()
+    ports.board.pull()
+    return noticed, restored
+
+
+def main():
+    logging.disable(logging.CRITICAL)  # Every pull logs a read error and a lost link
+    usb_ports = [port.device for port in FakePorts().others] + ["the light"]
+    print(f"old rule: {len(usb_ports)} ports with USB in the description ({', '.join(usb_ports)}), so it gives up")
+    print(f"{'mode':<5} {'pull noticed ms':>16} {'replug to color ms (median / max)':>34}")
+    for mode in ("udev", "poll"):
+        noticed, restored = run(mode)
+        print(f"{mode:<5} {statistics.median(noticed) * 1000:>16.1f} {statistics.median(restored) * 1000:>20.1f} / {max(restored) * 1000:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Generate the canned traces in benchmarks/traces/ (seeded, so the output is the same every run).
+
+    quiet_day      nine hours with two calls, a few dictation and device-probe blips and a Bluetooth drop at lunch
+    back_to_back   eight hours of meetings with short gaps, camera and screen sharing, join probes before each call
+    flapping       one hour of an audio service grabbing the microphone every few seconds, a browser tab
+                   flapping the webcam, and a real call in the middle
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight.trace import TraceRecorder
+
+TRACE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces")
+FILETIME_BASE = 133_400_000_000_000_000  # LastUsedTimeStop is a FILETIME: 100 ns ticks
+
+TEAMS = "MSTeams_8wekyb3d8bbwe"
+DICTATION = "MicrosoftWindows.Client.CBS_cw5n1h2txyewy"
+ZOOM = "NonPackaged\\C:#Users#me#AppData#Roaming#Zoom#bin#Zoom.exe"
+CHROME = "NonPackaged\\C:#Program Files#Google#Chrome#Application#chrome.exe"
+AUDIO_SERVICE = "NonPackaged\\C:#Program Files#Realtek#Audio#RtkAudUService64.exe"
+IDLE_APPS = [
+    ("microphone", "NonPackaged\\C:#Users#me#AppData#Local#Discord#Discord.exe"),
+    ("microphone", "NonPackaged\\C:#Program Files#Slack#slack.exe"),
+    ("webcam", "Microsoft.WindowsCamera_8wekyb3d8bbwe"),
+    ("webcam", "NonPackaged\\C:#Program Files#obs-studio#bin#64bit#obs64.exe"),
+    ("graphicsCaptureProgrammatic", "Microsoft.ScreenSketch_8wekyb3d8bbwe"),
+]
+
+
+class Timeline:
+    """Intervals of apps using capabilities, written out as a trace of ConsentStore snapshots."""
+
+    def __init__(self):
+        self.uses = []  # (start, end, store, app)
+        self.links = []  # (time, device, up)
+
+    def use(self, start, end, store, app):
+        self.uses.append((start, end, store, app))
+
+    def call(self, start, end, app, camera=True):
+        self.use(start, end, "microphone", app)
+        if camera:
+            self.use(start + 2, end, "webcam", app)
+
+    def write(self, path, name):
+        changes = {}  # time -> [(key, value)]
+        for start, end, store, app in self.uses:
+            key = f"{store}\\{app}"
+            changes.setdefault(start, []).append((key, 0))
+            changes.setdefault(end, []).append((key, FILETIME_BASE + round(end * 10_000_000)))
+        links = {}
+        for at, device, up in self.links:
+            links.setdefault(at, []).append((device, up))
+
+        now = [0.0]
+        recorder = TraceRecorder(path, name, clock=lambda: now[0])
+        values = {f"{store}\\{app}": FILETIME_BASE - 10_000_000 * i for i, (store, app) in enumerate(IDLE_APPS)}
+        recorder.registry(values)
+        in_use = {}  # key -> open intervals; an app used twice at once stays in use until both end
+        for at in sorted(changes.keys() | links.keys()):
+            now[0] = at
+            for key, value in changes.get(at, []):
+                in_use[key] = in_use.get(key, 0) + (1 if value == 0 else -1)
+                values[key] = 0 if in_use[key] > 0 else value
+            recorder.registry(values)
+            for device, up in links.get(at, []):
+                recorder.link(device, up)
+        recorder.close()
+        return recorder.events
+
+
+def blip(timeline, rng, at, store, app):
+    """An app opening the device for a fraction of a second: a probe, a chime, voice typing."""
+    timeline.use(at, at + rng.uniform(0.15, 1.5), store, app)
+
+
+def quiet_day(rng):
+    timeline = Timeline()
+    day = 9 * 3600
+    timeline.call(9017.4, 9017.4 + 25 * 60, TEAMS)
+    timeline.call(21631.9, 21631.9 + 15 * 60, ZOOM, camera=False)
+    for _ in range(6):
+        blip(timeline, rng, rng.uniform(0, day), "microphone", DICTATION)
+    for _ in range(10):
+        blip(timeline, rng, rng.uniform(0, day), "microphone", CHROME)
+    timeline.links += [(4 * 3600, "ble", 0), (4 * 3600 + 20, "ble", 1)]
+    timeline.use(day - 1, day, "microphone", DICTATION)  # Pins the end of the day
+    return timeline
+
+
+def back_to_back(rng):
+    timeline = Timeline()
+    now = 60.0
+    while now < 8 * 3600:
+        length = rng.choice([25, 30, 45, 55, 60]) * 60
+        app = rng.choice([TEAMS, TEAMS, ZOOM, CHROME])
+        blip(timeline, rng, now - 20, "microphone", app)  # Device check on the pre-join screen
+        camera_off = now + length * rng.uniform(0.3, 1.0)
+        timeline.use(now, now + length, "microphone", app)
+        timeline.use(now + 2, camera_off, "webcam", app)
+        if rng.random() < 0.4:
+            share = now + rng.uniform(0.1, 0.5) * length
+            timeline.use(share, share + rng.uniform(3, 15) * 60, "graphicsCaptureProgrammatic", app)
+        now += length + rng.choice([0, 0, 60, 120, 300]) + rng.uniform(0, 30)  # Joining a little late
+    return timeline
+
+
+def flapping(rng):
+    timeline = Timeline()
+    hour = 3600
+    now = 1.0
+    while now < hour:
+        blip(timeline, rng, now, "microphone", AUDIO_SERVICE)
+        now += rng.uniform(2, 8)
+    now = 600.0
+    while now < 900:
+        timeline.use(now, now + rng.uniform(0.5, 3), "webcam", CHROME)
+        now += rng.uniform(3, 10)
+    timeline.call(1800, 3000, TEAMS)
+    return timeline
+
+
+TRACES = {"quiet_day": quiet_day, "back_to_back": back_to_back, "flapping": flapping}
+
+
+def main():
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    for seed, (name, build) in enumerate(TRACES.items()):
+        path = os.path.join(TRACE_DIR, f"{name}.jsonl.gz")
+        events = build(random.Random(seed)).write(path, name)
+        print(f"{path}: {events} events, {os.path.getsize(path)} bytes")
+
+
+if __name__ == "__main__":
+    main()
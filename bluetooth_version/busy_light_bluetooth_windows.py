@@ -1,49 +1,49 @@
-import asyncio
 import tkinter as tk
 from tkinter import colorchooser, messagebox
-from PIL import Image, ImageDraw
 import logging
-from bleak import BleakClient, BleakScanner
-import winreg
 import os
 import json
-import threading
-import time
 import sys
-import pkgutil
 import win32api
 import win32con
 import win32gui
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight import metrics
+from busylight.ble_transport import BleTransport
+from busylight.core import BusyLight
+from busylight.debounce import DEFAULT_DEBOUNCE
+from busylight.icons import IconCache, destroy_hicon, image_to_hicon, light_state
+from busylight.logs import setup_logging
+from busylight.protocol import FrameEncoder
+from busylight.scanner import describe_presence
+from busylight.ui import UiDispatcher
+
 # Constants
 SETTINGS_FILE = "settings.json"
-MIC_USAGE_KEYS = [
-    r"Software\\Microsoft\\Windows\\CurrentVersion\\CapabilityAccessManager\\ConsentStore\\microphone",
-    r"Software\\Microsoft\\Windows\\CurrentVersion\\CapabilityAccessManager\\ConsentStore\\microphone\\NonPackaged",
-]
 
 # Logging setup
-DEBUG_MODE = True  # Set to False to disable logging
-if DEBUG_MODE:
-    logging.basicConfig(filename="app.log", level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
-else:
-    logging.basicConfig(level=logging.CRITICAL)  # Suppress all logs if DEBUG_MODE is False
+DEBUG_MODE = False  # Set to True to log every scan, write and reconnect attempt
+# Written by a background thread; app.log rotates at 1 MB and repeated lines are sampled.
+# Without DEBUG_MODE only warnings and errors are kept.
+log_pipeline = setup_logging("app.log", level=logging.DEBUG if DEBUG_MODE else logging.WARNING)
 
 # Global variables
-mic_in_use = False
-bluetooth_connected = False
-client = None
-mic_color = "255,0,0"  # Default red for mic in use
-idle_color = "0,255,0"  # Default green for mic idle
+HEARTBEAT_INTERVAL = 180  # Re-send the current color this often, until the light advertises its own idle timeout
 last_device_address = None
-running = False
-lock = threading.Lock()  # Synchronization lock
-last_color_sent = None  # Track the last color sent
-time_last_sent = 0  # Track time since the last RGB data was sent
-last_mic_status = None  # Track the last known microphone status
 tray_icon = None
-main_loop = None
 bluetooth_filter = "busy_light_"  # Default filter for Bluetooth devices
+binary_frames = False  # Set to True once every light runs firmware that decodes binary frames
+ble_acks = False  # Set to True once every light runs firmware that acks frames (implies binary frames)
+pixel_frames = False  # Set to True once every light runs firmware that decodes per-pixel frames (implies binary frames)
+SHOW_METRICS = False  # Set to True to show write latency and counters at the bottom of the window
+METRICS_REFRESH_MS = 2000  # Metrics change without a state change, so the overlay alone is refreshed on a timer
+calendar_settings = {}  # {"path": ".ics export", "lead_minutes": 2, "countdown": False} makes meetings busy (see busylight.meetings)
+broadcast_settings = {}  # {"publish": topic, ...} sends the state to lights on other machines (see busylight.broadcast)
+light = BusyLight(BleTransport(bluetooth_filter), resend_interval=HEARTBEAT_INTERVAL, auto_reconnect=True)
+light.debounce = dict(DEFAULT_DEBOUNCE)  # Hold back mic blips from device probes and join chimes; adds DEFAULT_GRACE (1 s) to every change
+link_note = None  # Why the link is down ("Reconnecting (...)"), shown until it is back
+dispatcher = None  # Runs work posted from the detector and event loop threads on the Tk thread
 
 # Windows tray-specific variables
 TRAY_ICON_ID = 1
@@ -52,42 +52,90 @@ WND_CLASS_NAME = "BusyLightControllerTray"
 tray_hwnd = None
 tray_icon_data = None
 hicon = None
-
-def initialize_event_loop():
-    global main_loop
-    if main_loop is None:
-        main_loop = asyncio.new_event_loop()
-        threading.Thread(target=main_loop.run_forever, daemon=True).start()
-
-initialize_event_loop()
+icon_cache = IconCache(convert=image_to_hicon, release=destroy_hicon)
 
 def log_environment_info():
+    from importlib import metadata
+
     logging.info(f"Python version: {sys.version}")
-    logging.info(f"Loaded modules: {[module.name for module in pkgutil.iter_modules()]}")
+    for package in ("bleak", "pywin32", "pillow"):
+        try:
+            logging.info(f"{package} version: {metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            logging.info(f"{package} not installed")
 
 def save_settings():
-    settings = {"mic_color": mic_color, "idle_color": idle_color, "bluetooth_filter": bluetooth_filter}
+    settings = {
+        "mic_color": light.mic_color,
+        "idle_color": light.idle_color,
+        "bluetooth_filter": bluetooth_filter,
+        "last_device_address": last_device_address,
+        "binary_frames": binary_frames,
+        "ble_acks": ble_acks,
+        "pixel_frames": pixel_frames,
+        "device_idle_timeout": light.transport.idle_timeout,
+        "debounce": light.debounce,
+        "ignore_apps": light.ignore_apps,
+        "capabilities": light.capabilities,
+        "capability_colors": light.capability_colors,
+        "app_rules": light.app_rules,
+        "broadcast": broadcast_settings,
+        "calendar": calendar_settings,
+    }
     with open(SETTINGS_FILE, "w") as f:
         json.dump(settings, f)
 
 def load_settings():
-    global mic_color, idle_color, bluetooth_filter
+    global bluetooth_filter, last_device_address, binary_frames, ble_acks, pixel_frames, broadcast_settings, calendar_settings
     if os.path.exists(SETTINGS_FILE):
         with open(SETTINGS_FILE, "r") as f:
             settings = json.load(f)
-            mic_color = settings.get("mic_color", mic_color)
-            idle_color = settings.get("idle_color", idle_color)
+            light.mic_color = settings.get("mic_color", light.mic_color)
+            light.idle_color = settings.get("idle_color", light.idle_color)
             bluetooth_filter = settings.get("bluetooth_filter", bluetooth_filter)
+            last_device_address = settings.get("last_device_address", last_device_address)
+            binary_frames = settings.get("binary_frames", binary_frames)
+            ble_acks = settings.get("ble_acks", ble_acks)
+            pixel_frames = settings.get("pixel_frames", pixel_frames)
+            light.transport.idle_timeout = settings.get("device_idle_timeout", light.transport.idle_timeout)
+            light.debounce = settings.get("debounce", light.debounce)
+            light.ignore_apps = settings.get("ignore_apps", light.ignore_apps)
+            light.capabilities = settings.get("capabilities", light.capabilities)
+            broadcast_settings = settings.get("broadcast", broadcast_settings)
+            calendar_settings = settings.get("calendar", calendar_settings)
+            try:
+                light.set_rules(settings.get("app_rules", light.app_rules), settings.get("capability_colors", light.capability_colors))
+            except ValueError as e:
+                logging.error(f"Ignoring app rules: {e}")
+            light.transport.name_filter = bluetooth_filter
+            light.transport.address = last_device_address
+            light.transport.acks = ble_acks
+            light.transport.pixel_frames = pixel_frames
+            light.transport.encoder = FrameEncoder() if binary_frames or ble_acks or pixel_frames else None
+            if light.transport.encoder:
+                light.transport.encoder.precompute([light.mic_color, light.idle_color, *light.rules.colors])
+
+def on_device_address(address):
+    """Remember the device that just connected so the next start can skip the scan."""
+    global last_device_address
+    last_device_address = address
+    save_settings()
 
 def create_icon():
-    """Create the icon image."""
-    width, height = 64, 64
-    image = Image.new("RGB", (width, height), "blue")
-    draw = ImageDraw.Draw(image)
-    draw.ellipse((16, 16, 48, 48), fill="red")
-    icon_path = "tray_icon.ico"
-    image.save(icon_path)
-    return win32gui.LoadImage(None, icon_path, win32con.IMAGE_ICON, 64, 64, win32con.LR_LOADFROMFILE)
+    """Return the icon for the light's current state, built in memory and cached."""
+    return icon_cache.get(*light_state(light))
+
+def update_tray_icon():
+    """Swap the tray icon when the light's state changes."""
+    global tray_icon_data, hicon
+    if not tray_icon_data:
+        return
+    new_hicon = create_icon()
+    if new_hicon == hicon:
+        return
+    hicon = new_hicon
+    tray_icon_data = tray_icon_data[:4] + (hicon,) + tray_icon_data[5:]
+    win32gui.Shell_NotifyIcon(win32gui.NIM_MODIFY, tray_icon_data)
 
 def on_tray_event(hwnd, msg, wparam, lparam):
     """Handle tray icon events."""
@@ -165,96 +213,61 @@ def on_exit():
         win32gui.DestroyWindow(tray_hwnd)
         tray_hwnd = None
 
-    # Destroy the icon
-    if hicon:
-        win32gui.DestroyIcon(hicon)
-        hicon = None
+    # Destroy the icons
+    icon_cache.clear()
+    hicon = None
 
     # Exit the program
     sys.exit(0)
 
-def check_microphone_usage():
-    global mic_in_use, running, last_mic_status
-    first_run = True
-    while running:
-        found_in_use = False
-        for root_key in MIC_USAGE_KEYS:
-            try:
-                reg_key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, root_key)
-                i = 0
-                while True:
-                    try:
-                        subkey_name = winreg.EnumKey(reg_key, i)
-                        subkey_path = f"{root_key}\\{subkey_name}"
-                        subkey = winreg.OpenKey(winreg.HKEY_CURRENT_USER, subkey_path)
-                        last_used_time_stop, _ = winreg.QueryValueEx(subkey, "LastUsedTimeStop")
-                        if last_used_time_stop == 0:
-                            found_in_use = True
-                            break
-                    except FileNotFoundError:
-                        pass
-                    except OSError:
-                        break
-                    i += 1
-            except FileNotFoundError:
-                pass
-            except PermissionError:
-                logging.error(f"Permission denied when accessing: {root_key}")
-
-        with lock:
-            mic_in_use = found_in_use
-            if first_run or mic_in_use != last_mic_status:
-                current_color = mic_color if mic_in_use else idle_color
-                asyncio.run_coroutine_threadsafe(send_color(current_color), main_loop)
-                last_mic_status = mic_in_use
-                first_run = False
-        time.sleep(3)
-
-async def send_color(color):
-    global client, bluetooth_connected, last_color_sent, time_last_sent
-    current_time = time.time()
-
-    if client and bluetooth_connected:
-        if color != last_color_sent or (current_time - time_last_sent) > 180:
-            try:
-                await client.write_gatt_char("abcd1234-abcd-1234-abcd-12345678abcd", color.encode())
-                logging.debug(f"Sent color: {color}")
-                last_color_sent = color
-                time_last_sent = current_time
-            except Exception as e:
-                logging.error(f"Error sending color: {e}")
-
-def update_status():
-    global last_mic_status
-
-    with lock:
-        current_color = mic_color if mic_in_use else idle_color
-        if mic_in_use != last_mic_status:
-            mic_status_label.config(text=f"Microphone Status: {'In Use' if mic_in_use else 'Idle'}")
-            asyncio.run_coroutine_threadsafe(send_color(current_color), main_loop)
-            last_mic_status = mic_in_use
-
-    bt_status_label.config(text=f"Bluetooth Status: {'Connected' if bluetooth_connected else 'Disconnected'}")
-    mic_status_label.config(text=f"Microphone Status: {'In Use' if mic_in_use else 'Idle'}")
-
-    if bluetooth_connected:
+def status_snapshot():
+    """Everything the window and tray show. The dispatcher redraws only when this changes."""
+    return (
+        light.connected,
+        link_note,
+        light.mic_in_use,
+        light.presence,
+        light.monitoring,
+        light_state(light),
+        metrics.summary(light.device.name) if SHOW_METRICS else None,
+    )
+
+def update_status(snapshot):
+    connected, note, mic_in_use, presence, monitoring, _, metrics_text = snapshot
+    if connected or note is None:
+        bt_status_label.config(text=f"Bluetooth Status: {'Connected' if connected else 'Disconnected'}")
+    else:
+        bt_status_label.config(text=f"Bluetooth Status: {note}")
+    in_use = f"In Use: {describe_presence(presence)}" if presence else "In Use"
+    mic_status_label.config(text=f"Microphone Status: {in_use if mic_in_use else 'Idle'}")
+
+    if connected:
         bluetooth_button.config(state=tk.DISABLED)
         disconnect_button.config(state=tk.NORMAL)
     else:
         bluetooth_button.config(state=tk.NORMAL)
         disconnect_button.config(state=tk.DISABLED)
 
-    window.after(1000, update_status)
+    start_button.config(state=tk.DISABLED if monitoring else tk.NORMAL)
+    stop_button.config(state=tk.NORMAL if monitoring else tk.DISABLED)
+
+    if metrics_text is not None:
+        metrics_label.config(text=metrics_text)
+
+    update_tray_icon()
+
+def refresh_metrics():
+    """Runs on the scheduler; the redraw itself happens on the Tk thread."""
+    dispatcher.post(dispatcher.redraw)
 
 def pick_color(use_mic):
-    global mic_color, idle_color
     color_code = colorchooser.askcolor(title="Choose color")[0]
     if color_code:
         color = f"{int(color_code[0])},{int(color_code[1])},{int(color_code[2])}"
         if use_mic:
-            mic_color = color
+            light.set_colors(mic_color=color)
         else:
-            idle_color = color
+            light.set_colors(idle_color=color)
         save_settings()
 
 def on_close():
@@ -267,97 +280,52 @@ def on_close():
 def on_minimize(event):
     on_close()
     
-async def find_device():
-    try:
-        devices = await BleakScanner.discover()
-        for device in devices:
-            if device.name and bluetooth_filter in device.name:
-                return device.address
-    except Exception as e:
-        logging.error(f"Error during Bluetooth discovery: {e}")
-    return None
-
 async def connect_device():
-    global client, bluetooth_connected
-    mac_address = await find_device()
-    if mac_address:
-        try:
-            client = BleakClient(mac_address)
-            await client.connect()
-            bluetooth_connected = client.is_connected
-            if bluetooth_connected:
-                bt_status_label.config(text="Bluetooth Status: Connected")
-                disconnect_button.config(state=tk.NORMAL)
-                bluetooth_button.config(state=tk.DISABLED)
-                asyncio.run_coroutine_threadsafe(monitor_session_status(), main_loop)
-        except Exception as e:
-            bluetooth_connected = False
-            logging.error(f"Connection failed: {e}")
-            handle_closing_session("CDConnection failed")
-    else:
-        messagebox.showwarning("Device Not Found", "No suitable device found.")
-
-def disconnect_bluetooth_force():
-    global client, bluetooth_connected
-    logging.error(f"disconnect_bluetooth: started")
-    try:
-        asyncio.run_coroutine_threadsafe(client.disconnect(), main_loop)
-        bluetooth_connected = False
-    except Exception as e:
-        logging.error(f"Error sending 'disconnect' command: {e}")
+    # Runs on the event loop thread, so the window is only touched through the dispatcher
+    if not await light.connect():
+        dispatcher.post(handle_closing_session, "CDConnection failed")
+        dispatcher.post(messagebox.showwarning, "Device Not Found", "No suitable device found.")
 
 def disconnect_bluetooth():
-    global client, bluetooth_connected
+    global link_note
     logging.error(f"disconnect_bluetooth: started")
-    if client and bluetooth_connected:
-        try:
-            asyncio.run_coroutine_threadsafe(client.disconnect(), main_loop)
-            bluetooth_connected = False
-        except Exception as e:
-            logging.error(f"Error sending 'disconnect' command: {e}")
+    link_note = None
+    # Also stops a reconnect that is still retrying
+    light.submit(light.disconnect())
 
 def start_microphone_identification():
-    global running
-    if not running:
-        running = True
-        threading.Thread(target=check_microphone_usage, daemon=True).start()
-        start_button.config(state=tk.DISABLED)
-        stop_button.config(state=tk.NORMAL)
+    if not light.monitoring:
+        light.start_monitoring()
 
 def stop_microphone_identification():
-    global running
-    if running:
-        running = False
-        start_button.config(state=tk.NORMAL)
-        stop_button.config(state=tk.DISABLED)
+    if light.monitoring:
+        light.stop_monitoring()
+
+def on_light_change():
+    """Called from any thread whenever the light's state changes."""
+    global link_note
+    if light.connected:
+        link_note = None
+    dispatcher.request_redraw()
+
+def on_link_lost(reason):
+    # Called on the event loop thread
+    global link_note
+    logging.warning(f"Link lost, reconnecting: {reason}")
+    link_note = f"Reconnecting ({reason})"
+    dispatcher.request_redraw()
 
 # Handle session closure
 def handle_closing_session(reason):
-    global bluetooth_connected
-    if not bluetooth_connected:  # Prevent redundant actions
-        return
-    bluetooth_connected = False
+    global link_note
     logging.warning(f"Session closed: {reason}")
-    bt_status_label.config(text=f"Bluetooth Status: Disconnected ({reason})")
-    disconnect_button.config(state=tk.DISABLED)
-    bluetooth_button.config(state=tk.NORMAL)
-    disconnect_bluetooth_force()
-
-async def monitor_session_status():
-    global bluetooth_connected
-    while bluetooth_connected:
-        try:
-            if client and not client.is_connected:
-                logging.warning("Connection lost during monitoring.")
-                handle_closing_session("MSSConnection lost (monitor)")
-                break
-        except Exception as e:
-            logging.error(f"Error during status monitoring: {e}")
-        await asyncio.sleep(2)
+    link_note = f"Disconnected ({reason})"
+    dispatcher.request_redraw()
+    light.submit(light.disconnect())
 
 def main():
     load_settings()
-    global window, bluetooth_button, disconnect_button, mic_status_label, bt_status_label, start_button, stop_button, mic_color_button, idle_color_button
+    global window, bluetooth_button, disconnect_button, mic_status_label, bt_status_label, start_button, stop_button, mic_color_button, idle_color_button, metrics_label, dispatcher
 
     window = tk.Tk()
     window.title("Busy Light Controller")
@@ -372,7 +340,7 @@ def main():
     bluetooth_frame = tk.Frame(window)
     bluetooth_frame.pack(pady=5)
 
-    bluetooth_button = tk.Button(bluetooth_frame, text="Connect to Bluetooth", command=lambda: asyncio.run_coroutine_threadsafe(connect_device(), main_loop))
+    bluetooth_button = tk.Button(bluetooth_frame, text="Connect to Bluetooth", command=lambda: light.submit(connect_device()))
     bluetooth_button.pack(side=tk.LEFT, padx=5)
 
     disconnect_button = tk.Button(bluetooth_frame, text="Disconnect Bluetooth", command=disconnect_bluetooth, state=tk.NORMAL)
@@ -407,12 +375,35 @@ def main():
     def update_filter():
         global bluetooth_filter
         bluetooth_filter = bluetooth_filter_entry.get()
+        light.transport.name_filter = bluetooth_filter
         save_settings()
 
     filter_button = tk.Button(bluetooth_filter_frame, text="Update Filter", command=update_filter)
     filter_button.pack(side=tk.LEFT, padx=5)
 
-    update_status()
+    metrics_label = tk.Label(window, text="", font=("Consolas", 9), justify=tk.LEFT)
+    if SHOW_METRICS:
+        metrics_label.pack(pady=5)
+
+    dispatcher = UiDispatcher(window, render=update_status, snapshot=status_snapshot)
+    light.listeners.append(on_light_change)
+    light.on_link_lost = on_link_lost
+    light.transport.on_address = on_device_address
+    dispatcher.redraw()
+    light.scheduler.watch_power()  # Polls, link checks and the metrics refresh back off on battery and while away
+    if SHOW_METRICS:
+        light.scheduler.every("metrics-refresh", METRICS_REFRESH_MS / 1000, refresh_metrics)
+    if broadcast_settings.get("publish"):
+        from busylight.broadcast import Publisher, broadcast_options
+
+        try:
+            Publisher(light, broadcast_settings["publish"], **broadcast_options(broadcast_settings)).start()
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not publish the status: {e}")
+    if calendar_settings.get("path"):
+        from busylight.meetings import MeetingWatcher
+
+        MeetingWatcher.from_settings(light, calendar_settings).start()
     window.mainloop()
 
 if __name__ == "__main__":
@@ -6,6 +6,7 @@
 
 #define SERVICE_UUID        "12345678-1234-1234-1234-123456789abc"
 #define CHARACTERISTIC_UUID "abcd1234-abcd-1234-abcd-12345678abcd"
+#define ACK_CHARACTERISTIC_UUID "abcd1235-abcd-1234-abcd-12345678abcd"
 
 #define PIN A0       // Pin where the NeoPixel is connected
 #define NUMPIXELS 60 // Total number of pixels
@@ -18,9 +19,61 @@ const unsigned long MAX_IDLE_TIME = 5 * 60 * 1000;       // 5 minutes of inactiv
 
 BLEServer *server = nullptr;
 BLECharacteristic *characteristic = nullptr;
+BLECharacteristic *ackCharacteristic = nullptr;
 unsigned long lastActivityTime = 0; // Tracks the last time data was received
 bool deviceConnected = false;
 
+// Binary frame format (see busylight/protocol.py)
+#define FRAME_SIZE 8
+#define FRAME_VERSION 1
+#define FRAME_CRC_FLAG 0x08
+#define OP_SET_COLOR 1
+#define OP_OFF 2
+#define OP_HEARTBEAT 3
+#define OP_ACK 4
+#define OP_PIXELS 5
+#define TARGET_ALL 0xFF
+
+// Pixel frames (see busylight/pixels.py): header, target, sequence, flags, base sequence, chunk index, chunk count, runs, crc
+#define PIXEL_HEADER_SIZE 7
+#define PIXEL_FLAG_DELTA 0x01
+#define PIXEL_LITERAL 0x80
+#define PIXEL_HISTORY 4 // Shown frames kept for the host to send deltas against
+
+uint8_t pixelHistory[PIXEL_HISTORY][NUMPIXELS][3];
+int16_t historySequence[PIXEL_HISTORY] = {-1, -1, -1, -1};
+uint8_t nextHistorySlot = 0;
+uint8_t workingPixels[NUMPIXELS][3]; // The frame whose chunks are arriving
+int16_t workingSequence = -1;
+uint8_t workingNextChunk = 0; // The chunk index the working frame needs next
+uint8_t workingChunks = 0;
+
+// Manufacturer data advertising MAX_IDLE_TIME: test company id 0xFFFF, "BL", seconds (uint16, little endian)
+#define MANUFACTURER_ID 0xFFFF
+
+// CRC-8, polynomial 0x07
+uint8_t crc8(const uint8_t *data, size_t length) {
+  uint8_t crc = 0;
+  for (size_t i = 0; i < length; i++) {
+    crc ^= data[i];
+    for (int bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+// Tell the host a frame was applied, so it can write without response and only retry lost frames
+void sendAck(uint8_t sequence) {
+  if (!deviceConnected) {
+    return;
+  }
+  uint8_t ack[FRAME_SIZE] = {(FRAME_VERSION << 4) | FRAME_CRC_FLAG | OP_ACK, TARGET_ALL, 0, 0, 0, 0, sequence, 0};
+  ack[7] = crc8(ack, FRAME_SIZE - 1);
+  ackCharacteristic->setValue(ack, FRAME_SIZE);
+  ackCharacteristic->notify();
+}
+
 // Function to set the LED matrix color
 void lightMiddleRows(uint32_t color) {
   strip.clear(); // Clear previous colors
@@ -35,6 +88,75 @@ void lightMiddleRows(uint32_t color) {
   strip.show(); // Apply the changes
 }
 
+// Apply one pixel frame chunk. Returns 1 once the frame is shown, 0 while chunks are missing, -1 if it was dropped
+int applyPixelFrame(const uint8_t *data, size_t length) {
+  if (length < PIXEL_HEADER_SIZE + 1 || ((data[0] & FRAME_CRC_FLAG) && crc8(data, length - 1) != data[length - 1])) {
+    return -1;
+  }
+  uint8_t sequence = data[2];
+  uint8_t flags = data[3];
+  uint8_t chunk = data[5];
+  uint8_t chunks = data[6];
+  if (chunk >= chunks) {
+    return -1;
+  }
+  if (chunk == 0) {
+    // A frame starts over at its first chunk, which is also where a resent frame begins
+    workingSequence = -1;
+    if (flags & PIXEL_FLAG_DELTA) {
+      int slot = -1;
+      for (int i = 0; i < PIXEL_HISTORY; i++) {
+        if (historySequence[i] == data[4]) {
+          slot = i;
+        }
+      }
+      if (slot < 0) {
+        return -1; // Base frame already gone: no ack, so the host gives up and sends a whole frame
+      }
+      memcpy(workingPixels, pixelHistory[slot], sizeof(workingPixels));
+    } else {
+      memset(workingPixels, 0, sizeof(workingPixels));
+    }
+    workingSequence = sequence;
+    workingChunks = chunks;
+  } else if (workingSequence != sequence || chunk != workingNextChunk || chunks != workingChunks) {
+    workingSequence = -1; // A chunk went missing: drop the frame rather than show part of it
+    return -1;
+  }
+
+  size_t position = PIXEL_HEADER_SIZE;
+  size_t end = length - 1;
+  while (position + 2 <= end) {
+    uint8_t start = data[position];
+    bool literal = data[position + 1] & PIXEL_LITERAL;
+    uint8_t count = data[position + 1] & 0x7F;
+    position += 2;
+    size_t size = literal ? 3 * count : 3;
+    if (position + size > end) {
+      workingSequence = -1;
+      return -1;
+    }
+    for (int i = 0; i < count && start + i < NUMPIXELS; i++) {
+      memcpy(workingPixels[start + i], data + position + (literal ? 3 * i : 0), 3);
+    }
+    position += size;
+  }
+  if (chunk < chunks - 1) {
+    workingNextChunk = chunk + 1;
+    return 0;
+  }
+
+  for (int i = 0; i < NUMPIXELS; i++) {
+    strip.setPixelColor(i, strip.Color(workingPixels[i][0], workingPixels[i][1], workingPixels[i][2]));
+  }
+  strip.show();
+  memcpy(pixelHistory[nextHistorySlot], workingPixels, sizeof(workingPixels));
+  historySequence[nextHistorySlot] = sequence;
+  nextHistorySlot = (nextHistorySlot + 1) % PIXEL_HISTORY;
+  workingSequence = -1;
+  return 1;
+}
+
 // Custom server callbacks
 class MyServerCallbacks : public BLEServerCallbacks {
   void onConnect(BLEServer* server) override {
@@ -86,7 +208,30 @@ class MySecurityCallbacks : public BLESecurityCallbacks {
 class MyCharacteristicCallbacks : public BLECharacteristicCallbacks {
   void onWrite(BLECharacteristic *pCharacteristic) override {
     String value = pCharacteristic->getValue(); // Get the written value as Arduino String
-    if (value.length() > 0) {
+    const uint8_t *data = (const uint8_t *)value.c_str();
+    if (value.length() > 0 && (data[0] >> 4) == FRAME_VERSION && (data[0] & 0x07) == OP_PIXELS) {
+      lastActivityTime = millis();
+      if (applyPixelFrame(data, value.length()) == 1) {
+        sendAck(data[2]);
+      }
+    } else if (value.length() == FRAME_SIZE && (data[0] >> 4) == FRAME_VERSION) {
+      // Binary frame: header, target, r, g, b, brightness, sequence, crc
+      if ((data[0] & FRAME_CRC_FLAG) && crc8(data, FRAME_SIZE - 1) != data[7]) {
+        Serial.println("Dropped frame with bad CRC.");
+        return;
+      }
+      uint8_t opcode = data[0] & 0x07;
+      uint8_t brightness = data[5];
+      if (opcode == OP_SET_COLOR) {
+        Serial.printf("Frame %d: RGB %d, %d, %d at %d\n", data[6], data[2], data[3], data[4], brightness);
+        lightMiddleRows(strip.Color(data[2] * brightness / 255, data[3] * brightness / 255, data[4] * brightness / 255));
+      } else if (opcode == OP_OFF) {
+        strip.clear();
+        strip.show();
+      }
+      lastActivityTime = millis(); // Heartbeats and colors both reset the activity timer
+      sendAck(data[6]); // A retransmitted frame is applied again and acked again
+    } else if (value.length() > 0) {
       Serial.print("Received command: ");
       Serial.println(value); // Log the received command
 
@@ -140,6 +285,7 @@ void setup() {
 
   // Initialize BLE Device
   BLEDevice::init("busy_light_2A1c");
+  BLEDevice::setMTU(247); // Room for a whole 60-pixel frame in one write
   server = BLEDevice::createServer();
 
   // Set Server Callbacks
@@ -150,7 +296,8 @@ void setup() {
   characteristic = service->createCharacteristic(
       CHARACTERISTIC_UUID,
       BLECharacteristic::PROPERTY_READ |
-      BLECharacteristic::PROPERTY_WRITE
+      BLECharacteristic::PROPERTY_WRITE |
+      BLECharacteristic::PROPERTY_WRITE_NR
   );
 
   // Set Characteristic Callbacks
@@ -160,12 +307,29 @@ void setup() {
   characteristic->addDescriptor(new BLE2902());
   characteristic->setValue("Hello BLE!");
 
+  ackCharacteristic = service->createCharacteristic(ACK_CHARACTERISTIC_UUID, BLECharacteristic::PROPERTY_NOTIFY);
+  ackCharacteristic->addDescriptor(new BLE2902());
+
   // Start the service
   service->start();
 
   // Start advertising the service
   BLEAdvertising *advertising = BLEDevice::getAdvertising();
   advertising->addServiceUUID(SERVICE_UUID);
+
+  // Advertise the idle timeout so the host can time its heartbeats to it. Custom advertisement
+  // data replaces the generated payload, so the flags and service UUID go in again, and the
+  // name moves to the scan response (flags 3 + UUID 18 + manufacturer data 8 = 29 of 31 bytes)
+  uint16_t idleSeconds = MAX_IDLE_TIME / 1000;
+  uint8_t manufacturerData[] = {MANUFACTURER_ID & 0xFF, MANUFACTURER_ID >> 8, 'B', 'L', idleSeconds & 0xFF, idleSeconds >> 8};
+  BLEAdvertisementData advertisementData;
+  advertisementData.setFlags(ESP_BLE_ADV_FLAG_GEN_DISC | ESP_BLE_ADV_FLAG_BREDR_NOT_SPT);
+  advertisementData.setCompleteServices(BLEUUID(SERVICE_UUID));
+  advertisementData.setManufacturerData(String((char *)manufacturerData, sizeof(manufacturerData)));
+  advertising->setAdvertisementData(advertisementData);
+  BLEAdvertisementData scanResponseData;
+  scanResponseData.setName("busy_light_2A1c");
+  advertising->setScanResponseData(scanResponseData);
   advertising->setScanResponse(true);
   advertising->setMinPreferred(0x06);  // Minimum preferred connection interval
   advertising->setMaxPreferred(0x12); // Maximum preferred connection interval
@@ -0,0 +1 @@
+"""Shared code for the USB and Bluetooth busy light front-ends."""
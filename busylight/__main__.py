@@ -0,0 +1,5 @@
+import sys
+
+from busylight.cli import main
+
+sys.exit(main())
@@ -0,0 +1,305 @@
+import asyncio
+import collections
+import logging
+import time
+
+from busylight import metrics
+from busylight.protocol import OP_ACK, FrameEncoder, decode, encode_ascii
+from busylight.transport import Transport
+
+SERVICE_UUID = "12345678-1234-1234-1234-123456789abc"
+COLOR_CHARACTERISTIC_UUID = "abcd1234-abcd-1234-abcd-12345678abcd"
+ACK_CHARACTERISTIC_UUID = "abcd1235-abcd-1234-abcd-12345678abcd"  # Notifies an OP_ACK frame per applied frame
+DEFAULT_NAME_FILTER = "busy_light_"
+DIRECT_CONNECT_TIMEOUT = 5  # Seconds to try the cached address before falling back to a scan
+DIRECT_ATTEMPTS_BEFORE_SCAN = 3  # After a link drop, retries that go straight to the cached address
+SCAN_TIMEOUT = 10  # Seconds to wait for a matching advertisement
+RANK_WINDOW = 0.2  # Seconds to keep listening after the first match so nearby lights can be ranked by RSSI
+ADVERTISEMENT_TTL = 30  # Seconds a cached advertisement can stand in for a scan
+ACK_TIMEOUT = 0.25  # Seconds to wait for an ack before writing the frame again
+ACK_RETRIES = 4
+# The firmware advertises its idle disconnect timeout as manufacturer data: b"BL" + seconds (uint16, little endian)
+MANUFACTURER_ID = 0xFFFF  # Reserved for testing, not assigned to a company
+IDLE_TIMEOUT_PREFIX = b"BL"
+HEARTBEAT_FRACTION = 0.8  # Heartbeat at this fraction of the advertised idle timeout
+DEFAULT_MTU = 23  # ATT MTU before any exchange; a write carries MTU - 3 bytes
+PENDING_PIXEL_FRAMES = 4  # Unacked pixel frames remembered so a late ack still moves the delta base
+
+
+def parse_idle_timeout(manufacturer_data):
+    """Return the idle timeout in seconds from advertisement manufacturer data, or None."""
+    data = (manufacturer_data or {}).get(MANUFACTURER_ID)
+    if not data or len(data) < 4 or bytes(data[:2]) != IDLE_TIMEOUT_PREFIX:
+        return None
+    return int.from_bytes(bytes(data[2:4]), "little") or None
+
+
+class BleTransport(Transport):
+    """Bluetooth LE link to the ESP32 running busy_light_bluetooth_xiao_esp32c3.ino.
+
+    The address of the last device that connected is kept (and handed to
+    on_address so the front-end can persist it). connect() tries that address
+    directly before scanning, and reuses the same BleakClient for every
+    reconnect to it. After a link drop the device is almost certainly the same
+    one, so a few direct attempts are made before paying for another scan.
+
+    With acks=True (binary frames only) colors go out as write-without-response
+    and the firmware confirms each frame on ACK_CHARACTERISTIC_UUID. Only the
+    newest unacknowledged frame is ever written again; one that was replaced
+    by a newer color is simply forgotten.
+
+    With pixel_frames=True (firmware with OP_PIXELS) send_pixels() streams
+    the whole strip, each frame holding only the pixels that changed since
+    the newest frame the light confirmed: by ack, or by the write response
+    without acks.
+    """
+
+    name = "ble"
+    link_check_interval = None  # The disconnect callback sets an event
+
+    def __init__(self, name_filter=DEFAULT_NAME_FILTER, address=None, on_address=None, binary=False, bleak=None, acks=False, idle_timeout=None, pixel_frames=False):
+        self._bleak_module = bleak  # None imports the real bleak on first use
+        self.encoder = FrameEncoder() if binary or acks or pixel_frames else None  # None sends the legacy "r,g,b" text
+        self.acks = acks
+        self.pixel_frames = pixel_frames
+        self.idle_timeout = idle_timeout  # Seconds the firmware waits before dropping a silent link, once known
+        self.name_filter = name_filter
+        self.address = address
+        self.on_address = on_address  # Called with the address after a successful connect
+        self.client = None
+        self._disconnected = None
+        self._connected_once = False
+        self._direct_failures = 0
+        self.advertisements = {}  # address -> (name, rssi, time.monotonic() when seen) for matching devices
+        self.scan_latencies = collections.deque(maxlen=64)  # Seconds from scan start to first match
+        self.ack_latencies = collections.deque(maxlen=64)  # Seconds from first write to ack
+        self.retransmits = 0
+        self._unacked = None  # (sequence, payloads, time.perf_counter() of the first write, is a pixel frame)
+        self._retry_task = None
+        self._acked_pixels = None  # (sequence, pixels) of the newest pixel frame the light confirmed
+        self._pending_pixels = collections.OrderedDict()  # sequence -> pixels written but not yet acked
+        self.pixel_bytes = 0  # Bytes of pixel frames written, retransmits excluded
+
+    @property
+    def _bleak(self):
+        if self._bleak_module is None:
+            import bleak
+
+            self._bleak_module = bleak
+        return self._bleak_module
+
+    @property
+    def is_connected(self):
+        return self.client is not None and self.client.is_connected
+
+    @property
+    def heartbeat_interval(self):
+        if self.idle_timeout is None:
+            return None
+        return self.idle_timeout * HEARTBEAT_FRACTION
+
+    def matches(self, name, service_uuids):
+        """A device matches on the name filter, or on the service UUID when it advertised no name."""
+        if name:
+            return self.name_filter in name
+        return SERVICE_UUID in (service_uuids or [])
+
+    def best_cached_device(self):
+        """Return the strongest matching address seen within ADVERTISEMENT_TTL, or None."""
+        now = time.monotonic()
+        fresh = [(rssi, address) for address, (name, rssi, seen_at) in self.advertisements.items() if now - seen_at < ADVERTISEMENT_TTL]
+        return max(fresh)[1] if fresh else None
+
+    async def find_device(self, use_cache=True):
+        """Stream advertisements and stop as soon as a matching light is heard."""
+        if use_cache:
+            cached = self.best_cached_device()
+            if cached:
+                logging.debug(f"Using cached advertisement for {cached}")
+                return cached
+
+        found = asyncio.Event()
+        idle_timeouts = {}
+
+        def on_detection(device, advertisement_data):
+            name = advertisement_data.local_name or device.name
+            if self.matches(name, advertisement_data.service_uuids):
+                self.advertisements[device.address] = (name, advertisement_data.rssi, time.monotonic())
+                idle_timeouts[device.address] = parse_idle_timeout(getattr(advertisement_data, "manufacturer_data", None))
+                found.set()
+
+        started_at = time.perf_counter()
+        try:
+            scanner = self._bleak.BleakScanner(detection_callback=on_detection)
+            await scanner.start()
+            try:
+                await asyncio.wait_for(found.wait(), SCAN_TIMEOUT)
+                self.scan_latencies.append(time.perf_counter() - started_at)
+                metrics.ble_scan_seconds.observe(self.scan_latencies[-1])
+                logging.debug(f"Scan matched after {self.scan_latencies[-1] * 1000:.0f} ms")
+                await asyncio.sleep(RANK_WINDOW)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                await scanner.stop()
+        except Exception as e:
+            logging.error(f"Error during Bluetooth discovery: {e}")
+            return None
+        address = self.best_cached_device()
+        if idle_timeouts.get(address):
+            self.idle_timeout = idle_timeouts[address]
+        return address
+
+    def _on_disconnect(self, client):
+        if self._disconnected is not None:
+            self._disconnected.set()
+
+    def _client_for(self, address):
+        if self.client is None or self.client.address != address:
+            self.client = self._bleak.BleakClient(address, disconnected_callback=self._on_disconnect)
+        return self.client
+
+    async def _connect_to(self, address, timeout=None):
+        client = self._client_for(address)
+        self._disconnected = asyncio.Event()
+        try:
+            if timeout is None:
+                await client.connect()
+            else:
+                await asyncio.wait_for(client.connect(), timeout)
+        except Exception as e:
+            logging.error(f"Connection to {address} failed: {e}")
+            # Don't let a stale advertisement send the next attempt back here
+            self.advertisements.pop(address, None)
+            return False
+        self._acked_pixels = None  # The light may have restarted; its frame history with it
+        self._pending_pixels.clear()
+        if self.acks and client.is_connected:
+            self._unacked = None
+            try:
+                await client.start_notify(ACK_CHARACTERISTIC_UUID, self._on_ack)
+            except Exception as e:
+                logging.error(f"Acks unavailable, falling back to acknowledged writes: {e}")
+                self.acks = False
+        return client.is_connected
+
+    async def connect(self):
+        if self.address:
+            if await self._connect_to(self.address, DIRECT_CONNECT_TIMEOUT):
+                logging.debug(f"Connected to cached address {self.address}")
+                self._connected_once = True
+                self._direct_failures = 0
+                return True
+            self._direct_failures += 1
+            if self._connected_once and self._direct_failures < DIRECT_ATTEMPTS_BEFORE_SCAN:
+                return False
+
+        mac_address = await self.find_device()
+        if not mac_address or not await self._connect_to(mac_address):
+            return False
+        self._connected_once = True
+        self._direct_failures = 0
+        if mac_address != self.address:
+            self.address = mac_address
+            if self.on_address:
+                self.on_address(mac_address)
+        return True
+
+    async def wait_disconnected(self):
+        if self._disconnected is None:
+            return
+        await self._disconnected.wait()
+
+    async def disconnect(self):
+        self._unacked = None
+        if self.client:
+            try:
+                await self.client.disconnect()
+            except Exception as e:
+                logging.error(f"Error sending 'disconnect' command: {e}")
+
+    async def send(self, color):
+        payload = self.encoder.encode(color) if self.encoder else encode_ascii(color)
+        if not self.acks:
+            await self.client.write_gatt_char(COLOR_CHARACTERISTIC_UUID, payload)
+            return
+        # Returns once the frame is queued; the ack (or the retry) happens in the background
+        await self._write_unacked(payload[6], [payload])
+
+    async def _write_unacked(self, sequence, payloads, is_pixels=False):
+        self._unacked = (sequence, payloads, time.perf_counter(), is_pixels)
+        for payload in payloads:
+            await self.client.write_gatt_char(COLOR_CHARACTERISTIC_UUID, payload, response=False)
+        if self._retry_task is None or self._retry_task.done():
+            self._retry_task = asyncio.ensure_future(self._retry_unacked())
+
+    async def send_pixels(self, pixels):
+        if not self.pixel_frames:
+            await super().send_pixels(pixels)
+            return
+        from busylight.pixels import encode_pixels
+
+        sequence = self.encoder.next_sequence()
+        base_sequence, base = self._acked_pixels or (0, None)
+        mtu = getattr(self.client, "mtu_size", None) or DEFAULT_MTU
+        payloads = encode_pixels(pixels, sequence, base, base_sequence, max_payload=mtu - 3)
+        self.pixel_bytes += sum(map(len, payloads))
+        if not self.acks:
+            for payload in payloads:
+                await self.client.write_gatt_char(COLOR_CHARACTERISTIC_UUID, payload)
+            self._acked_pixels = (sequence, pixels.copy())
+            return
+        self._pending_pixels[sequence] = pixels.copy()
+        while len(self._pending_pixels) > PENDING_PIXEL_FRAMES:
+            self._pending_pixels.popitem(last=False)
+        await self._write_unacked(sequence, payloads, is_pixels=True)
+
+    def _on_ack(self, characteristic, data):
+        try:
+            frame = decode(data)
+        except ValueError as e:
+            logging.debug(f"Ignoring malformed ack: {e}")
+            return
+        if frame.opcode != OP_ACK:
+            return
+        if frame.sequence in self._pending_pixels:
+            # Older pending frames can no longer become the base
+            while True:
+                sequence, pixels = self._pending_pixels.popitem(last=False)
+                if sequence == frame.sequence:
+                    break
+            self._acked_pixels = (sequence, pixels)
+        unacked = self._unacked
+        if unacked is None or frame.sequence != unacked[0]:
+            return  # An ack for a frame that was already replaced
+        self._unacked = None
+        self.ack_latencies.append(time.perf_counter() - unacked[2])
+        metrics.echo_seconds.observe(self.ack_latencies[-1], self.name)
+
+    async def _retry_unacked(self):
+        """Write the newest frame again until it is acked, ACK_RETRIES times at most."""
+        attempts = 0
+        sequence = None
+        while self._unacked is not None and self.is_connected:
+            if self._unacked[0] != sequence:
+                sequence, attempts = self._unacked[0], 0  # A newer frame replaced the one being retried
+            await asyncio.sleep(ACK_TIMEOUT)
+            unacked = self._unacked
+            if unacked is None or unacked[0] != sequence or not self.is_connected:
+                continue
+            if attempts >= ACK_RETRIES:
+                logging.error(f"Frame {sequence} was never acknowledged")
+                metrics.write_errors.inc(self.name)
+                self._unacked = None
+                if unacked[3]:
+                    self._acked_pixels = None  # The light may have lost the base frame; send the next one whole
+                return
+            attempts += 1
+            self.retransmits += 1
+            metrics.retransmits.inc(self.name)
+            try:
+                for payload in unacked[1]:
+                    await self.client.write_gatt_char(COLOR_CHARACTERISTIC_UUID, payload, response=False)
+            except Exception as e:
+                logging.error(f"Error resending frame {sequence}: {e}")
+                return
@@ -0,0 +1,377 @@
+"""Send the presence state to busy lights on other machines, and drive local lights from it.
+
+A Publisher sends its BusyLight's color and busy flag as one small UDP
+datagram per change. The datagram goes to a multicast group that every
+subscriber on the LAN has joined. Where multicast does not get through
+(guest Wi-Fi, VPNs), it goes to a Relay instead. A Subscriber posts what
+it receives as a status source on its own BusyLight, and that BusyLight
+drives the lights attached to its machine. This way the light over a
+door can follow a PC it is not plugged into.
+
+Datagram layout (HEADER.size bytes, then the topic):
+
+    0-1   magic b"BL"
+    2     high nibble = version, low nibble = kind (KIND_STATE or KIND_REQUEST)
+    3     flags: bit 0 = busy
+    4-7   epoch: the publisher's start time in seconds
+    8-11  sequence number within the epoch
+    12-14 red, green, blue
+    15    topic length, followed by the UTF-8 topic
+
+(epoch, sequence) orders the states of a topic. A subscriber drops
+duplicates and any datagram that arrives after a newer one. A publisher
+that restarts at sequence 0 still wins, because its epoch is newer. Each
+state is sent again every REPUBLISH_INTERVAL, which repairs a lost
+datagram. A subscriber that hears nothing from a topic for EXPIRE_AFTER
+seconds drops it and falls back to its own idle color.
+
+A subscriber that joins late sends a KIND_REQUEST for its topic (an empty
+topic means all of them), and the last state is replayed at once instead
+of at the next republish. The Relay is a stand-in for an MQTT broker with
+retained messages. Publishers send their states to it. Subscribers send
+requests to it to subscribe. It forwards each state to the subscribers of
+that topic, and answers a request with the retained state.
+"""
+import asyncio
+import collections
+import logging
+import socket
+import struct
+import time
+
+from busylight import metrics
+from busylight.status import DEFAULT_SOURCE_PRIORITY, IDLE_SOURCE_PRIORITY
+from busylight.transport import parse_color
+
+MAGIC = b"BL"
+VERSION = 1
+KIND_STATE = 1
+KIND_REQUEST = 2
+FLAG_BUSY = 0x01
+HEADER = struct.Struct("!2sBBIIBBBB")
+MAX_TOPIC_BYTES = 255
+
+MULTICAST_GROUP = "239.255.66.76"  # Organisation-local scope, not routed off site
+BROADCAST_PORT = 47821
+RELAY_PORT = 47822
+ANY_INTERFACE = "0.0.0.0"
+MULTICAST_TTL = 1  # Hops; 1 keeps the datagrams on the local subnet
+REPUBLISH_INTERVAL = 30  # Seconds between resends of an unchanged state
+EXPIRE_AFTER = 3 * REPUBLISH_INTERVAL  # Seconds of silence before a topic's state is dropped
+REPLAY_DELAY = 0.02  # Late-joiner requests arriving within this window share one replay
+REMOTE_SOURCE_PREFIX = "remote:"
+REMOTE_IDLE_PRIORITY = IDLE_SOURCE_PRIORITY  # An idle remote shows its idle color, but anything local outranks it
+
+Message = collections.namedtuple("Message", "kind topic epoch sequence rgb busy")
+
+
+def encode(kind, topic, epoch=0, sequence=0, rgb=(0, 0, 0), busy=False):
+    topic = topic.encode()
+    if len(topic) > MAX_TOPIC_BYTES:
+        raise ValueError(f"Topic longer than {MAX_TOPIC_BYTES} bytes")
+    return HEADER.pack(MAGIC, (VERSION << 4) | kind, FLAG_BUSY if busy else 0, epoch, sequence, *rgb, len(topic)) + topic
+
+
+def encode_request(topic=""):
+    return encode(KIND_REQUEST, topic)
+
+
+def decode(data):
+    """Decode a datagram into a Message. Raises ValueError for anything else."""
+    if len(data) < HEADER.size:
+        raise ValueError(f"Datagram too short ({len(data)} bytes)")
+    magic, header, flags, epoch, sequence, red, green, blue, length = HEADER.unpack_from(data)
+    if magic != MAGIC or header >> 4 != VERSION:
+        raise ValueError("Not a busy light datagram")
+    if len(data) != HEADER.size + length:
+        raise ValueError("Topic length mismatch")
+    kind = header & 0x0F
+    if kind not in (KIND_STATE, KIND_REQUEST):
+        raise ValueError(f"Unknown kind {kind}")
+    topic = data[HEADER.size:].decode("utf-8")
+    return Message(kind, topic, epoch, sequence, (red, green, blue), bool(flags & FLAG_BUSY))
+
+
+def parse_address(text, default_port):
+    """Turn "host" or "host:port" into a (host, port) tuple."""
+    host, _, port = text.rpartition(":") if ":" in text else (text, "", "")
+    return host, int(port) if port else default_port
+
+
+def broadcast_options(settings):
+    """Publisher and Subscriber keyword arguments from the "broadcast" settings (group, port, relay as "host:port", interface)."""
+    options = {
+        "group": settings.get("group", MULTICAST_GROUP),
+        "port": settings.get("port", BROADCAST_PORT),
+        "interface": settings.get("interface", ANY_INTERFACE),
+    }
+    if settings.get("relay"):
+        options["relay"] = parse_address(settings["relay"], RELAY_PORT)
+    return options
+
+
+def _multicast_socket(group, port, interface):
+    """A UDP socket joined to the group on port, which also sends to it. Several may share the port."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("", port))
+        membership = struct.pack("4s4s", socket.inet_aton(group), socket.inet_aton(interface))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, MULTICAST_TTL)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)  # Subscribers on this machine hear it too
+        if interface != ANY_INTERFACE:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def _unicast_socket(host="", port=0):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    try:
+        sock.bind((host, port))
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class _Endpoint(asyncio.DatagramProtocol):
+    """A socket on the light's loop that decodes what arrives: the multicast group, or a relay if one is given."""
+
+    def __init__(self, light, group, port, relay, interface):
+        self.light = light
+        self.group = group
+        self.port = port
+        self.relay = relay
+        self.interface = interface
+        self.destination = relay or (group, port)
+        self.transport = None
+        self.sent = 0  # Datagrams sent
+        self.invalid = 0  # Datagrams received that did not decode
+
+    async def open(self):
+        sock = _unicast_socket() if self.relay else _multicast_socket(self.group, self.port, self.interface)
+        self.transport, _ = await self.light.loop.create_datagram_endpoint(lambda: self, sock=sock)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def send(self, data, address=None):
+        if self.transport is None:
+            return
+        self.transport.sendto(data, address or self.destination)
+        self.sent += 1
+
+    def datagram_received(self, data, address):
+        try:
+            message = decode(data)
+        except (ValueError, UnicodeDecodeError) as e:
+            self.invalid += 1
+            logging.debug(f"Ignoring datagram from {address}: {e}")
+            return
+        self.message_received(message, address)
+
+    def message_received(self, message, address):
+        """Handle a decoded message. Subclasses override this; the base ignores it."""
+
+    def error_received(self, exc):
+        logging.warning(f"Broadcast socket error: {exc}")
+
+
+class Publisher(_Endpoint):
+    """Send light's color and busy flag under topic whenever they change.
+
+    busy is the merged state (BusyLight.busy): the microphone, or a daemon
+    or calendar source, so subscribers rank it like a local busy source.
+
+    start() and stop() may be called from any thread.
+    """
+
+    def __init__(self, light, topic, group=MULTICAST_GROUP, port=BROADCAST_PORT, relay=None, interface=ANY_INTERFACE):
+        super().__init__(light, group, port, relay, interface)
+        encode(KIND_STATE, topic)  # Fail early on a topic that does not fit
+        self.topic = topic
+        self.epoch = int(time.time()) & 0xFFFFFFFF
+        self.sequence = 0
+        self.state = None  # (color, busy) last published
+        self.datagram = None  # The last state datagram, replayed to late joiners
+        self.replays = 0
+        self._replay = None
+
+    @property
+    def task_name(self):
+        return f"publish:{self.topic}"
+
+    def start(self):
+        self.light.submit(self.open()).result()
+        self.light.listeners.append(self._on_change)
+        self.light.scheduler.every(self.task_name, REPUBLISH_INTERVAL, self.republish, backoff=False)
+        self._on_change()
+        logging.info(f"Publishing {self.topic!r} to {self.destination[0]}:{self.destination[1]}")
+
+    def stop(self):
+        if self._on_change in self.light.listeners:
+            self.light.listeners.remove(self._on_change)
+        self.light.scheduler.cancel(self.task_name)
+        self.light.loop.call_soon_threadsafe(self.close)
+
+    def _on_change(self):
+        """BusyLight listener; runs on whichever thread changed the state."""
+        with self.light.lock:
+            state = (self.light.current_color, self.light.busy)
+        self.light.loop.call_soon_threadsafe(self.publish, *state)
+
+    def publish(self, color, busy, force=False):
+        """Send the state unless it was the last one sent. Runs on the loop."""
+        if (color, busy) == self.state and not force:
+            return
+        self.state = (color, busy)
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        self.datagram = encode(KIND_STATE, self.topic, self.epoch, self.sequence, parse_color(color), busy)
+        self.send(self.datagram)
+
+    def republish(self):
+        """Scheduled resend, so a subscriber that missed the last datagram catches up."""
+        if self.state is not None:
+            self.publish(*self.state, force=True)
+
+    def message_received(self, message, address):
+        if message.kind != KIND_REQUEST or message.topic not in ("", self.topic) or self.datagram is None:
+            return
+        if self._replay is None:
+            self._replay = self.light.loop.call_later(REPLAY_DELAY, self._send_replay)
+
+    def _send_replay(self):
+        self._replay = None
+        self.replays += 1
+        self.send(self.datagram)  # Unchanged sequence number: subscribers that have it drop it
+
+
+class Subscriber(_Endpoint):
+    """Post the states published under topics (all topics when empty) as status sources on light.
+
+    A busy remote is posted at priority, and an idle one at
+    REMOTE_IDLE_PRIORITY, so when several topics are followed the light
+    is busy if any of them is. Each post expires after EXPIRE_AFTER seconds
+    without a state.
+    """
+
+    def __init__(self, light, topics=(), group=MULTICAST_GROUP, port=BROADCAST_PORT, relay=None, interface=ANY_INTERFACE,
+                 priority=DEFAULT_SOURCE_PRIORITY):
+        super().__init__(light, group, port, relay, interface)
+        self.topics = set(topics)
+        self.priority = priority
+        self.last = {}  # topic -> (epoch, sequence) last applied
+        self.applied = 0
+        self.dropped = 0  # Duplicates and datagrams older than one already applied
+        self.lost = 0  # Datagrams missed, from gaps in the sequence numbers
+
+    def start(self):
+        self.light.submit(self.open()).result()
+        if self.relay:
+            # The relay forgets subscribers it has not heard from in EXPIRE_AFTER
+            self.light.scheduler.every("subscribe", REPUBLISH_INTERVAL, self.request, backoff=False, first=0)
+        else:
+            self.light.loop.call_soon_threadsafe(self.request)
+        logging.info(f"Subscribed to {', '.join(sorted(self.topics)) or 'every topic'} on {self.destination[0]}:{self.destination[1]}")
+
+    def stop(self):
+        self.light.scheduler.cancel("subscribe")
+        self.light.loop.call_soon_threadsafe(self.close)
+
+    def request(self):
+        """Ask for the last state of each topic; the answer is the replay late joiners get."""
+        for topic in self.topics or ("",):
+            self.send(encode_request(topic))
+
+    def message_received(self, message, address):
+        if message.kind != KIND_STATE or (self.topics and message.topic not in self.topics):
+            return
+        key = (message.epoch, message.sequence)
+        last = self.last.get(message.topic)
+        if last is not None and key <= last:
+            self.dropped += 1
+            metrics.remote_dropped.inc(message.topic)
+            return
+        if last is not None and last[0] == message.epoch and message.sequence > last[1] + 1:
+            self.lost += message.sequence - last[1] - 1
+            metrics.remote_lost.inc(message.topic, message.sequence - last[1] - 1)
+        self.last[message.topic] = key
+        self.applied += 1
+        metrics.remote_states.inc(message.topic)
+        color = ",".join(str(value) for value in message.rgb)
+        priority = self.priority if message.busy else REMOTE_IDLE_PRIORITY
+        self.light.set_source(REMOTE_SOURCE_PREFIX + message.topic, color, priority, EXPIRE_AFTER)
+
+
+class Relay(asyncio.DatagramProtocol):
+    """Retain the last state of each topic and forward states to the subscribers of their topic."""
+
+    def __init__(self, host=ANY_INTERFACE, port=RELAY_PORT):
+        self.host = host
+        self.port = port
+        self.retained = {}  # topic -> ((epoch, sequence), datagram)
+        self.subscribers = {}  # address -> {topic ("" for all): expires at, loop time}
+        self.forwarded = 0
+        self.transport = None
+        self._loop = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self.transport, _ = await self._loop.create_datagram_endpoint(lambda: self, sock=_unicast_socket(self.host, self.port))
+        logging.info(f"Relay listening on {self.host}:{self.port}")
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def datagram_received(self, data, address):
+        try:
+            message = decode(data)
+        except (ValueError, UnicodeDecodeError):
+            return
+        now = self._loop.time()
+        if message.kind == KIND_REQUEST:
+            self.subscribers.setdefault(address, {})[message.topic] = now + EXPIRE_AFTER
+            for topic, (_, datagram) in list(self.retained.items()):
+                if message.topic in ("", topic):
+                    self.transport.sendto(datagram, address)
+            return
+        key = (message.epoch, message.sequence)
+        retained = self.retained.get(message.topic)
+        if retained is not None and key <= retained[0]:
+            return  # A duplicate, or older than the retained state
+        self.retained[message.topic] = (key, data)
+        for subscriber, topics in list(self.subscribers.items()):
+            for topic, expires_at in list(topics.items()):
+                if expires_at <= now:
+                    del topics[topic]
+            if not topics:
+                del self.subscribers[subscriber]
+            elif "" in topics or message.topic in topics:
+                self.transport.sendto(data, subscriber)
+                self.forwarded += 1
+
+
+def run_relay(host=ANY_INTERFACE, port=RELAY_PORT):
+    """Run a relay until interrupted."""
+    async def serve():
+        relay = Relay(host, port)
+        await relay.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            relay.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,333 @@
+"""Command line entry point: python -m busylight <command>.
+
+Each command imports only what it needs: set-color and status against a
+running daemon load nothing beyond the socket client, and no mode imports
+tkinter, PIL or pywin32 unless it opens a window.
+"""
+import argparse
+import os
+import sys
+
+CLI_SOURCE = "cli"
+
+
+def _address(args):
+    from busylight.client import DEFAULT_ADDRESS
+
+    return args.socket or DEFAULT_ADDRESS
+
+
+def _transports(args):
+    transports = []
+    if args.serial:
+        from busylight.serial_transport import SerialTransport
+
+        if args.serial == "auto":
+            from busylight.daemon import load_settings
+            from busylight.usb_ports import UsbMatch, UsbPortManager
+
+            match = UsbMatch.from_settings(load_settings().get("usb_match", {}))
+            transports.append(SerialTransport(manager=UsbPortManager(match)))
+        else:
+            transports.append(SerialTransport(args.serial))
+    if args.ble is not None:
+        from busylight.ble_transport import BleTransport
+        from busylight.daemon import load_settings
+
+        settings = load_settings()
+        transports.append(
+            BleTransport(
+                args.ble or settings.get("bluetooth_filter", "busy_light_"),
+                address=settings.get("last_device_address"),
+                binary=settings.get("binary_frames", False),
+                acks=settings.get("ble_acks", False),
+                pixel_frames=settings.get("pixel_frames", False),
+                idle_timeout=settings.get("device_idle_timeout"),
+            )
+        )
+    return transports
+
+
+def _set_color_directly(args, color):
+    """No daemon is running: open the light(s) just long enough to write one color. Fails unless every light took it."""
+    from busylight.core import BusyLight
+    from busylight.transport import validate_color
+
+    try:
+        color = validate_color(color)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    transports = _transports(args)
+    if not transports:
+        print("No daemon is running; pass --serial or --ble to set the light directly.", file=sys.stderr)
+        return 1
+    light = BusyLight(idle_color=color)
+    for transport in transports:
+        light.add_device(transport)
+    light.submit(light.connect()).result()  # Connecting writes the color
+    failed = [device.name for device in light.devices if device.last_color_sent != color]
+    light.submit(light.disconnect()).result()
+    if failed:
+        print(f"Could not set the color on {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_set_color(args):
+    from busylight.client import request
+
+    message = {"source": args.source, "color": args.color, "priority": args.priority}
+    if args.ttl is not None:
+        message["ttl"] = args.ttl
+    try:
+        reply = request(message, _address(args))
+    except OSError:
+        return _set_color_directly(args, args.color)
+    if not reply.get("ok"):
+        print(reply.get("error"), file=sys.stderr)
+        return 1
+    print(reply["color"])
+    return 0
+
+
+def cmd_clear(args):
+    from busylight.client import request
+
+    try:
+        reply = request({"source": args.source, "clear": True}, _address(args))
+    except OSError as e:
+        print(f"Daemon not reachable: {e}", file=sys.stderr)
+        return 1
+    if not reply.get("ok"):
+        print(reply.get("error"), file=sys.stderr)
+        return 1
+    print(reply["color"])
+    return 0
+
+
+def cmd_status(args):
+    import json
+
+    from busylight.client import request
+
+    try:
+        reply = request({"command": "status"}, _address(args))
+    except OSError as e:
+        print(f"Daemon not reachable: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(reply, indent=2))
+    return 0
+
+
+def cmd_reload(args):
+    from busylight.client import request
+
+    try:
+        reply = request({"command": "reload"}, _address(args))
+    except OSError as e:
+        print(f"Daemon not reachable: {e}", file=sys.stderr)
+        return 1
+    if not reply.get("ok"):
+        print(reply.get("error"), file=sys.stderr)
+        return 1
+    print(reply["color"])
+    return 0
+
+
+def cmd_effect(args):
+    from busylight.client import request
+
+    message = {"effect": args.name}
+    if args.color:
+        message["color"] = args.color
+    if args.duration is not None:
+        message["duration"] = args.duration
+    if args.fps is not None:
+        message["fps"] = args.fps
+    try:
+        reply = request(message, _address(args))
+    except OSError as e:
+        print(f"Daemon not reachable: {e}", file=sys.stderr)
+        return 1
+    if not reply.get("ok"):
+        print(reply.get("error"), file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_metrics(args):
+    from busylight.client import request
+
+    try:
+        reply = request({"command": "metrics"}, _address(args))
+    except OSError as e:
+        print(f"Daemon not reachable: {e}", file=sys.stderr)
+        return 1
+    sys.stdout.write(reply["metrics"])
+    return 0
+
+
+def cmd_run(args):
+    if args.headless:
+        from busylight.daemon import AlreadyRunning, run_daemon
+        from busylight.logs import setup_logging
+
+        setup_logging()
+        transports = _transports(args)
+        if not transports:
+            print("Choose at least one of --serial or --ble.", file=sys.stderr)
+            return 1
+        try:
+            run_daemon(transports, _address(args), metrics_port=args.metrics_port, metrics_file=args.metrics_file, record=args.record,
+                       publish=args.publish, calendar=args.calendar)
+        except AlreadyRunning as e:
+            print(e, file=sys.stderr)
+            return 1
+        return 0
+
+    import runpy
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if args.gui == "usb":
+        script = os.path.join(root, "usb_version", "busy_light_usb_windows.py")
+    else:
+        script = os.path.join(root, "bluetooth_version", "busy_light_bluetooth_windows.py")
+    runpy.run_path(script, run_name="__main__")
+    return 0
+
+
+def cmd_calendar(args):
+    import datetime
+
+    from busylight.meetings import Calendar
+
+    calendar = Calendar(args.file, args.days)
+    if not calendar.refresh():
+        print(f"Cannot read {args.file}", file=sys.stderr)
+        return 1
+    busy, change = calendar.state()
+    print(f"meetings in the next {args.days} days: {calendar.instances}")
+    print(f"busy now: {'yes' if busy else 'no'}")
+    if change is not None:
+        print(f"{'free' if busy else 'busy'} from: {datetime.datetime.fromtimestamp(change):%a %Y-%m-%d %H:%M}")
+    return 0
+
+
+def cmd_subscribe(args):
+    from busylight.daemon import AlreadyRunning, run_daemon
+    from busylight.logs import setup_logging
+
+    setup_logging()
+    transports = _transports(args)
+    if not transports:
+        print("Choose at least one of --serial or --ble.", file=sys.stderr)
+        return 1
+    try:
+        run_daemon(transports, _address(args), monitor=False, subscribe=args.topics)
+    except AlreadyRunning as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_relay(args):
+    from busylight.broadcast import ANY_INTERFACE, RELAY_PORT, run_relay
+    from busylight.logs import setup_logging
+
+    setup_logging()
+    run_relay(args.host or ANY_INTERFACE, args.port or RELAY_PORT)
+    return 0
+
+
+def cmd_replay(args):
+    from busylight.debounce import DEFAULT_DEBOUNCE
+    from busylight.replay import Replayer
+
+    result = Replayer(args.trace, mode="poll" if args.poll else "notify", debounce=DEFAULT_DEBOUNCE if args.debounce else None).run()
+
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.0f} ms"
+
+    print(f"{result.name}: {result.duration / 3600:.2f} simulated hours replayed in {result.wall:.2f} s")
+    print(f"state changes: {result.changes}, shown: {len(result.latencies)}, hidden: {result.hidden}")
+    print(f"writes: {result.writes} ({result.writes_per_hour:.1f}/h), recorded: {result.recorded_writes}")
+    print(f"detect latency p50: {ms(result.latency(0.5))}, p95: {ms(result.latency(0.95))}")
+    print(f"scans: {result.scans}, CPU per simulated hour: {result.cpu_per_hour * 1000:.1f} ms")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="busylight", description="Control the busy light.")
+    parser.add_argument("--socket", help="daemon socket path")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_transport_options(command):
+        command.add_argument("--serial", nargs="?", const="auto", metavar="PORT", help="USB light (found by USB ID and reopened when replugged if the port is omitted)")
+        command.add_argument("--ble", nargs="?", const="", metavar="FILTER", help="Bluetooth light")
+
+    set_color = commands.add_parser("set-color", help="post a color to the daemon (or straight to a light)")
+    set_color.add_argument("color", help='"r,g,b"')
+    set_color.add_argument("--source", default=CLI_SOURCE)
+    set_color.add_argument("--priority", type=int, default=100)
+    set_color.add_argument("--ttl", type=float, help="seconds until the color expires")
+    add_transport_options(set_color)
+    set_color.set_defaults(func=cmd_set_color)
+
+    clear = commands.add_parser("clear", help="remove a source's color")
+    clear.add_argument("--source", default=CLI_SOURCE)
+    clear.set_defaults(func=cmd_clear)
+
+    status = commands.add_parser("status", help="show the daemon's state")
+    status.set_defaults(func=cmd_status)
+
+    reload = commands.add_parser("reload", help="make the daemon re-read its settings (colors, ignored apps, app rules)")
+    reload.set_defaults(func=cmd_reload)
+
+    effect = commands.add_parser("effect", help="play an LED effect on the daemon's lights (or stop one)")
+    effect.add_argument("name", choices=["breathe", "blink", "countdown", "solid", "stop"])
+    effect.add_argument("--color", help='"r,g,b" (default: the current color)')
+    effect.add_argument("--duration", type=float, help="seconds to play (countdown length for countdown)")
+    effect.add_argument("--fps", type=int)
+    effect.set_defaults(func=cmd_effect)
+
+    metrics = commands.add_parser("metrics", help="print the daemon's latency metrics (Prometheus text)")
+    metrics.set_defaults(func=cmd_metrics)
+
+    run = commands.add_parser("run", help="run the daemon (--headless) or a GUI")
+    run.add_argument("--headless", action="store_true", help="no window or tray icon")
+    run.add_argument("--gui", choices=["usb", "ble"], default="ble")
+    run.add_argument("--metrics-port", type=int, metavar="PORT", help="serve Prometheus metrics over HTTP on localhost (headless)")
+    run.add_argument("--metrics-file", metavar="PATH", help="keep a Prometheus textfile up to date (headless)")
+    run.add_argument("--record", metavar="TRACE", help="record the ConsentStore and device I/O to a trace file, .gz to compress (headless)")
+    run.add_argument("--calendar", metavar="ICS", help="also busy during the meetings in this calendar export (headless)")
+    run.add_argument("--publish", metavar="TOPIC", help="broadcast the state to subscribers on the network under TOPIC (headless)")
+    add_transport_options(run)
+    run.set_defaults(func=cmd_run)
+
+    calendar = commands.add_parser("calendar", help="show what a calendar export makes the light do now")
+    calendar.add_argument("file", help=".ics file")
+    calendar.add_argument("--days", type=int, default=14, help="days ahead to expand recurring meetings")
+    calendar.set_defaults(func=cmd_calendar)
+
+    subscribe = commands.add_parser("subscribe", help="drive the lights on this machine from states published on the network")
+    subscribe.add_argument("topics", nargs="*", metavar="TOPIC", help="topics to follow (default: all); busy if any of them is")
+    add_transport_options(subscribe)
+    subscribe.set_defaults(func=cmd_subscribe)
+
+    relay = commands.add_parser("relay", help="forward published states to subscribers where multicast does not get through")
+    relay.add_argument("--host", help="address to listen on (default: all)")
+    relay.add_argument("--port", type=int, help="UDP port (default: 47822)")
+    relay.set_defaults(func=cmd_relay)
+
+    replay = commands.add_parser("replay", help="replay a recorded trace on a virtual clock and report latency, writes and CPU")
+    replay.add_argument("trace")
+    replay.add_argument("--poll", action="store_true", help="poll every few seconds instead of scanning on registry notifications")
+    replay.add_argument("--debounce", action="store_true", help="hold back blips with the default debounce")
+    replay.set_defaults(func=cmd_replay)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,25 @@
+"""Client side of the daemon status API. Kept free of heavy imports so it starts fast."""
+import json
+import os
+import socket
+import sys
+
+if sys.platform == "win32":
+    # The Proactor event loop has no Unix socket server
+    DEFAULT_ADDRESS = ("127.0.0.1", 47820)
+else:
+    DEFAULT_ADDRESS = os.path.expanduser("~/.busylight.sock")
+
+
+def request(message, address=DEFAULT_ADDRESS, timeout=5):
+    """Send one request to a running daemon and return its reply."""
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    with sock:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        sock.sendall(json.dumps(message).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            return json.loads(f.readline())
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import threading
+import time
+
+from busylight.debounce import StateFilter
+from busylight.detector import MicrophoneDetector, default_backend
+from busylight.devices import Device, DeviceRegistry
+from busylight.rules import RuleTable
+from busylight.scheduler import Scheduler
+from busylight.scanner import DEFAULT_CAPABILITIES
+from busylight.status import DEFAULT_SOURCE_PRIORITY, IDLE_SOURCE_PRIORITY, MIC_PRIORITY, StatusMerger
+
+DEFAULT_MIC_COLOR = "255,0,0"  # Red for mic in use
+DEFAULT_IDLE_COLOR = "0,255,0"  # Green for mic idle
+
+main_loop = None
+
+
+def get_event_loop():
+    """Return the shared asyncio loop, starting its thread on first use."""
+    global main_loop
+    if main_loop is None:
+        main_loop = asyncio.new_event_loop()
+        threading.Thread(target=main_loop.run_forever, daemon=True).start()
+    return main_loop
+
+
+class BusyLight:
+    """Microphone state and the registry of lights it drives, shared by every front-end.
+
+    Front-ends call the plain methods from the Tk thread or the detector
+    thread; the transport I/O itself always runs on the shared event loop.
+    Periodic work (detector polls, heartbeats, link checks) shares one
+    coalescing scheduler on that loop.
+    """
+
+    def __init__(self, transport=None, mic_color=DEFAULT_MIC_COLOR, idle_color=DEFAULT_IDLE_COLOR, resend_interval=None, auto_reconnect=False, loop=None):
+        self.mic_color = mic_color
+        self.idle_color = idle_color
+        self.resend_interval = resend_interval  # Re-send an unchanged color after this many seconds
+        self.auto_reconnect = auto_reconnect
+        self.debounce = None  # StateFilter settings ({"grace", "min_on", "min_off"}); None reports every change
+        self.ignore_apps = []  # ConsentStore app patterns that never count as using the microphone
+        self.capabilities = list(DEFAULT_CAPABILITIES)  # ConsentStore capabilities that count as busy, in order of precedence
+        self.capability_colors = {}  # capability -> color shown instead of mic_color while it is in use
+        self.app_rules = []  # Per-app color and ignore rules (see busylight.rules)
+        self.rules = RuleTable()  # app_rules and capability_colors compiled by set_rules()
+        self._loop = loop
+        self.scheduler = Scheduler(loop)
+        self.lock = threading.Lock()
+        self.mic_in_use = False
+        self.presence = ()  # The Presence entries behind mic_in_use, from detectors that report them
+        self.sources = StatusMerger()  # Colors posted by other status producers (daemon clients)
+        self.detector = None
+        self.devices = DeviceRegistry()
+        self.listeners = []  # Called with no arguments, from any thread, after a state change
+        self.on_link_lost = None  # Called with a reason string when a link drops
+        if transport is not None:
+            self.add_device(transport)
+
+    @property
+    def loop(self):
+        """The event loop the transports run on. The shared loop thread starts on first use."""
+        if self._loop is None:
+            self._loop = get_event_loop()
+        return self._loop
+
+    @property
+    def connected(self):
+        return self.devices.connected
+
+    @property
+    def monitoring(self):
+        return self.detector is not None
+
+    @property
+    def busy_color(self):
+        """The color the app rules and capability colors pick for the presence, else mic_color."""
+        return self.rules.resolve(self.presence)[0] or self.mic_color
+
+    @property
+    def busy_app(self):
+        """The Presence entry whose rule picked busy_color, or None."""
+        return self.rules.resolve(self.presence)[1]
+
+    @property
+    def ignore_patterns(self):
+        """ignore_apps plus the app rules' ignore patterns, for the scanner."""
+        return [*self.ignore_apps, *self.rules.ignore]
+
+    @property
+    def current_color(self):
+        top = self.sources.resolve()
+        if self.mic_in_use and (top is None or top[0] < MIC_PRIORITY):
+            return self.busy_color
+        if top is not None:
+            return top[2]
+        return self.idle_color
+
+    @property
+    def busy(self):
+        """Whether the merged state is busy: the microphone is in use, or a source above IDLE_SOURCE_PRIORITY is posted."""
+        top = self.sources.resolve()
+        return self.mic_in_use or (top is not None and top[0] > IDLE_SOURCE_PRIORITY)
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def notify(self):
+        for listener in self.listeners:
+            try:
+                listener()
+            except Exception as e:
+                logging.error(f"Status listener failed: {e}")
+
+    # Microphone state
+
+    def set_mic_in_use(self, in_use):
+        """Take a detector result: a bool, or a presence tuple from the ConsentStore scanner."""
+        with self.lock:
+            self.mic_in_use = bool(in_use)
+            self.presence = in_use if isinstance(in_use, tuple) else ()
+            color = self.current_color
+        self._push(color)
+        self.notify()
+
+    def set_colors(self, mic_color=None, idle_color=None):
+        with self.lock:
+            self.mic_color = mic_color or self.mic_color
+            self.idle_color = idle_color or self.idle_color
+            color = self.current_color
+        self._push(color)
+        self.notify()
+
+    def set_rules(self, app_rules=None, capability_colors=None):
+        """Compile new app rules (and capability colors) and apply them without restarting monitoring.
+
+        Raises ValueError for a malformed rule and keeps the old table.
+        """
+        app_rules = self.app_rules if app_rules is None else app_rules
+        capability_colors = self.capability_colors if capability_colors is None else capability_colors
+        rules = RuleTable(app_rules, capability_colors, self.capabilities)
+        with self.lock:
+            self.app_rules = app_rules
+            self.capability_colors = capability_colors
+            self.rules = rules
+            color = self.current_color
+        detector = self.detector
+        scanner = getattr(detector.backend, "scanner", None) if detector else None
+        if scanner is not None:
+            scanner.set_ignore(self.ignore_patterns)
+            detector.backend.wake()  # Rescan, so a newly ignored app stops counting as busy
+        self._push(color)
+        self.notify()
+
+    def set_source(self, name, color, priority=DEFAULT_SOURCE_PRIORITY, ttl=None):
+        """Post a color from another status producer. It expires after ttl seconds if given."""
+        with self.lock:
+            self.sources.set(name, color, priority, ttl)
+            color = self.current_color
+        self._push(color)
+        if ttl is not None:
+            self.loop.call_soon_threadsafe(self.loop.call_later, ttl, self.refresh)
+        self.notify()
+
+    def clear_source(self, name):
+        with self.lock:
+            if not self.sources.clear(name):
+                return
+            color = self.current_color
+        self._push(color)
+        self.notify()
+
+    def refresh(self):
+        """Re-resolve the color, e.g. after a source expired."""
+        with self.lock:
+            color = self.current_color
+        self._push(color)
+        self.notify()
+
+    def play_effect(self, effect, fps=None, duration=None):
+        """Stream a busylight.effects effect to every light. Returns a future for the players."""
+        return self.submit(self.devices.play_effect(effect, fps, duration))
+
+    def stop_effect(self):
+        self.loop.call_soon_threadsafe(self.devices.stop_effect)
+
+    def start_monitoring(self, backend=None):
+        if self.detector is None:
+            state_filter = StateFilter.from_settings(self.debounce) if self.debounce is not None else None
+            self.detector = MicrophoneDetector(backend or default_backend(self.ignore_patterns, self.capabilities), self.set_mic_in_use, state_filter=state_filter)
+            self.detector.start(self.scheduler)
+            self.notify()
+
+    def stop_monitoring(self):
+        if self.detector is not None:
+            self.detector.stop()
+            self.detector = None
+            self.notify()
+
+    # Devices
+
+    def add_device(self, transport, name=None):
+        """Register another light. Every device gets its own dedup and link state."""
+        device = Device(transport, name, resend_interval=self.resend_interval, auto_reconnect=self.auto_reconnect, scheduler=self.scheduler)
+        device.color = self.current_color
+        device.on_change = self.notify
+        device.on_link_lost = lambda reason: self._link_lost(device, reason)
+        return self.devices.add(device)
+
+    def _link_lost(self, device, reason):
+        if self.on_link_lost:
+            self.on_link_lost(reason if len(self.devices) == 1 else f"{device.name}: {reason}")
+
+    def _push(self, color):
+        self.loop.call_soon_threadsafe(self.devices.set_color, color, False, time.perf_counter())
+
+    @property
+    def device(self):
+        """The first registered device, for front-ends that drive a single light."""
+        return next(iter(self.devices), None)
+
+    @property
+    def transport(self):
+        return self.device.transport
+
+    @property
+    def last_color_sent(self):
+        return self.device.last_color_sent
+
+    @property
+    def time_to_first_color(self):
+        return self.device.time_to_first_color
+
+    async def connect(self):
+        connected = await self.devices.connect_all()
+        self.notify()
+        return connected
+
+    async def disconnect(self):
+        await self.devices.disconnect_all()
+        self.notify()
@@ -0,0 +1,275 @@
+"""Headless busy light daemon.
+
+Runs the microphone detector and the transports without Tk, and lets other
+programs on the machine (softphone hooks, do-not-disturb scripts, CI
+notifiers) post colors over a local socket. Each request is one line of JSON:
+
+    {"source": "softphone", "color": "255,0,0", "priority": 100, "ttl": 600}
+    {"source": "softphone", "clear": true}
+    {"command": "status"}
+    {"command": "metrics"}
+    {"command": "reload"}
+    {"effect": "breathe", "color": "255,0,0", "duration": 60, "options": {"period": 3}}
+    {"effect": "stop"}
+
+and gets one line of JSON back. Sources are merged by priority (see
+busylight.status); the microphone detector takes part as MIC_PRIORITY.
+reload re-reads the settings file and applies the colors, ignored apps and
+app rules (see busylight.rules) while monitoring keeps running.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+
+from busylight import metrics
+from busylight.client import DEFAULT_ADDRESS
+from busylight.core import DEFAULT_IDLE_COLOR, DEFAULT_MIC_COLOR, BusyLight
+from busylight.debounce import DEFAULT_DEBOUNCE
+from busylight.scanner import DEFAULT_CAPABILITIES
+from busylight.status import DEFAULT_SOURCE_PRIORITY
+from busylight.transport import validate_color
+
+SETTINGS_FILE = "settings.json"
+METRICS_FILE_INTERVAL = 15  # Seconds between rewrites of the metrics file
+
+
+class AlreadyRunning(RuntimeError):
+    """Another daemon is serving the status API on the address."""
+
+
+def load_settings(path=SETTINGS_FILE):
+    """Read the settings file the Bluetooth front-end writes, if there is one."""
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def apply_rules(light, settings):
+    """Apply the settings that can change while monitoring: colors, ignored apps and app rules."""
+    light.ignore_apps = settings.get("ignore_apps", [])
+    light.set_rules(settings.get("app_rules", []), settings.get("capability_colors", {}))
+    light.set_colors(settings.get("mic_color", DEFAULT_MIC_COLOR), settings.get("idle_color", DEFAULT_IDLE_COLOR))
+
+
+class StatusServer:
+    """Serve the line-JSON status API for one BusyLight on its event loop."""
+
+    def __init__(self, light, address=DEFAULT_ADDRESS, settings_path=SETTINGS_FILE):
+        self.light = light
+        self.address = address
+        self.settings_path = settings_path
+        self.server = None
+        self.requests = 0
+
+    async def start(self):
+        """Start listening. Raises AlreadyRunning if a daemon answers on the address."""
+        if isinstance(self.address, str):
+            if os.path.exists(self.address):
+                try:
+                    _, writer = await asyncio.open_unix_connection(self.address)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    os.unlink(self.address)  # Left behind by a daemon that did not exit cleanly
+                else:
+                    writer.close()
+                    raise AlreadyRunning(f"A busy light daemon is already running on {self.address}")
+            self.server = await asyncio.start_unix_server(self._handle, path=self.address)
+            os.chmod(self.address, 0o600)
+        else:
+            host, port = self.address
+            self.server = await asyncio.start_server(self._handle, host, port)
+        logging.info(f"Status API listening on {self.address}")
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def handle_message(self, message):
+        self.requests += 1
+        if message.get("command") == "status":
+            return self.status()
+        if message.get("command") == "metrics":
+            return {"ok": True, "metrics": metrics.registry.render()}
+        if message.get("command") == "reload":
+            return self.reload()
+        if "effect" in message:
+            return self.effect(message)
+        source = message.get("source")
+        if not source:
+            return {"ok": False, "error": "missing source"}
+        if message.get("clear"):
+            self.light.clear_source(source)
+        elif "color" in message:
+            try:
+                color = validate_color(message["color"])
+            except ValueError as e:
+                return {"ok": False, "error": str(e)}
+            priority = message.get("priority", DEFAULT_SOURCE_PRIORITY)
+            if not isinstance(priority, int) or isinstance(priority, bool):
+                return {"ok": False, "error": f"Invalid priority {priority!r}; expected an integer"}
+            ttl = message.get("ttl")
+            if ttl is not None and (not isinstance(ttl, (int, float)) or isinstance(ttl, bool) or not 0 <= ttl < math.inf):
+                return {"ok": False, "error": f"Invalid ttl {ttl!r}; expected seconds, 0 or more"}
+            self.light.set_source(source, color, priority, ttl)
+        else:
+            return {"ok": False, "error": "expected color or clear"}
+        return {"ok": True, "color": self.light.current_color}
+
+    def effect(self, message):
+        if message["effect"] == "stop":
+            self.light.stop_effect()
+            return {"ok": True}
+        from busylight import effects
+
+        options = dict(message.get("options", {}))
+        if message["effect"] == "countdown" and message.get("duration"):
+            options.setdefault("duration", message["duration"])  # The bar runs out when the effect ends
+        try:
+            color = validate_color(message["color"]) if message.get("color") else self.light.current_color
+            effect = effects.create(message["effect"], color, **options)
+        except (ValueError, TypeError) as e:
+            return {"ok": False, "error": str(e)}
+        self.light.play_effect(effect, message.get("fps"), message.get("duration"))
+        return {"ok": True}
+
+    def reload(self):
+        try:
+            apply_rules(self.light, load_settings(self.settings_path))
+        except (OSError, ValueError) as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": True, "color": self.light.current_color, "rules": len(self.light.app_rules)}
+
+    def status(self):
+        top = self.light.sources.resolve()
+        busy_app = self.light.busy_app if self.light.mic_in_use else None
+        return {
+            "ok": True,
+            "color": self.light.current_color,
+            "mic_in_use": self.light.mic_in_use,
+            "presence": [{"capability": item.capability, "app": item.app} for item in self.light.presence],
+            "busy_app": busy_app.app if busy_app else None,
+            "source": top[1] if top else None,
+            "devices": {device.name: device.connected for device in self.light.devices},
+        }
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = self.handle_message(json.loads(line))
+                except (ValueError, TypeError, AttributeError) as e:
+                    response = {"ok": False, "error": str(e)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def write_metrics_file(path):
+    """Rewrite the Prometheus textfile once; run_daemon schedules it every METRICS_FILE_INTERVAL."""
+    try:
+        await asyncio.to_thread(metrics.registry.write, path)
+    except OSError as e:
+        logging.error(f"Error writing metrics file: {e}")
+
+
+def run_daemon(transports, address=DEFAULT_ADDRESS, settings=None, monitor=True, metrics_port=None, metrics_file=None, record=None,
+               settings_path=SETTINGS_FILE, publish=None, subscribe=None, calendar=None):
+    """Run until interrupted: detector, transports and the status API, no GUI.
+
+    metrics_port serves the Prometheus metrics over HTTP on localhost;
+    metrics_file rewrites them to a file every METRICS_FILE_INTERVAL seconds.
+    record is a trace file to write the ConsentStore and device I/O timeline
+    to (see busylight.trace). The reload command re-reads settings_path.
+    publish is a topic to broadcast the state under, subscribe a list of
+    topics (empty for all) whose states drive these lights; the "broadcast"
+    settings pick the group or relay (see busylight.broadcast). calendar
+    is an .ics file whose meetings make the light busy (see
+    busylight.meetings); the "calendar" settings give the lead time.
+    """
+    settings = load_settings(settings_path) if settings is None else settings
+    recorder = None
+    if record:
+        from busylight.trace import RecordingTransport, TraceRecorder
+
+        recorder = TraceRecorder(record, capabilities=settings.get("capabilities", DEFAULT_CAPABILITIES))
+        transports = [RecordingTransport(transport, recorder) for transport in transports]
+    light = BusyLight(
+        mic_color=settings.get("mic_color", DEFAULT_MIC_COLOR),
+        idle_color=settings.get("idle_color", DEFAULT_IDLE_COLOR),
+        auto_reconnect=True,
+    )
+    light.debounce = settings.get("debounce", DEFAULT_DEBOUNCE)  # The default grace delays every change by 1 s; {"grace": 0} turns that off
+    light.ignore_apps = settings.get("ignore_apps", [])
+    light.capabilities = settings.get("capabilities", light.capabilities)
+    try:
+        light.set_rules(settings.get("app_rules", []), settings.get("capability_colors", {}))
+    except ValueError as e:
+        logging.error(f"Ignoring app rules: {e}")
+    for transport in transports:
+        light.add_device(transport)
+    server = StatusServer(light, address, settings_path)
+    light.submit(server.start()).result()
+    metrics_server = light.submit(metrics.registry.serve(port=metrics_port)).result() if metrics_port else None
+    light.scheduler.watch_power()
+    endpoints = []
+    broadcast = settings.get("broadcast", {})
+    publish = publish or broadcast.get("publish")
+    if publish or subscribe is not None:
+        from busylight.broadcast import Publisher, Subscriber, broadcast_options
+
+        options = broadcast_options(broadcast)
+        if publish:
+            endpoints.append(Publisher(light, publish, **options))
+        if subscribe is not None:
+            endpoints.append(Subscriber(light, subscribe, **options))
+        for endpoint in endpoints:
+            endpoint.start()
+    watcher = None
+    calendar_settings = dict(settings.get("calendar", {}))
+    if calendar:
+        calendar_settings["path"] = calendar
+    if calendar_settings.get("path"):
+        from busylight.meetings import MeetingWatcher
+
+        watcher = MeetingWatcher.from_settings(light, calendar_settings)
+        watcher.start()
+    if metrics_file:
+        light.scheduler.every("metrics-file", METRICS_FILE_INTERVAL, lambda: write_metrics_file(metrics_file), first=0)
+    light.submit(light.connect())
+    if monitor:
+        backend = None
+        if recorder:
+            from busylight.detector import default_backend
+            from busylight.trace import RecordingBackend
+
+            backend = RecordingBackend(default_backend(light.ignore_patterns, light.capabilities), recorder)
+        light.start_monitoring(backend)
+    try:
+        light.submit(asyncio.Event().wait()).result()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        light.stop_monitoring()
+        if watcher:
+            watcher.stop()
+        for endpoint in endpoints:
+            endpoint.stop()
+        light.submit(light.disconnect()).result()
+        light.submit(server.stop()).result()
+        if metrics_server:
+            light.loop.call_soon_threadsafe(metrics_server.close)
+        if recorder:
+            recorder.close()
+
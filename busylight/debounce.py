@@ -0,0 +1,83 @@
+"""Debounce and hysteresis for the microphone state.
+
+Apps grab the microphone for a fraction of a second to probe devices or
+play a join chime, then let go. Reported as-is, every blip is two writes to
+the light. StateFilter sits between the detector and the light:
+
+    grace    a raw change must last this long before it is reported
+    min_on   once busy is reported, it stays reported at least this long
+    min_off  once idle is reported, it stays reported at least this long
+
+The filter never starts a timer of its own: update() and poll() take the
+current time, and deadline says when poll() next needs to run, so the
+detector thread can fold it into the wait it already does (and a replay can
+drive it on a virtual clock).
+"""
+import time
+
+# Seconds; longer than a device probe or a join chime. Every change, idle to
+# busy included, reaches the light this much later; a grace of 0 reports it at once
+DEFAULT_GRACE = 1.0
+DEFAULT_MIN_ON = 5.0
+DEFAULT_MIN_OFF = 2.0
+DEFAULT_DEBOUNCE = {"grace": DEFAULT_GRACE, "min_on": DEFAULT_MIN_ON, "min_off": DEFAULT_MIN_OFF}
+
+
+class StateFilter:
+    """Turn raw in-use samples into debounced changes, reported through on_change(in_use)."""
+
+    def __init__(self, on_change=None, grace=DEFAULT_GRACE, min_on=DEFAULT_MIN_ON, min_off=DEFAULT_MIN_OFF, clock=time.monotonic):
+        self.on_change = on_change
+        self.grace = grace
+        self.min_on = min_on
+        self.min_off = min_off
+        self.clock = clock
+        self.raw = None
+        self.reported = None
+        self.deadline = None  # clock() time at which poll() may report a held-back change, or None
+        self.suppressed = 0  # Raw changes that were never reported
+        self._raw_since = 0
+        self._reported_since = 0
+
+    @classmethod
+    def from_settings(cls, settings, on_change=None):
+        """Build a filter from a {"grace": ..., "min_on": ..., "min_off": ...} dict; missing keys use the defaults."""
+        return cls(on_change, **{key: settings.get(key, default) for key, default in DEFAULT_DEBOUNCE.items()})
+
+    def update(self, in_use, now=None):
+        """Feed one raw sample. Returns the reported state."""
+        now = self.clock() if now is None else now
+        if in_use != self.raw:
+            if self.raw is not None and self.raw != self.reported:
+                self.suppressed += 1  # The previous raw change flipped back before it was reported
+            self.raw = in_use
+            self._raw_since = now
+        return self.poll(now)
+
+    def poll(self, now=None):
+        """Report the raw state if it has lasted long enough. Returns the reported state."""
+        now = self.clock() if now is None else now
+        if self.raw == self.reported or self.raw is None:
+            self.deadline = None
+            return self.reported
+        if self.reported is None:
+            ready_at = now  # The first sample is reported straight away
+        else:
+            dwell = self.min_on if self.reported else self.min_off
+            ready_at = max(self._raw_since + self.grace, self._reported_since + dwell)
+        if now < ready_at:
+            self.deadline = ready_at
+            return self.reported
+        self.deadline = None
+        self.reported = self.raw
+        self._reported_since = now
+        if self.on_change:
+            self.on_change(self.reported)
+        return self.reported
+
+    def wait_time(self, timeout, now=None):
+        """Shorten a wait so it ends by the deadline."""
+        if self.deadline is None:
+            return timeout
+        remaining = max(0.0, self.deadline - (self.clock() if now is None else now))
+        return remaining if timeout is None else min(timeout, remaining)
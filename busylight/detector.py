@@ -0,0 +1,376 @@
+import asyncio
+import glob
+import logging
+import sys
+import threading
+import time
+
+from busylight import metrics
+from busylight.scanner import DEFAULT_CAPABILITIES, ConsentStoreScanner
+
+# Constants
+POLL_INTERVAL = 3  # Seconds between scans when no change notifications are available
+NOTIFY_FALLBACK_INTERVAL = 60  # Safety rescan interval when notifications are available
+ALSA_STATUS_GLOB = "/proc/asound/card*/pcm*c/sub*/status"
+ALSA_POLL_INTERVAL = 0.25  # The /proc status files cannot be watched, only re-read
+DETECTOR_TASK = "detector"  # Scheduler task names
+DEBOUNCE_TASK = "detector-debounce"
+FALLBACK_TASK = "detector-fallback"
+
+# RegNotifyChangeKeyValue flags
+REG_NOTIFY_CHANGE_NAME = 0x00000001
+REG_NOTIFY_CHANGE_LAST_SET = 0x00000004
+WAIT_TIMEOUT = 0x00000102
+INFINITE = 0xFFFFFFFF
+
+
+class PollingBackend:
+    """Rescan on a fixed interval. Used when change notifications are unavailable."""
+
+    notifies = False
+
+    def __init__(self, scan, interval=POLL_INTERVAL, close=None, scanner=None):
+        self._scan = scan
+        self._close = close
+        self.scanner = scanner  # The ConsentStoreScanner behind scan, if there is one
+        self.interval = interval
+        self._wake = threading.Event()
+
+    def scan(self):
+        return self._scan()
+
+    def wait_for_change(self, timeout):
+        """Sleep until the next poll. Always returns False (nothing was signalled)."""
+        self._wake.wait(min(timeout, self.interval))
+        self._wake.clear()
+        return False
+
+    def wake(self):
+        self._wake.set()
+
+    def close(self):
+        if self._close:
+            self._close()
+
+
+class RegistryNotifyBackend:
+    """Block on RegNotifyChangeKeyValue for the ConsentStore trees and rescan only on change.
+
+    One subtree watch covers a capability store and its NonPackaged key.
+    A notification rescans just the store that fired; timeouts rescan all of
+    them. Stores missing on this Windows version are not watched.
+    """
+
+    notifies = True
+
+    def __init__(self, scanner=None):
+        import ctypes
+        import winreg
+
+        self._ctypes = ctypes
+        self._advapi32 = ctypes.windll.advapi32
+        self._kernel32 = ctypes.windll.kernel32
+        self._kernel32.CreateEventW.restype = ctypes.c_void_p
+        self.scanner = scanner or ConsentStoreScanner()
+        self.keys = []
+        self._capabilities = []  # Capability whose store each watched key is
+        self._changed = None  # Capabilities to rescan, None for all
+        self._handles = []
+        self._events = []
+        try:
+            for root_key in self.scanner.keys:
+                if any(root_key.startswith(other + "\\") for other in self.scanner.keys):
+                    continue  # Inside a watched subtree already
+                try:
+                    handle = winreg.OpenKey(winreg.HKEY_CURRENT_USER, root_key, 0, winreg.KEY_NOTIFY | winreg.KEY_READ)
+                except FileNotFoundError:
+                    logging.debug(f"Not watching missing store {root_key}")
+                    continue
+                self._handles.append(handle)
+                self.keys.append(root_key)
+                self._capabilities.append(self.scanner.capability_by_key[root_key])
+                self._events.append(self._create_event())
+            if not self._handles:
+                raise OSError("No ConsentStore key to watch")
+            # The last event is never armed on a key, it is only used by wake()
+            self._wake_event = self._create_event()
+        except OSError:
+            self.close()
+            raise
+        self._armed = [False] * len(self._handles)
+
+    def _create_event(self):
+        event = self._kernel32.CreateEventW(None, False, False, None)
+        if not event:
+            raise OSError("CreateEventW failed")
+        return event
+
+    def _arm(self, index):
+        # Notifications are one-shot, so each key must be re-armed after it fires
+        result = self._advapi32.RegNotifyChangeKeyValue(
+            self._ctypes.c_void_p(int(self._handles[index])),
+            True,
+            REG_NOTIFY_CHANGE_NAME | REG_NOTIFY_CHANGE_LAST_SET,
+            self._ctypes.c_void_p(self._events[index]),
+            True,
+        )
+        if result != 0:
+            raise OSError(f"RegNotifyChangeKeyValue failed for {self.keys[index]}: {result}")
+        self._armed[index] = True
+
+    def scan(self):
+        # Arm before scanning so a change that happens during the scan is not missed
+        for index, armed in enumerate(self._armed):
+            if not armed:
+                self._arm(index)
+        changed, self._changed = self._changed, None
+        return self.scanner.scan(changed)
+
+    def wait_for_change(self, timeout):
+        """Block until a watched tree changes. Returns False on timeout or wake()."""
+        handles = (self._ctypes.c_void_p * (len(self._events) + 1))(*self._events, self._wake_event)
+        milliseconds = INFINITE if timeout is None else int(timeout * 1000)
+        result = self._kernel32.WaitForMultipleObjects(len(handles), handles, False, milliseconds)
+        if result == WAIT_TIMEOUT or result == len(self._events):
+            return False
+        if 0 <= result < len(self._events):
+            self._armed[result] = False
+            self._changed = {self._capabilities[result]}
+            return True
+        raise OSError(f"WaitForMultipleObjects failed: {result}")
+
+    def wake(self):
+        self._kernel32.SetEvent(self._ctypes.c_void_p(self._wake_event))
+
+    def close(self):
+        for handle in self._handles:
+            handle.Close()
+        for event in self._events + [getattr(self, "_wake_event", None)]:
+            if event:
+                self._kernel32.CloseHandle(self._ctypes.c_void_p(event))
+        self._handles = []
+        self._events = []
+        self._wake_event = None
+        self.scanner.close()
+
+
+def scan_alsa_capture(pattern=ALSA_STATUS_GLOB):
+    """Return True if any ALSA capture substream is open."""
+    for path in glob.glob(pattern):
+        try:
+            with open(path) as f:
+                if f.read(16).strip() != "closed":
+                    return True
+        except OSError:
+            pass
+    return False
+
+
+class AlsaBackend:
+    """Linux backend that watches the ALSA capture substream status files."""
+
+    notifies = True
+
+    def __init__(self, pattern=ALSA_STATUS_GLOB, interval=ALSA_POLL_INTERVAL):
+        self.pattern = pattern
+        self.interval = interval
+        self._last = None
+        self._wake = threading.Event()
+
+    def scan(self):
+        self._last = scan_alsa_capture(self.pattern)
+        return self._last
+
+    def wait_for_change(self, timeout):
+        """Re-read the status files until the state differs from the last scan."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._wake.is_set():
+            if scan_alsa_capture(self.pattern) != self._last:
+                return True
+            remaining = self.interval if deadline is None else min(self.interval, deadline - time.monotonic())
+            if remaining <= 0:
+                break
+            self._wake.wait(remaining)
+        self._wake.clear()
+        return False
+
+    def wake(self):
+        self._wake.set()
+
+    def close(self):
+        pass
+
+
+class FakeBackend:
+    """In-memory backend for measuring detect latency without a registry or sound card."""
+
+    notifies = True
+
+    def __init__(self, in_use=False):
+        self.in_use = in_use
+        self.changed_at = None  # time.perf_counter() of the last set_in_use call
+        self._pending = False
+        self._event = threading.Event()
+
+    def set_in_use(self, in_use):
+        self.in_use = in_use
+        self.changed_at = time.perf_counter()
+        self._pending = True
+        self._event.set()
+
+    def scan(self):
+        return self.in_use
+
+    def wait_for_change(self, timeout):
+        self._event.wait(timeout)
+        self._event.clear()
+        changed, self._pending = self._pending, False
+        return changed
+
+    def wake(self):
+        self._event.set()
+
+    def close(self):
+        pass
+
+
+def default_backend(ignore=(), capabilities=DEFAULT_CAPABILITIES):
+    """Pick the best backend for this platform, falling back to polling.
+
+    On Windows the scan reports the presence (see busylight.scanner) for
+    the given capabilities, and ignore holds ConsentStore app patterns that
+    never count as present. Elsewhere it is just whether the microphone is
+    in use.
+    """
+    if sys.platform == "win32":
+        scanner = ConsentStoreScanner(capabilities, ignore=ignore)
+        try:
+            return RegistryNotifyBackend(scanner)
+        except (OSError, AttributeError) as e:
+            logging.error(f"Registry change notifications unavailable, polling instead: {e}")
+            return PollingBackend(scanner.scan, close=scanner.close, scanner=scanner)
+    if sys.platform.startswith("linux"):
+        return AlsaBackend()
+    return PollingBackend(lambda: False)
+
+
+class MicrophoneDetector:
+    """Run a backend and report microphone state changes to a callback.
+
+    With a state_filter (busylight.debounce.StateFilter) the raw changes go
+    through it, and the wait for the next change is cut short whenever the
+    filter has a held-back change due.
+
+    Started with a scheduler (busylight.scheduler.Scheduler), backends that
+    poll (those with an interval) are scanned by a scheduler task, in a
+    worker thread so the loop keeps serving the lights, instead of a thread
+    of their own, and backends that block on change notifications
+    keep their thread but leave the fallback rescan to the scheduler.
+    """
+
+    def __init__(self, backend, on_change, fallback_interval=None, state_filter=None):
+        self.backend = backend
+        self.on_change = on_change
+        if fallback_interval is None:
+            fallback_interval = NOTIFY_FALLBACK_INTERVAL if backend.notifies else POLL_INTERVAL
+        self.fallback_interval = fallback_interval
+        self.state_filter = state_filter
+        if state_filter is not None:
+            state_filter.on_change = on_change
+        self.in_use = None
+        self.scheduler = None
+        self._running = False
+        self._thread = None
+        self._scheduled_fallback = False
+        self._scanning = False  # A scheduled scan is running in a worker thread
+
+    def _rescan(self):
+        started_at = time.perf_counter()
+        try:
+            in_use = self.backend.scan()
+        except OSError as e:
+            logging.error(f"Error scanning microphone usage: {e}")
+            return
+        metrics.scan_seconds.observe(time.perf_counter() - started_at)
+        logging.debug(f"Microphone status: {'In Use' if in_use else 'Not in Use'}")
+        if in_use != self.in_use:
+            self.in_use = in_use
+            metrics.detector_changes.inc()
+            if self.state_filter is not None:
+                self.state_filter.update(in_use)
+            else:
+                self.on_change(in_use)
+        elif self.state_filter is not None:
+            self.state_filter.poll()
+
+    def run(self):
+        """Scan once, then rescan whenever the backend signals a change or the fallback interval passes. start() sets _running first."""
+        try:
+            while self._running:
+                self._rescan()
+                timeout = None if self._scheduled_fallback else self.fallback_interval
+                if self.state_filter is not None:
+                    timeout = self.state_filter.wait_time(timeout)
+                try:
+                    self.backend.wait_for_change(timeout)
+                except OSError as e:
+                    logging.error(f"Change notification failed, polling instead: {e}")
+                    scanner = self.backend.scanner
+                    self.backend.close()
+                    self.backend = PollingBackend(scanner.scan, close=scanner.close, scanner=scanner)
+                    self.fallback_interval = POLL_INTERVAL
+                    if self._scheduled_fallback:
+                        self.scheduler.cancel(FALLBACK_TASK)
+                        self._scheduled_fallback = False
+        finally:
+            self.backend.close()
+
+    async def _tick(self):
+        """Scheduled scan, in a worker thread so a slow scan does not hold up the loop; also schedules the next one the debounce needs."""
+        if not self._running or self._scanning:
+            return  # A tick that comes due while the last scan still runs is skipped
+        self._scanning = True
+        try:
+            await asyncio.to_thread(self._rescan)
+        finally:
+            self._scanning = False
+            if not self._running:
+                self.backend.close()  # stop() came during the scan and left the close to it
+        if not self._running:
+            return
+        if self.state_filter is not None:
+            wait = self.state_filter.wait_time(None)
+            if wait is not None:
+                self.scheduler.after(DEBOUNCE_TASK, wait, self._tick)
+
+    def start(self, scheduler=None):
+        self.scheduler = scheduler
+        interval = getattr(self.backend, "interval", None)
+        if scheduler is not None and interval is not None:
+            self._running = True
+            scheduler.every(DETECTOR_TASK, interval, self._tick, first=0)
+            return
+        if scheduler is not None:
+            self._scheduled_fallback = True
+            scheduler.every(FALLBACK_TASK, self.fallback_interval, self.backend.wake)
+        self._running = True  # Here, not in run(): a stop() right after start() must not be undone by the new thread
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def _close_polled(self):
+        """Close a scheduler-polled backend, unless a scan is running; _tick closes it when that scan ends."""
+        if not self._scanning:
+            self.backend.close()
+
+    def stop(self):
+        self._running = False
+        if self.scheduler is not None:
+            for name in (DETECTOR_TASK, DEBOUNCE_TASK, FALLBACK_TASK):
+                self.scheduler.cancel(name)
+        if self._thread is None:
+            if self.scheduler is not None:
+                self.scheduler.loop.call_soon_threadsafe(self._close_polled)
+            return
+        self.backend.wake()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
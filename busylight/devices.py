@@ -0,0 +1,311 @@
+import asyncio
+import logging
+import random
+import time
+
+from busylight import metrics
+
+RECONNECT_MIN_DELAY = 0.5  # First reconnect backoff in seconds
+RECONNECT_MAX_DELAY = 30
+HEARTBEAT_RETRY_DELAY = 5  # Seconds before retrying a heartbeat that failed
+HEARTBEAT_SLACK = 0.25  # Fraction of the heartbeat interval a scheduled heartbeat may go out early
+
+
+class Device:
+    """One busy light: a transport plus the color it should show and the dedup state for it.
+
+    All methods run on the event loop. set_color() never waits for the
+    transport: a single sender task per device writes the latest requested
+    color, so a slow or dead device only ever delays itself.
+
+    With a scheduler (busylight.scheduler.Scheduler) the heartbeat, and the
+    link check of transports that can only poll is_connected, are tasks on
+    it instead of a sleeping loop each.
+    """
+
+    def __init__(self, transport, name=None, resend_interval=None, auto_reconnect=False, clock=time.time, scheduler=None):
+        self.transport = transport
+        self.name = name or transport.name
+        self.resend_interval = resend_interval  # Re-send an unchanged color after this many seconds, unless the transport knows better
+        self.auto_reconnect = auto_reconnect
+        self.clock = clock  # For heartbeat timing; a replay swaps in its virtual clock
+        self.scheduler = scheduler
+        self.color = None  # The color this device should be showing
+        self.last_color_sent = None
+        self.time_last_sent = 0
+        self.time_to_first_color = {}  # "startup"/"reconnect" -> seconds until the first color was written
+        self.on_change = None  # Called with no arguments after the link state changes
+        self.on_link_lost = None  # Called with a reason string when the link drops
+        self._first_color_pending = None  # (kind, time.perf_counter() when the wait started)
+        self._queued_at = None  # time.perf_counter() when the color waiting to be sent was requested
+        self._disconnecting = False
+        self._sender = None
+        self._heartbeat = None
+        self._waiting = None  # reconnect() waiting for a hotplug device that was absent at connect()
+        self.effect = None  # busylight.effects.EffectPlayer while an effect owns the light
+
+    @property
+    def connected(self):
+        return self.transport.is_connected
+
+    @property
+    def heartbeat_interval(self):
+        """How often an unchanged color is re-sent: the device's own timeout if the transport learned it."""
+        return self.transport.heartbeat_interval or self.resend_interval
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+    def set_color(self, color, force=False, queued_at=None):
+        """Make the device show color. Returns the sender task.
+
+        queued_at is the time.perf_counter() of the state change that asked
+        for it, when that happened on another thread.
+        """
+        if color != self.color or self._queued_at is None:
+            self._queued_at = queued_at or time.perf_counter()
+        self.color = color
+        if force:
+            self.last_color_sent = None
+        if self._sender is None or self._sender.done():
+            self._sender = asyncio.ensure_future(self._flush())
+        return self._sender
+
+    async def _flush(self):
+        while True:
+            color = self.color
+            await self.send_color(color)
+            if self.color == color:
+                return
+
+    async def send_color(self, color, force=False):
+        """Send a color unless it matches the last one sent. Returns True if it was written."""
+        if color is None or not self.transport.is_connected:
+            self._queued_at = None  # Time spent disconnected is not queue time
+            return False
+        if self.effect is not None:
+            return False  # The color is shown once the effect ends
+        current_time = self.clock()
+        interval = self.heartbeat_interval
+        resend_due = interval is not None and (current_time - self.time_last_sent) >= interval
+        if color == self.last_color_sent and not force and not resend_due:
+            logging.debug(f"{self.name}: command not sent as it matches the last sent color.")
+            metrics.writes_suppressed.inc(self.name)
+            self._queued_at = None
+            return False
+        started_at = time.perf_counter()
+        if self._queued_at is not None:
+            metrics.queue_seconds.observe(started_at - self._queued_at, self.name)
+            self._queued_at = None
+        try:
+            await self.transport.send(color)
+        except Exception as e:
+            logging.error(f"{self.name}: error sending color: {e}")
+            metrics.write_errors.inc(self.name)
+            return False
+        metrics.write_seconds.observe(time.perf_counter() - started_at, self.name)
+        metrics.writes.inc(self.name)
+        logging.debug(f"{self.name}: sent color {color}")
+        self.last_color_sent = color
+        self.time_last_sent = current_time
+        if self._first_color_pending:
+            kind, since = self._first_color_pending
+            self._first_color_pending = None
+            self.time_to_first_color[kind] = time.perf_counter() - since
+            logging.info(f"{self.name}: time to first color ({kind}): {self.time_to_first_color[kind] * 1000:.0f} ms")
+        return True
+
+    async def _open_link(self):
+        if not await self.transport.connect():
+            return False
+        # The device does not remember what it showed before, so always resend
+        self.last_color_sent = None
+        await self.send_color(self.color)
+        if self.scheduler is not None:
+            if self.transport.link_check_interval is not None:
+                self.scheduler.every(self._task_name("link"), self.transport.link_check_interval, self._check_link)
+            else:
+                asyncio.ensure_future(self.monitor_link())
+            self._schedule_heartbeat()
+        else:
+            asyncio.ensure_future(self.monitor_link())
+            if self._heartbeat is None or self._heartbeat.done():
+                self._heartbeat = asyncio.ensure_future(self.keep_alive())
+        self._changed()
+        return True
+
+    def _task_name(self, kind):
+        return f"{kind}:{self.name}"
+
+    def _schedule_heartbeat(self, delay=None):
+        interval = self.heartbeat_interval
+        if interval is None:
+            return
+        if delay is None:
+            delay = max(0.0, self.time_last_sent + interval - self.clock())
+        self.scheduler.every(self._task_name("heartbeat"), interval, self._heartbeat_due, slack=interval * HEARTBEAT_SLACK, backoff=False, first=delay)
+
+    def _heartbeat_due(self):
+        """Scheduled heartbeat: re-send the color unless something was written recently enough."""
+        interval = self.heartbeat_interval
+        if interval is None or self._disconnecting or not self.transport.is_connected:
+            self.scheduler.cancel(self._task_name("heartbeat"))
+            return None
+        wait = self.time_last_sent + interval - self.clock()
+        if wait > interval * HEARTBEAT_SLACK or self.effect is not None:
+            self._schedule_heartbeat(wait if self.effect is None else interval)
+            return None
+        return self._send_heartbeat()
+
+    async def _send_heartbeat(self):
+        if not await self.send_color(self.color, force=True):
+            self._schedule_heartbeat(HEARTBEAT_RETRY_DELAY)
+
+    def _check_link(self):
+        """Scheduled link check for transports without a disconnect event."""
+        if self.transport.is_connected:
+            return None
+        self.scheduler.cancel(self._task_name("link"))
+        if self._disconnecting:
+            return None
+        return self._link_lost()
+
+    async def play_effect(self, effect, fps=None, duration=None):
+        """Stream an effect instead of the solid color until it ends or stop_effect() is called.
+
+        Returns the EffectPlayer, for its frame statistics. The solid color
+        is re-sent afterwards.
+        """
+        from busylight.effects import DEFAULT_FPS, EffectPlayer
+
+        self.stop_effect()
+        player = self.effect = EffectPlayer(self.transport, effect, fps or DEFAULT_FPS)
+        try:
+            await player.run(duration)
+        finally:
+            if self.effect is player:
+                self.effect = None
+                self.set_color(self.color, force=True)
+        return player
+
+    def stop_effect(self):
+        if self.effect is not None:
+            self.effect.stop()
+
+    async def keep_alive(self):
+        """Re-send the current color whenever heartbeat_interval passes without a write."""
+        while self.transport.is_connected and not self._disconnecting:
+            interval = self.heartbeat_interval
+            if interval is None:
+                return
+            wait = self.time_last_sent + interval - self.clock()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            elif not await self.send_color(self.color):
+                await asyncio.sleep(HEARTBEAT_RETRY_DELAY)
+
+    async def connect(self):
+        self._disconnecting = False
+        if "startup" not in self.time_to_first_color:
+            self._first_color_pending = ("startup", time.perf_counter())
+        connected = await self._open_link()
+        if not connected:
+            self._changed()
+            if self.auto_reconnect and self.transport.hotplug and (self._waiting is None or self._waiting.done()):
+                self._waiting = asyncio.ensure_future(self.reconnect("startup"))  # Open it when it is plugged in
+        return connected
+
+    async def reconnect(self, kind="reconnect"):
+        """Retry the link with jittered exponential backoff until it is back or disconnect() is called.
+
+        Hotplug transports end each wait as soon as the device reappears.
+        """
+        self._first_color_pending = (kind, time.perf_counter())
+        delay = RECONNECT_MIN_DELAY
+        while not self._disconnecting:
+            if await self._open_link():
+                if kind == "reconnect":
+                    metrics.reconnects.inc(self.name)
+                return True
+            await self.transport.wait_available(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+        return False
+
+    async def disconnect(self):
+        self._disconnecting = True
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        if self.scheduler is not None:
+            self.scheduler.cancel(self._task_name("heartbeat"))
+            self.scheduler.cancel(self._task_name("link"))
+        await self.transport.disconnect()
+        self._changed()
+
+    async def monitor_link(self):
+        await self.transport.wait_disconnected()
+        if self._disconnecting:
+            return
+        await self._link_lost()
+
+    async def _link_lost(self):
+        logging.warning(f"{self.name}: connection lost during monitoring.")
+        metrics.links_lost.inc(self.name)
+        self._changed()
+        if self.on_link_lost:
+            self.on_link_lost("Connection lost (monitor)")
+        if self.auto_reconnect:
+            await self.reconnect()
+
+
+class DeviceRegistry:
+    """The set of lights driven from this host, keyed by device name."""
+
+    def __init__(self):
+        self.devices = {}
+
+    def __iter__(self):
+        return iter(list(self.devices.values()))
+
+    def __len__(self):
+        return len(self.devices)
+
+    def add(self, device):
+        if device.name in self.devices:
+            raise ValueError(f"A device named {device.name!r} is already registered")
+        self.devices[device.name] = device
+        return device
+
+    def remove(self, name):
+        return self.devices.pop(name)
+
+    def get(self, name):
+        return self.devices.get(name)
+
+    @property
+    def connected(self):
+        return any(device.connected for device in self)
+
+    def set_color(self, color, force=False, queued_at=None):
+        """Start sending color to every device at once. Must be called on the event loop."""
+        return [device.set_color(color, force, queued_at) for device in self]
+
+    async def broadcast(self, color, force=False):
+        """Send color to every device concurrently and wait until each one has finished."""
+        await asyncio.gather(*self.set_color(color, force), return_exceptions=True)
+
+    async def play_effect(self, effect, fps=None, duration=None):
+        """Play one effect on every device at once. Returns the players."""
+        return await asyncio.gather(*(device.play_effect(effect, fps, duration) for device in self))
+
+    def stop_effect(self):
+        for device in self:
+            device.stop_effect()
+
+    async def connect_all(self):
+        results = await asyncio.gather(*(device.connect() for device in self), return_exceptions=True)
+        return any(result is True for result in results)
+
+    async def disconnect_all(self):
+        await asyncio.gather(*(device.disconnect() for device in self), return_exceptions=True)
@@ -0,0 +1,168 @@
+"""Host-side LED effects, rendered with NumPy and streamed at a fixed frame rate.
+
+An effect is a callable effect(t, out) that fills out, a (pixels, 3) uint8
+array, with the frame for t seconds after the effect started. EffectPlayer
+calls it on a fixed schedule and hands each frame to the transport's
+send_pixels(). Frames are rendered for the time they are due, not the time
+the player got round to them, so a late frame never slows the animation
+down: if the transport falls behind, the frames that are already overdue
+are dropped and the player jumps to the current one.
+"""
+import asyncio
+import collections
+import logging
+import math
+import time
+
+import numpy as np
+
+from busylight.transport import parse_color
+
+NUM_PIXELS = 60  # NUMPIXELS in the firmware
+DEFAULT_FPS = 30
+FRAME_HISTORY = 512  # Frames whose lateness is kept for the jitter figure
+
+
+def _rgb(color):
+    return np.array(parse_color(color) if isinstance(color, str) else color, dtype=np.float32)
+
+
+class Solid:
+    def __init__(self, color):
+        self.color = _rgb(color)
+
+    def __call__(self, t, out):
+        out[:] = self.color
+
+
+class Breathe:
+    """Fade the whole strip between floor and full brightness once per period."""
+
+    def __init__(self, color, period=4.0, floor=0.15):
+        self.color = _rgb(color)
+        self.period = period
+        self.floor = floor
+
+    def __call__(self, t, out):
+        level = self.floor + (1 - self.floor) * (0.5 - 0.5 * math.cos(2 * math.pi * t / self.period))
+        out[:] = np.rint(self.color * level)
+
+
+class Blink:
+    """Switch between color and off_color; on for duty of each period."""
+
+    def __init__(self, color, period=0.5, duty=0.5, off_color=(0, 0, 0)):
+        self.color = _rgb(color)
+        self.off_color = _rgb(off_color)
+        self.period = period
+        self.duty = duty
+
+    def __call__(self, t, out):
+        out[:] = self.color if (t % self.period) < self.period * self.duty else self.off_color
+
+
+class Countdown:
+    """A bar that shrinks from the full strip to nothing over duration seconds.
+
+    The pixel at the end of the bar is dimmed by the fraction of it that is
+    left, so the bar moves smoothly rather than a whole pixel at a time.
+    """
+
+    def __init__(self, color, duration=60.0, background=(0, 0, 0)):
+        self.color = _rgb(color)
+        self.background = _rgb(background)
+        self.duration = duration
+        self._positions = None
+
+    def __call__(self, t, out):
+        if self._positions is None or len(self._positions) != len(out):
+            self._positions = np.arange(len(out), dtype=np.float32)[:, None]
+        lit = len(out) * max(0.0, 1 - t / self.duration)
+        coverage = np.clip(lit - self._positions, 0, 1)  # 1 inside the bar, a fraction on its edge, 0 past it
+        out[:] = np.rint(self.background + (self.color - self.background) * coverage)
+
+
+EFFECTS = {
+    "solid": Solid,
+    "breathe": Breathe,
+    "blink": Blink,
+    "countdown": Countdown,
+}
+
+
+def create(name, color, **options):
+    """Build an effect by name, e.g. create("breathe", "255,0,0", period=3)."""
+    try:
+        effect = EFFECTS[name]
+    except KeyError:
+        raise ValueError(f"Unknown effect {name!r}; expected one of {', '.join(EFFECTS)}") from None
+    return effect(color, **options)
+
+
+class EffectPlayer:
+    """Render an effect and stream it to one transport at fps, dropping frames instead of falling behind.
+
+    Frames identical to the previous one are not sent (a blink is mostly
+    unchanged frames), so a slow link only pays for the frames that differ.
+    """
+
+    def __init__(self, transport, effect, fps=DEFAULT_FPS, num_pixels=None, clock=time.perf_counter):
+        self.transport = transport
+        self.effect = effect
+        self.fps = fps
+        if num_pixels is None:
+            num_pixels = len(effect) if hasattr(effect, "__len__") else NUM_PIXELS  # A FrameBuffer knows its length
+        self.num_pixels = num_pixels
+        self.clock = clock
+        self.sent = 0
+        self.dropped = 0  # Frames skipped because they were already overdue
+        self.unchanged = 0  # Frames not sent because they matched the previous one
+        self.lateness = collections.deque(maxlen=FRAME_HISTORY)  # Seconds between a frame being due and it being handed over
+        self.elapsed = 0.0
+        self._stopped = asyncio.Event()
+
+    def stop(self):
+        """Stop after the current frame. Must be called on the event loop."""
+        self._stopped.set()
+
+    async def run(self, duration=None):
+        """Play until stop() is called, duration passes or the link drops."""
+        interval = 1 / self.fps
+        frame = np.zeros((self.num_pixels, 3), dtype=np.uint8)
+        previous = None
+        start = self.clock()
+        index = 0
+        while not self._stopped.is_set() and self.transport.is_connected:
+            due = start + index * interval
+            if duration is not None and due - start > duration:
+                break
+            self.effect(due - start, frame)
+            if previous is not None and np.array_equal(frame, previous):
+                self.unchanged += 1
+            else:
+                self.lateness.append(self.clock() - due)
+                try:
+                    await self.transport.send_pixels(frame)
+                except Exception as e:
+                    logging.error(f"Effect frame failed: {e}")
+                    break
+                self.sent += 1
+                previous = frame.copy()
+
+            # Next frame that is still in the future; any in between are dropped
+            now = self.clock()
+            self.elapsed = now - start
+            next_index = max(index + 1, math.floor((now - start) / interval) + 1)
+            self.dropped += next_index - index - 1
+            index = next_index
+            try:
+                await asyncio.wait_for(self._stopped.wait(), max(0.0, start + index * interval - self.clock()))
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        """Return (frames delivered on schedule per second, jitter) where jitter is the standard deviation of lateness."""
+        if not self.elapsed:
+            return 0.0, 0.0
+        jitter = float(np.std(self.lateness)) if self.lateness else 0.0
+        return (self.sent + self.unchanged) / self.elapsed, jitter
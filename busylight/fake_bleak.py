@@ -0,0 +1,199 @@
+"""In-memory stand-in for the parts of bleak the BLE transport uses.
+
+A FakeBleak instance is a simulated radio: pass it wherever the bleak module
+is expected, add devices to it and drop their links to exercise reconnects.
+A device added with acks=True behaves like the GATT server in the firmware:
+it notifies an ack frame for every binary frame it applies. Pixel frames
+are applied with the reference decoder, so device.decoder.pixels is what the
+strip would show.
+"""
+import asyncio
+import random
+import time
+
+from busylight.protocol import OP_PIXELS, VERSION, decode, encode_ack
+
+
+class FakeDevice:
+    def __init__(self, name, address, rssi=-60, service_uuids=(), manufacturer_data=None, acks=False):
+        self.name = name
+        self.address = address
+        self.rssi = rssi
+        self.service_uuids = list(service_uuids)
+        self.manufacturer_data = dict(manufacturer_data or {})
+        self.acks = acks  # Notify an ack for each binary frame, like the current firmware
+        self.in_range = True
+        self.writes = []  # (time.perf_counter(), characteristic, data, response)
+        self.dropped = 0  # Writes without response lost before the firmware saw them
+        self.decoder = None  # busylight.pixels.PixelDecoder, once a pixel frame arrives
+
+    def apply(self, data):
+        """Apply a write like the firmware. Returns the sequence number it would ack, or None."""
+        if data and data[0] >> 4 == VERSION and data[0] & 0x07 == OP_PIXELS:
+            if self.decoder is None:
+                from busylight.pixels import PixelDecoder
+
+                self.decoder = PixelDecoder()
+            try:
+                shown = self.decoder.feed(data)
+            except ValueError:
+                return None
+            return None if shown is None else shown[0]
+        try:
+            return decode(data).sequence
+        except ValueError:
+            return None
+
+
+class FakeAdvertisementData:
+    def __init__(self, device):
+        self.local_name = device.name
+        self.rssi = device.rssi
+        self.service_uuids = device.service_uuids
+        self.manufacturer_data = device.manufacturer_data
+
+
+class FakeBleak:
+    def __init__(self, scan_time=5.0, connect_time=0.05, write_time=0.01, advertising_interval=0.1, command_time=0.001, command_delivery=0.0, ack_delay=0.0075, drop_rate=0.0, mtu_size=247):
+        self.scan_time = scan_time  # How long discover() runs, like bleak's default timeout
+        self.advertising_interval = advertising_interval  # Each device advertises once per interval
+        self.connect_time = connect_time
+        self.write_time = write_time  # Acknowledged write: request out, response back
+        self.command_time = command_time  # Write without response: just queued for the next connection event
+        self.command_delivery = command_delivery  # From queueing a write without response to the device seeing it
+        self.ack_delay = ack_delay  # From a write without response to the ack notification
+        self.drop_rate = drop_rate  # Fraction of writes without response the firmware never sees
+        self.mtu_size = mtu_size  # Negotiated ATT MTU; Windows usually gets 247 from an ESP32
+        self.devices = {}
+        self.clients = []
+        self.scans = 0
+        radio = self
+
+        class BleakScanner(_FakeScanner):
+            _radio = radio
+
+            @staticmethod
+            async def discover(timeout=None):
+                radio.scans += 1
+                await asyncio.sleep(radio.scan_time if timeout is None else min(timeout, radio.scan_time))
+                return [device for device in radio.devices.values() if device.in_range]
+
+        class BleakClient(_FakeClient):
+            def __init__(self, address, disconnected_callback=None):
+                super().__init__(radio, address, disconnected_callback)
+                radio.clients.append(self)
+
+        self.BleakScanner = BleakScanner
+        self.BleakClient = BleakClient
+
+    def add_device(self, name, address, **kwargs):
+        device = self.devices[address] = FakeDevice(name, address, **kwargs)
+        return device
+
+    def drop(self, address, in_range=False):
+        """Drop every link to a device, optionally leaving it out of range."""
+        self.devices[address].in_range = in_range
+        for client in self.clients:
+            if client.address == address and client.is_connected:
+                client._lost()
+
+
+class _FakeScanner:
+    """Streaming scanner: calls detection_callback for each advertisement until stop()."""
+
+    _radio = None
+
+    def __init__(self, detection_callback=None, service_uuids=None):
+        self._callback = detection_callback
+        self._service_uuids = service_uuids
+        self._task = None
+
+    async def _advertise(self, device):
+        # Devices are not in phase with the scan start
+        await asyncio.sleep(random.uniform(0, self._radio.advertising_interval))
+        while True:
+            if device.in_range and (not self._service_uuids or set(self._service_uuids) & set(device.service_uuids)):
+                self._callback(device, FakeAdvertisementData(device))
+            await asyncio.sleep(self._radio.advertising_interval)
+
+    async def _run(self):
+        await asyncio.gather(*(self._advertise(device) for device in list(self._radio.devices.values())))
+
+    async def start(self):
+        self._radio.scans += 1
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+
+class _FakeClient:
+    def __init__(self, radio, address, disconnected_callback):
+        self._radio = radio
+        self.address = address
+        self._disconnected_callback = disconnected_callback
+        self.is_connected = False
+        self.connects = 0
+        self.mtu_size = radio.mtu_size
+        self._notify = {}  # characteristic -> callback
+
+    async def connect(self):
+        await asyncio.sleep(self._radio.connect_time)
+        device = self._radio.devices.get(self.address)
+        if device is None or not device.in_range:
+            raise OSError(f"Device with address {self.address} was not found")
+        self.connects += 1
+        self.is_connected = True
+        return True
+
+    async def disconnect(self):
+        if self.is_connected:
+            self._lost()
+        return True
+
+    def _lost(self):
+        self.is_connected = False
+        if self._disconnected_callback:
+            self._disconnected_callback(self)
+
+    async def start_notify(self, characteristic, callback):
+        if not self._radio.devices[self.address].acks:
+            raise OSError(f"Characteristic {characteristic} was not found")
+        self._notify[characteristic] = callback
+
+    async def stop_notify(self, characteristic):
+        self._notify.pop(characteristic, None)
+
+    async def write_gatt_char(self, characteristic, data, response=None):
+        if not self.is_connected:
+            raise OSError("Not connected")
+        device = self._radio.devices[self.address]
+        if response is False:
+            await asyncio.sleep(self._radio.command_time)
+            if random.random() < self._radio.drop_rate:
+                device.dropped += 1
+            elif self._radio.command_delivery:
+                asyncio.get_running_loop().call_later(self._radio.command_delivery, self._deliver, device, characteristic, bytes(data), response)
+            else:
+                self._deliver(device, characteristic, bytes(data), response)
+            return
+        await asyncio.sleep(self._radio.write_time)
+        self._deliver(device, characteristic, bytes(data), response)
+
+    def _deliver(self, device, characteristic, data, response):
+        device.writes.append((time.perf_counter(), characteristic, data, response))
+        sequence = device.apply(data)
+        if device.acks and self._notify:
+            if sequence is not None:
+                ack = bytearray(encode_ack(sequence))
+                for ack_characteristic, callback in list(self._notify.items()):
+                    asyncio.get_running_loop().call_later(self._radio.ack_delay, callback, ack_characteristic, ack)
@@ -0,0 +1,133 @@
+"""In-memory stand-in for the parts of the winreg module the scanners use.
+
+Counts every registry call and every open handle so the cost of a scan can be
+measured on any platform.
+"""
+import itertools
+
+HKEY_CURRENT_USER = "HKEY_CURRENT_USER"
+KEY_READ = 0x20019
+KEY_NOTIFY = 0x0010
+
+
+class _Key:
+    def __init__(self):
+        self.subkeys = {}
+        self.values = {}
+        self.last_write = 0
+        self.names = None  # Cached subkey order for EnumKey
+
+    def touch(self, clock):
+        self.last_write = next(clock)
+        self.names = None
+
+
+class FakeHandle:
+    def __init__(self, registry, path, node):
+        self._registry = registry
+        self.path = path
+        self.node = node  # A handle keeps pointing at the key it opened, even if one is recreated at its path
+        self.closed = False
+
+    def Close(self):
+        self._registry.CloseKey(self)
+
+    def __int__(self):
+        return id(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Close()
+
+
+class FakeWinreg:
+    """Pass an instance wherever the winreg module is expected."""
+
+    HKEY_CURRENT_USER = HKEY_CURRENT_USER
+    KEY_READ = KEY_READ
+    KEY_NOTIFY = KEY_NOTIFY
+
+    def __init__(self):
+        self._root = _Key()
+        self._clock = itertools.count(1)
+        self.calls = 0
+        self.open_handles = 0
+
+    # Test helpers
+
+    def _find(self, path, create=False):
+        key = self._root
+        for part in path.split("\\") if path else []:
+            if part not in key.subkeys:
+                if not create:
+                    raise FileNotFoundError(2, "The system cannot find the file specified", path)
+                key.subkeys[part] = _Key()
+                key.touch(self._clock)
+            key = key.subkeys[part]
+        return key
+
+    def create_key(self, path):
+        self._find(path, create=True)
+
+    def set_value(self, path, name, value):
+        key = self._find(path, create=True)
+        key.values[name] = value
+        key.last_write = next(self._clock)
+
+    def delete_key(self, path):
+        parent_path, _, name = path.rpartition("\\")
+        parent = self._find(parent_path)
+        del parent.subkeys[name]
+        parent.touch(self._clock)
+
+    def reset_counters(self):
+        self.calls = 0
+
+    # winreg API
+
+    def _resolve(self, key, sub_key=""):
+        base = "" if key == HKEY_CURRENT_USER else key.path
+        if not isinstance(key, str) and key.closed:
+            raise OSError(6, "The handle is invalid")
+        return f"{base}\\{sub_key}".strip("\\") if sub_key else base
+
+    def _node(self, key):
+        node = self._find(self._resolve(key))
+        if not isinstance(key, str) and key.node is not node:
+            raise OSError(1018, "Illegal operation attempted on a registry key that has been marked for deletion")
+        return node
+
+    def OpenKey(self, key, sub_key, reserved=0, access=KEY_READ):
+        self.calls += 1
+        path = self._resolve(key, sub_key)
+        node = self._find(path)
+        self.open_handles += 1
+        return FakeHandle(self, path, node)
+
+    def CloseKey(self, hkey):
+        if not hkey.closed:
+            hkey.closed = True
+            self.open_handles -= 1
+
+    def EnumKey(self, key, index):
+        self.calls += 1
+        node = self._node(key)
+        if node.names is None:
+            node.names = list(node.subkeys)
+        if index >= len(node.names):
+            raise OSError(259, "No more data is available")
+        return node.names[index]
+
+    def QueryInfoKey(self, key):
+        self.calls += 1
+        node = self._node(key)
+        return len(node.subkeys), len(node.values), node.last_write
+
+    def QueryValueEx(self, key, value_name):
+        self.calls += 1
+        node = self._node(key)
+        if value_name not in node.values:
+            raise FileNotFoundError(2, "The system cannot find the file specified", value_name)
+        return node.values[value_name], 4
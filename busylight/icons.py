@@ -0,0 +1,97 @@
+"""Tray icons built in memory, one per light state and color, kept in a small LRU."""
+import collections
+import io
+
+from busylight.transport import parse_color
+
+ICON_SIZE = 64
+ICON_CACHE_SIZE = 16
+BACKGROUND = (40, 40, 40)
+DISCONNECTED_COLOR = (128, 128, 128)
+
+# Tray states
+BUSY = "busy"
+IDLE = "idle"
+DISCONNECTED = "disconnected"
+
+
+def light_state(light):
+    """Return (state, color) for a BusyLight, the key the icon cache uses."""
+    if not light.connected:
+        return DISCONNECTED, None
+    return (BUSY if light.mic_in_use else IDLE), light.current_color
+
+
+def render_icon(state, color=None, size=ICON_SIZE):
+    """Draw the icon for a state as a PIL image: a filled dot in the light's color, or a grey ring."""
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    draw.rounded_rectangle((0, 0, size - 1, size - 1), radius=size // 6, fill=BACKGROUND)
+    margin = size // 6
+    box = (margin, margin, size - margin, size - margin)
+    if state == DISCONNECTED or color is None:
+        draw.ellipse(box, outline=DISCONNECTED_COLOR, width=max(2, size // 12))
+    else:
+        draw.ellipse(box, fill=parse_color(color))
+    return image
+
+
+def image_to_hicon(image):
+    """Turn a PIL image into a Windows HICON without touching the disk."""
+    import win32gui
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    # PNG-compressed icon resources are accepted since Windows Vista
+    return win32gui.CreateIconFromResourceEx(buffer.getvalue(), True, 0x00030000, image.width, image.height, 0)
+
+
+def destroy_hicon(hicon):
+    import win32gui
+
+    win32gui.DestroyIcon(hicon)
+
+
+class IconCache:
+    """LRU of tray icons keyed by (state, color).
+
+    convert turns the rendered PIL image into whatever the tray backend wants
+    (the image itself for pystray, an HICON for the win32 tray); release frees
+    an evicted icon. Icons still shown in the tray must not be evicted, so
+    keep maxsize above the number of states in use at once.
+    """
+
+    def __init__(self, convert=None, release=None, maxsize=ICON_CACHE_SIZE, size=ICON_SIZE):
+        self.convert = convert
+        self.release = release
+        self.maxsize = maxsize
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._icons = collections.OrderedDict()
+
+    def get(self, state, color=None):
+        key = (state, color)
+        icon = self._icons.get(key)
+        if icon is not None:
+            self._icons.move_to_end(key)
+            self.hits += 1
+            return icon
+        self.misses += 1
+        icon = render_icon(state, color, self.size)
+        if self.convert:
+            icon = self.convert(icon)
+        self._icons[key] = icon
+        if len(self._icons) > self.maxsize:
+            _, evicted = self._icons.popitem(last=False)
+            if self.release:
+                self.release(evicted)
+        return icon
+
+    def clear(self):
+        while self._icons:
+            _, icon = self._icons.popitem()
+            if self.release:
+                self.release(icon)
@@ -0,0 +1,150 @@
+"""Logging that stays off the hot paths.
+
+Records are filtered and queued on the calling thread (Tk, detector, event
+loop, serial reader) and written by one background thread into a
+size-rotated file. Each call site is rate limited, a message repeated
+verbatim from the same call site (the detector's "Microphone status: Not in
+Use" on every scan, the dedup "command not sent" line) is only sampled, and
+the most recent lines are kept in memory for the GUI.
+"""
+import atexit
+import collections
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+LOG_MAX_BYTES = 1024 * 1024  # Rotate the log file at this size
+LOG_BACKUP_COUNT = 3
+RATE_LIMIT_BURST = 20  # Records one call site may log per RATE_LIMIT_PERIOD
+RATE_LIMIT_PERIOD = 10  # Seconds
+REPEAT_SAMPLE_EVERY = 100  # Keep one in this many verbatim repeats of the previous message
+RING_SIZE = 500  # Lines kept in memory for the GUI
+
+
+class LogThrottle(logging.Filter):
+    """Rate limit each call site and sample verbatim repeats.
+
+    Records at exempt_level and above always pass. A record that gets through
+    after others were dropped says how many, so the file still shows that
+    something was happening.
+    """
+
+    def __init__(self, burst=RATE_LIMIT_BURST, period=RATE_LIMIT_PERIOD, sample_every=REPEAT_SAMPLE_EVERY, exempt_level=logging.ERROR):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.sample_every = sample_every
+        self.exempt_level = exempt_level
+        self.sites = {}  # (pathname, lineno) -> [window start, records passed in window, dropped, last message, repeats]
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= self.exempt_level:
+            return True
+        message = record.getMessage()
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            site = self.sites.get(key)
+            if site is None:
+                site = self.sites[key] = [now, 0, 0, None, 0]
+            if message == site[3]:
+                site[4] += 1
+                if site[4] % self.sample_every:
+                    return self._drop(site)
+            else:
+                site[3] = message
+                site[4] = 0
+            if now - site[0] >= self.period:
+                site[0] = now
+                site[1] = 0
+            if site[1] >= self.burst:
+                return self._drop(site)
+            site[1] += 1
+            dropped, site[2] = site[2], 0
+        if dropped:
+            record.msg = f"{message} ({dropped} similar suppressed)"
+            record.args = None
+        return True
+
+    def _drop(self, site):
+        site[2] += 1
+        self.dropped += 1
+        return False
+
+
+class RingBufferHandler(logging.Handler):
+    """Keep the last formatted lines in memory. version changes whenever a line is added."""
+
+    def __init__(self, size=RING_SIZE):
+        super().__init__()
+        self.records = collections.deque(maxlen=size)
+        self.version = 0
+        self.on_add = None  # Called with no arguments, from the adding thread, after each line
+
+    def emit(self, record):
+        self.add(self.format(record))
+
+    def add(self, line):
+        """Append a line that did not come through logging (e.g. a firmware echo). Thread-safe."""
+        self.records.append(line)
+        self.version += 1
+        if self.on_add:
+            self.on_add()
+
+    def lines(self):
+        return list(self.records)
+
+
+class LogPipeline:
+    """The queue, its listener thread and the handlers it feeds. Created by setup_logging()."""
+
+    def __init__(self, handlers, throttle, ring):
+        self.queue = queue.SimpleQueue()
+        self.throttle = throttle
+        self.ring = ring
+        self.handler = logging.handlers.QueueHandler(self.queue)
+        self.handler.addFilter(throttle)
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.running = False
+
+    def start(self):
+        self.listener.start()
+        self.running = True
+
+    def stop(self):
+        """Flush everything queued so far and stop the writer thread."""
+        if self.running:
+            self.running = False
+            self.listener.stop()
+
+
+def setup_logging(filename=None, level=logging.INFO, fmt=LOG_FORMAT, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, throttle=None, ring_size=RING_SIZE):
+    """Route the root logger through a background writer and return the LogPipeline.
+
+    filename None logs to stderr instead of a rotating file. Replaces any
+    handlers already on the root logger, and stops the writer at exit.
+    """
+    formatter = logging.Formatter(fmt)
+    if filename:
+        output = logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+    else:
+        output = logging.StreamHandler()
+    output.setFormatter(formatter)
+    ring = RingBufferHandler(ring_size)
+    ring.setFormatter(formatter)
+    pipeline = LogPipeline([output, ring], throttle or LogThrottle(), ring)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(pipeline.handler)
+    root.setLevel(level)
+    pipeline.start()
+    atexit.register(pipeline.stop)
+    return pipeline
@@ -0,0 +1,481 @@
+"""Go busy ahead of scheduled meetings, using a local .ics calendar export.
+
+Calendar reads the export and expands recurring events over a window
+around now. It merges the instances into an IntervalIndex: sorted,
+disjoint busy intervals that answer "busy now, and when does that
+change" with one binary search. When the file changes, only the events
+whose text changed are expanded again, and the rest are reused. Events
+are grouped by UID, so an edited occurrence re-expands its series.
+
+MeetingWatcher posts a meeting as a status source at CALENDAR_PRIORITY,
+below the microphone. The light is busy during a meeting even before the
+microphone opens, and the detector's own colors win while it is in use.
+lead_time seconds before a meeting, the light goes busy early, or the
+countdown effect plays until the meeting starts. The watcher wakes on
+the scheduler exactly at the next change, and polls the file only for
+edits.
+
+Supported from RFC 5545:
+- DTSTART with DTEND or DURATION, in UTC, with a TZID (zoneinfo), or as
+  floating local time.
+- RRULE with FREQ DAILY, WEEKLY (BYDAY), MONTHLY (on the start's day, or
+  BYDAY like 2TU or -1FR) and YEARLY, plus INTERVAL, COUNT and UNTIL.
+- EXDATE and RECURRENCE-ID overrides.
+- STATUS:CANCELLED, TRANSP:TRANSPARENT and Outlook's FREE busy status
+  (free time).
+
+All-day events never count as busy. Other RRULE parts are ignored with a
+warning, which leaves the series on its base frequency.
+"""
+import asyncio
+import bisect
+import collections
+import datetime
+import functools
+import itertools
+import logging
+import operator
+import os
+import re
+import time
+from calendar import monthrange
+
+from busylight.status import CALENDAR_PRIORITY
+
+CALENDAR_SOURCE = "calendar"
+CALENDAR_CHECK_INTERVAL = 60  # Seconds between checks of the file for edits
+DEFAULT_LEAD_TIME = 120  # Seconds before a meeting that the light goes busy (or starts the countdown)
+DEFAULT_HORIZON_DAYS = 14  # Days ahead that recurring events are expanded
+LOOKBEHIND = 86400  # Seconds before now that are expanded too, for meetings already running
+INCREMENTAL_LIMIT = 8  # Patch the sorted instances in place while fewer than 1 in this many events changed; else sort them again
+WEEKDAYS = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+SUPPORTED_RULE_PARTS = {"FREQ", "INTERVAL", "COUNT", "UNTIL", "BYDAY", "WKST"}
+
+Event = collections.namedtuple("Event", "start duration rule exdates busy recurrence_id")
+
+_DURATION = re.compile(r"([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+_warned = set()
+
+
+def _warn_once(message):
+    if message not in _warned:
+        _warned.add(message)
+        logging.warning(message)
+
+
+def unfold(text):
+    """Join folded content lines (continuations start with a space or a tab)."""
+    lines = []
+    for line in text.splitlines():
+        if line[:1] in (" ", "\t") and lines:
+            lines[-1] += line[1:]
+        elif line:
+            lines.append(line)
+    return lines
+
+
+def parse_line(line):
+    """Split "NAME;PARAM=value:text" into (name, params, text). A ":" inside a quoted parameter is kept."""
+    quoted = False
+    for i, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ":" and not quoted:
+            head, value = line[:i], line[i + 1:]
+            break
+    else:
+        head, value = line, ""
+    name, *parts = head.split(";")
+    params = {}
+    for part in parts:
+        key, _, param = part.partition("=")
+        params[key.upper()] = param.strip('"')
+    return name.upper(), params, value
+
+
+def event_blocks(lines):
+    """Group the VEVENT blocks by UID: {uid: tuple of blocks}, each block a tuple of lines without nested components."""
+    groups = collections.defaultdict(list)
+    block = None
+    depth = 0
+    for line in lines:
+        upper = line.upper()
+        if upper == "BEGIN:VEVENT":
+            block, depth = [], 0
+        elif block is None:
+            continue
+        elif upper == "END:VEVENT":
+            uid = next((field[4:] for field in block if field.upper().startswith("UID:")), None)
+            groups[uid or hash(tuple(block))].append(tuple(block))
+            block = None
+        elif upper.startswith("BEGIN:"):
+            depth += 1  # VALARM and the like
+        elif upper.startswith("END:"):
+            depth -= 1
+        elif depth == 0:
+            block.append(line)
+    return {uid: tuple(blocks) for uid, blocks in groups.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def _zone(tzid):
+    """The zoneinfo zone for a TZID, or None (local time) for one zoneinfo does not know."""
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+    try:
+        return ZoneInfo(tzid)
+    except (ZoneInfoNotFoundError, ValueError):
+        _warn_once(f"Unknown calendar time zone {tzid!r}; using local time")
+        return None
+
+
+def parse_time(value, params):
+    """Return (datetime, all_day). Times without a zone are naive, i.e. local time."""
+    if params.get("VALUE") == "DATE" or len(value) == 8:
+        return datetime.datetime.strptime(value[:8], "%Y%m%d"), True
+    moment = datetime.datetime.strptime(value[:15], "%Y%m%dT%H%M%S")
+    if value.endswith("Z"):
+        return moment.replace(tzinfo=datetime.timezone.utc), False
+    zone = _zone(params["TZID"]) if "TZID" in params else None
+    return (moment.replace(tzinfo=zone) if zone else moment), False
+
+
+def parse_duration(value):
+    match = _DURATION.match(value)
+    if match is None:
+        raise ValueError(f"Invalid duration {value!r}")
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    duration = datetime.timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                                  minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -duration if sign == "-" else duration
+
+
+def parse_event(block):
+    """Turn one VEVENT block into an Event, or None for one without a start."""
+    props = {}
+    exdates = set()
+    for line in block:
+        name, params, value = parse_line(line)
+        if name == "EXDATE":
+            exdates.update(parse_time(part, params)[0].timestamp() for part in value.split(",") if part)
+        else:
+            props.setdefault(name, (params, value))
+    if "DTSTART" not in props:
+        return None
+    start, all_day = parse_time(props["DTSTART"][1], props["DTSTART"][0])
+    if "DTEND" in props:
+        duration = parse_time(props["DTEND"][1], props["DTEND"][0])[0] - start
+    elif "DURATION" in props:
+        duration = parse_duration(props["DURATION"][1])
+    else:
+        duration = datetime.timedelta(days=1) if all_day else datetime.timedelta()
+    rule = None
+    if "RRULE" in props:
+        rule = dict(part.split("=", 1) for part in props["RRULE"][1].upper().split(";") if "=" in part)
+        unsupported = set(rule) - SUPPORTED_RULE_PARTS
+        if unsupported:
+            _warn_once(f"Ignoring unsupported RRULE parts {', '.join(sorted(unsupported))}")
+    busy = not all_day and all((
+        props.get("STATUS", ({}, ""))[1].upper() != "CANCELLED",
+        props.get("TRANSP", ({}, ""))[1].upper() != "TRANSPARENT",
+        props.get("X-MICROSOFT-CDO-BUSYSTATUS", ({}, ""))[1].upper() != "FREE",
+    ))
+    recurrence_id = parse_time(props["RECURRENCE-ID"][1], props["RECURRENCE-ID"][0])[0].timestamp() if "RECURRENCE-ID" in props else None
+    return Event(start, duration, rule, exdates, busy, recurrence_id)
+
+
+def _add_months(moment, months):
+    """moment moved by whole months, or None when that month has no such day (the 31st in April)."""
+    month = moment.month - 1 + months
+    year, month = moment.year + month // 12, month % 12 + 1
+    if moment.day > monthrange(year, month)[1]:
+        return None
+    return moment.replace(year=year, month=month)
+
+
+def _nth_weekdays(year, month, weekday, ordinal, time_of_day):
+    """The dates in a month that match BYDAY weekday with an ordinal (2 = second, -1 = last, None = every one)."""
+    days_in_month = monthrange(year, month)[1]
+    first = (weekday - datetime.date(year, month, 1).weekday()) % 7 + 1
+    days = list(range(first, days_in_month + 1, 7))
+    if ordinal is not None:
+        days = [days[ordinal - 1 if ordinal > 0 else ordinal]] if -len(days) <= ordinal <= len(days) and ordinal else []
+    return [time_of_day.replace(year=year, month=month, day=day) for day in days]
+
+
+def _candidates(start, rule, window_start, window_end):
+    """Yield (n, start datetime) of the occurrences in order, n counting from 0 at DTSTART.
+
+    DAILY and WEEKLY series skip straight to the period just before
+    window_start; MONTHLY and YEARLY ones stop after window_end, even when
+    no month matched (a BYDAY of 5MO).
+    """
+    freq = rule.get("FREQ")
+    interval = max(1, int(rule.get("INTERVAL", 1)))
+    byday = [(int(day[:-2]) if day[:-2] else None, WEEKDAYS[day[-2:]]) for day in rule.get("BYDAY", "").split(",") if day[-2:] in WEEKDAYS]
+    if freq == "DAILY":
+        step = datetime.timedelta(days=interval)
+        k = max(0, int((window_start - start.timestamp()) // step.total_seconds()) - 1)
+        while True:
+            yield k, start + k * step
+            k += 1
+    elif freq == "WEEKLY":
+        days = sorted({weekday for _, weekday in byday} or {start.weekday()})
+        first_week = [day for day in days if day >= start.weekday()]
+        week_start = start - datetime.timedelta(days=start.weekday())
+        step = datetime.timedelta(weeks=interval)
+        w = max(0, int((window_start - week_start.timestamp()) // step.total_seconds()) - 1)
+        while True:
+            base = len(first_week) + (w - 1) * len(days) if w else 0
+            for j, day in enumerate(first_week if w == 0 else days):
+                yield base + j, week_start + w * step + datetime.timedelta(days=day)
+            w += 1
+    elif freq in ("MONTHLY", "YEARLY"):
+        months = interval * (12 if freq == "YEARLY" else 1)
+        n, k = 0, 0
+        while True:
+            month = _add_months(start.replace(day=1), k * months)
+            if month.timestamp() > window_end:
+                return
+            if freq == "MONTHLY" and byday:
+                moments = sorted(moment for ordinal, weekday in byday for moment in _nth_weekdays(month.year, month.month, weekday, ordinal, start))
+                moments = [moment for moment in moments if moment >= start]
+            else:
+                moment = _add_months(start, k * months)
+                moments = [moment] if moment is not None else []
+            for moment in moments:
+                yield n, moment
+                n += 1
+            k += 1
+    else:
+        _warn_once(f"Unsupported RRULE frequency {freq!r}; using the first occurrence only")
+        yield 0, start
+
+
+def _until(event):
+    """The latest start UNTIL allows, in epoch seconds. UNTIL is inclusive, and a date-only UNTIL (common from Outlook) includes that whole day."""
+    moment, date_only = parse_time(event.rule["UNTIL"], {})
+    if not date_only:
+        return moment.timestamp()
+    next_day = (moment + datetime.timedelta(days=1)).replace(tzinfo=event.start.tzinfo)
+    return next_day.timestamp() - 1
+
+
+def occurrences(event, window_start, window_end):
+    """Yield the (start, end) epoch seconds of each instance of event that overlaps the window."""
+    length = event.duration.total_seconds()
+    if length <= 0:
+        return  # Reminders and other zero-length entries take no time
+    if event.rule is None:
+        start = event.start.timestamp()
+        if start < window_end and start + length > window_start:
+            yield start, start + length
+        return
+    count = int(event.rule["COUNT"]) if "COUNT" in event.rule else None
+    until = _until(event) if "UNTIL" in event.rule else None
+    for n, moment in _candidates(event.start, event.rule, window_start - length, window_end):
+        if count is not None and n >= count:
+            return
+        start = moment.timestamp()
+        if start >= window_end or (until is not None and start > until):
+            return
+        if start + length > window_start and start not in event.exdates:
+            yield start, start + length
+
+
+def expand(blocks, window_start, window_end):
+    """The sorted busy intervals of one UID's blocks: the series, with its overridden and excluded instances applied."""
+    master, overrides = None, []
+    for block in blocks:
+        event = parse_event(block)
+        if event is None:
+            continue
+        if event.recurrence_id is None:
+            master = event
+        else:
+            overrides.append(event)
+    replaced = {event.recurrence_id for event in overrides}
+    intervals = []
+    if master is not None and master.busy:
+        intervals.extend(interval for interval in occurrences(master, window_start, window_end) if interval[0] not in replaced)
+    for event in overrides:
+        if event.busy:
+            intervals.extend(occurrences(event._replace(rule=None), window_start, window_end))
+    intervals.sort()
+    return intervals
+
+
+class IntervalIndex:
+    """Sorted, disjoint busy intervals. Each query is one binary search.
+
+    Overlapping and back-to-back meetings merge into one interval, so the
+    light does not flicker between them.
+    """
+
+    def __init__(self, intervals=()):
+        """intervals: (start, end) pairs sorted by start, each end after its start."""
+        starts = list(map(operator.itemgetter(0), intervals))
+        reach = list(itertools.accumulate(map(operator.itemgetter(1), intervals), max))  # Latest end up to each interval
+        # A busy stretch ends where the next interval starts after everything before it has ended
+        breaks = [i for i, start, before in zip(itertools.count(1), starts[1:], reach) if start > before]
+        self.starts = starts[:1] + [starts[i] for i in breaks]
+        self.ends = [reach[i - 1] for i in breaks] + reach[-1:]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def state(self, t):
+        """Return (busy, next change) at epoch time t; the next change is None when nothing is scheduled."""
+        i = bisect.bisect_right(self.starts, t) - 1
+        if i >= 0 and t < self.ends[i]:
+            return True, self.ends[i]
+        return False, self.starts[i + 1] if i + 1 < len(self.starts) else None
+
+    def busy_at(self, t):
+        return self.state(t)[0]
+
+
+class Calendar:
+    """The busy intervals of an .ics file, refreshed incrementally when it changes."""
+
+    def __init__(self, path, horizon_days=DEFAULT_HORIZON_DAYS, clock=time.time):
+        self.path = path
+        self.horizon = horizon_days * 86400
+        self.clock = clock
+        self.index = IntervalIndex()
+        self.instances = 0  # Busy instances in the window
+        self.expanded = 0  # UIDs expanded by the last refresh
+        self.reused = 0  # UIDs whose intervals the last refresh kept
+        self.window = None  # (start, end) epoch seconds the intervals cover
+        self._stat = None
+        self._groups = {}  # uid -> (blocks, intervals)
+        self._instances = []  # Every group's intervals, sorted
+
+    def refresh(self):
+        """Re-read the file if it changed, or if the window has to move on. Returns whether the index was rebuilt. Blocking."""
+        now = self.clock()
+        try:
+            stat = os.stat(self.path)
+        except OSError as e:
+            if self._stat is not None:
+                logging.warning(f"Calendar {self.path} unavailable, keeping the meetings already read: {e}")
+                self._stat = None
+            return False
+        stat = (stat.st_mtime_ns, stat.st_size)
+        slide = self.window is None or now + self.horizon / 2 > self.window[1]
+        if stat == self._stat and not slide:
+            return False
+        with open(self.path, encoding="utf-8", errors="replace") as f:
+            groups = event_blocks(unfold(f.read()))
+        if slide:
+            self.window = (now - LOOKBEHIND, now + self.horizon)
+        expanded = {}
+        self.expanded = self.reused = 0
+        for uid, blocks in groups.items():
+            cached = self._groups.get(uid)
+            if cached is not None and cached[0] == blocks and not slide:
+                expanded[uid] = cached
+                self.reused += 1
+                continue
+            try:
+                expanded[uid] = (blocks, expand(blocks, *self.window))
+            except (ValueError, TypeError, KeyError, IndexError) as e:
+                logging.warning(f"Skipping calendar event {uid}: {e}")
+                expanded[uid] = (blocks, [])
+            self.expanded += 1
+        if slide or self.expanded + len(self._groups) - self.reused > len(expanded) // INCREMENTAL_LIMIT:
+            self._instances = sorted(interval for _, intervals in expanded.values() for interval in intervals)
+        else:
+            self._patch(expanded)
+        self._groups = expanded
+        self._stat = stat
+        self.instances = len(self._instances)
+        self.index = IntervalIndex(self._instances)
+        logging.debug(f"Calendar: {self.instances} meetings, {self.expanded} events expanded, {self.reused} reused")
+        return True
+
+    def _patch(self, expanded):
+        """Swap the intervals of the groups that changed or went away in the sorted instance list."""
+        instances = self._instances
+        for uid, (blocks, intervals) in self._groups.items():
+            if expanded.get(uid, (None,))[0] != blocks:
+                for interval in intervals:
+                    i = bisect.bisect_left(instances, interval)
+                    if i < len(instances) and instances[i] == interval:
+                        del instances[i]
+        for uid, (blocks, intervals) in expanded.items():
+            if self._groups.get(uid, (None,))[0] != blocks:
+                for interval in intervals:
+                    bisect.insort(instances, interval)
+
+    def state(self, t=None):
+        """(busy, next change) now, or at epoch time t."""
+        return self.index.state(self.clock() if t is None else t)
+
+
+class MeetingWatcher:
+    """Make light busy during the calendar's meetings, and lead_time seconds ahead of them.
+
+    With countdown the lead time plays the countdown effect instead of
+    going busy early. color defaults to the light's mic color. All methods
+    may be called from any thread.
+    """
+
+    def __init__(self, light, calendar, lead_time=DEFAULT_LEAD_TIME, countdown=False, color=None):
+        self.light = light
+        self.calendar = calendar
+        self.lead_time = lead_time
+        self.countdown = countdown
+        self.color = color
+        self.busy = False  # Whether the calendar source is posted
+        self.next_change = None  # Epoch time of the next meeting start or end
+        self._countdown_for = None  # Start of the meeting the countdown runs for
+
+    @classmethod
+    def from_settings(cls, light, settings):
+        """Build a watcher from a {"path", "lead_minutes", "countdown", "color", "horizon_days"} dict."""
+        meetings = Calendar(settings["path"], settings.get("horizon_days", DEFAULT_HORIZON_DAYS))
+        return cls(light, meetings, settings.get("lead_minutes", DEFAULT_LEAD_TIME / 60) * 60, settings.get("countdown", False), settings.get("color"))
+
+    def start(self):
+        self.light.scheduler.every("calendar", CALENDAR_CHECK_INTERVAL, self.check, first=0)
+
+    def stop(self):
+        self.light.scheduler.cancel("calendar")
+        self.light.scheduler.cancel("calendar-change")
+        if self._countdown_for is not None:
+            self.light.stop_effect()
+        self.light.clear_source(CALENDAR_SOURCE)
+
+    async def check(self):
+        """Scheduled: pick up edits to the file, then re-evaluate."""
+        try:
+            await asyncio.to_thread(self.calendar.refresh)
+        except (OSError, ValueError) as e:
+            logging.error(f"Error reading calendar {self.calendar.path}: {e}")
+        self.update()
+
+    def update(self):
+        """Post or clear the calendar source for now, and wake again at the next change. Runs on the loop."""
+        now = self.calendar.clock()
+        busy, change = self.calendar.state(now)
+        soon = not busy and change is not None and change - now <= self.lead_time
+        color = self.color or self.light.mic_color
+        if busy or (soon and not self.countdown):
+            self.light.set_source(CALENDAR_SOURCE, color, CALENDAR_PRIORITY)
+        elif self.busy:
+            self.light.clear_source(CALENDAR_SOURCE)
+        self.busy = busy or (soon and not self.countdown)
+        if not (soon and self.countdown):
+            self._countdown_for = None
+        elif self._countdown_for != change and not self.light.mic_in_use:
+            from busylight import effects
+
+            self._countdown_for = change
+            self.light.play_effect(effects.create("countdown", color, duration=change - now), duration=change - now)
+        self.next_change = change
+        wakes = [t for t in (change, None if busy or change is None else change - self.lead_time) if t is not None and t > now]
+        if wakes:
+            self.light.scheduler.after("calendar-change", min(wakes) - now, self.update)
+        else:
+            self.light.scheduler.cancel("calendar-change")
@@ -0,0 +1,200 @@
+"""Fixed-memory latency histograms and counters, exported in the Prometheus text format.
+
+Every stage between the microphone flipping and the LED changing is timed:
+
+    detector scan  ->  queued on the event loop  ->  transport write  ->  firmware echo
+
+Histograms keep one count per bucket, so memory does not grow with the
+number of observations. Each metric can carry one label (the device name
+for per-device metrics); the label values are the registered devices, so
+that stays bounded too.
+"""
+import asyncio
+import bisect
+import logging
+import os
+import threading
+
+# Upper bounds in seconds, from sub-millisecond scans to multi-second BLE writes
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_PORT = 9477  # Default port for serve()
+
+
+def _labels(label_name, label_value):
+    if label_value is None:
+        return ""
+    escaped = str(label_value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'{label_name}="{escaped}"'
+
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = {}  # label value (None without a label) -> count
+        self._lock = threading.Lock()
+
+    def inc(self, label=None, amount=1):
+        with self._lock:
+            self.values[label] = self.values.get(label, 0) + amount
+
+    def value(self, label=None):
+        return self.values.get(label, 0)
+
+    def total(self):
+        return sum(self.values.values())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label, value in sorted(self.values.items(), key=lambda item: str(item[0])):
+            labels = _labels(self.label, label)
+            lines.append(f"{self.name}{{{labels}}} {value}" if labels else f"{self.name} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, label=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self.series = {}  # label value -> [per-bucket counts (last is +Inf), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, label=None):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(label)
+            if series is None:
+                series = self.series[label] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, label=None):
+        series = self.series.get(label)
+        return series[2] if series else 0
+
+    def quantile(self, q, label=None):
+        """Estimate a quantile as the upper bound of the bucket it falls in. None without observations."""
+        series = self.series.get(label)
+        if not series or not series[2]:
+            return None
+        rank = q * series[2]
+        seen = 0
+        for bound, count in zip(self.buckets, series[0]):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label, (counts, total, count) in sorted(self.series.items(), key=lambda item: str(item[0])):
+            labels = _labels(self.label, label)
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{_format(float(bound))}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {_format(total)}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, label=None):
+        metric = Counter(name, help, label)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, label=None, buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, label, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write render() to path atomically, for node_exporter's textfile collector."""
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as f:
+            f.write(self.render())
+        os.replace(temporary, path)
+
+    async def serve(self, host="127.0.0.1", port=METRICS_PORT):
+        """Serve render() over HTTP for a Prometheus scraper. Returns the asyncio server."""
+
+        async def handle(reader, writer):
+            try:
+                # Any request path gets the metrics; the headers are read and ignored
+                while (await reader.readline()).strip():
+                    pass
+                body = self.render().encode()
+                writer.write(
+                    b"HTTP/1.0 200 OK\r\n"
+                    b"Content-Type: text/plain; version=0.0.4\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, host, port)
+        logging.info(f"Metrics listening on http://{host}:{port}/metrics")
+        return server
+
+
+registry = MetricsRegistry()
+
+scan_seconds = registry.histogram("busylight_detector_scan_seconds", "Time one microphone scan took.")
+detector_changes = registry.counter("busylight_detector_changes_total", "Microphone state changes seen by the detector.")
+queue_seconds = registry.histogram("busylight_queue_seconds", "Time from a state change to the device's write starting.", "device")
+write_seconds = registry.histogram("busylight_write_seconds", "Time the transport took to accept a write.", "device")
+echo_seconds = registry.histogram("busylight_echo_seconds", "Time from a write to the firmware's echo or acknowledgement.", "transport")
+writes = registry.counter("busylight_writes_total", "Colors written to a device.", "device")
+writes_suppressed = registry.counter("busylight_writes_suppressed_total", "Writes skipped because the device already shows the color.", "device")
+writes_coalesced = registry.counter("busylight_writes_coalesced_total", "Queued commands replaced by a newer one before they were written.", "transport")
+write_errors = registry.counter("busylight_write_errors_total", "Writes that raised an error.", "device")
+retransmits = registry.counter("busylight_retransmits_total", "Frames written again because no ack arrived in time.", "transport")
+links_lost = registry.counter("busylight_links_lost_total", "Times a device link dropped.", "device")
+reconnects = registry.counter("busylight_reconnects_total", "Times a dropped link was re-established.", "device")
+ble_scan_seconds = registry.histogram("busylight_ble_scan_seconds", "Time from a BLE scan starting to the first matching advertisement.")
+remote_states = registry.counter("busylight_remote_states_total", "Presence states applied from a publisher.", "topic")
+remote_dropped = registry.counter("busylight_remote_dropped_total", "Presence datagrams dropped as duplicates or older than one already applied.", "topic")
+remote_lost = registry.counter("busylight_remote_lost_total", "Presence datagrams missed, from gaps in the sequence numbers.", "topic")
+
+
+def summary(device=None, transport=None):
+    """A few headline numbers for the GUI overlay, as text. transport defaults to the device name."""
+    transport = transport or device
+
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.1f}"
+
+    return (
+        f"write p50/p95 ms: {ms(write_seconds.quantile(0.5, device))}/{ms(write_seconds.quantile(0.95, device))}  "
+        f"queue p95 ms: {ms(queue_seconds.quantile(0.95, device))}  "
+        f"echo p95 ms: {ms(echo_seconds.quantile(0.95, transport))}\n"
+        f"writes: {writes.value(device)}  suppressed: {writes_suppressed.value(device)}  "
+        f"coalesced: {writes_coalesced.value(transport)}  retransmits: {retransmits.value(transport)}  "
+        f"reconnects: {reconnects.value(device)}"
+    )
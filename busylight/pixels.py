@@ -0,0 +1,211 @@
+"""Per-pixel framebuffer and the run-length / delta pixel frames that carry it.
+
+Pixel frame layout (OP_PIXELS, variable length):
+
+    0    header: version, CRC flag, opcode OP_PIXELS (see busylight.protocol)
+    1    target device id
+    2    sequence number (shared with the other frames)
+    3    flags: FLAG_DELTA = runs apply on top of the frame with the base
+         sequence
+    4    base sequence (0 without FLAG_DELTA)
+    5    chunk index, from 0
+    6    chunk count
+    7..  runs, each: start pixel, count, then either one color for all
+         count pixels or, with LITERAL in the count byte, count colors
+    -1   CRC-8 of everything before it
+
+A frame too large for one write is split into chunks on run boundaries; the
+light shows it once the last chunk arrives, and only if every chunk before
+it arrived in order. A chunk out of order drops the frame, so a lost chunk
+never shows (or acks) a partial frame. Pixel indices are one byte, so a
+strip can have at most MAX_PIXELS pixels.
+"""
+import numpy as np
+
+from busylight.effects import NUM_PIXELS
+from busylight.protocol import CRC_FLAG, OP_PIXELS, TARGET_ALL, VERSION, crc8
+from busylight.transport import parse_color
+
+HEADER_SIZE = 7
+MAX_PIXELS = 256
+MAX_CHUNKS = 255
+FLAG_DELTA = 0x01
+LITERAL = 0x80  # Set in a run's count byte when the run carries one color per pixel
+MAX_RUN = 0x7F
+DEFAULT_MAX_PAYLOAD = 244  # ATT MTU 247 minus the 3-byte ATT header
+DECODER_HISTORY = 4  # Frames a light keeps to apply deltas against; the firmware keeps as many
+
+
+class FrameBuffer:
+    """A strip's pixels as a (length, 3) uint8 array, with single pixel and range setters.
+
+    Also usable as a busylight.effects effect: playing it streams whatever
+    the buffer holds, and frames that did not change are not sent.
+    """
+
+    def __init__(self, length=NUM_PIXELS):
+        if not 0 < length <= MAX_PIXELS:
+            raise ValueError(f"A strip has 1 to {MAX_PIXELS} pixels, not {length}")
+        self.pixels = np.zeros((length, 3), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.pixels)
+
+    @staticmethod
+    def _rgb(color):
+        return parse_color(color) if isinstance(color, str) else color
+
+    def set_pixel(self, index, color):
+        self.pixels[index] = self._rgb(color)
+
+    def set_range(self, start, stop, color):
+        """Set pixels start..stop-1, like a slice."""
+        self.pixels[start:stop] = self._rgb(color)
+
+    def fill(self, color):
+        self.pixels[:] = self._rgb(color)
+
+    def clear(self):
+        self.pixels[:] = 0
+
+    def __call__(self, t, out):
+        out[:] = self.pixels
+
+
+def _segments(pixels, changed):
+    """Yield (start, length) for each run of identical, changed pixels."""
+    boundary = np.ones(len(pixels), dtype=bool)
+    boundary[1:] = np.any(pixels[1:] != pixels[:-1], axis=1) | (changed[1:] != changed[:-1])
+    starts = np.flatnonzero(boundary)
+    lengths = np.diff(np.append(starts, len(pixels)))
+    for start, length in zip(starts.tolist(), lengths.tolist()):
+        if changed[start]:
+            yield start, length
+
+
+def _runs(pixels, changed, max_literal):
+    """Encode the changed pixels as runs: a repeated color costs 5 bytes, lone pixels share a literal run."""
+    literal_start = literal_end = None
+
+    def literal():
+        for start in range(literal_start, literal_end, max_literal):
+            count = min(max_literal, literal_end - start)
+            yield bytes((start, LITERAL | count)) + pixels[start:start + count].tobytes()
+
+    for start, length in _segments(pixels, changed):
+        if length == 1:
+            if literal_start is not None and literal_end == start:
+                literal_end += 1
+                continue
+            if literal_start is not None:
+                yield from literal()
+            literal_start, literal_end = start, start + 1
+            continue
+        if literal_start is not None:
+            yield from literal()
+            literal_start = None
+        for offset in range(0, length, MAX_RUN):
+            count = min(MAX_RUN, length - offset)
+            yield bytes((start + offset, count)) + pixels[start].tobytes()
+    if literal_start is not None:
+        yield from literal()
+
+
+def encode_pixels(pixels, sequence, base=None, base_sequence=0, target=TARGET_ALL, max_payload=DEFAULT_MAX_PAYLOAD):
+    """Encode a (length, 3) uint8 frame, as a delta against base if given. Returns a list of chunks.
+
+    An unchanged frame still yields one (empty) chunk, so the light acks it.
+    Raises ValueError if the frame needs more than MAX_CHUNKS chunks.
+    """
+    pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+    if base is None:
+        changed = np.ones(len(pixels), dtype=bool)
+        flags, base_sequence = 0, 0
+    else:
+        changed = np.any(pixels != base, axis=1)
+        flags = FLAG_DELTA
+    room = max_payload - HEADER_SIZE - 1
+    max_literal = min(MAX_RUN, (room - 2) // 3)
+    header = (VERSION << 4) | CRC_FLAG | OP_PIXELS
+    bodies = [b""]
+    for run in _runs(pixels, changed, max_literal):
+        if len(bodies[-1]) + len(run) > room:
+            bodies.append(b"")
+        bodies[-1] += run
+    if len(bodies) > MAX_CHUNKS:
+        raise ValueError(f"A frame of {len(bodies)} chunks does not fit; raise max_payload")
+    chunks = []
+    for i, body in enumerate(bodies):
+        data = bytes((header, target, sequence, flags, base_sequence, i, len(bodies))) + body
+        chunks.append(data + bytes((crc8(data),)))
+    return chunks
+
+
+class PixelDecoder:
+    """Reference decoder: what the firmware does with pixel frames.
+
+    feed() takes one chunk and returns (sequence, pixels) once a frame is
+    complete, None while chunks are outstanding. Raises ValueError on a bad
+    CRC, a chunk out of order (the frame is dropped) or a delta against a
+    frame it no longer has.
+    """
+
+    def __init__(self, length=NUM_PIXELS, history=DECODER_HISTORY):
+        self.length = length
+        self.history = history
+        self.frames = {}  # sequence -> pixels, the last `history` complete frames
+        self.pixels = np.zeros((length, 3), dtype=np.uint8)  # What the strip shows
+        self._working = None  # (sequence, pixels, next chunk index, chunk count) of a frame whose chunks are still arriving
+
+    def feed(self, data):
+        data = bytes(data)
+        if len(data) < HEADER_SIZE + 1 or data[0] & 0x07 != OP_PIXELS:
+            raise ValueError("Not a pixel frame")
+        if data[0] & CRC_FLAG and crc8(data[:-1]) != data[-1]:
+            raise ValueError("CRC mismatch")
+        sequence, flags, base_sequence, index, chunks = data[2], data[3], data[4], data[5], data[6]
+        if index >= chunks:
+            raise ValueError(f"Chunk {index} of {chunks}")
+        if index == 0:
+            # A frame starts over at its first chunk, which is also where a resent frame begins
+            if flags & FLAG_DELTA:
+                if base_sequence not in self.frames:
+                    self._working = None
+                    raise ValueError(f"Delta against unknown frame {base_sequence}")
+                working = self.frames[base_sequence].copy()
+            else:
+                working = np.zeros((self.length, 3), dtype=np.uint8)
+        elif self._working is not None and self._working[0] == sequence and self._working[2:] == (index, chunks):
+            working = self._working[1]
+        else:
+            self._working = None
+            raise ValueError(f"Chunk {index} of frame {sequence} out of order; dropping the frame")
+
+        body, position = data[HEADER_SIZE:-1], 0
+        while position < len(body):
+            start, count = body[position], body[position + 1]
+            position += 2
+            if count & LITERAL:
+                count &= MAX_RUN
+                colors = np.frombuffer(body, dtype=np.uint8, count=3 * count, offset=position).reshape(count, 3)
+                working[start:start + count] = colors[: max(0, self.length - start)]
+                position += 3 * count
+            else:
+                working[start:start + count] = tuple(body[position:position + 3])
+                position += 3
+        if index < chunks - 1:
+            self._working = (sequence, working, index + 1, chunks)
+            return None
+
+        self._working = None
+        self.pixels = working
+        self.frames[sequence] = working
+        while len(self.frames) > self.history:
+            del self.frames[next(iter(self.frames))]
+        return sequence, working
+
+
+def full_frame_size(length):
+    """Bytes a frame with every pixel spelled out would take: header, one literal run per MAX_RUN pixels, CRC."""
+    runs = -(-length // MAX_RUN)
+    return HEADER_SIZE + 2 * runs + 3 * length + 1
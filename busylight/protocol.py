@@ -0,0 +1,144 @@
+"""Binary color frames, and a reference decoder that also understands the legacy ASCII commands.
+
+Frame layout (FRAME_SIZE bytes):
+
+    0    header: high nibble = version, bit 3 = CRC present, bits 0-2 = opcode
+    1    target device id (TARGET_ALL for every light)
+    2-4  red, green, blue
+    5    brightness (255 = full)
+    6    sequence number, wraps at 256
+    7    CRC-8 (poly 0x07) of bytes 0-6, or 0 when the CRC flag is clear
+
+The header byte is always 0x10-0x1F, which never starts a legacy command
+("255,0,0" or the single letters R/G/W/E), so a peer can tell the two apart
+from the first byte.
+"""
+import collections
+
+from busylight.transport import parse_color
+
+VERSION = 1
+FRAME_SIZE = 8
+TARGET_ALL = 0xFF
+FULL_BRIGHTNESS = 255
+CRC_FLAG = 0x08
+
+# Opcodes
+OP_SET_COLOR = 1
+OP_OFF = 2
+OP_HEARTBEAT = 3
+OP_ACK = 4
+OP_PIXELS = 5  # Variable length, see busylight.pixels
+
+LEGACY_LETTERS = {
+    "R": (255, 0, 0),
+    "G": (0, 255, 0),
+    "W": (255, 255, 255),
+    "E": (0, 0, 0),
+}
+
+Frame = collections.namedtuple("Frame", "version opcode target rgb brightness sequence")
+
+
+def _crc8_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return bytes(table)
+
+
+CRC8_TABLE = _crc8_table()
+
+
+def crc8(data, crc=0):
+    for byte in data:
+        crc = CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+class FrameEncoder:
+    """Build frames, reusing a precomputed body for each color already seen.
+
+    Only the sequence number and CRC change between two frames for the same
+    color, so those are the only bytes computed per update.
+    """
+
+    def __init__(self, target=TARGET_ALL, brightness=FULL_BRIGHTNESS, use_crc=True):
+        self.target = target
+        self.brightness = brightness
+        self.use_crc = use_crc
+        self.sequence = 0
+        self._bodies = {}  # (opcode, color, brightness) -> (first 6 bytes, CRC of them)
+
+    def _body(self, opcode, color, brightness):
+        key = (opcode, color, brightness)
+        body = self._bodies.get(key)
+        if body is None:
+            rgb = parse_color(color) if color else (0, 0, 0)
+            header = (VERSION << 4) | (CRC_FLAG if self.use_crc else 0) | opcode
+            data = bytes((header, self.target, *rgb, brightness))
+            body = self._bodies[key] = (data, crc8(data))
+        return body
+
+    def precompute(self, colors):
+        """Warm the cache for the configured colors (mic, idle, ...)."""
+        for color in colors:
+            self._body(OP_SET_COLOR, color, self.brightness)
+
+    def next_sequence(self):
+        """Take a sequence number, for frames built elsewhere (busylight.pixels) that share the counter."""
+        sequence = self.sequence
+        self.sequence = (sequence + 1) & 0xFF
+        return sequence
+
+    def encode(self, color, opcode=OP_SET_COLOR, brightness=None):
+        """Return the next frame for an "r,g,b" color and advance the sequence number."""
+        body, body_crc = self._body(opcode, color, self.brightness if brightness is None else brightness)
+        sequence = self.next_sequence()
+        crc = CRC8_TABLE[body_crc ^ sequence] if self.use_crc else 0
+        return body + bytes((sequence, crc))
+
+
+def encode_ack(sequence, target=TARGET_ALL):
+    """The frame a light notifies back after applying the frame with this sequence number."""
+    data = bytes(((VERSION << 4) | CRC_FLAG | OP_ACK, target, 0, 0, 0, 0, sequence))
+    return data + bytes((crc8(data),))
+
+
+def encode_ascii(color):
+    """The legacy "r,g,b" payload the original Bluetooth firmware expects."""
+    return color.encode()
+
+
+def is_binary_frame(data):
+    return len(data) >= FRAME_SIZE and data[0] >> 4 == VERSION
+
+
+def decode(data):
+    """Decode a binary frame or a legacy ASCII command into a Frame.
+
+    Legacy commands decode with version 0, full brightness and no sequence
+    number. Raises ValueError for anything else, including a bad CRC.
+    """
+    data = bytes(data)
+    if is_binary_frame(data):
+        if len(data) != FRAME_SIZE and data[0] & 0x07 != OP_PIXELS:
+            raise ValueError(f"Expected {FRAME_SIZE} bytes, got {len(data)}")
+        header = data[0]
+        if header & 0x07 == OP_PIXELS:
+            raise ValueError("Pixel frames are decoded by busylight.pixels.PixelDecoder")
+        if header & CRC_FLAG and crc8(data[:7]) != data[7]:
+            raise ValueError("CRC mismatch")
+        return Frame(VERSION, header & 0x07, data[1], tuple(data[2:5]), data[5], data[6])
+
+    text = data.decode("ascii", errors="strict").strip()
+    if text in LEGACY_LETTERS:
+        rgb = LEGACY_LETTERS[text]
+        return Frame(0, OP_OFF if text == "E" else OP_SET_COLOR, TARGET_ALL, rgb, FULL_BRIGHTNESS, None)
+    parts = text.split(",")
+    if len(parts) != 3:
+        raise ValueError(f"Invalid command format: {text!r}")
+    return Frame(0, OP_SET_COLOR, TARGET_ALL, parse_color(text), FULL_BRIGHTNESS, None)
@@ -0,0 +1,328 @@
+"""Replay a recorded trace through the real detection and dedup code on a virtual clock.
+
+The trace's ConsentStore events are applied to a FakeWinreg, which the
+ConsentStoreScanner reads like the real registry. Its results go through
+MicrophoneDetector (and the StateFilter when debounce is on) to BusyLight,
+whose Device dedups and writes to an in-memory transport. Everything runs
+on an event loop whose clock jumps straight to the next timer, so a
+simulated day replays in seconds, on any platform, with the same result
+every time.
+
+Detect latency is measured from the trace event that changed whether
+anything is in use to the write that showed it; changes the light never
+showed (a flap the debounce held back, or one that was over before the
+next poll) are counted separately.
+"""
+import asyncio
+import bisect
+import random
+import selectors
+import time
+
+from busylight.core import BusyLight
+from busylight.debounce import StateFilter
+from busylight.detector import POLL_INTERVAL, MicrophoneDetector
+from busylight.fake_winreg import FakeWinreg
+from busylight.scanner import CAPABILITY_STORES, CONSENT_STORE_ROOT, ConsentStoreScanner, capability_keys
+from busylight.trace import read_trace
+from busylight.transport import Transport
+
+DEFAULT_WRITE_LATENCY = 0.01  # Seconds a simulated write takes, like an acknowledged BLE write
+SETTLE_TIME = 30  # Seconds replayed after the last event so held-back changes get written
+REPLAY_SEED = 0  # Reconnect jitter is drawn from random; seeding it keeps replays identical
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """Never blocks: a wait for the next timer moves the loop's clock forward instead."""
+
+    def __init__(self):
+        super().__init__()
+        self.loop = None
+
+    def select(self, timeout=None):
+        ready = super().select(0)
+        if not ready and timeout:
+            self.loop.now += timeout
+            self.loop.wakeups += 1
+        return ready
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """An event loop whose time() is virtual and only advances when every task is waiting."""
+
+    def __init__(self):
+        selector = _VirtualSelector()
+        super().__init__(selector)
+        selector.loop = self
+        self.now = 0.0
+        self.wakeups = 0  # Times the loop would have slept until a timer
+
+    def time(self):
+        return self.now
+
+    def run_in_executor(self, executor, func, *args):
+        """Run func inline: the clock would otherwise move on while a worker thread runs it."""
+        future = self.create_future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class ReplayTransport(Transport):
+    """Records each write with the virtual time it completed. The trace's link events set available and call drop()."""
+
+    name = "replay"
+    link_check_interval = None
+
+    def __init__(self, latency=DEFAULT_WRITE_LATENCY):
+        self.latency = latency
+        self.available = True
+        self.writes = []  # (loop time, color)
+        self._connected = False
+        self._lost = None
+
+    @property
+    def is_connected(self):
+        return self._connected
+
+    async def connect(self):
+        self._connected = self.available
+        if self._connected:
+            self._lost = asyncio.Event()
+        return self._connected
+
+    async def disconnect(self):
+        self.drop()
+
+    def drop(self):
+        self._connected = False
+        if self._lost is not None:
+            self._lost.set()
+
+    async def wait_disconnected(self):
+        if self._lost is not None:
+            await self._lost.wait()
+
+    async def send(self, color):
+        if not self._connected:
+            raise ConnectionError("Replay transport is not connected")
+        await asyncio.sleep(self.latency)
+        self.writes.append((asyncio.get_running_loop().time(), color))
+
+
+class _ReplayBackend:
+    """Detector backend over the scanner; the replay signals changes itself."""
+
+    def __init__(self, scanner, notifies):
+        self.scanner = scanner
+        self.notifies = notifies
+        self.scans = 0
+        self.scan_cpu = 0.0  # Process time spent in scans
+
+    def scan(self):
+        self.scans += 1
+        started_at = time.process_time()
+        result = self.scanner.scan()
+        self.scan_cpu += time.process_time() - started_at
+        return result
+
+    def close(self):
+        self.scanner.close()
+
+
+class ReplayResult:
+    def __init__(self, name, mode, duration):
+        self.name = name
+        self.mode = mode
+        self.duration = duration  # Simulated seconds
+        self.events = 0
+        self.recorded_writes = 0  # Writes in the trace itself, when it was recorded against a light
+        self.writes = 0
+        self.changes = 0  # Times the traced state flipped between busy and idle
+        self.hidden = 0  # Flips the light never showed
+        self.latencies = []  # Seconds from a flip to the write that showed it
+        self.scans = 0
+        self.scan_cpu = 0.0
+        self.cpu = 0.0  # Process time for the whole replay
+        self.wall = 0.0
+
+    def _per_hour(self, value):
+        return value * 3600 / self.duration if self.duration else 0.0
+
+    @property
+    def cpu_per_hour(self):
+        return self._per_hour(self.cpu)
+
+    @property
+    def writes_per_hour(self):
+        return self._per_hour(self.writes)
+
+    @property
+    def speedup(self):
+        return self.duration / self.wall if self.wall else float("inf")
+
+    def latency(self, q):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Replayer:
+    """Replay one trace.
+
+    mode "notify" scans as soon as the registry changes (RegistryNotifyBackend),
+    "poll" every poll_interval (PollingBackend). debounce is a StateFilter
+    settings dict, or None to report every change.
+    """
+
+    def __init__(self, path, mode="notify", poll_interval=POLL_INTERVAL, debounce=None, write_latency=DEFAULT_WRITE_LATENCY,
+                 resend_interval=None, capabilities=None, ignore=()):
+        self.header, self.trace = read_trace(path)
+        self.name = self.header.get("name", path)
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.write_latency = write_latency
+        self.resend_interval = resend_interval
+        self.capabilities = capabilities or self.header.get("capabilities") or list(CAPABILITY_STORES)
+        self.ignore = ignore
+        self._stores = {CAPABILITY_STORES[capability] for capability in self.capabilities}
+
+    def run(self):
+        state = random.getstate()
+        random.seed(REPLAY_SEED)
+        loop = VirtualTimeLoop()
+        started_at, cpu_at = time.perf_counter(), time.process_time()
+        try:
+            result = loop.run_until_complete(self._replay())
+        finally:
+            loop.close()
+            random.setstate(state)
+        result.wall = time.perf_counter() - started_at
+        result.cpu = time.process_time() - cpu_at
+        return result
+
+    def _busy(self, values, scanner):
+        """Whether the registry contents mean busy, worked out directly from the trace."""
+        for path, value in values.items():
+            capability_store, _, rest = path.partition("\\")
+            app = rest.rpartition("\\")[2]
+            if value == 0 and capability_store in self._stores and not (scanner.ignore and scanner.is_ignored(app)):
+                return True
+        return False
+
+    async def _replay(self):
+        loop = asyncio.get_running_loop()
+        end = max((event[0] for event in self.trace), default=0) / 1000 + SETTLE_TIME
+        result = ReplayResult(self.name, self.mode, end)
+
+        registry = FakeWinreg()
+        for capability in self.capabilities:
+            for root_key in capability_keys(capability):
+                registry.create_key(root_key)  # Windows has the stores before any app uses them
+        scanner = ConsentStoreScanner(self.capabilities, winreg=registry, ignore=self.ignore, clock=loop.time)
+        backend = _ReplayBackend(scanner, notifies=self.mode == "notify")
+        transport = ReplayTransport(self.write_latency)
+        light = BusyLight(transport, resend_interval=self.resend_interval, auto_reconnect=True, loop=loop)
+        light.device.clock = loop.time
+        state_filter = None
+        if self.debounce is not None:
+            state_filter = StateFilter.from_settings(self.debounce)
+            state_filter.clock = loop.time
+        fallback_interval = None if backend.notifies else self.poll_interval
+        detector = MicrophoneDetector(backend, light.set_mic_in_use, fallback_interval, state_filter)
+
+        values = {}
+        flips = []  # (time, busy) each time the traced state changed
+        changed = asyncio.Event()
+
+        def apply(event):
+            kind = event[1]
+            if kind in ("set", "del"):
+                path = f"{CONSENT_STORE_ROOT}\\{event[2]}"
+                if kind == "set":
+                    registry.set_value(path, "LastUsedTimeStop", event[3])
+                    values[event[2]] = event[3]
+                elif event[2] in values:
+                    registry.delete_key(path)
+                    del values[event[2]]
+                busy = self._busy(values, scanner)
+                if not flips or flips[-1][1] != busy:
+                    flips.append((loop.time(), busy))
+                changed.set()
+            elif kind == "write":
+                result.recorded_writes += 1
+            elif kind == "link":
+                transport.available = bool(event[3])
+                if not event[3]:
+                    transport.drop()
+
+        async def detect():
+            # MicrophoneDetector.run(), with the blocking wait swapped for the event loop
+            while True:
+                detector._rescan()
+                timeout = detector.fallback_interval
+                if state_filter is not None:
+                    timeout = state_filter.wait_time(timeout)
+                if backend.notifies:
+                    try:
+                        await asyncio.wait_for(changed.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    changed.clear()
+                else:
+                    await asyncio.sleep(timeout)
+
+        index = 0
+        while index < len(self.trace) and self.trace[index][0] == 0:
+            apply(self.trace[index])  # The snapshot the recording started with
+            index += 1
+        flips[:] = [(0.0, self._busy(values, scanner))]
+        await light.connect()
+        detector_task = asyncio.ensure_future(detect())
+        for event in self.trace[index:]:
+            delay = event[0] / 1000 - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            apply(event)
+        await asyncio.sleep(max(0.0, end - loop.time()))
+
+        detector_task.cancel()
+        await light.disconnect()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        backend.close()
+
+        result.events = len(self.trace)
+        result.scans = backend.scans
+        result.scan_cpu = backend.scan_cpu
+        result.writes = len(transport.writes)
+        self._match(flips, transport.writes, light.idle_color, result)
+        return result
+
+    @staticmethod
+    def _match(flips, writes, idle_color, result):
+        """Pair each write that changed what the light shows with the latest flip to that state before it."""
+        result.changes = len(flips) - 1
+        times = [at for at, _ in flips]
+        shown = flips[0][1]  # The starting state, shown by the first write
+        pending = 1  # Index of the first flip not yet shown or counted as hidden
+        for written_at, color in writes:
+            busy = color != idle_color
+            if busy == shown:
+                continue  # Heartbeat or reconnect resend
+            index = bisect.bisect_right(times, written_at) - 1
+            if index >= pending and flips[index][1] != busy:
+                index -= 1  # States alternate; the newest flip went back already
+            if index < pending:
+                continue
+            result.latencies.append(written_at - flips[index][0])
+            result.hidden += index - pending
+            pending = index + 1
+            shown = busy
+        result.hidden += len(flips) - pending
@@ -0,0 +1,105 @@
+"""Per-app color rules: which app using the microphone, camera or screen decides the busy color.
+
+Rules live in the settings file next to mic_color and idle_color:
+
+    "app_rules": [
+        {"app": "*teams*", "color": "255,0,0"},
+        {"app": "*obs64.exe", "color": "128,0,128", "priority": 10},
+        {"app": "*chrome.exe", "color": "255,191,0", "capability": "microphone"},
+        {"app": "microsoftwindows.client.cbs_*", "ignore": true}
+    ]
+
+app is a case-insensitive glob matched against the ConsentStore subkey name,
+like ignore_apps. capability limits a rule to one store. When several apps
+are present the highest priority rule wins, then the earlier rule, then the
+earlier capability. Apps no rule matches fall back to capability_colors and
+then mic_color. Ignore rules are handed to the scanner, so an ignored app
+never counts as busy; they apply to every store.
+
+RuleTable compiles the rules once. The first time an app is seen its best
+rule is found and cached, so turning a presence into a color costs a dict
+lookup per app, and a repeated presence costs one lookup in all.
+"""
+import fnmatch
+
+from busylight.transport import validate_color
+
+DEFAULT_RULE_PRIORITY = 0
+CAPABILITY_COLOR_PRIORITY = -1  # capability_colors lose to every app rule with a default priority
+MAX_CACHED_PRESENCES = 256
+
+
+def _check(rule):
+    if not isinstance(rule, dict) or not rule.get("app") or not isinstance(rule["app"], str):
+        raise ValueError(f"App rule needs an app pattern: {rule!r}")
+    if rule.get("ignore"):
+        return
+    if not rule.get("color"):
+        raise ValueError(f"App rule needs a color or ignore: {rule!r}")
+    validate_color(rule["color"])
+    priority = rule.get("priority", DEFAULT_RULE_PRIORITY)
+    if not isinstance(priority, int) or isinstance(priority, bool):
+        raise ValueError(f"App rule priority must be an integer: {rule!r}")
+
+
+class RuleTable:
+    """app_rules and capability_colors compiled for lookup by Presence.
+
+    resolve(presence) returns (color, Presence) for the item that decided
+    the color, or (None, None) when no rule matches.
+    """
+
+    def __init__(self, rules=(), capability_colors=None, capabilities=()):
+        self.rules = []  # (rank, capability or None, pattern, color), best rank first
+        self.ignore = []  # Patterns for the scanner
+        for index, rule in enumerate(rules):
+            _check(rule)
+            pattern = rule["app"].lower()
+            if rule.get("ignore"):
+                self.ignore.append(pattern)
+                continue
+            rank = (rule.get("priority", DEFAULT_RULE_PRIORITY), -index)
+            self.rules.append((rank, rule.get("capability"), pattern, validate_color(rule["color"])))
+        self.rules.sort(key=lambda rule: rule[0], reverse=True)
+        self.capability_colors = {}  # capability -> (rank, color)
+        for capability, color in (capability_colors or {}).items():
+            if color:
+                color = validate_color(color)
+                order = list(capabilities).index(capability) if capability in capabilities else len(capabilities)
+                self.capability_colors[capability] = ((CAPABILITY_COLOR_PRIORITY, -order), color)
+        self.colors = sorted({color for _, _, _, color in self.rules} | {color for _, color in self.capability_colors.values()})
+        self._by_item = {}  # Presence -> (rank, color) or None
+        self._by_presence = {}  # presence tuple -> (color, Presence or None)
+
+    def lookup(self, item):
+        """The (rank, color) of the best rule for one Presence, or None."""
+        try:
+            return self._by_item[item]
+        except KeyError:
+            pass
+        name = item.app.lower()
+        found = None
+        for rank, capability, pattern, color in self.rules:
+            if (capability is None or capability == item.capability) and fnmatch.fnmatchcase(name, pattern):
+                found = (rank, color)
+                break
+        if found is None:
+            found = self.capability_colors.get(item.capability)
+        self._by_item[item] = found
+        return found
+
+    def resolve(self, presence):
+        try:
+            return self._by_presence[presence]
+        except KeyError:
+            pass
+        best, winner = None, None
+        for item in presence:
+            found = self.lookup(item)
+            if found is not None and (best is None or found[0] > best[0]):
+                best, winner = found, item
+        resolved = (None, None) if best is None else (best[1], winner)
+        if len(self._by_presence) >= MAX_CACHED_PRESENCES:
+            self._by_presence.clear()
+        self._by_presence[presence] = resolved
+        return resolved
@@ -0,0 +1,216 @@
+import collections
+import fnmatch
+import logging
+import time
+
+# Constants
+CONSENT_STORE_ROOT = r"Software\Microsoft\Windows\CurrentVersion\CapabilityAccessManager\ConsentStore"
+# Capability -> ConsentStore subkey. Every store records LastUsedTimeStop == 0 while an app uses it;
+# screen capture is only recorded by Windows 11, for apps using the Graphics Capture API.
+CAPABILITY_STORES = {
+    "microphone": "microphone",
+    "webcam": "webcam",
+    "screen": "graphicsCaptureProgrammatic",
+}
+DEFAULT_CAPABILITIES = ("microphone", "webcam", "screen")  # Also the order of precedence for colors
+MISSING_STORE_RETRY = 60  # Seconds before looking again for a store this Windows version doesn't have
+
+
+def capability_keys(capability):
+    """The root keys of one capability store: packaged apps, then NonPackaged (desktop) apps."""
+    store = f"{CONSENT_STORE_ROOT}\\{CAPABILITY_STORES[capability]}"
+    return [store, store + r"\NonPackaged"]
+
+
+MIC_USAGE_KEYS = capability_keys("microphone")
+CONSENT_STORE_KEY = MIC_USAGE_KEYS[0]
+
+
+class Presence(collections.namedtuple("Presence", "capability app")):
+    """One app using one capability. app is the ConsentStore subkey name."""
+
+    __slots__ = ()
+
+    @property
+    def app_name(self):
+        """The executable for a desktop app ("C:#Program Files#...#Teams.exe" -> "Teams.exe"), else the package name."""
+        return self.app.rsplit("#", 1)[-1]
+
+
+def describe_presence(presence):
+    """Text for a status line, e.g. "ms-teams.exe (microphone, webcam)"; empty when idle."""
+    apps = {}
+    for item in presence:
+        apps.setdefault(item.app_name, []).append(item.capability)
+    return ", ".join(f"{app} ({', '.join(capabilities)})" for app, capabilities in apps.items())
+
+
+class _Entry:
+    """Cached state for one app subkey."""
+
+    __slots__ = ("handle", "last_write", "in_use")
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.last_write = None
+        self.in_use = False
+
+
+class ConsentStoreScanner:
+    """Incremental scanner for the ConsentStore keys of one or more capabilities.
+
+    Keeps one open handle per app subkey and only re-reads LastUsedTimeStop
+    when the subkey's last-write time moved. The app list of a root key is
+    only re-enumerated when the root key itself was written (subkey added or
+    removed). All capabilities go through the same caches in one pass, so
+    each extra store costs one QueryInfoKey per root and per app it lists.
+
+    scan() returns the presence: a tuple of Presence(capability, app) for
+    every app in use, in capability order, empty (and so falsy) when idle.
+
+    ignore is a list of case-insensitive glob patterns matched against the
+    subkey names (e.g. "*dictation*" or "C:#Tools#*"); matching apps are
+    tracked in active but never count as present.
+    """
+
+    def __init__(self, capabilities=DEFAULT_CAPABILITIES, winreg=None, ignore=(), clock=time.monotonic):
+        if winreg is None:
+            import winreg
+        self._winreg = winreg
+        self.clock = clock
+        self.capabilities = list(capabilities)
+        self.capability_by_key = {}  # root_key -> capability
+        for capability in self.capabilities:
+            for root_key in capability_keys(capability):
+                self.capability_by_key[root_key] = capability
+        self.keys = list(self.capability_by_key)
+        self._roots = {}  # root_key -> [handle, last_write, subkey count at the last enumeration]
+        self._entries = {}  # root_key -> {subkey_name: _Entry}
+        self._missing = {}  # root_key -> clock() time to look for it again
+        self.active = set()  # (capability, subkey name) with LastUsedTimeStop == 0
+        self.presence = ()
+        self.set_ignore(ignore)
+
+    def set_ignore(self, ignore):
+        """Replace the ignore patterns. The next scan applies them."""
+        self.ignore = [pattern.lower() for pattern in ignore]
+        self._ignored = {}  # subkey name -> whether an ignore pattern matches it
+
+    def is_ignored(self, subkey_name):
+        ignored = self._ignored.get(subkey_name)
+        if ignored is None:
+            name = subkey_name.lower()
+            ignored = self._ignored[subkey_name] = any(fnmatch.fnmatchcase(name, pattern) for pattern in self.ignore)
+        return ignored
+
+    def scan(self, capabilities=None):
+        """Refresh the cache and return the presence.
+
+        capabilities limits the pass to the stores known to have changed;
+        the others keep their cached state.
+        """
+        for root_key, capability in self.capability_by_key.items():
+            if capabilities is not None and capability not in capabilities:
+                continue
+            try:
+                self._scan_root(root_key)
+            except FileNotFoundError:
+                self._drop_root(root_key)
+                self._missing[root_key] = self.clock() + MISSING_STORE_RETRY
+            except PermissionError:
+                logging.error(f"Permission denied when accessing: {root_key}")
+                self._drop_root(root_key)
+        order = self.capabilities.index
+        self.presence = tuple(
+            Presence(capability, name)
+            for capability, name in sorted(self.active, key=lambda item: (order(item[0]), item[1]))
+            if not self.ignore or not self.is_ignored(name)
+        )
+        return self.presence
+
+    def _scan_root(self, root_key):
+        winreg = self._winreg
+        root = self._roots.get(root_key)
+        if root is None:
+            retry_at = self._missing.get(root_key)
+            if retry_at is not None and self.clock() < retry_at:
+                return
+            root = self._roots[root_key] = [winreg.OpenKey(winreg.HKEY_CURRENT_USER, root_key), None, None]
+            self._missing.pop(root_key, None)
+            self._entries[root_key] = {}
+        entries = self._entries[root_key]
+        capability = self.capability_by_key[root_key]
+
+        # Compared with the raw count, not len(entries): that leaves out nested roots and subkeys that failed to open
+        subkey_count, _, last_write = winreg.QueryInfoKey(root[0])
+        if last_write != root[1] or subkey_count != root[2]:
+            self._refresh_names(root_key, root[0], subkey_count)
+            root[1], root[2] = last_write, subkey_count
+
+        for subkey_name, entry in list(entries.items()):
+            try:
+                last_write = winreg.QueryInfoKey(entry.handle)[2]
+                if last_write == entry.last_write:
+                    continue
+                entry.last_write = last_write
+                try:
+                    last_used_time_stop, _ = winreg.QueryValueEx(entry.handle, "LastUsedTimeStop")
+                    entry.in_use = last_used_time_stop == 0
+                except FileNotFoundError:
+                    entry.in_use = False
+            except OSError:
+                # The app key was deleted under us. It may already be back with the root's
+                # last-write time and count unchanged, so list the names again next scan.
+                self._close_entry(entries.pop(subkey_name))
+                entry.in_use = False
+                root[1] = root[2] = None
+            if entry.in_use:
+                self.active.add((capability, subkey_name))
+            else:
+                self.active.discard((capability, subkey_name))
+
+    def _refresh_names(self, root_key, root_handle, subkey_count):
+        winreg = self._winreg
+        entries = self._entries[root_key]
+        names = set()
+        for i in range(subkey_count):
+            try:
+                names.add(winreg.EnumKey(root_handle, i))
+            except OSError:
+                break
+        # Nested roots (NonPackaged) are scanned as roots of their own
+        names.difference_update(
+            key[len(root_key) + 1:] for key in self.keys if key.startswith(root_key + "\\")
+        )
+        for subkey_name in set(entries) - names:
+            self._close_entry(entries.pop(subkey_name))
+            self.active.discard((self.capability_by_key[root_key], subkey_name))
+        for subkey_name in names - set(entries):
+            try:
+                entries[subkey_name] = _Entry(winreg.OpenKey(root_handle, subkey_name))
+            except OSError:
+                pass
+
+    def _close_entry(self, entry):
+        try:
+            self._winreg.CloseKey(entry.handle)
+        except OSError:
+            pass
+
+    def _drop_root(self, root_key):
+        for subkey_name, entry in self._entries.pop(root_key, {}).items():
+            self._close_entry(entry)
+            self.active.discard((self.capability_by_key[root_key], subkey_name))
+        root = self._roots.pop(root_key, None)
+        if root is not None:
+            try:
+                self._winreg.CloseKey(root[0])
+            except OSError:
+                pass
+
+    def close(self):
+        """Close every cached handle. The scanner reopens them on the next scan."""
+        for root_key in list(self._roots):
+            self._drop_root(root_key)
+        self.active.clear()
+        self.presence = ()
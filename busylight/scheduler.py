@@ -0,0 +1,257 @@
+"""One timer for everything that runs periodically: detector polls, heartbeats, link checks, UI refreshes.
+
+Each task has an interval and a slack: it may run up to slack seconds
+before it is due. When the scheduler wakes for the earliest task it also
+runs each task within its slack that would otherwise need a wakeup of its
+own, so timers with different periods fall into step and share wakeups
+instead of each waking the machine. Running early never delays anything;
+it only means a poll or a heartbeat happens a little more often than
+asked.
+
+Tasks that can wait longer (polls, link checks, UI refreshes) back off
+while the machine runs on battery and again while the user is away; tasks
+a device depends on, like heartbeats before its idle timeout, never do.
+PowerMonitor reads the power state, and the scheduler checks it on a
+coalesced task of its own.
+
+All methods may be called from any thread. Callbacks run on the event
+loop; a callback that returns a coroutine has it scheduled as a task, and
+the task failing counts as the callback failing.
+"""
+import asyncio
+import logging
+import os
+import sys
+
+DEFAULT_SLACK = 0.5  # Fraction of the interval a task may run early
+POWER_CHECK_INTERVAL = 60  # Seconds between power and idle checks
+BATTERY_BACKOFF = 2  # Interval multiplier while on battery
+IDLE_BACKOFF = 4  # Interval multiplier while the user is away
+IDLE_AFTER = 300  # Seconds without keyboard or mouse input before the user counts as away
+POWER_SUPPLY_DIR = "/sys/class/power_supply"
+
+
+class PowerMonitor:
+    """Whether the machine is on battery, and how long since the last user input.
+
+    Windows answers both from user32/kernel32; Linux reads the mains supply
+    from sysfs and cannot tell idle time; elsewhere neither is known.
+    """
+
+    def __init__(self):
+        self._kernel32 = None
+        self._user32 = None
+        if sys.platform == "win32":
+            import ctypes
+
+            self._ctypes = ctypes
+            self._kernel32 = ctypes.windll.kernel32
+            self._user32 = ctypes.windll.user32
+
+    def on_battery(self):
+        if self._kernel32 is not None:
+            ctypes = self._ctypes
+
+            class SYSTEM_POWER_STATUS(ctypes.Structure):
+                _fields_ = [("ACLineStatus", ctypes.c_ubyte), ("BatteryFlag", ctypes.c_ubyte), ("BatteryLifePercent", ctypes.c_ubyte),
+                            ("SystemStatusFlag", ctypes.c_ubyte), ("BatteryLifeTime", ctypes.c_ulong), ("BatteryFullLifeTime", ctypes.c_ulong)]
+
+            status = SYSTEM_POWER_STATUS()
+            if not self._kernel32.GetSystemPowerStatus(ctypes.byref(status)):
+                return False
+            return status.ACLineStatus == 0
+        try:
+            supplies = os.listdir(POWER_SUPPLY_DIR)
+        except OSError:
+            return False
+        mains = []
+        for supply in supplies:
+            try:
+                with open(os.path.join(POWER_SUPPLY_DIR, supply, "type")) as f:
+                    if f.read().strip() != "Mains":
+                        continue
+                with open(os.path.join(POWER_SUPPLY_DIR, supply, "online")) as f:
+                    mains.append(f.read().strip() == "1")
+            except OSError:
+                continue
+        return bool(mains) and not any(mains)
+
+    def idle_seconds(self):
+        """Seconds since the last keyboard or mouse input, or None if unknown."""
+        if self._user32 is None:
+            return None
+        ctypes = self._ctypes
+
+        class LASTINPUTINFO(ctypes.Structure):
+            _fields_ = [("cbSize", ctypes.c_uint), ("dwTime", ctypes.c_uint)]
+
+        info = LASTINPUTINFO(ctypes.sizeof(LASTINPUTINFO), 0)
+        if not self._user32.GetLastInputInfo(ctypes.byref(info)):
+            return None
+        return ((self._kernel32.GetTickCount() - info.dwTime) & 0xFFFFFFFF) / 1000
+
+
+class Task:
+    __slots__ = ("name", "callback", "interval", "slack", "backoff", "due", "last_run", "runs", "failures")
+
+    def __init__(self, name, callback, interval, slack, backoff, due):
+        self.name = name
+        self.callback = callback
+        self.interval = interval  # Seconds, None for a one-shot task
+        self.slack = slack
+        self.backoff = backoff  # Whether the interval stretches on battery and while idle
+        self.due = due  # Loop time
+        self.last_run = None
+        self.runs = 0
+        self.failures = 0  # Runs whose callback, or the coroutine it returned, raised
+
+
+class Scheduler:
+    """Coalesced timers on one event loop (see the module docstring)."""
+
+    def __init__(self, loop=None):
+        self._loop = loop
+        self.tasks = {}  # name -> Task
+        self.factor = 1  # Current backoff multiplier
+        self.on_battery = False
+        self.idle = False
+        self.power = None
+        self.wakeups = 0  # Timer wakeups that ran at least one task
+        self._timer = None
+
+    @property
+    def loop(self):
+        if self._loop is None:
+            from busylight.core import get_event_loop
+
+            self._loop = get_event_loop()
+        return self._loop
+
+    def _call(self, func, *args):
+        """Run func on the loop: now if this is the loop thread, else as soon as the loop gets to it."""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    def every(self, name, interval, callback, slack=None, backoff=True, first=None):
+        """Run callback every interval seconds, first after first seconds (default: one interval). Replaces a task of the same name."""
+        slack = interval * DEFAULT_SLACK if slack is None else slack
+        task = Task(name, callback, interval, slack, backoff, None)
+        self._call(self._add, task, interval if first is None else first)
+        return task
+
+    def after(self, name, delay, callback, slack=0):
+        """Run callback once, delay seconds from now. Replaces a task of the same name."""
+        task = Task(name, callback, None, slack, False, None)
+        self._call(self._add, task, delay)
+        return task
+
+    def cancel(self, name):
+        self._call(self._cancel, name)
+
+    def watch_power(self, power=None):
+        """Back off on battery and while the user is away, checking every POWER_CHECK_INTERVAL."""
+        self.power = power or PowerMonitor()
+        self.every("power", POWER_CHECK_INTERVAL, self.check_power, backoff=False, first=0)
+
+    def check_power(self):
+        try:
+            self.on_battery = self.power.on_battery()
+            idle_seconds = self.power.idle_seconds()
+        except OSError as e:
+            logging.debug(f"Power state unavailable: {e}")
+            return
+        self.idle = idle_seconds is not None and idle_seconds >= IDLE_AFTER
+        self.set_factor((BATTERY_BACKOFF if self.on_battery else 1) * (IDLE_BACKOFF if self.idle else 1))
+
+    def set_factor(self, factor):
+        """Change the backoff multiplier. Tasks that are now overdue run at the next wakeup."""
+        self._call(self._set_factor, factor)
+
+    def interval(self, task):
+        return task.interval * self.factor if task.backoff else task.interval
+
+    # Loop thread only from here on
+
+    def _add(self, task, delay):
+        task.due = self.loop.time() + delay
+        self.tasks[task.name] = task
+        self._arm()
+
+    def _cancel(self, name):
+        if self.tasks.pop(name, None) is not None:
+            self._arm()
+
+    def _set_factor(self, factor):
+        if factor == self.factor:
+            return
+        logging.debug(f"Scheduler backoff x{factor}")
+        self.factor = factor
+        for task in self.tasks.values():
+            if task.backoff and task.interval is not None and task.last_run is not None:
+                task.due = task.last_run + self.interval(task)
+        self._arm()
+
+    def _arm(self):
+        due = min((task.due for task in self.tasks.values()), default=None)
+        if self._timer is not None:
+            if due is not None and self._timer.when() == due:
+                return
+            self._timer.cancel()
+            self._timer = None
+        if due is not None:
+            self._timer = self.loop.call_at(due, self._run)
+
+    def _ready(self, now):
+        """The tasks to run at now: every task that is due, and each task within its slack that no later wakeup reaches in time."""
+        due = [task for task in self.tasks.values() if task.due <= now]
+        early = sorted((task for task in self.tasks.values() if task.due - task.slack <= now < task.due), key=lambda task: task.due)
+        running = {task.name for task in due}
+        next_wakeup = min(
+            [task.due for task in self.tasks.values() if task.name not in running and task not in early]
+            + [now + self.interval(task) for task in due if task.interval is not None],
+            default=None,
+        )
+        for task in early:
+            if next_wakeup is not None and next_wakeup <= task.due:
+                continue  # A later wakeup comes before it is due; it can run then
+            due.append(task)
+            if task.interval is not None:
+                next_wakeup = min(now + self.interval(task), next_wakeup if next_wakeup is not None else float("inf"))
+        return due
+
+    def _run(self):
+        self._timer = None
+        now = self.loop.time()
+        ready = self._ready(now)
+        if ready:
+            self.wakeups += 1
+        for task in sorted(ready, key=lambda task: task.due):
+            if self.tasks.get(task.name) is not task:
+                continue  # Cancelled or replaced by an earlier callback
+            task.last_run = now
+            task.runs += 1
+            if task.interval is None:
+                del self.tasks[task.name]
+            else:
+                task.due = now + self.interval(task)
+            try:
+                result = task.callback()
+                if asyncio.iscoroutine(result):
+                    asyncio.ensure_future(result).add_done_callback(lambda future, task=task: self._finished(task, future))
+            except Exception as e:
+                self._failed(task, e)
+        self._arm()
+
+    def _finished(self, task, future):
+        if not future.cancelled() and future.exception() is not None:
+            self._failed(task, future.exception())
+
+    def _failed(self, task, error):
+        task.failures += 1
+        logging.error(f"Scheduled task {task.name} failed: {error}")
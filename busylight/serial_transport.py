@@ -0,0 +1,232 @@
+import asyncio
+import collections
+import logging
+import threading
+import time
+
+from busylight import metrics
+from busylight.transport import Transport, parse_color
+from busylight.usb_ports import UsbPortManager
+
+BAUD_RATE = 115200
+READ_TIMEOUT = 1  # Seconds; bounds how long the reader thread takes to notice a stop
+ECHO_PREFIX = "Received: "
+ROUND_TRIP_HISTORY = 256
+ECHO_TIMEOUT = 0.2  # Seconds to wait for an echo before writing the next command anyway
+
+# The USB firmware only understands single-letter commands
+SERIAL_COMMANDS = {
+    (255, 0, 0): "R",
+    (0, 255, 0): "G",
+    (255, 255, 255): "W",
+    (0, 0, 0): "E",
+}
+
+
+def color_to_command(color):
+    """Map an "r,g,b" color to the closest command letter the USB firmware knows."""
+    rgb = parse_color(color)
+    nearest = min(SERIAL_COMMANDS, key=lambda known: sum((a - b) ** 2 for a, b in zip(known, rgb)))
+    return SERIAL_COMMANDS[nearest]
+
+
+class SerialWriter:
+    """Writer and reader threads for one open serial port.
+
+    Pending commands live in a single slot and only one command is in flight
+    at a time (until its echo arrives or ECHO_TIMEOUT passes), so a burst of
+    color changes collapses to the latest one instead of queueing up in the
+    firmware. Echo lines are read on their own thread and matched to the
+    command they acknowledge to measure the round trip.
+    """
+
+    def __init__(self, serial_connection, on_response=None, on_error=None):
+        self.serial_connection = serial_connection
+        self.on_response = on_response
+        self.on_error = on_error
+        self.pending = None
+        self.coalesced = 0  # Commands replaced before they were written
+        self.round_trips = collections.deque(maxlen=ROUND_TRIP_HISTORY)  # Seconds from write to echo
+        self._in_flight = collections.deque()
+        self._condition = threading.Condition()
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._write_loop, daemon=True),
+            threading.Thread(target=self._read_loop, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, command):
+        """Queue a command without blocking. A command still waiting is replaced."""
+        with self._condition:
+            if self.pending is not None:
+                self.coalesced += 1
+                metrics.writes_coalesced.inc("serial")
+            self.pending = command
+            self._condition.notify_all()
+
+    def _write_loop(self):
+        while True:
+            with self._condition:
+                while self._running and self.pending is None:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                command, self.pending = self.pending, None
+                self._in_flight.clear()  # Anything still unechoed timed out
+            try:
+                self._in_flight.append((command, time.perf_counter()))
+                self.serial_connection.write(command.encode())
+            except Exception as e:
+                self._fail(f"Error sending data to ESP32c6: {e}")
+                return
+            with self._condition:
+                self._condition.wait_for(lambda: not self._in_flight or not self._running, ECHO_TIMEOUT)
+
+    def _read_loop(self):
+        while self._running:
+            try:
+                line = self.serial_connection.readline()
+            except Exception as e:
+                self._fail(f"Error reading from ESP32c6: {e}")
+                return
+            if not line:
+                continue
+            response = line.decode("utf-8", errors="replace").strip()
+            logging.debug(f"Received from Arduino: {response}")
+            if response.startswith(ECHO_PREFIX):
+                self._match_echo(response[len(ECHO_PREFIX):])
+            if self.on_response:
+                self.on_response(response)
+
+    def _match_echo(self, command):
+        # Commands sent before the echoed one were lost or never echoed
+        while self._in_flight:
+            sent, sent_at = self._in_flight.popleft()
+            if sent == command:
+                self.round_trips.append(time.perf_counter() - sent_at)
+                metrics.echo_seconds.observe(self.round_trips[-1], "serial")
+                break
+        with self._condition:
+            self._condition.notify_all()
+
+    def _fail(self, message):
+        if not self._running:
+            return
+        logging.error(message)
+        self._running = False
+        if self.on_error:
+            self.on_error()
+
+    def flush(self, timeout):
+        """Wait until nothing is pending or in flight. Returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.pending is None and not self._in_flight or not self._running, timeout)
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=2)
+
+
+class SerialTransport(Transport):
+    """USB serial link to the ESP32 running busy_light_usb_xiao_esp3c3.ino.
+
+    Without a fixed port a UsbPortManager finds the light by its USB IDs.
+    A pulled cable is noticed by the reader thread straight away, and
+    wait_available() returns as soon as the light is plugged back in, so
+    Device.reconnect() reopens it and resends the color without waiting
+    out its backoff.
+    """
+
+    name = "serial"
+    link_check_interval = None  # The reader thread reports a dropped port
+
+    def __init__(self, port=None, on_response=None, manager=None):
+        self.port = port
+        self.on_response = on_response  # Called from the reader thread with each echo line
+        self.manager = manager if manager is not None or port is not None else UsbPortManager()
+        self.hotplug = self.manager is not None
+        self.serial_connection = None
+        self.writer = None
+        self._lost = None
+
+    @property
+    def is_connected(self):
+        return self.serial_connection is not None and self.serial_connection.is_open
+
+    async def connect(self):
+        import serial
+
+        if self.writer is not None:
+            await asyncio.to_thread(self.writer.stop)  # Left over from a port that dropped
+            self.writer = None
+        if self.manager is not None:
+            self.manager.watch()
+            self.port = await asyncio.to_thread(self.manager.find)
+        if self.port is None:
+            return False
+        try:
+            self.serial_connection = await asyncio.to_thread(serial.Serial, self.port, BAUD_RATE, timeout=READ_TIMEOUT)
+            logging.debug(f"Successfully opened serial port: {self.port}")
+        except Exception as e:
+            logging.error(f"Error opening serial port: {e}")
+            return False
+        loop = asyncio.get_running_loop()
+        connection = self.serial_connection
+        lost = self._lost = asyncio.Event()
+
+        def on_error():
+            try:
+                connection.close()
+            except Exception as e:
+                logging.error(f"Error closing serial port: {e}")
+            loop.call_soon_threadsafe(lost.set)
+
+        self.writer = SerialWriter(self.serial_connection, self.on_response, on_error=on_error)
+        return True
+
+    async def wait_disconnected(self):
+        if self._lost is not None:
+            await self._lost.wait()
+
+    async def wait_available(self, timeout):
+        if self.manager is None:
+            await asyncio.sleep(timeout)
+        else:
+            await self.manager.wait_for_port(timeout)
+
+    def _close_port(self):
+        if self.serial_connection is not None:
+            try:
+                self.serial_connection.close()
+            except Exception as e:
+                logging.error(f"Error closing serial port: {e}")
+
+    async def disconnect(self):
+        if self.manager is not None:
+            self.manager.wake()  # Ends a reconnect waiting for the light to be plugged in
+            self.manager.close()
+        if self.writer is not None:
+            # Let the last color go out; the reader may be inside readline() for up to READ_TIMEOUT
+            await asyncio.to_thread(self.writer.flush, ECHO_TIMEOUT * 2)
+            await asyncio.to_thread(self.writer.stop)
+            self.writer = None
+        if self.serial_connection is not None:
+            self._close_port()
+            self.serial_connection = None
+            logging.debug(f"Serial port {self.port} closed.")
+        if self._lost is not None:
+            self._lost.set()
+
+    async def send(self, color):
+        """Hand the command to the writer thread. Returns as soon as it is queued."""
+        if not self.is_connected:
+            raise ConnectionError("No ESP32c6 connected.")
+        command = color_to_command(color)
+        logging.debug(f"Attempting to send command: {command}")
+        self.writer.put(command)
@@ -0,0 +1,40 @@
+import time
+
+MIC_PRIORITY = 50  # Priority of the built-in microphone detector
+CALENDAR_PRIORITY = 40  # Scheduled meetings; the detector's colors win while it reports use
+DEFAULT_SOURCE_PRIORITY = 100  # External producers outrank the detector unless they say otherwise
+IDLE_SOURCE_PRIORITY = 1  # Sources at or below this show a color without counting as busy (an idle remote light)
+
+
+class StatusMerger:
+    """Colors posted by several status sources, merged by priority.
+
+    Each source holds at most one color. The highest priority source that has
+    not expired wins; on a tie the most recent post wins.
+    """
+
+    def __init__(self):
+        self.sources = {}  # name -> (priority, order, color, expires_at or None)
+        self._order = 0
+
+    def set(self, name, color, priority=DEFAULT_SOURCE_PRIORITY, ttl=None):
+        self._order += 1
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        self.sources[name] = (priority, self._order, color, expires_at)
+
+    def clear(self, name):
+        return self.sources.pop(name, None) is not None
+
+    def resolve(self):
+        """Return (priority, name, color) of the winning source, or None."""
+        now = time.monotonic()
+        best = None
+        for name, (priority, order, color, expires_at) in list(self.sources.items()):
+            if expires_at is not None and expires_at <= now:
+                del self.sources[name]
+                continue
+            if best is None or (priority, order) > best[0]:
+                best = ((priority, order), name, color)
+        if best is None:
+            return None
+        return best[0][0], best[1], best[2]
@@ -0,0 +1,210 @@
+"""Record what the detector saw and what the lights were sent, as a compact trace file.
+
+A trace is JSON lines, gzip-compressed when the file name ends in .gz. The
+first line is a header object, every other line one event:
+
+    {"busylight_trace": 1, "name": "...", "capabilities": ["microphone", ...]}
+    [ms, "set", path, last_used_time_stop]   ConsentStore app key written
+    [ms, "del", path]                        app key removed
+    [ms, "write", device, color]             color written to a light
+    [ms, "link", device, 0 or 1]             link dropped / established
+    [ms, "end"]                              recording stopped
+
+ms counts from the start of the recording. path is relative to the
+ConsentStore key ("microphone\\NonPackaged\\C:#...#Teams.exe"). Registry
+state is recorded as differences between snapshots, so an hour with no
+activity costs nothing. busylight.replay plays a trace back.
+"""
+import gzip
+import json
+import threading
+import time
+
+from busylight.scanner import CONSENT_STORE_ROOT, DEFAULT_CAPABILITIES, capability_keys
+from busylight.transport import Transport
+
+TRACE_VERSION = 1
+ALSA_APP = "microphone\\NonPackaged\\alsa"  # Stands in for the ConsentStore where there is no registry
+
+
+def open_trace(path, mode="r"):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_trace(path):
+    """Return (header, events) from a trace file."""
+    with open_trace(path) as f:
+        header = json.loads(f.readline())
+        if header.get("busylight_trace") != TRACE_VERSION:
+            raise ValueError(f"{path} is not a version {TRACE_VERSION} busylight trace")
+        return header, [json.loads(line) for line in f if line.strip()]
+
+
+def read_consent_store(winreg, capabilities=DEFAULT_CAPABILITIES):
+    """Snapshot LastUsedTimeStop of every app key in the capability stores, by path relative to the ConsentStore."""
+    values = {}
+    for capability in capabilities:
+        keys = capability_keys(capability)
+        for root_key in keys:
+            try:
+                root = winreg.OpenKey(winreg.HKEY_CURRENT_USER, root_key)
+            except OSError:
+                continue
+            try:
+                index = 0
+                while True:
+                    try:
+                        name = winreg.EnumKey(root, index)
+                    except OSError:
+                        break
+                    index += 1
+                    if f"{root_key}\\{name}" in keys:
+                        continue  # NonPackaged is a store root of its own
+                    try:
+                        with winreg.OpenKey(root, name) as app:
+                            value, _ = winreg.QueryValueEx(app, "LastUsedTimeStop")
+                    except OSError:
+                        continue
+                    values[f"{root_key[len(CONSENT_STORE_ROOT) + 1:]}\\{name}"] = value
+            finally:
+                winreg.CloseKey(root)
+    return values
+
+
+class TraceRecorder:
+    """Append events to a trace file. Safe to call from the detector thread and the event loop at once."""
+
+    def __init__(self, path, name=None, capabilities=DEFAULT_CAPABILITIES, clock=time.monotonic):
+        self.path = path
+        self.clock = clock
+        self.capabilities = list(capabilities)
+        self.events = 0
+        self._file = open_trace(path, "w")
+        self._lock = threading.Lock()
+        self._registry = {}  # The last snapshot, to record only what changed
+        self._start = clock()
+        header = {"busylight_trace": TRACE_VERSION, "name": name or path, "capabilities": self.capabilities, "recorded_at": time.time()}
+        self._file.write(json.dumps(header) + "\n")
+
+    def _event(self, *fields):
+        ms = round((self.clock() - self._start) * 1000)
+        line = json.dumps([ms, *fields], separators=(",", ":"))
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line + "\n")
+            self.events += 1
+
+    def registry(self, values):
+        """Record the differences between this ConsentStore snapshot and the last one."""
+        for path, value in values.items():
+            if self._registry.get(path) != value:
+                self._event("set", path, value)
+        for path in self._registry.keys() - values.keys():
+            self._event("del", path)
+        self._registry = dict(values)
+
+    def write(self, device, color):
+        self._event("write", device, color)
+
+    def link(self, device, up):
+        self._event("link", device, int(bool(up)))
+
+    def close(self):
+        self._event("end")
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class RecordingBackend:
+    """Wrap a detector backend and record a ConsentStore snapshot after every scan.
+
+    Without a registry (Linux) the scan result itself is recorded, as one
+    app under the microphone store, so the trace still replays.
+    """
+
+    def __init__(self, backend, recorder, winreg=None):
+        self.backend = backend
+        self.recorder = recorder
+        self.notifies = backend.notifies
+        self.interval = getattr(backend, "interval", None)
+        if winreg is None:
+            try:
+                import winreg
+            except ImportError:
+                pass
+        self._winreg = winreg
+
+    @property
+    def scanner(self):
+        return self.backend.scanner
+
+    def scan(self):
+        result = self.backend.scan()
+        if self._winreg is not None:
+            self.recorder.registry(read_consent_store(self._winreg, self.recorder.capabilities))
+        else:
+            self.recorder.registry({ALSA_APP: 0 if result else 1})
+        return result
+
+    def wait_for_change(self, timeout):
+        return self.backend.wait_for_change(timeout)
+
+    def wake(self):
+        self.backend.wake()
+
+    def close(self):
+        self.backend.close()
+
+
+class RecordingTransport(Transport):
+    """Wrap a transport and record its link changes and the colors written. Effect frames are not recorded."""
+
+    def __init__(self, transport, recorder):
+        self.transport = transport
+        self.recorder = recorder
+        self.name = transport.name
+
+    @property
+    def is_connected(self):
+        return self.transport.is_connected
+
+    @property
+    def heartbeat_interval(self):
+        return self.transport.heartbeat_interval
+
+    @property
+    def link_check_interval(self):
+        return self.transport.link_check_interval
+
+    @property
+    def hotplug(self):
+        return self.transport.hotplug
+
+    async def connect(self):
+        connected = await self.transport.connect()
+        if connected:
+            self.recorder.link(self.name, True)
+        return connected
+
+    async def disconnect(self):
+        await self.transport.disconnect()
+        self.recorder.link(self.name, False)
+
+    async def send(self, color):
+        await self.transport.send(color)
+        self.recorder.write(self.name, color)
+
+    async def send_pixels(self, pixels):
+        await self.transport.send_pixels(pixels)
+
+    async def wait_disconnected(self):
+        await self.transport.wait_disconnected()
+        self.recorder.link(self.name, False)
+
+    async def wait_available(self, timeout):
+        await self.transport.wait_available(timeout)
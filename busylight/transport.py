@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+LINK_CHECK_INTERVAL = 2  # Seconds between link checks for transports without a disconnect event
+
+
+def parse_color(color):
+    """Turn an "r,g,b" settings string into a tuple of ints clamped to 0-255."""
+    return tuple(max(0, min(255, int(part))) for part in color.split(","))
+
+
+def validate_color(color):
+    """Check a color from outside (the status API): exactly three integers 0-255. Returns it as "r,g,b"; raises ValueError."""
+    parts = color.split(",") if isinstance(color, str) else []
+    if len(parts) != 3:
+        raise ValueError(f'Invalid color {color!r}; expected "r,g,b"')
+    try:
+        rgb = [int(part) for part in parts]
+    except ValueError:
+        raise ValueError(f'Invalid color {color!r}; expected "r,g,b"') from None
+    if not all(0 <= value <= 255 for value in rgb):
+        raise ValueError(f"Invalid color {color!r}; each component must be 0-255")
+    return ",".join(map(str, rgb))
+
+
+class Transport:
+    """A link to one busy light.
+
+    Colors are passed around as "r,g,b" strings, the format the settings file
+    and the Bluetooth firmware already use. Each transport turns them into
+    whatever its device understands.
+    """
+
+    name = "transport"
+    heartbeat_interval = None  # Seconds between keep-alive resends the device needs, if the transport knows
+    link_check_interval = LINK_CHECK_INTERVAL  # Seconds between is_connected checks; None when wait_disconnected waits on an event
+    hotplug = False  # Whether wait_available() returns as soon as the device is back
+
+    @property
+    def is_connected(self):
+        raise NotImplementedError
+
+    async def connect(self):
+        """Open the link. Returns True on success."""
+        raise NotImplementedError
+
+    async def disconnect(self):
+        raise NotImplementedError
+
+    async def send(self, color):
+        """Send one color. Raises on failure."""
+        raise NotImplementedError
+
+    async def send_pixels(self, pixels):
+        """Show a (pixels, 3) uint8 frame. Raises on failure.
+
+        Transports whose firmware only takes one color send the frame's
+        average, which still shows fades, blinks and a shrinking bar as a
+        dimming light.
+        """
+        average = pixels.mean(axis=0).round().astype(int)
+        await self.send(f"{average[0]},{average[1]},{average[2]}")
+
+    async def wait_disconnected(self):
+        """Return once the link has dropped."""
+        while self.is_connected:
+            await asyncio.sleep(LINK_CHECK_INTERVAL)
+
+    async def wait_available(self, timeout):
+        """Wait up to timeout seconds before the next connect attempt; hotplug transports return when the device appears."""
+        await asyncio.sleep(timeout)
+
+
+class MemoryTransport(Transport):
+    """In-memory transport that records every color it is sent."""
+
+    name = "memory"
+    link_check_interval = None  # wait_disconnected polls on its own, fast enough for benchmarks
+
+    def __init__(self, latency=0, fail=False, connect_latency=0):
+        self.latency = latency  # Simulated write time in seconds
+        self.connect_latency = connect_latency
+        self.fail = fail
+        self.available = True  # Set to False to make connect() fail
+        self.sent = []  # (time.perf_counter(), color) for every successful send
+        self.frames = []  # (time.perf_counter(), copy of the pixels) for every send_pixels()
+        self._connected = False
+
+    @property
+    def is_connected(self):
+        return self._connected
+
+    async def connect(self):
+        if self.connect_latency:
+            await asyncio.sleep(self.connect_latency)
+        self._connected = self.available
+        return self._connected
+
+    async def disconnect(self):
+        self._connected = False
+
+    def drop(self):
+        """Simulate the link going away."""
+        self._connected = False
+
+    async def wait_disconnected(self):
+        while self._connected:
+            await asyncio.sleep(0.01)
+
+    async def send(self, color):
+        if not self._connected:
+            raise ConnectionError("Memory transport is not connected")
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail:
+            raise ConnectionError("Simulated write failure")
+        self.sent.append((time.perf_counter(), color))
+
+    async def send_pixels(self, pixels):
+        if not self._connected:
+            raise ConnectionError("Memory transport is not connected")
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail:
+            raise ConnectionError("Simulated write failure")
+        self.frames.append((time.perf_counter(), pixels.copy()))
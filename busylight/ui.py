@@ -0,0 +1,89 @@
+"""Hand state changes from the detector, transport and tray threads to the Tk thread.
+
+Tk widgets may only be touched from the thread running mainloop(). Other
+threads post callables (or just ask for a redraw) here; the first post after
+the queue drained generates one virtual event, and the Tk thread runs
+everything queued in that one wakeup. Nothing runs on a timer, so an idle
+window does not wake up at all.
+"""
+import logging
+import queue
+import threading
+
+DISPATCH_EVENT = "<<BusyLightDispatch>>"
+
+
+class UiDispatcher:
+    """Run posted work on the Tk thread, and redraw only when the visible state changed.
+
+    snapshot() returns a comparable value describing everything the window
+    shows; render(snapshot) updates the widgets from it. Both run on the Tk
+    thread.
+    """
+
+    def __init__(self, window, render=None, snapshot=None):
+        self.window = window
+        self.render = render
+        self.snapshot = snapshot
+        self.wakeups = 0  # Times the Tk thread was woken to drain the queue
+        self.redraws = 0  # Times render() actually ran
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._dirty = False
+        self._shown = object()  # Never equal to a snapshot, so the first redraw always renders
+        window.bind(DISPATCH_EVENT, self._drain)
+
+    def post(self, func, *args):
+        """Run func(*args) on the Tk thread. Safe to call from any thread."""
+        self._queue.put((func, args))
+        self._wake()
+
+    def request_redraw(self):
+        """Re-render if the state changed. Safe to call from any thread; bursts collapse to one redraw."""
+        self._dirty = True
+        self._wake()
+
+    def _wake(self):
+        with self._lock:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        try:
+            # Virtual events are the one Tk call that is safe from other threads
+            self.window.event_generate(DISPATCH_EVENT, when="tail")
+        except RuntimeError:
+            # mainloop has exited; clear the flag so a later post can still wake the window
+            with self._lock:
+                self._scheduled = False
+        except Exception as e:
+            with self._lock:
+                self._scheduled = False
+            logging.debug(f"UI dispatch failed: {e}")
+
+    def _drain(self, event=None):
+        self.wakeups += 1
+        with self._lock:
+            self._scheduled = False
+        while True:
+            try:
+                func, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception as e:
+                logging.error(f"UI callback {getattr(func, '__name__', func)} failed: {e}")
+        if self._dirty:
+            self._dirty = False
+            self.redraw()
+
+    def redraw(self, force=False):
+        """Render now if the snapshot changed (or force). Tk thread only."""
+        if self.render is None:
+            return
+        state = self.snapshot() if self.snapshot else None
+        if force or state != self._shown:
+            self._shown = state
+            self.redraws += 1
+            self.render(state)
@@ -0,0 +1,175 @@
+"""Find the USB light among the serial ports, and notice when it is plugged back in.
+
+Ports are matched on USB vendor/product ID and, if given, serial number,
+so docks, USB-serial adapters and other boards are skipped. The XIAO
+ESP32-C3/C6 enumerate through the chip's own USB Serial/JTAG controller
+as Espressif 303A:1001. Boards behind a USB-serial bridge chip report the
+bridge's IDs instead; when nothing matches, the old rule (the only port
+with "USB" in its description) is still tried.
+
+The manager remembers the serial number and port of the device it last
+picked. A replugged board that comes back under another name (COM4 ->
+COM5, ttyACM0 -> ttyACM1) is found by its serial number, and with
+several matches the one in use before wins.
+
+wait_for_port() returns as soon as a matching port shows up. On Linux,
+with pyudev installed, it wakes on udev tty events and costs nothing
+while it waits. Elsewhere it re-lists the ports every HOTPLUG_POLL_INTERVAL,
+and only while a device is missing.
+"""
+import asyncio
+import logging
+import sys
+
+ESPRESSIF_VID = 0x303A
+USB_SERIAL_JTAG_PID = 0x1001  # ESP32-C3/C6/S3 built-in USB Serial/JTAG
+HOTPLUG_POLL_INTERVAL = 1.0  # Seconds between port listings while waiting without udev
+
+
+def _usb_id(value):
+    """A vendor or product ID from the settings: an int, or a hex string like "303A" or "0x303a"."""
+    if value is None or isinstance(value, int):
+        return value
+    return int(value, 16)
+
+
+class UsbMatch:
+    """Which ports count as the light: vid, pid and serial_number, each None for any."""
+
+    def __init__(self, vid=ESPRESSIF_VID, pid=None, serial_number=None, description_fallback=True):
+        self.vid = _usb_id(vid)
+        self.pid = _usb_id(pid)
+        self.serial_number = serial_number
+        self.description_fallback = description_fallback  # Fall back to the only "USB" port when no ID matches
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build a match from a {"vid": ..., "pid": ..., "serial_number": ...} dict; missing keys match the ESP32 default."""
+        return cls(settings.get("vid", ESPRESSIF_VID), settings.get("pid"), settings.get("serial_number"),
+                   settings.get("description_fallback", True))
+
+    def matches(self, port):
+        if port.vid is None:
+            return False  # Not a USB device
+        return ((self.vid is None or port.vid == self.vid)
+                and (self.pid is None or port.pid == self.pid)
+                and (self.serial_number is None or port.serial_number == self.serial_number))
+
+
+def list_serial_ports():
+    import serial.tools.list_ports
+
+    return serial.tools.list_ports.comports()
+
+
+class UsbPortManager:
+    """Pick the light's port, and wait for it to come back after it was unplugged."""
+
+    def __init__(self, match=None, list_ports=list_serial_ports, poll_interval=HOTPLUG_POLL_INTERVAL):
+        self.match = match or UsbMatch()
+        self.list_ports = list_ports
+        self.poll_interval = poll_interval
+        self.port = None  # The port last picked
+        self.serial_number = None  # Its serial number, to recognise it under a new port name
+        self.watching = False  # Whether hot-plug events arrive (udev)
+        self.listings = 0  # Times the ports were listed
+        self._changed = asyncio.Event()
+        self._woken = False
+        self._monitor = None
+        self._loop = None
+        self._warned = False
+
+    def find(self):
+        """Return the port of the light, or None. Blocking: lists the serial ports."""
+        self.listings += 1
+        ports = list(self.list_ports())
+        matches = [port for port in ports if self.match.matches(port)]
+        if not matches and self.match.description_fallback:
+            legacy = [port for port in ports if "USB" in (port.description or "")]
+            if len(legacy) == 1:
+                matches = legacy
+        if not matches:
+            return None
+        chosen = None
+        if len(matches) > 1:
+            known = [port for port in matches if self.serial_number and port.serial_number == self.serial_number]
+            chosen = next(iter(known), None) or next((port for port in matches if port.device == self.port), None)
+            if chosen is None:
+                chosen = sorted(matches, key=lambda port: port.device)[0]
+                if not self._warned:
+                    logging.warning(f"Several USB lights found ({', '.join(port.device for port in matches)}); using {chosen.device}. "
+                                    "Set a serial number to choose one.")
+                    self._warned = True
+        else:
+            chosen = matches[0]
+        if chosen.device != self.port:
+            logging.debug(f"USB light on {chosen.device} (serial number {chosen.serial_number})")
+        self.port = chosen.device
+        self.serial_number = chosen.serial_number or self.serial_number
+        return self.port
+
+    def watch(self):
+        """Start listening for udev tty events on the running loop. Returns whether events will arrive."""
+        self._loop = asyncio.get_running_loop()
+        if self.watching or not sys.platform.startswith("linux"):
+            return self.watching
+        try:
+            import pyudev
+        except ImportError:
+            logging.debug("pyudev not installed; polling for the USB light while it is missing")
+            return False
+        try:
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by("tty")
+            monitor.start()
+            self._loop.add_reader(monitor.fileno(), self._on_udev)
+        except (OSError, ValueError) as e:
+            logging.debug(f"udev monitor unavailable, polling instead: {e}")
+            return False
+        self._monitor = monitor
+        self.watching = True
+        return True
+
+    def _on_udev(self):
+        while True:
+            device = self._monitor.poll(timeout=0)
+            if device is None:
+                break
+            logging.debug(f"udev: {device.action} {device.device_node}")
+        self._changed.set()
+
+    def changed(self):
+        """Report a hot-plug event from another source. Safe from any thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._changed.set)
+
+    def wake(self):
+        """End a wait_for_port() early (the transport is being closed). Safe from any thread."""
+        self._woken = True
+        self.changed()
+
+    async def wait_for_port(self, timeout):
+        """Return the port as soon as the light is present, or None after timeout or wake()."""
+        loop = self._loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        self._woken = False
+        while True:
+            self._changed.clear()  # Before listing, so an event during the listing is not lost
+            port = await asyncio.to_thread(self.find)
+            if port is not None:
+                return port
+            remaining = deadline - loop.time()
+            if remaining <= 0 or self._woken:
+                return None
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining if self.watching else min(remaining, self.poll_interval))
+            except asyncio.TimeoutError:
+                pass
+            if self._woken:
+                return None
+
+    def close(self):
+        if self._monitor is not None:
+            self._loop.remove_reader(self._monitor.fileno())
+            self._monitor = None
+            self.watching = False
@@ -0,0 +1,248 @@
+import asyncio
+
+import numpy as np
+
+from busylight import ble_transport
+from busylight.ble_transport import ACK_CHARACTERISTIC_UUID, IDLE_TIMEOUT_PREFIX, MANUFACTURER_ID, BleTransport, parse_idle_timeout
+from busylight.devices import Device
+from busylight.effects import NUM_PIXELS
+from busylight.fake_bleak import FakeBleak
+from busylight.pixels import FLAG_DELTA
+from busylight.protocol import decode, encode_ack
+
+ADDRESS = "AA:BB:CC:DD:EE:01"
+
+
+def radio(**kwargs):
+    options = dict(connect_time=0, write_time=0.001, command_time=0, ack_delay=0.001, advertising_interval=0.01)
+    options.update(kwargs)
+    return FakeBleak(**options)
+
+
+def advertised(seconds):
+    return {MANUFACTURER_ID: IDLE_TIMEOUT_PREFIX + seconds.to_bytes(2, "little")}
+
+
+async def settle(transport, timeout=2):
+    for _ in range(int(timeout / 0.005)):
+        if transport._unacked is None:
+            return
+        await asyncio.sleep(0.005)
+    raise TimeoutError
+
+
+def test_parse_idle_timeout():
+    assert parse_idle_timeout(advertised(300)) == 300
+    assert parse_idle_timeout(None) is None
+    assert parse_idle_timeout({MANUFACTURER_ID: b"XX\x2c\x01"}) is None
+    assert parse_idle_timeout({MANUFACTURER_ID: b"BL\x00\x00"}) is None
+    assert parse_idle_timeout({0x004C: advertised(300)[MANUFACTURER_ID]}) is None
+
+
+def test_heartbeat_follows_advertised_idle_timeout():
+    async def run():
+        fake = radio()
+        fake.add_device("busy_light_01", ADDRESS, manufacturer_data=advertised(300))
+        transport = BleTransport(binary=True, bleak=fake)
+        assert transport.heartbeat_interval is None
+        assert await transport.connect()
+        assert transport.heartbeat_interval == 240
+        assert Device(transport, resend_interval=180).heartbeat_interval == 240
+        await transport.disconnect()
+
+    asyncio.run(run())
+
+
+def test_heartbeat_resends_before_idle_timeout():
+    async def run():
+        fake = radio()
+        device = fake.add_device("busy_light_01", ADDRESS, manufacturer_data=advertised(1))
+        light = Device(BleTransport(binary=True, bleak=fake))
+        light.color = "255,0,0"
+        assert await light.connect()
+        await asyncio.sleep(0.5)
+        assert len(device.writes) == 1
+        await asyncio.sleep(0.45)  # Past 80% of the 1 s timeout
+        assert len(device.writes) == 2
+        await light.disconnect()
+
+    asyncio.run(run())
+
+
+def test_acked_send_returns_before_the_ack():
+    async def run():
+        fake = radio(ack_delay=0.05)
+        device = fake.add_device("busy_light_01", ADDRESS, acks=True)
+        transport = BleTransport(acks=True, bleak=fake)
+        assert await transport.connect()
+        await transport.send("255,0,0")
+        assert transport._unacked is not None
+        assert device.writes[-1][3] is False  # Written without response
+        await settle(transport)
+        assert transport.retransmits == 0 and len(transport.ack_latencies) == 1
+        assert decode(device.writes[-1][2]).rgb == (255, 0, 0)
+        await transport.disconnect()
+
+    asyncio.run(run())
+
+
+def test_lost_frame_is_written_again(monkeypatch):
+    monkeypatch.setattr(ble_transport, "ACK_TIMEOUT", 0.02)
+
+    async def run():
+        fake = radio(drop_rate=1.0)
+        device = fake.add_device("busy_light_01", ADDRESS, acks=True)
+        transport = BleTransport(acks=True, bleak=fake)
+        assert await transport.connect()
+        await transport.send("0,0,255")
+        fake.drop_rate = 0.0
+        await settle(transport)
+        assert device.dropped == 1 and transport.retransmits == 1
+        assert decode(device.writes[-1][2]).rgb == (0, 0, 255)
+        await transport.disconnect()
+
+    asyncio.run(run())
+
+
+def test_only_the_newest_frame_is_retried(monkeypatch):
+    monkeypatch.setattr(ble_transport, "ACK_TIMEOUT", 0.02)
+
+    async def run():
+        fake = radio(drop_rate=1.0)
+        device = fake.add_device("busy_light_01", ADDRESS, acks=True)
+        transport = BleTransport(acks=True, bleak=fake)
+        assert await transport.connect()
+        await transport.send("255,0,0")
+        await transport.send("0,255,0")
+        fake.drop_rate = 0.0
+        await settle(transport)
+        assert [decode(write[2]).rgb for write in device.writes] == [(0, 255, 0)]
+        await transport.disconnect()
+
+    asyncio.run(run())
+
+
+def test_unacked_frame_gives_up_after_retries(monkeypatch):
+    monkeypatch.setattr(ble_transport, "ACK_TIMEOUT", 0.01)
+
+    async def run():
+        fake = radio(drop_rate=1.0)
+        fake.add_device("busy_light_01", ADDRESS, acks=True)
+        transport = BleTransport(acks=True, bleak=fake)
+        assert await transport.connect()
+        await transport.send("255,0,0")
+        await settle(transport)
+        assert transport.retransmits == ble_transport.ACK_RETRIES
+        await transport.disconnect()
+
+    asyncio.run(run())
+
+
+def test_firmware_without_acks_falls_back_to_acknowledged_writes():
+    async def run():
+        fake = radio()
+        device = fake.add_device("busy_light_01", ADDRESS)
+        transport = BleTransport(acks=True, bleak=fake)
+        assert await transport.connect()
+        assert transport.acks is False
+        await transport.send("255,0,0")
+        assert device.writes[-1][3] is None and transport._unacked is None
+        await transport.disconnect()
+
+    asyncio.run(run())
+
+
+def test_ack_for_a_replaced_frame_is_ignored():
+    transport = BleTransport(acks=True, bleak=radio())
+    transport._unacked = (7, [b""], 0.0, False)
+    transport._on_ack(ACK_CHARACTERISTIC_UUID, encode_ack(6))
+    assert transport._unacked is not None
+    transport._on_ack(ACK_CHARACTERISTIC_UUID, encode_ack(7))
+    assert transport._unacked is None
+
+
+def frame(value, changed=()):
+    pixels = np.full((NUM_PIXELS, 3), value, dtype=np.uint8)
+    for index in changed:
+        pixels[index] = (255, 0, 0)
+    return pixels
+
+
+def pixel_writes(device):
+    """(sequence, flags, base sequence) of each pixel chunk the device received."""
+    return [(data[2], data[3], data[4]) for _, _, data, _ in device.writes]
+
+
+def test_pixel_frames_delta_against_the_written_frame():
+    async def run():
+        fake = radio()
+        device = fake.add_device("busy_light_01", ADDRESS)
+        transport = BleTransport(pixel_frames=True, bleak=fake)
+        assert await transport.connect()
+        await transport.send_pixels(frame(10))
+        await transport.send_pixels(frame(10, changed=[3]))
+        (first, flags, _), (second, delta_flags, base) = pixel_writes(device)
+        assert not flags & FLAG_DELTA and delta_flags & FLAG_DELTA and base == first
+        np.testing.assert_array_equal(device.decoder.pixels, frame(10, changed=[3]))
+        await transport.disconnect()
+
+    asyncio.run(run())
+
+
+def test_pixel_base_advances_on_acks():
+    async def run():
+        fake = radio(ack_delay=0.05)
+        device = fake.add_device("busy_light_01", ADDRESS, acks=True)
+        transport = BleTransport(pixel_frames=True, acks=True, bleak=fake)
+        assert await transport.connect()
+        await transport.send_pixels(frame(1))
+        await transport.send_pixels(frame(2))  # Nothing acked yet: a whole frame again
+        await settle(transport)
+        await transport.send_pixels(frame(2, changed=[0]))  # Against the newest acked frame
+        await settle(transport)
+        writes = pixel_writes(device)
+        assert [flags & FLAG_DELTA for _, flags, _ in writes] == [0, 0, FLAG_DELTA]
+        assert writes[2][2] == writes[1][0]
+        np.testing.assert_array_equal(device.decoder.pixels, frame(2, changed=[0]))
+        await transport.disconnect()
+
+    asyncio.run(run())
+
+
+def test_whole_frame_after_a_lost_pixel_frame(monkeypatch):
+    monkeypatch.setattr(ble_transport, "ACK_TIMEOUT", 0.01)
+
+    async def run():
+        fake = radio()
+        device = fake.add_device("busy_light_01", ADDRESS, acks=True)
+        transport = BleTransport(pixel_frames=True, acks=True, bleak=fake)
+        assert await transport.connect()
+        await transport.send_pixels(frame(1))
+        await settle(transport)
+        fake.drop_rate = 1.0
+        await transport.send_pixels(frame(1, changed=[5]))  # Never arrives
+        await settle(transport)
+        fake.drop_rate = 0.0
+        await transport.send_pixels(frame(1, changed=[6]))
+        await settle(transport)
+        assert not pixel_writes(device)[-1][1] & FLAG_DELTA
+        np.testing.assert_array_equal(device.decoder.pixels, frame(1, changed=[6]))
+        await transport.disconnect()
+
+    asyncio.run(run())
+
+
+def test_pixel_frames_fit_the_mtu():
+    async def run():
+        fake = radio(mtu_size=23)
+        device = fake.add_device("busy_light_01", ADDRESS, acks=True)
+        transport = BleTransport(pixel_frames=True, acks=True, bleak=fake)
+        assert await transport.connect()
+        pixels = np.random.default_rng(1).integers(0, 256, size=(NUM_PIXELS, 3), dtype=np.uint8)
+        await transport.send_pixels(pixels)
+        await settle(transport)
+        assert len(device.writes) > 1 and all(len(data) <= 20 for _, _, data, _ in device.writes)
+        np.testing.assert_array_equal(device.decoder.pixels, pixels)
+        await transport.disconnect()
+
+    asyncio.run(run())
@@ -0,0 +1,163 @@
+import time
+
+import pytest
+
+from busylight.broadcast import (KIND_REQUEST, KIND_STATE, REMOTE_IDLE_PRIORITY, REMOTE_SOURCE_PREFIX, Message, Publisher, Relay, Subscriber,
+                                 decode, encode, encode_request, parse_address)
+from busylight.core import BusyLight
+from busylight.status import CALENDAR_PRIORITY
+from busylight.transport import MemoryTransport
+
+TOPIC = "alice"
+
+
+def test_round_trip():
+    data = encode(KIND_STATE, TOPIC, 1700000000, 7, (255, 0, 10), True)
+    assert decode(data) == Message(KIND_STATE, TOPIC, 1700000000, 7, (255, 0, 10), True)
+    assert decode(encode_request()) == Message(KIND_REQUEST, "", 0, 0, (0, 0, 0), False)
+
+
+@pytest.mark.parametrize("data", [
+    b"BL",
+    b"XX" + encode(KIND_STATE, TOPIC)[2:],
+    encode(KIND_STATE, TOPIC)[:-1],
+    encode(KIND_STATE, TOPIC)[:2] + bytes((0x13,)) + encode(KIND_STATE, TOPIC)[3:],
+    encode(KIND_STATE, TOPIC)[:2] + bytes((0x21,)) + encode(KIND_STATE, TOPIC)[3:],
+])
+def test_invalid_datagrams_rejected(data):
+    with pytest.raises(ValueError):
+        decode(data)
+
+
+def test_long_topic_rejected():
+    with pytest.raises(ValueError):
+        encode(KIND_STATE, "x" * 256)
+
+
+def test_parse_address():
+    assert parse_address("relay.lan", 47822) == ("relay.lan", 47822)
+    assert parse_address("10.0.0.2:5000", 47822) == ("10.0.0.2", 5000)
+
+
+@pytest.fixture
+def light():
+    light = BusyLight(MemoryTransport())
+    light.submit(light.connect()).result()
+    return light
+
+
+def state(epoch, sequence, busy=True, topic=TOPIC, rgb=(255, 0, 0)):
+    return Message(KIND_STATE, topic, epoch, sequence, rgb, busy)
+
+
+def test_subscriber_orders_by_epoch_and_sequence(light):
+    subscriber = Subscriber(light, [TOPIC])
+    subscriber.message_received(state(10, 1), None)
+    subscriber.message_received(state(10, 1), None)  # Duplicate
+    subscriber.message_received(state(10, 4, rgb=(0, 0, 255)), None)  # 2 and 3 were lost
+    subscriber.message_received(state(10, 3), None)  # Arrived late
+    assert (subscriber.applied, subscriber.dropped, subscriber.lost) == (2, 2, 2)
+    assert light.current_color == "0,0,255"
+    subscriber.message_received(state(11, 1, rgb=(0, 255, 0)), None)  # The publisher restarted
+    assert light.current_color == "0,255,0"
+    subscriber.message_received(state(10, 9), None)  # From before the restart
+    assert light.current_color == "0,255,0"
+
+
+def test_subscriber_ranks_idle_remotes_below_local_sources(light):
+    subscriber = Subscriber(light)
+    subscriber.message_received(state(1, 1, busy=False, rgb=(0, 255, 0)), None)
+    assert light.sources.sources[REMOTE_SOURCE_PREFIX + TOPIC][0] == REMOTE_IDLE_PRIORITY
+    assert not light.busy
+    light.set_source("calendar", "255,0,0", CALENDAR_PRIORITY)
+    assert light.current_color == "255,0,0"
+    subscriber.message_received(state(1, 2, topic="bob"), None)
+    assert light.sources.sources[REMOTE_SOURCE_PREFIX + "bob"][0] > CALENDAR_PRIORITY
+
+
+def test_subscriber_filters_topics(light):
+    subscriber = Subscriber(light, [TOPIC])
+    subscriber.message_received(state(1, 1, topic="bob"), None)
+    assert subscriber.applied == 0
+
+
+def test_published_busy_flag_is_the_merged_state(light):
+    publisher = Publisher(light, TOPIC)
+    sent = []
+    publisher.send = sent.append
+    light.set_source("calendar", "255,0,0", CALENDAR_PRIORITY)  # Busy without the microphone
+
+    def published():
+        publisher._on_change()
+        light.submit(asyncio_noop()).result()  # publish() was queued on the loop
+        return decode(sent[-1])
+
+    message = published()
+    assert message.busy and message.rgb == (255, 0, 0)
+    light.clear_source("calendar")
+    assert not published().busy
+    light.set_mic_in_use(True)
+    assert published().busy
+    assert [decode(data).sequence for data in sent] == [1, 2, 3]
+
+
+async def asyncio_noop():
+    pass
+
+
+def wait_until(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_relay_forwards_and_replays_to_late_joiners(light):
+    relay = Relay("127.0.0.1", 0)
+    light.submit(relay.start()).result()
+    address = ("127.0.0.1", relay.transport.get_extra_info("sockname")[1])
+    publisher_light = BusyLight()
+    publisher = Publisher(publisher_light, TOPIC, relay=address)
+    try:
+        publisher.start()
+        publisher_light.set_mic_in_use(True)
+        wait_until(lambda: relay.retained.get(TOPIC) and decode(relay.retained[TOPIC][1]).busy)
+
+        # Joins after the state was published: the relay answers the subscribe request with it
+        subscriber = Subscriber(light, [TOPIC], relay=address)
+        subscriber.start()
+        wait_until(lambda: subscriber.applied == 1)
+        assert light.current_color == publisher_light.mic_color
+
+        publisher_light.set_mic_in_use(False)
+        wait_until(lambda: subscriber.applied == 2)
+        assert relay.forwarded == 1
+        assert light.current_color == publisher_light.idle_color
+
+        # A stale datagram is neither retained nor forwarded
+        stale = encode(KIND_STATE, TOPIC, publisher.epoch, 1, (1, 2, 3), True)
+        publisher_light.loop.call_soon_threadsafe(publisher.send, stale)
+        time.sleep(0.05)
+        assert relay.forwarded == 1 and subscriber.applied == 2
+        subscriber.stop()
+    finally:
+        publisher.stop()
+        light.loop.call_soon_threadsafe(relay.close)
+
+
+def test_publisher_replays_its_state_on_request(light, monkeypatch):
+    monkeypatch.setattr("busylight.broadcast.REPLAY_DELAY", 0.01)
+    publisher = Publisher(light, TOPIC)
+    sent = []
+    publisher.send = sent.append
+
+    async def requests():
+        publisher.publish("255,0,0", True)
+        for topic in ("", TOPIC, "bob", TOPIC):
+            publisher.message_received(Message(KIND_REQUEST, topic, 0, 0, (0, 0, 0), False), None)
+
+    light.submit(requests()).result()
+    wait_until(lambda: publisher.replays)
+    time.sleep(0.03)
+    assert publisher.replays == 1  # Requests within REPLAY_DELAY share one replay
+    assert sent == [publisher.datagram, publisher.datagram]
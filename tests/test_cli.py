@@ -0,0 +1,53 @@
+from busylight import cli
+from busylight.core import BusyLight
+from busylight.daemon import StatusServer
+from busylight.transport import MemoryTransport
+
+
+def test_clear_without_daemon(tmp_path, capsys):
+    assert cli.main(["--socket", str(tmp_path / "missing.sock"), "clear"]) == 1
+    assert "Daemon not reachable" in capsys.readouterr().err
+
+
+def test_error_replies_are_reported(tmp_path, capsys):
+    address = str(tmp_path / "busylight.sock")
+    light = BusyLight(MemoryTransport())
+    light.submit(light.connect()).result()
+    server = StatusServer(light, address)
+    light.submit(server.start()).result()
+    try:
+        assert cli.main(["--socket", address, "set-color", "red"]) == 1
+        assert "Invalid color" in capsys.readouterr().err
+        assert cli.main(["--socket", address, "set-color", "1,2,3"]) == 0
+        assert cli.main(["--socket", address, "clear"]) == 0
+    finally:
+        light.submit(server.stop()).result()
+
+
+def set_directly(tmp_path, monkeypatch, color, *transports):
+    monkeypatch.setattr(cli, "_transports", lambda args: list(transports))
+    return cli.main(["--socket", str(tmp_path / "missing.sock"), "set-color", color])
+
+
+def test_set_color_without_daemon_writes_the_light(tmp_path, monkeypatch):
+    transport = MemoryTransport()
+    assert set_directly(tmp_path, monkeypatch, " 1, 2,3", transport) == 0
+    assert [color for _, color in transport.sent] == ["1,2,3"]
+
+
+def test_set_color_without_daemon_rejects_invalid_colors(tmp_path, monkeypatch, capsys):
+    transport = MemoryTransport()
+    assert set_directly(tmp_path, monkeypatch, "red", transport) == 1
+    assert "Invalid color" in capsys.readouterr().err
+    assert transport.sent == []
+
+
+def test_set_color_without_daemon_reports_failed_writes(tmp_path, monkeypatch, capsys):
+    unplugged = MemoryTransport()
+    unplugged.available = False
+    assert set_directly(tmp_path, monkeypatch, "1,2,3", unplugged) == 1
+    assert "Could not set the color on memory" in capsys.readouterr().err
+    broken = MemoryTransport(fail=True)
+    broken.name = "broken"
+    assert set_directly(tmp_path, monkeypatch, "1,2,3", MemoryTransport(), broken) == 1
+    assert "Could not set the color on broken" in capsys.readouterr().err
@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+from busylight.core import BusyLight
+from busylight.daemon import AlreadyRunning, StatusServer
+from busylight.transport import MemoryTransport, validate_color
+
+
+@pytest.fixture
+def light():
+    light = BusyLight(MemoryTransport())
+    light.submit(light.connect()).result()
+    return light
+
+
+def post(light, server, message):
+    """Handle a message on the light's loop, as the socket handler does."""
+    async def handle():
+        return server.handle_message(message)
+    return light.submit(handle()).result()
+
+
+@pytest.mark.parametrize("color", ["red", "1,2", "1,2,3,4", "0,256,0", "-1,0,0", "a,b,c", "", None, 5])
+def test_invalid_colors_rejected(light, color):
+    server = StatusServer(light)
+    before = light.current_color
+    reply = post(light, server, {"source": "hook", "color": color})
+    assert reply["ok"] is False and reply["error"]
+    assert light.current_color == before
+
+
+def test_valid_color_is_normalized():
+    assert validate_color(" 255, 0 ,10") == "255,0,10"
+
+
+def test_valid_color_sets_source(light):
+    server = StatusServer(light)
+    reply = post(light, server, {"source": "hook", "color": "1,2,3", "priority": 1000})
+    assert reply == {"ok": True, "color": "1,2,3"}
+
+
+@pytest.mark.parametrize("field, value", [
+    ("priority", "high"), ("priority", True), ("priority", 1.5), ("priority", None),
+    ("ttl", "x"), ("ttl", -1), ("ttl", float("inf")), ("ttl", float("nan")), ("ttl", False),
+])
+def test_invalid_priority_and_ttl_rejected(light, field, value):
+    server = StatusServer(light)
+    reply = post(light, server, {"source": "hook", "color": "1,2,3", field: value})
+    assert reply["ok"] is False and field in reply["error"]
+    assert "hook" not in light.sources.sources
+    assert post(light, server, {"command": "status"})["ok"]
+
+
+def test_valid_ttl_accepted(light):
+    server = StatusServer(light)
+    assert post(light, server, {"source": "hook", "color": "1,2,3", "ttl": 2.5})["ok"]
+    assert post(light, server, {"source": "hook2", "color": "1,2,3", "ttl": None})["ok"]
+
+
+def test_invalid_effect_color_rejected(light):
+    server = StatusServer(light)
+    reply = post(light, server, {"effect": "breathe", "color": "1,2"})
+    assert reply["ok"] is False
+
+
+def test_second_server_refuses_running_socket(light, tmp_path):
+    address = str(tmp_path / "busylight.sock")
+    first = StatusServer(light, address)
+    light.submit(first.start()).result()
+    second = StatusServer(light, address)
+    with pytest.raises(AlreadyRunning):
+        light.submit(second.start()).result()
+    assert first.server is not None and os.path.exists(address)
+    light.submit(first.stop()).result()
+
+
+def test_stale_socket_is_replaced(light, tmp_path):
+    import socket
+
+    address = str(tmp_path / "busylight.sock")
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(address)
+    stale.close()  # The path stays behind with nothing listening
+    server = StatusServer(light, address)
+    light.submit(server.start()).result()
+    assert server.server is not None
+    light.submit(server.stop()).result()
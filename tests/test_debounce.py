@@ -0,0 +1,126 @@
+from busylight.debounce import DEFAULT_DEBOUNCE, StateFilter
+from busylight.detector import MicrophoneDetector, PollingBackend
+from busylight.fake_winreg import FakeWinreg
+from busylight.scanner import MIC_USAGE_KEYS, ConsentStoreScanner, Presence
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_filter(**settings):
+    changes = []
+    clock = Clock()
+    state_filter = StateFilter(changes.append, clock=clock, **{**DEFAULT_DEBOUNCE, **settings})
+    return state_filter, changes, clock
+
+
+def test_first_sample_is_reported_straight_away():
+    state_filter, changes, clock = make_filter()
+    assert state_filter.update(False) is False
+    assert changes == [False] and state_filter.deadline is None
+
+
+def test_change_is_reported_when_the_grace_period_expires():
+    state_filter, changes, clock = make_filter(grace=1.0, min_off=0)
+    state_filter.update(False)
+    clock.now = 10.0
+    assert state_filter.update(True) is False
+    assert state_filter.deadline == 11.0
+    assert state_filter.wait_time(30) == 1.0
+    clock.now = 10.99
+    assert state_filter.poll() is False
+    clock.now = 11.0
+    assert state_filter.poll() is True
+    assert changes == [False, True] and state_filter.deadline is None
+
+
+def test_blip_shorter_than_the_grace_period_is_suppressed():
+    state_filter, changes, clock = make_filter(grace=1.0)
+    state_filter.update(False)
+    clock.now = 10.0
+    state_filter.update(True)
+    clock.now = 10.5
+    state_filter.update(False)
+    clock.now = 20.0
+    state_filter.poll()
+    assert changes == [False]
+    assert state_filter.suppressed == 1 and state_filter.deadline is None
+
+
+def test_zero_grace_reports_at_once():
+    state_filter, changes, clock = make_filter(grace=0, min_off=0)
+    state_filter.update(False)
+    clock.now = 1.0
+    assert state_filter.update(True) is True
+
+
+def test_busy_is_held_for_min_on():
+    state_filter, changes, clock = make_filter(grace=0, min_on=5.0, min_off=0)
+    state_filter.update(False)
+    clock.now = 10.0
+    state_filter.update(True)
+    clock.now = 11.0
+    assert state_filter.update(False) is True  # The meeting was left after a second
+    assert state_filter.deadline == 15.0
+    clock.now = 15.0
+    assert state_filter.poll() is False
+    assert changes == [False, True, False]
+
+
+def test_idle_is_held_for_min_off():
+    state_filter, changes, clock = make_filter(grace=0, min_on=0, min_off=2.0)
+    state_filter.update(True)
+    clock.now = 10.0
+    state_filter.update(False)
+    clock.now = 10.5
+    assert state_filter.update(True) is False
+    assert state_filter.deadline == 12.0
+    clock.now = 12.0
+    assert state_filter.poll() is True
+    assert changes == [True, False, True]
+
+
+def test_grace_counts_from_the_raw_change_not_the_dwell():
+    state_filter, changes, clock = make_filter(grace=1.0, min_on=0, min_off=2.0)
+    state_filter.update(True)
+    clock.now = 10.0
+    state_filter.update(False)
+    state_filter.poll(11.0)
+    clock.now = 11.5
+    state_filter.update(True)
+    # min_off ends at 13.0, grace at 12.5: the later of the two wins
+    assert state_filter.deadline == 13.0
+
+
+def test_from_settings_fills_in_defaults():
+    state_filter = StateFilter.from_settings({"grace": 0})
+    assert (state_filter.grace, state_filter.min_on, state_filter.min_off) == (0, DEFAULT_DEBOUNCE["min_on"], DEFAULT_DEBOUNCE["min_off"])
+
+
+def test_ignored_apps_never_reach_the_filter():
+    registry = FakeWinreg()
+    registry.set_value(f"{MIC_USAGE_KEYS[0]}\\Dictation.App", "LastUsedTimeStop", 133000000000000000)
+    registry.set_value(f"{MIC_USAGE_KEYS[0]}\\Teams.App", "LastUsedTimeStop", 133000000000000000)
+    scanner = ConsentStoreScanner(["microphone"], winreg=registry, ignore=["*dictation*"])
+    state_filter, changes, clock = make_filter(grace=1.0, min_off=0)
+    detector = MicrophoneDetector(PollingBackend(scanner.scan), changes.append, state_filter=state_filter)
+    detector._rescan()
+    assert changes == [()]
+
+    clock.now = 10.0
+    registry.set_value(f"{MIC_USAGE_KEYS[0]}\\Dictation.App", "LastUsedTimeStop", 0)
+    detector._rescan()
+    clock.now = 20.0
+    detector._rescan()
+    assert changes == [()] and state_filter.deadline is None
+
+    registry.set_value(f"{MIC_USAGE_KEYS[0]}\\Teams.App", "LastUsedTimeStop", 0)
+    detector._rescan()
+    clock.now = 21.0
+    detector._rescan()
+    assert changes == [(), (Presence("microphone", "Teams.App"),)]
@@ -0,0 +1,132 @@
+import asyncio
+import sys
+import threading
+import time
+
+from busylight import detector
+from busylight.detector import AlsaBackend, FakeBackend, MicrophoneDetector, PollingBackend, default_backend
+from busylight.fake_winreg import FakeWinreg
+from busylight.scheduler import Scheduler
+from busylight.scanner import MIC_USAGE_KEYS, Presence
+
+
+def start(backend, **kwargs):
+    changes = []
+    seen = threading.Event()
+
+    def on_change(in_use):
+        changes.append((in_use, time.perf_counter()))
+        seen.set()
+
+    watcher = MicrophoneDetector(backend, on_change, **kwargs)
+    watcher.start()
+    assert seen.wait(1)  # The first scan always reports
+    return watcher, changes, seen
+
+
+def test_changes_reach_the_callback_quickly():
+    backend = FakeBackend()
+    watcher, changes, seen = start(backend)
+    latencies = []
+    try:
+        for i in range(20):
+            seen.clear()
+            backend.set_in_use(i % 2 == 0)
+            assert seen.wait(1)
+            latencies.append(changes[-1][1] - backend.changed_at)
+    finally:
+        watcher.stop()
+    assert [in_use for in_use, _ in changes] == [False] + [i % 2 == 0 for i in range(20)]
+    assert max(latencies) < 0.1  # Notified, not polled: no waiting out the fallback interval
+
+
+def test_unchanged_scans_do_not_call_back():
+    backend = FakeBackend()
+    watcher, changes, _ = start(backend, fallback_interval=0.01)
+    time.sleep(0.1)
+    watcher.stop()
+    assert len(changes) == 1
+
+
+def test_stop_right_after_start_returns(monkeypatch):
+    gate = threading.Event()
+    Thread = threading.Thread
+
+    class SlowThread(Thread):
+        """A thread that only gets scheduled after stop() was called."""
+
+        def run(self):
+            gate.wait(1)
+            super().run()
+
+    monkeypatch.setattr(detector.threading, "Thread", SlowThread)
+    watcher = MicrophoneDetector(FakeBackend(), lambda in_use: None)
+    watcher.start()
+    stopper = Thread(target=watcher.stop, daemon=True)
+    stopper.start()
+    time.sleep(0.05)  # stop() is waiting in join()
+    gate.set()
+    stopper.join(2)
+    assert not stopper.is_alive()
+
+
+def test_polling_backend_rescans_on_its_interval():
+    states = iter([False, False, True])
+    watcher, changes, seen = start(PollingBackend(lambda: next(states, True), interval=0.01))
+    seen.clear()
+    try:
+        assert seen.wait(1)
+    finally:
+        watcher.stop()
+    assert [in_use for in_use, _ in changes] == [False, True]
+
+
+def test_scheduled_scan_runs_off_the_loop():
+    release = threading.Event()
+    scanned_on = []
+    closed = []
+
+    def scan():
+        scanned_on.append(threading.current_thread())
+        release.wait(1)
+        return True
+
+    async def main():
+        changes = []
+        watcher = MicrophoneDetector(PollingBackend(scan, interval=10, close=lambda: closed.append(True)), changes.append)
+        watcher.start(Scheduler(asyncio.get_running_loop()))
+        started_at = time.perf_counter()
+        await asyncio.sleep(0.05)
+        assert time.perf_counter() - started_at < 0.5  # The loop ran on while the scan was blocked
+        assert scanned_on and scanned_on[0] is not threading.current_thread()
+        watcher.stop()
+        await asyncio.sleep(0.01)
+        assert closed == []  # Not closed under the running scan
+        release.set()
+        for _ in range(100):
+            if closed:
+                break
+            await asyncio.sleep(0.01)
+        assert closed == [True] and changes == [True]
+
+    asyncio.run(main())
+
+
+def test_backend_selection(monkeypatch):
+    monkeypatch.setattr(sys, "platform", "linux")
+    assert isinstance(default_backend(), AlsaBackend)
+
+    monkeypatch.setattr(sys, "platform", "darwin")
+    backend = default_backend()
+    assert isinstance(backend, PollingBackend) and backend.scan() is False
+
+    # Without ctypes.windll (not Windows) registry notifications fail, and the ConsentStore scan is polled
+    registry = FakeWinreg()
+    registry.set_value(f"{MIC_USAGE_KEYS[0]}\\Teams", "LastUsedTimeStop", 0)
+    registry.set_value(f"{MIC_USAGE_KEYS[0]}\\Dictation", "LastUsedTimeStop", 0)
+    monkeypatch.setitem(sys.modules, "winreg", registry)
+    monkeypatch.setattr(sys, "platform", "win32")
+    backend = default_backend(ignore=["dictation"], capabilities=["microphone"])
+    assert isinstance(backend, PollingBackend) and backend.interval == detector.POLL_INTERVAL
+    assert backend.scan() == (Presence("microphone", "Teams"),)
+    backend.close()
@@ -0,0 +1,234 @@
+import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from busylight import meetings
+from busylight.meetings import CALENDAR_SOURCE, Calendar, IntervalIndex, MeetingWatcher, event_blocks, expand, parse_line, unfold
+
+BERLIN = ZoneInfo("Europe/Berlin")
+HOUR = 3600
+
+
+def at(*args):
+    return datetime.datetime(*args, tzinfo=BERLIN).timestamp()
+
+
+def ics(*events):
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0"]
+    for event in events:
+        lines += ["BEGIN:VEVENT", *event, "END:VEVENT"]
+    return "\r\n".join(lines + ["END:VCALENDAR"]) + "\r\n"
+
+
+def event(uid, start, *extra, minutes=30):
+    return [f"UID:{uid}", f"DTSTART;TZID=Europe/Berlin:{start}", f"DURATION:PT{minutes}M", *extra]
+
+
+def starts(*events, window=(at(2026, 1, 1), at(2027, 1, 1))):
+    """The start times of every busy instance, as Berlin wall-clock datetimes."""
+    intervals = []
+    for blocks in event_blocks(unfold(ics(*events))).values():
+        intervals += expand(blocks, *window)
+    return [datetime.datetime.fromtimestamp(start, BERLIN).replace(tzinfo=None) for start, _ in sorted(intervals)]
+
+
+def test_unfold_and_quoted_parameters():
+    assert unfold("SUMMARY:Long\r\n  title\r\nUID:1") == ["SUMMARY:Long title", "UID:1"]
+    assert parse_line('DTSTART;TZID="W. Europe: Standard":20260105T090000') == ("DTSTART", {"TZID": "W. Europe: Standard"}, "20260105T090000")
+
+
+def test_nested_components_are_skipped():
+    blocks = event_blocks(unfold(ics(event("a", "20260105T090000", "BEGIN:VALARM", "TRIGGER:-PT10M", "DURATION:PT1H", "END:VALARM"))))
+    assert list(blocks) == ["a"] and not any("TRIGGER" in line for line in blocks["a"][0])
+    assert starts(event("a", "20260105T090000", "BEGIN:VALARM", "DURATION:PT5H", "END:VALARM")) == [datetime.datetime(2026, 1, 5, 9)]
+
+
+def test_daily_count():
+    assert starts(event("a", "20260105T090000", "RRULE:FREQ=DAILY;COUNT=3")) == [
+        datetime.datetime(2026, 1, 5, 9), datetime.datetime(2026, 1, 6, 9), datetime.datetime(2026, 1, 7, 9)]
+
+
+def test_weekly_byday_interval_and_count():
+    # DTSTART is a Wednesday: the first week only has Wednesday and Friday, then every other week
+    assert starts(event("a", "20260107T100000", "RRULE:FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE,FR;COUNT=5")) == [
+        datetime.datetime(2026, 1, 7, 10), datetime.datetime(2026, 1, 9, 10),
+        datetime.datetime(2026, 1, 19, 10), datetime.datetime(2026, 1, 21, 10), datetime.datetime(2026, 1, 23, 10)]
+
+
+def test_monthly_nth_weekday():
+    assert starts(event("a", "20260101T090000", "RRULE:FREQ=MONTHLY;BYDAY=-1FR;COUNT=3")) == [
+        datetime.datetime(2026, 1, 30, 9), datetime.datetime(2026, 2, 27, 9), datetime.datetime(2026, 3, 27, 9)]
+    assert starts(event("b", "20260101T090000", "RRULE:FREQ=MONTHLY;BYDAY=2TU;COUNT=2")) == [
+        datetime.datetime(2026, 1, 13, 9), datetime.datetime(2026, 2, 10, 9)]
+
+
+def test_monthly_on_the_31st_skips_short_months():
+    assert starts(event("a", "20260131T090000", "RRULE:FREQ=MONTHLY;COUNT=3")) == [
+        datetime.datetime(2026, 1, 31, 9), datetime.datetime(2026, 3, 31, 9), datetime.datetime(2026, 5, 31, 9)]
+
+
+def test_yearly():
+    assert starts(event("a", "20250610T090000", "RRULE:FREQ=YEARLY"), window=(at(2025, 1, 1), at(2028, 1, 1))) == [
+        datetime.datetime(2025, 6, 10, 9), datetime.datetime(2026, 6, 10, 9), datetime.datetime(2027, 6, 10, 9)]
+
+
+def test_until_is_inclusive():
+    assert starts(event("a", "20261019T090000", "RRULE:FREQ=DAILY;UNTIL=20261021T070000Z"))[-1] == datetime.datetime(2026, 10, 21, 9)
+
+
+def test_date_only_until_includes_that_day():
+    assert starts(event("a", "20261019T090000", "RRULE:FREQ=DAILY;UNTIL=20261022")) == [
+        datetime.datetime(2026, 10, 19, 9), datetime.datetime(2026, 10, 20, 9),
+        datetime.datetime(2026, 10, 21, 9), datetime.datetime(2026, 10, 22, 9)]
+
+
+def test_exdate_and_moved_occurrence():
+    master = event("a", "20260105T090000", "RRULE:FREQ=DAILY;COUNT=4", "EXDATE;TZID=Europe/Berlin:20260106T090000")
+    moved = ["UID:a", "RECURRENCE-ID;TZID=Europe/Berlin:20260107T090000", "DTSTART;TZID=Europe/Berlin:20260107T150000", "DURATION:PT30M"]
+    cancelled = ["UID:a", "RECURRENCE-ID;TZID=Europe/Berlin:20260108T090000", "DTSTART;TZID=Europe/Berlin:20260108T090000",
+                 "DURATION:PT30M", "STATUS:CANCELLED"]
+    assert starts(master, moved, cancelled) == [datetime.datetime(2026, 1, 5, 9), datetime.datetime(2026, 1, 7, 15)]
+
+
+def test_wall_clock_time_kept_across_dst():
+    # Berlin moves to summer time on 2026-03-29
+    found = starts(event("a", "20260323T090000", "RRULE:FREQ=WEEKLY;COUNT=3"))
+    assert [moment.hour for moment in found] == [9, 9, 9]
+    assert found[1] - found[0] == datetime.timedelta(weeks=1)
+
+
+def test_free_time_is_not_busy():
+    assert starts(
+        event("a", "20260105T090000", "TRANSP:TRANSPARENT"),
+        event("b", "20260105T100000", "STATUS:CANCELLED"),
+        event("c", "20260105T110000", "X-MICROSOFT-CDO-BUSYSTATUS:FREE"),
+        ["UID:d", "DTSTART;VALUE=DATE:20260105", "DTEND;VALUE=DATE:20260106"],
+        event("e", "20260105T120000", minutes=0),
+    ) == []
+
+
+def test_interval_index_merges_overlaps():
+    index = IntervalIndex([(0, 10), (5, 20), (20, 30), (40, 50)])
+    assert (index.starts, index.ends) == ([0, 40], [30, 50])
+    assert index.state(-1) == (False, 0)
+    assert index.state(25) == (True, 30)
+    assert index.state(30) == (False, 40)
+    assert index.state(50) == (False, None)
+    assert IntervalIndex().state(0) == (False, None)
+
+
+def write(path, text):
+    with open(path, "w", newline="") as f:
+        f.write(text)
+
+
+def series(count):
+    return [event(f"s{i}", f"202601{5 + i % 5:02d}T{8 + i % 9:02d}{(i * 7) % 60:02d}00", f"RRULE:FREQ=WEEKLY;INTERVAL={1 + i % 3}",
+                  minutes=15 + i % 4 * 15) for i in range(count)]
+
+
+@pytest.mark.parametrize("incremental_limit", [1000, 1])
+def test_patch_matches_a_full_sort(tmp_path, monkeypatch, incremental_limit):
+    monkeypatch.setattr(meetings, "INCREMENTAL_LIMIT", incremental_limit)  # 1 patches in place, 1000 sorts again
+    now = at(2026, 2, 2)
+    path = tmp_path / "calendar.ics"
+    events = series(40)
+    write(path, ics(*events))
+    calendar = Calendar(str(path), 30, clock=lambda: now)
+    assert calendar.refresh()
+    assert not calendar.refresh()
+
+    events[3] = event("s3", "20260106T133000", "RRULE:FREQ=DAILY")  # Edited
+    del events[7]  # Deleted
+    events.append(event("new", "20260203T170000"))  # Added
+    write(path, ics(*events) + "\r\n")  # A different size, so the change is seen even within one mtime tick
+    assert calendar.refresh()
+    assert (calendar.expanded, calendar.reused) == (2, 38)
+
+    fresh = Calendar(str(path), 30, clock=lambda: now)
+    fresh.refresh()
+    assert calendar._instances == fresh._instances
+    assert (calendar.index.starts, calendar.index.ends) == (fresh.index.starts, fresh.index.ends)
+
+
+def test_window_slides_forward(tmp_path):
+    clock = [at(2026, 1, 5)]
+    path = tmp_path / "calendar.ics"
+    write(path, ics(event("a", "20260105T090000", "RRULE:FREQ=DAILY")))
+    calendar = Calendar(str(path), 4, clock=lambda: clock[0])
+    calendar.refresh()
+    clock[0] = at(2026, 1, 20, 8)
+    assert calendar.refresh()
+    assert calendar.state() == (False, at(2026, 1, 20, 9))
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.wakeups = {}
+
+    def after(self, name, delay, callback):
+        self.wakeups[name] = delay
+
+    def cancel(self, name):
+        self.wakeups.pop(name, None)
+
+
+class FakeLight:
+    mic_color = "255,0,0"
+    mic_in_use = False
+
+    def __init__(self):
+        self.scheduler = FakeScheduler()
+        self.sources = {}
+        self.effects = []
+
+    def set_source(self, name, color, priority):
+        self.sources[name] = color
+
+    def clear_source(self, name):
+        self.sources.pop(name, None)
+
+    def play_effect(self, effect, duration=None):
+        self.effects.append(duration)
+
+    def stop_effect(self):
+        pass
+
+
+def watcher_at(tmp_path, countdown):
+    clock = [at(2026, 1, 5, 8, 50)]
+    path = tmp_path / "calendar.ics"
+    write(path, ics(event("a", "20260105T090000")))
+    calendar = Calendar(str(path), clock=lambda: clock[0])
+    calendar.refresh()
+    light = FakeLight()
+    return clock, light, MeetingWatcher(light, calendar, lead_time=120, countdown=countdown)
+
+
+def test_watcher_goes_busy_lead_time_ahead(tmp_path):
+    clock, light, watcher = watcher_at(tmp_path, countdown=False)
+    watcher.update()
+    assert light.sources == {} and light.scheduler.wakeups["calendar-change"] == 480  # At 08:58
+    clock[0] += 480
+    watcher.update()
+    assert light.sources == {CALENDAR_SOURCE: "255,0,0"} and light.scheduler.wakeups["calendar-change"] == 120  # The start
+    clock[0] += 120
+    watcher.update()
+    assert light.sources and light.scheduler.wakeups["calendar-change"] == 30 * 60  # The end
+    clock[0] += 30 * 60
+    watcher.update()
+    assert light.sources == {} and "calendar-change" not in light.scheduler.wakeups
+
+
+def test_watcher_countdown(tmp_path):
+    clock, light, watcher = watcher_at(tmp_path, countdown=True)
+    clock[0] += 480
+    watcher.update()
+    assert light.sources == {} and light.effects == [120]
+    clock[0] += 60
+    watcher.update()
+    assert light.effects == [120]  # Started once per meeting
+    clock[0] += 60
+    watcher.update()
+    assert light.sources == {CALENDAR_SOURCE: "255,0,0"}
@@ -0,0 +1,154 @@
+import numpy as np
+import pytest
+
+from busylight.pixels import DECODER_HISTORY, FLAG_DELTA, HEADER_SIZE, FrameBuffer, PixelDecoder, encode_pixels, full_frame_size
+
+LENGTH = 60
+
+
+def random_frame(rng):
+    return rng.integers(0, 256, size=(LENGTH, 3), dtype=np.uint8)
+
+
+def feed_all(decoder, chunks):
+    results = [decoder.feed(chunk) for chunk in chunks]
+    assert all(result is None for result in results[:-1])
+    return results[-1]
+
+
+def test_full_frame_round_trip():
+    rng = np.random.default_rng(1)
+    decoder = PixelDecoder(LENGTH)
+    pixels = random_frame(rng)
+    sequence, shown = feed_all(decoder, encode_pixels(pixels, 5))
+    assert sequence == 5
+    np.testing.assert_array_equal(shown, pixels)
+    np.testing.assert_array_equal(decoder.pixels, pixels)
+
+
+def test_solid_frame_is_one_run():
+    buffer = FrameBuffer(LENGTH)
+    buffer.fill("255,0,0")
+    (chunk,) = encode_pixels(buffer.pixels, 1)
+    assert len(chunk) < full_frame_size(LENGTH)
+    np.testing.assert_array_equal(PixelDecoder(LENGTH).feed(chunk)[1], buffer.pixels)
+
+
+def test_delta_frames_apply_on_their_base():
+    rng = np.random.default_rng(2)
+    decoder = PixelDecoder(LENGTH)
+    base = random_frame(rng)
+    feed_all(decoder, encode_pixels(base, 1))
+    frame = base.copy()
+    frame[3] = (1, 2, 3)
+    frame[10:20] = (9, 9, 9)
+    chunks = encode_pixels(frame, 2, base, 1)
+    assert chunks[0][3] & FLAG_DELTA
+    assert sum(map(len, chunks)) < full_frame_size(LENGTH)
+    sequence, shown = feed_all(decoder, chunks)
+    assert sequence == 2
+    np.testing.assert_array_equal(shown, frame)
+    # The base itself is left as it was, so it can still take another delta
+    np.testing.assert_array_equal(decoder.frames[1], base)
+
+
+def test_delta_against_an_older_frame_in_history():
+    rng = np.random.default_rng(3)
+    decoder = PixelDecoder(LENGTH)
+    first = random_frame(rng)
+    feed_all(decoder, encode_pixels(first, 1))
+    feed_all(decoder, encode_pixels(random_frame(rng), 2))
+    frame = first.copy()
+    frame[0] = (0, 0, 0)
+    np.testing.assert_array_equal(feed_all(decoder, encode_pixels(frame, 3, first, 1))[1], frame)
+
+
+def test_unchanged_frame_still_yields_a_chunk():
+    pixels = np.zeros((LENGTH, 3), dtype=np.uint8)
+    decoder = PixelDecoder(LENGTH)
+    feed_all(decoder, encode_pixels(pixels, 1))
+    (chunk,) = encode_pixels(pixels, 2, pixels, 1)
+    assert decoder.feed(chunk)[0] == 2
+
+
+def test_large_frame_is_chunked():
+    rng = np.random.default_rng(4)
+    pixels = random_frame(rng)
+    chunks = encode_pixels(pixels, 7, max_payload=40)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 40 for chunk in chunks)
+    assert [(chunk[5], chunk[6]) for chunk in chunks] == [(i, len(chunks)) for i in range(len(chunks))]
+    np.testing.assert_array_equal(feed_all(PixelDecoder(LENGTH), chunks)[1], pixels)
+
+
+@pytest.mark.parametrize("lost", [0, 1, -1])
+def test_frame_with_a_lost_chunk_is_never_shown(lost):
+    rng = np.random.default_rng(6)
+    decoder = PixelDecoder(LENGTH)
+    base = random_frame(rng)
+    feed_all(decoder, encode_pixels(base, 1))
+    chunks = encode_pixels(random_frame(rng), 2, base, 1, max_payload=40)
+    del chunks[lost]
+    results = []
+    for chunk in chunks:
+        try:
+            results.append(decoder.feed(chunk))
+        except ValueError:
+            results.append("dropped")
+    assert all(result in (None, "dropped") for result in results)
+    assert 2 not in decoder.frames
+    np.testing.assert_array_equal(decoder.pixels, base)
+
+
+def test_resent_frame_after_a_lost_chunk_is_shown():
+    rng = np.random.default_rng(7)
+    decoder = PixelDecoder(LENGTH)
+    pixels = random_frame(rng)
+    chunks = encode_pixels(pixels, 3, max_payload=40)
+    decoder.feed(chunks[0])
+    with pytest.raises(ValueError, match="out of order"):
+        decoder.feed(chunks[2])
+    np.testing.assert_array_equal(feed_all(decoder, chunks)[1], pixels)
+    # A resend that starts over before the first copy finished works too
+    decoder.feed(chunks[0])
+    decoder.feed(chunks[1])
+    np.testing.assert_array_equal(feed_all(decoder, chunks)[1], pixels)
+
+
+def test_frame_needing_too_many_chunks_is_refused():
+    rng = np.random.default_rng(8)
+    pixels = rng.integers(0, 256, size=(256, 3), dtype=np.uint8)
+    pixels[1::2] = 0  # No two neighbours alike, so no run covers more than one pixel
+    with pytest.raises(ValueError, match="chunks"):
+        encode_pixels(pixels, 1, max_payload=HEADER_SIZE + 1 + 5)  # Room for one single-pixel run per chunk
+
+
+def test_crc_mismatch_rejected():
+    (chunk,) = encode_pixels(np.zeros((LENGTH, 3), dtype=np.uint8), 1)
+    corrupted = bytearray(chunk)
+    corrupted[-2] ^= 0x01
+    with pytest.raises(ValueError, match="CRC"):
+        PixelDecoder(LENGTH).feed(corrupted)
+
+
+def test_delta_against_unknown_frame_rejected():
+    rng = np.random.default_rng(5)
+    decoder = PixelDecoder(LENGTH)
+    base = random_frame(rng)
+    with pytest.raises(ValueError, match="unknown frame"):
+        decoder.feed(encode_pixels(random_frame(rng), 2, base, 1)[0])
+
+
+def test_history_forgets_old_frames():
+    decoder = PixelDecoder(LENGTH)
+    pixels = np.zeros((LENGTH, 3), dtype=np.uint8)
+    for sequence in range(1, DECODER_HISTORY + 2):
+        feed_all(decoder, encode_pixels(pixels, sequence))
+    assert 1 not in decoder.frames and len(decoder.frames) == DECODER_HISTORY
+    with pytest.raises(ValueError):
+        decoder.feed(encode_pixels(pixels, 9, pixels, 1)[0])
+
+
+def test_non_pixel_frame_rejected():
+    with pytest.raises(ValueError):
+        PixelDecoder(LENGTH).feed(b"255,0,0")
@@ -0,0 +1,66 @@
+import pytest
+
+from busylight import protocol
+from busylight.protocol import FRAME_SIZE, OP_HEARTBEAT, OP_SET_COLOR, FrameEncoder, decode, encode_ack, encode_ascii
+
+
+def test_frame_round_trip():
+    encoder = FrameEncoder(target=3, brightness=128)
+    frame = decode(encoder.encode("10,20,30"))
+    assert frame == protocol.Frame(protocol.VERSION, OP_SET_COLOR, 3, (10, 20, 30), 128, 0)
+
+
+def test_sequence_numbers_advance_and_wrap():
+    encoder = FrameEncoder()
+    sequences = [decode(encoder.encode("255,0,0"))[-1] for _ in range(258)]
+    assert sequences[:3] == [0, 1, 2]
+    assert sequences[255:] == [255, 0, 1]
+
+
+def test_cached_body_matches_a_fresh_encoder():
+    warm = FrameEncoder()
+    warm.precompute(["255,0,0", "0,255,0"])
+    warm.encode("0,255,0")
+    cold = FrameEncoder()
+    cold.next_sequence()
+    assert warm.encode("255,0,0", opcode=OP_HEARTBEAT) == cold.encode("255,0,0", opcode=OP_HEARTBEAT)
+
+
+def test_corrupted_frame_is_rejected():
+    frame = bytearray(FrameEncoder().encode("1,2,3"))
+    frame[3] ^= 0x01
+    with pytest.raises(ValueError, match="CRC"):
+        decode(bytes(frame))
+
+
+def test_frame_without_crc_is_accepted():
+    frame = FrameEncoder(use_crc=False).encode("1,2,3")
+    assert frame[-1] == 0
+    assert decode(frame).rgb == (1, 2, 3)
+
+
+def test_wrong_length_is_rejected():
+    with pytest.raises(ValueError):
+        decode(FrameEncoder().encode("1,2,3")[:FRAME_SIZE - 1] + b"\x00\x00")
+
+
+def test_ack_decodes():
+    frame = decode(encode_ack(42))
+    assert frame.opcode == protocol.OP_ACK
+    assert frame.sequence == 42
+
+
+@pytest.mark.parametrize("command, rgb, opcode", [
+    (encode_ascii("255,128,0"), (255, 128, 0), OP_SET_COLOR),
+    (b"G", (0, 255, 0), OP_SET_COLOR),
+    (b"E\n", (0, 0, 0), protocol.OP_OFF),
+])
+def test_legacy_commands_decode(command, rgb, opcode):
+    frame = decode(command)
+    assert (frame.version, frame.rgb, frame.opcode, frame.sequence) == (0, rgb, opcode, None)
+
+
+@pytest.mark.parametrize("command", [b"255,0", b"X", b"1,2,3,4"])
+def test_malformed_legacy_commands_are_rejected(command):
+    with pytest.raises(ValueError):
+        decode(command)
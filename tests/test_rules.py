@@ -0,0 +1,114 @@
+import json
+import time
+
+import pytest
+
+from busylight.core import BusyLight
+from busylight.daemon import StatusServer
+from busylight.fake_winreg import FakeWinreg
+from busylight.rules import RuleTable
+from busylight.scanner import MIC_USAGE_KEYS, ConsentStoreScanner, Presence, capability_keys
+from busylight.transport import MemoryTransport
+
+TEAMS = Presence("microphone", "MSTeams_8wekyb3d8bbwe")
+OBS = Presence("webcam", "C:#Program Files#obs-studio#bin#64bit#obs64.exe")
+CHROME = Presence("microphone", "C:#Program Files#Google#Chrome#Application#chrome.exe")
+
+
+def test_glob_matching_is_case_insensitive():
+    table = RuleTable([{"app": "*teams*", "color": "255,0,0"}])
+    assert table.resolve((TEAMS,)) == ("255,0,0", TEAMS)
+    assert table.resolve((CHROME,)) == (None, None)
+
+
+def test_capability_limits_a_rule():
+    table = RuleTable([{"app": "*chrome.exe", "color": "255,191,0", "capability": "webcam"}])
+    assert table.resolve((CHROME,)) == (None, None)
+    assert table.resolve((Presence("webcam", CHROME.app),))[0] == "255,191,0"
+
+
+def test_precedence():
+    rules = [
+        {"app": "*teams*", "color": "255,0,0"},
+        {"app": "*obs64.exe", "color": "128,0,128", "priority": 10},
+        {"app": "*", "color": "1,1,1"},
+    ]
+    table = RuleTable(rules, {"microphone": "0,0,255"}, ["microphone", "webcam"])
+    # Priority beats order, and an earlier rule beats the catch-all after it
+    assert table.resolve((TEAMS, OBS)) == ("128,0,128", OBS)
+    assert table.resolve((CHROME, TEAMS)) == ("255,0,0", TEAMS)
+    # A matching rule beats the capability color
+    assert table.resolve((CHROME,)) == ("1,1,1", CHROME)
+
+
+def test_capability_colors_lose_to_rules():
+    table = RuleTable([{"app": "*teams*", "color": "255,0,0"}], {"microphone": "0,0,255", "webcam": "0,255,0"}, ["microphone", "webcam"])
+    assert table.resolve((CHROME, TEAMS))[0] == "255,0,0"
+    assert table.resolve((CHROME,))[0] == "0,0,255"
+    # Between capability colors the earlier capability wins
+    assert table.resolve((Presence("webcam", "x"), CHROME))[0] == "0,0,255"
+    assert sorted(table.colors) == ["0,0,255", "0,255,0", "255,0,0"]
+
+
+@pytest.mark.parametrize("rule", [
+    {"color": "255,0,0"},
+    {"app": "*teams*"},
+    {"app": "*teams*", "color": "red"},
+    {"app": "*teams*", "color": "1,2"},
+    {"app": "*teams*", "color": "255,0,0", "priority": "high"},
+    {"app": "*teams*", "color": "255,0,0", "priority": True},
+    {"app": 5, "color": "255,0,0"},
+    "*teams*",
+])
+def test_malformed_rules_raise_value_error(rule):
+    with pytest.raises(ValueError):
+        RuleTable([rule])
+
+
+def test_malformed_capability_color_raises_value_error():
+    with pytest.raises(ValueError):
+        RuleTable([], {"microphone": "blue"})
+
+
+def test_ignore_rules_reach_the_scanner():
+    registry = FakeWinreg()
+    for root_key in capability_keys("microphone"):
+        registry.set_value(f"{root_key}\\app", "LastUsedTimeStop", 1)
+    registry.set_value(f"{MIC_USAGE_KEYS[0]}\\MicrosoftWindows.Client.CBS_cw5n1h2txyewy", "LastUsedTimeStop", 0)
+    table = RuleTable([{"app": "microsoftwindows.client.cbs_*", "ignore": True}])
+    assert table.rules == [] and table.ignore == ["microsoftwindows.client.cbs_*"]
+    scanner = ConsentStoreScanner(["microphone"], winreg=registry, ignore=table.ignore)
+    assert scanner.scan() == ()
+
+
+def wait_for(transport, color, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not (transport.sent and transport.sent[-1][1] == color):
+        assert time.monotonic() < deadline, transport.sent[-1:]
+        time.sleep(0.005)
+
+
+def test_rules_reload_without_restarting(tmp_path):
+    transport = MemoryTransport()
+    light = BusyLight(transport)
+    light.submit(light.connect()).result()
+    light.set_mic_in_use((TEAMS,))
+    wait_for(transport, light.mic_color)
+
+    light.set_rules([{"app": "*teams*", "color": "255,0,0"}])
+    assert light.current_color == "255,0,0"
+    wait_for(transport, "255,0,0")
+
+    with pytest.raises(ValueError):
+        light.set_rules([{"app": "*teams*", "color": "red"}])
+    assert light.current_color == "255,0,0"  # The old table is kept
+
+    settings = tmp_path / "settings.json"
+    settings.write_text(json.dumps({"app_rules": [{"app": "*teams*", "color": "0,0,255"}]}))
+    reply = StatusServer(light, settings_path=str(settings)).reload()
+    assert reply == {"ok": True, "color": "0,0,255", "rules": 1}
+    wait_for(transport, "0,0,255")
+
+    settings.write_text(json.dumps({"app_rules": [{"app": "*teams*", "color": "0,0,255", "priority": "high"}]}))
+    assert StatusServer(light, settings_path=str(settings)).reload()["ok"] is False
+    assert light.current_color == "0,0,255"
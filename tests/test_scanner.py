@@ -0,0 +1,75 @@
+from busylight.fake_winreg import FakeWinreg
+from busylight.scanner import MIC_USAGE_KEYS, ConsentStoreScanner, Presence, capability_keys
+
+APPS = 500  # Per root: packaged and NonPackaged
+
+
+def build_registry(apps=APPS):
+    registry = FakeWinreg()
+    for root_key in capability_keys("microphone"):
+        for i in range(apps):
+            registry.set_value(f"{root_key}\\app{i}", "LastUsedTimeStop", 133000000000000000 + i)
+    return registry
+
+
+def test_unchanged_scan_queries_each_key_once():
+    registry = build_registry()
+    scanner = ConsentStoreScanner(["microphone"], winreg=registry)
+    scanner.scan()
+    registry.reset_counters()
+    assert scanner.scan() == ()
+    # One QueryInfoKey per root and per app; no EnumKey, OpenKey or QueryValueEx
+    assert registry.calls == 2 + 2 * APPS
+
+
+def test_changed_app_is_the_only_one_reread():
+    registry = build_registry()
+    scanner = ConsentStoreScanner(["microphone"], winreg=registry)
+    scanner.scan()
+    registry.set_value(f"{MIC_USAGE_KEYS[1]}\\app7", "LastUsedTimeStop", 0)
+    registry.reset_counters()
+    assert scanner.scan() == (Presence("microphone", "app7"),)
+    assert registry.calls == 2 + 2 * APPS + 1
+
+
+def test_added_and_removed_apps_are_picked_up():
+    registry = build_registry(apps=3)
+    scanner = ConsentStoreScanner(["microphone"], winreg=registry)
+    scanner.scan()
+    registry.set_value(f"{MIC_USAGE_KEYS[0]}\\new", "LastUsedTimeStop", 0)
+    assert scanner.scan() == (Presence("microphone", "new"),)
+    registry.delete_key(f"{MIC_USAGE_KEYS[0]}\\new")
+    assert scanner.scan() == ()
+    registry.reset_counters()
+    scanner.scan()
+    assert registry.calls == 2 + 2 * 3
+
+
+def test_ignored_apps_never_count():
+    registry = build_registry(apps=2)
+    registry.set_value(f"{MIC_USAGE_KEYS[0]}\\Dictation.App", "LastUsedTimeStop", 0)
+    scanner = ConsentStoreScanner(["microphone"], winreg=registry, ignore=["*dictation*"])
+    assert scanner.scan() == ()
+    assert ("microphone", "Dictation.App") in scanner.active
+
+
+def test_close_releases_every_handle():
+    registry = build_registry(apps=10)
+    scanner = ConsentStoreScanner(["microphone"], winreg=registry)
+    scanner.scan()
+    assert registry.open_handles == 2 + 2 * 10
+    scanner.close()
+    assert registry.open_handles == 0
+
+
+def test_app_recreated_without_a_root_change_is_tracked_again():
+    registry = build_registry(apps=3)
+    scanner = ConsentStoreScanner(["microphone"], winreg=registry)
+    scanner.scan()
+    root = registry._find(MIC_USAGE_KEYS[0])
+    last_write = root.last_write
+    registry.delete_key(f"{MIC_USAGE_KEYS[0]}\\app1")
+    registry.set_value(f"{MIC_USAGE_KEYS[0]}\\app1", "LastUsedTimeStop", 0)
+    root.last_write = last_write  # Both changes within one tick of the root's timestamp
+    scanner.scan()  # The old handle fails
+    assert scanner.scan() == (Presence("microphone", "app1"),)
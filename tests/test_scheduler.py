@@ -0,0 +1,87 @@
+import asyncio
+import logging
+
+from busylight.scheduler import Scheduler
+
+
+def run_for(seconds, setup):
+    async def main():
+        scheduler = Scheduler(asyncio.get_running_loop())
+        setup(scheduler)
+        await asyncio.sleep(seconds)
+        return scheduler
+
+    return asyncio.run(main())
+
+
+def test_interval_task_repeats():
+    calls = []
+    scheduler = run_for(0.1, lambda scheduler: scheduler.every("tick", 0.02, lambda: calls.append(1), slack=0))
+    assert 2 <= len(calls) <= 5
+    assert scheduler.tasks["tick"].runs == len(calls)
+
+
+def test_one_shot_task_runs_once():
+    calls = []
+    scheduler = run_for(0.05, lambda scheduler: scheduler.after("once", 0.01, lambda: calls.append(1)))
+    assert calls == [1] and "once" not in scheduler.tasks
+
+
+def test_task_within_slack_shares_a_wakeup():
+    calls = []
+
+    def setup(scheduler):
+        scheduler.every("a", 0.02, lambda: calls.append("a"), slack=0)
+        scheduler.every("b", 0.025, lambda: calls.append("b"), slack=0.01)
+
+    scheduler = run_for(0.03, setup)
+    assert calls == ["a", "b"] and scheduler.wakeups == 1
+
+
+def test_synchronous_failure_is_logged(caplog):
+    def fail():
+        raise RuntimeError("boom")
+
+    with caplog.at_level(logging.ERROR):
+        scheduler = run_for(0.03, lambda scheduler: scheduler.every("job", 0.01, fail, slack=0))
+    assert scheduler.tasks["job"].failures >= 1
+    assert "Scheduled task job failed: boom" in caplog.text
+
+
+def test_coroutine_failure_is_logged(caplog):
+    async def fail():
+        await asyncio.sleep(0)
+        raise RuntimeError("async boom")
+
+    with caplog.at_level(logging.ERROR):
+        run_for(0.03, lambda scheduler: scheduler.after("job", 0.01, fail))
+    assert "Scheduled task job failed: async boom" in caplog.text
+    assert "never retrieved" not in caplog.text
+
+
+def test_coroutine_failure_counts_against_the_task():
+    async def fail():
+        raise RuntimeError("async boom")
+
+    scheduler = run_for(0.05, lambda scheduler: scheduler.every("job", 0.01, fail, slack=0))
+    task = scheduler.tasks["job"]
+    assert task.failures == task.runs >= 2
+
+
+def test_cancelled_coroutine_is_not_a_failure(caplog):
+    async def hang():
+        await asyncio.sleep(10)
+
+    async def main():
+        scheduler = Scheduler(asyncio.get_running_loop())
+        task = scheduler.after("job", 0, hang)
+        await asyncio.sleep(0.01)
+        for pending in asyncio.all_tasks():
+            if pending is not asyncio.current_task():
+                pending.cancel()
+        await asyncio.sleep(0.01)
+        return task
+
+    with caplog.at_level(logging.ERROR):
+        task = asyncio.run(main())
+    assert task.failures == 0 and "failed" not in caplog.text
@@ -0,0 +1,86 @@
+import queue
+import threading
+
+from busylight.serial_transport import SerialWriter, color_to_command
+
+
+class FakeSerial:
+    """A port whose firmware echoes each command only when the test says so."""
+
+    def __init__(self, auto_echo=True):
+        self.auto_echo = auto_echo
+        self.written = []
+        self.is_open = True
+        self.write_started = threading.Event()
+        self._lines = queue.Queue()
+
+    def write(self, data):
+        if not self.is_open:
+            raise OSError("port closed")
+        self.written.append(data.decode())
+        self.write_started.set()
+        if self.auto_echo:
+            self.echo(data.decode())
+
+    def echo(self, command):
+        self._lines.put(f"Received: {command}\r\n".encode())
+
+    def readline(self):
+        if not self.is_open:
+            raise OSError("port closed")
+        try:
+            return self._lines.get(timeout=0.05)
+        except queue.Empty:
+            return b""
+
+    def close(self):
+        self.is_open = False
+
+
+def test_color_to_command_picks_the_nearest_letter():
+    assert color_to_command("255,0,0") == "R"
+    assert color_to_command("10,240,20") == "G"
+    assert color_to_command("250,250,240") == "W"
+    assert color_to_command("0,0,10") == "E"
+
+
+def test_echo_is_matched_to_its_command():
+    port = FakeSerial()
+    writer = SerialWriter(port)
+    try:
+        writer.put("R")
+        assert writer.flush(2)
+        assert port.written == ["R"]
+        assert len(writer.round_trips) == 1
+    finally:
+        writer.stop()
+
+
+def test_burst_collapses_to_the_latest_command():
+    port = FakeSerial(auto_echo=False)
+    writer = SerialWriter(port)
+    try:
+        writer.put("R")
+        assert port.write_started.wait(2)  # "R" is in flight, waiting for its echo
+        for command in "GWEG":
+            writer.put(command)
+        port.write_started.clear()
+        port.echo("R")  # Frees the slot; only the latest pending command follows
+        assert port.write_started.wait(2)
+        port.echo(port.written[-1])
+        assert writer.flush(2)
+        assert port.written == ["R", "G"]
+        assert writer.coalesced == 3
+    finally:
+        writer.stop()
+
+
+def test_read_error_reports_the_port_lost():
+    port = FakeSerial()
+    lost = threading.Event()
+    writer = SerialWriter(port, on_error=lost.set)
+    try:
+        port.close()
+        assert lost.wait(2)
+    finally:
+        writer.stop()
@@ -0,0 +1,67 @@
+from busylight.ui import DISPATCH_EVENT, UiDispatcher
+
+
+class FakeWindow:
+    """Stands in for the Tk root: event_generate delivers the bound handler on drain()."""
+
+    def __init__(self):
+        self.handlers = {}
+        self.pending = 0
+        self.fail_next = None
+
+    def bind(self, event, handler):
+        self.handlers[event] = handler
+
+    def event_generate(self, event, when=None):
+        if self.fail_next:
+            error, self.fail_next = self.fail_next, None
+            raise error
+        self.pending += 1
+
+    def drain(self):
+        while self.pending:
+            self.pending -= 1
+            self.handlers[DISPATCH_EVENT]()
+
+
+def test_burst_collapses_to_one_wakeup():
+    window = FakeWindow()
+    ran = []
+    dispatcher = UiDispatcher(window)
+    for i in range(5):
+        dispatcher.post(ran.append, i)
+    assert window.pending == 1
+    window.drain()
+    assert ran == [0, 1, 2, 3, 4] and dispatcher.wakeups == 1
+
+
+def test_redraw_only_when_snapshot_changes():
+    window = FakeWindow()
+    state = {"color": "0,0,0"}
+    rendered = []
+    dispatcher = UiDispatcher(window, render=rendered.append, snapshot=lambda: state["color"])
+    dispatcher.request_redraw()
+    window.drain()
+    dispatcher.request_redraw()
+    window.drain()
+    state["color"] = "255,0,0"
+    dispatcher.request_redraw()
+    window.drain()
+    assert rendered == ["0,0,0", "255,0,0"]
+
+
+class TclError(Exception):
+    pass
+
+
+def test_failed_post_does_not_block_later_wakeups():
+    for error in (TclError("not ready"), RuntimeError("main thread is not in main loop")):
+        window = FakeWindow()
+        ran = []
+        dispatcher = UiDispatcher(window)
+        window.fail_next = error
+        dispatcher.post(ran.append, 1)
+        assert window.pending == 0
+        dispatcher.post(ran.append, 2)
+        window.drain()
+        assert ran == [1, 2]
@@ -0,0 +1,202 @@
+import asyncio
+import os
+import select
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import serial
+
+from busylight.core import BusyLight
+from busylight.devices import Device
+from busylight.serial_transport import SerialTransport
+from busylight.usb_ports import ESPRESSIF_VID, USB_SERIAL_JTAG_PID, UsbMatch, UsbPortManager
+from tests.test_serial_transport import FakeSerial
+
+
+def port(device, vid=ESPRESSIF_VID, pid=USB_SERIAL_JTAG_PID, serial_number="A1", description="USB JTAG/serial debug unit"):
+    return SimpleNamespace(device=device, vid=vid, pid=pid, serial_number=serial_number, description=description)
+
+
+DOCK = port("COM3", vid=0x17EF, pid=0x3082, serial_number=None, description="USB Ethernet")
+BRIDGE = port("COM7", vid=0x1A86, pid=0x7523, serial_number=None, description="USB-SERIAL CH340")
+BLUETOOTH = port("COM9", vid=None, pid=None, serial_number=None, description="Standard Serial over Bluetooth link")
+
+
+def manager(ports, **kwargs):
+    return UsbPortManager(list_ports=lambda: list(ports), **kwargs)
+
+
+def test_match_on_usb_ids():
+    assert UsbMatch().matches(port("COM4"))
+    assert not UsbMatch().matches(DOCK)
+    assert not UsbMatch().matches(BLUETOOTH)
+    assert UsbMatch(vid="1a86", pid="0x7523").matches(BRIDGE)
+    assert not UsbMatch(serial_number="B2").matches(port("COM4"))
+
+
+def test_match_from_settings():
+    match = UsbMatch.from_settings({"vid": "0x1A86", "pid": "7523", "description_fallback": False})
+    assert (match.vid, match.pid, match.serial_number, match.description_fallback) == (0x1A86, 0x7523, None, False)
+    assert UsbMatch.from_settings({}).vid == ESPRESSIF_VID
+
+
+def test_skips_other_usb_devices():
+    assert manager([DOCK, BLUETOOTH, port("COM4")]).find() == "COM4"
+
+
+def test_description_fallback_needs_a_single_usb_port():
+    assert manager([BRIDGE, BLUETOOTH]).find() == "COM7"
+    assert manager([BRIDGE, DOCK]).find() is None
+    assert manager([BRIDGE], match=UsbMatch(description_fallback=False)).find() is None
+
+
+def test_replugged_light_is_found_under_a_new_name():
+    ports = [port("COM4", serial_number="A1"), port("COM5", serial_number="B2")]
+    usb = manager(ports)
+    usb.serial_number = "B2"
+    assert usb.find() == "COM5"
+    ports[:] = [port("COM4", serial_number="A1"), port("COM6", serial_number="B2")]
+    assert usb.find() == "COM6"
+
+
+def test_several_lights_prefer_the_port_in_use():
+    usb = manager([port("COM4", serial_number=None), port("COM5", serial_number=None)])
+    usb.port = "COM5"
+    assert usb.find() == "COM5"
+    assert manager([port("COM5", serial_number=None), port("COM4", serial_number=None)]).find() == "COM4"
+
+
+def test_wait_for_port_wakes_on_change():
+    ports = []
+    usb = manager(ports, poll_interval=10)
+
+    async def run():
+        waiting = asyncio.ensure_future(usb.wait_for_port(5))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        ports.append(port("COM4"))
+        started = time.perf_counter()
+        usb.changed()
+        assert await waiting == "COM4"
+        return time.perf_counter() - started
+
+    assert asyncio.run(run()) < 1
+
+
+def test_wait_for_port_times_out_and_wakes():
+    usb = manager([], poll_interval=0.01)
+
+    async def run():
+        assert await usb.wait_for_port(0.05) is None
+        assert usb.listings > 2
+        waiting = asyncio.ensure_future(usb.wait_for_port(5))
+        await asyncio.sleep(0.02)
+        usb.wake()
+        assert await asyncio.wait_for(waiting, 1) is None
+
+    asyncio.run(run())
+
+
+def test_light_is_reopened_when_replugged(monkeypatch):
+    ports = [port("COM4")]
+    opened = []
+
+    def open_port(name, baudrate, timeout=None):
+        opened.append((name, FakeSerial()))
+        return opened[-1][1]
+
+    monkeypatch.setattr(serial, "Serial", open_port)
+    usb = manager(ports, poll_interval=10)
+
+    async def run():
+        light = Device(SerialTransport(manager=usb), auto_reconnect=True)
+        light.color = "255,0,0"
+        assert await light.connect()
+        assert opened[0][0] == "COM4"
+
+        ports.clear()  # Unplugged: the reader thread fails on the closed port
+        opened[0][1].close()
+        for _ in range(200):
+            if not light.connected:
+                break
+            await asyncio.sleep(0.01)
+        assert not light.connected
+
+        ports.append(port("COM5"))  # Back under a new name
+        usb.changed()
+        for _ in range(300):
+            if light.connected and opened[-1][1].written:
+                break
+            await asyncio.sleep(0.01)
+        assert opened[-1][0] == "COM5" and opened[-1][1].written == ["R"]
+        await light.disconnect()
+
+    asyncio.run(run())
+
+
+class PtyBoard:
+    """The light on a pty, as in benchmarks/bench_usb_hotplug.py: records each command and echoes it like the firmware."""
+
+    def __init__(self):
+        import pty
+        import tty
+
+        self.master_fd, self.slave_fd = pty.openpty()
+        tty.setraw(self.slave_fd)
+        self.device = os.ttyname(self.slave_fd)
+        self.received = []
+        self._stop_r, self._stop_w = os.pipe()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            ready, _, _ = select.select([self.master_fd, self._stop_r], [], [])
+            if self._stop_r in ready:
+                return
+            try:
+                data = os.read(self.master_fd, 64)
+            except OSError:
+                return
+            for command in data.decode(errors="replace"):
+                self.received.append(command)
+                os.write(self.master_fd, f"Received: {command}\r\n".encode())
+
+    def pull(self):
+        os.write(self._stop_w, b"x")
+        self._thread.join()
+        for fd in (self.master_fd, self.slave_fd, self._stop_r, self._stop_w):
+            os.close(fd)
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs ptys")
+def test_light_on_a_pty_is_reopened_when_replugged():
+    boards = [PtyBoard()]
+    usb = UsbPortManager(list_ports=lambda: [port(board.device, serial_number="A1") for board in boards], poll_interval=10)
+    light = BusyLight(SerialTransport(manager=usb), auto_reconnect=True)
+    light.set_mic_in_use(True)
+    try:
+        assert light.submit(light.connect()).result()
+        wait_until(lambda: boards[0].received == ["R"])
+
+        boards.pop().pull()  # Pulled: reading the closed pty fails
+        wait_until(lambda: not light.connected)
+
+        boards.append(PtyBoard())  # Back on a new pty, like ttyACM0 returning as ttyACM1
+        usb.changed()
+        wait_until(lambda: boards[0].received == ["R"])
+        assert light.transport.port == boards[0].device
+    finally:
+        light.submit(light.disconnect()).result()
+        for board in boards:
+            board.pull()
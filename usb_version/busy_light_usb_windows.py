@@ -1,36 +1,42 @@
-import winreg
-import time
-import serial
-import serial.tools.list_ports
+import os
+import sys
 import threading
 import tkinter as tk
 from tkinter import messagebox
 import logging
 import pystray
 from pystray import MenuItem as item
-from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from busylight import metrics
+from busylight.core import BusyLight
+from busylight.debounce import DEFAULT_DEBOUNCE
+from busylight.icons import IconCache, light_state
+from busylight.logs import setup_logging
+from busylight.scanner import describe_presence
+from busylight.serial_transport import SerialTransport
+from busylight.ui import UiDispatcher
 
 # Set up logging
 DEBUG_MODE = False  # Set this to False to disable debugging (logs and console messages)
-logging.basicConfig(filename='log.txt', level=logging.DEBUG if DEBUG_MODE else logging.INFO, format='%(asctime)s - %(message)s')
+# Written by a background thread; log.txt rotates at 1 MB and repeated lines are sampled
+log_pipeline = setup_logging('log.txt', level=logging.DEBUG if DEBUG_MODE else logging.INFO, fmt='%(asctime)s - %(message)s')
 
 # Global variables
-esp_connected = None
-microphone_in_use = False
-esp_port = None
-serial_connection = None  # To store the serial connection object
-running = False  # To track if the microphone identification is running
-SHOW_ARDUINO_RESPONSE = False  # Set this to False to hide Arduino responses in the GUI
+SHOW_ARDUINO_RESPONSE = False  # Set this to False to hide Arduino responses and recent log lines in the GUI
+SHOW_METRICS = False  # Set this to True to show write latency and counters under the buttons
+METRICS_REFRESH_MS = 2000  # Metrics change without a state change, so the overlay alone is refreshed on a timer
 tray_icon = None  # For system tray icon
-microphone_thread = None  # To keep track of the microphone-checking thread
-last_color_sent = None  # To prevent redundant command sending
+icon_cache = IconCache()  # pystray takes the PIL images as they are
+dispatcher = None  # Runs work posted from the detector, event loop and tray threads on the Tk thread
+# Found by USB ID; after the cable is pulled the light is reopened as soon as it is plugged back in
+light = BusyLight(SerialTransport(on_response=lambda response: log_pipeline.ring.add(f"Arduino: {response}")), auto_reconnect=True)
+light.debounce = dict(DEFAULT_DEBOUNCE)  # Hold back mic blips from device probes and join chimes; adds DEFAULT_GRACE (1 s) to every change
 
 # Function to create the system tray icon
-def create_tray_icon():
-    icon_image = Image.new('RGB', (64, 64), color=(255, 255, 255))
-    draw = ImageDraw.Draw(icon_image)
-    draw.rectangle([(0, 0), (64, 64)], fill="blue")  # Draw a simple blue square as the icon
-
+def create_tray_icon(icon_image):
+    """Runs on the tray thread; the icon image comes from the Tk thread, which owns icon_cache."""
+    global tray_icon
     tray_icon = pystray.Icon("Busylight", icon_image, menu=pystray.Menu(
         item('Restore', restore_window),
         item('Quit', quit_program)
@@ -39,6 +45,9 @@ def create_tray_icon():
 
 def restore_window(icon, item):
     """Restore the Tkinter window when clicked in the tray."""
+    dispatcher.post(show_window)
+
+def show_window():
     window.deiconify()  # Show the Tkinter window again
     window.update_idletasks()
     logging.debug("Window restored.")
@@ -47,130 +56,59 @@ def quit_program(icon, item):
     """Gracefully quit the application."""
     icon.stop()
     logging.debug("System Tray Icon stopped.")
+    dispatcher.post(close_window)
 
+def close_window():
     # Gracefully exit Tkinter and the application
     window.quit()
     window.destroy()
 
     # Stop background threads
-    global running
-    running = False
-    if microphone_thread:
-        microphone_thread.join()  # Ensure the background thread is stopped
-
-def check_microphone_usage():
-    global microphone_in_use
-    root_key = r"Software\Microsoft\Windows\CurrentVersion\CapabilityAccessManager\ConsentStore\microphone"
-    try:
-        reg_key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, root_key)
-        logging.debug("Checking microphone usage from the registry.")
-    except FileNotFoundError:
-        logging.error("Registry key not found. Unable to check microphone usage.")
-        return
-
-    while running:
-        microphone_in_use = False
-        try:
-            i = 0
-            while True:
-                subkey_name = winreg.EnumKey(reg_key, i)
-                subkey_path = f"{root_key}\\{subkey_name}"
-                try:
-                    subkey = winreg.OpenKey(winreg.HKEY_CURRENT_USER, subkey_path)
-                    last_used_time_stop, _ = winreg.QueryValueEx(subkey, "LastUsedTimeStop")
-                    if last_used_time_stop == 0:
-                        microphone_in_use = True
-                        break
-                except FileNotFoundError:
-                    pass
-                i += 1
-        except OSError:
-            pass
-
-        # Now check the NonPackaged directory
-        nonpackaged_key = r"Software\Microsoft\Windows\CurrentVersion\CapabilityAccessManager\ConsentStore\microphone\NonPackaged"
-        try:
-            nonpackaged_reg_key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, nonpackaged_key)
-            nonpackaged_i = 0
-            while True:
-                subkey_name = winreg.EnumKey(nonpackaged_reg_key, nonpackaged_i)
-                nonpackaged_subkey_path = f"{nonpackaged_key}\\{subkey_name}"
-                try:
-                    nonpackaged_subkey = winreg.OpenKey(winreg.HKEY_CURRENT_USER, nonpackaged_subkey_path)
-                    last_used_time_stop, _ = winreg.QueryValueEx(nonpackaged_subkey, "LastUsedTimeStop")
-                    if last_used_time_stop == 0:
-                        microphone_in_use = True
-                        break
-                except FileNotFoundError:
-                    pass
-                nonpackaged_i += 1
-        except OSError:
-            pass
-
-        logging.debug(f"Microphone status: {'In Use' if microphone_in_use else 'Not in Use'}")
-        time.sleep(3)  # Adjusted to check every 3 seconds
-
-def detect_esp32c6():
-    global esp_port
-    connected_ports = []
-    for port in serial.tools.list_ports.comports():
-        if 'USB' in port.description:
-            connected_ports.append(port.device)
-
-    if len(connected_ports) == 1:
-        esp_port = connected_ports[0]
-        logging.debug(f"Detected ESP32c6 on port: {esp_port}")
-    else:
-        logging.error("Multiple or no USB devices found. Please select the ESP32c6 port manually.")
-
-def send_color_to_esp32(color):
-    global serial_connection, last_color_sent
-    if serial_connection is None:
-        logging.error("No ESP32c6 connected.")
-        return
-
-    if color == last_color_sent:
-        logging.debug("Command not sent as it matches the last sent color.")
-        return
-
-    try:
-        logging.debug(f"Attempting to send command: {color}")
-        serial_connection.write(color.encode())  # Send the color change ('R', 'G', 'W')
-        time.sleep(0.1)  # Short delay to give the Arduino time to respond
-        response = serial_connection.readline().decode('utf-8').strip()  # Read the echo response from Arduino
-
-        if response and SHOW_ARDUINO_RESPONSE:  # Only show non-empty response if enabled
-            logging.debug(f"Received from Arduino: {response}")
-            response_box.insert(tk.END, f"Arduino: {response}\n")  # Display the Arduino response in the text box
-            response_box.yview(tk.END)  # Scroll to the bottom
-        elif not SHOW_ARDUINO_RESPONSE:
-            logging.debug("Arduino response display is off.")
-        else:
-            logging.error("No response from Arduino")
-
-        last_color_sent = color  # Update the last sent color
-    except Exception as e:
-        logging.error(f"Error sending data to ESP32c6: {e}")
-
-def update_status():
-    mic_status = "In Use" if microphone_in_use else "Not in Use"
+    light.stop_monitoring()
+
+def on_light_change():
+    """Called from any thread whenever the light's state changes. The tray icon is swapped on the Tk thread."""
+    dispatcher.request_redraw()
+
+def status_snapshot():
+    """Everything the window and tray show. The dispatcher redraws only when this changes."""
+    return (
+        light_state(light),
+        light.mic_in_use,
+        light.presence,
+        light.transport.port if light.connected else None,
+        log_pipeline.ring.version if SHOW_ARDUINO_RESPONSE else None,
+        metrics.summary(light.device.name) if SHOW_METRICS else None,
+    )
+
+def push_status(snapshot):
+    tray_state, mic_in_use, presence, port, log_version, metrics_text = snapshot
+    mic_status = "Not in Use"
+    if mic_in_use:
+        mic_status = f"In Use: {describe_presence(presence)}" if presence else "In Use"
     mic_status_label.config(text=f"Microphone Status: {mic_status}")
-    if esp_port is not None:
-        com_port_label.config(text=f"Connected to: {esp_port}")
+    if tray_icon is not None:
+        tray_icon.icon = icon_cache.get(*tray_state)  # Cached, so no drawing or file I/O
+    if port is not None:
+        com_port_label.config(text=f"Connected to: {port}")
     else:
         com_port_label.config(text="No COM Port Connected")
 
-    # Send color command to ESP32 based on microphone status
-    if microphone_in_use:
-        send_color_to_esp32('R')  # Red for in use
-    else:
-        send_color_to_esp32('G')  # Green for not in use
+    # Show the echo lines and log records kept in memory
+    if log_version is not None:
+        response_box.delete("1.0", tk.END)
+        response_box.insert(tk.END, "\n".join(log_pipeline.ring.lines()[-100:]))
+        response_box.yview(tk.END)  # Scroll to the bottom
+
+    if metrics_text is not None:
+        metrics_label.config(text=metrics_text)
 
-    logging.debug(f"Status updated: Microphone is {'in use' if microphone_in_use else 'not in use'}.")
-    window.after(1000, update_status)  # Update every 1 second
+def refresh_metrics():
+    """Runs on the scheduler; the redraw itself happens on the Tk thread."""
+    dispatcher.post(dispatcher.redraw)
 
 def create_window():
-    global window, mic_status_label, com_port_label, response_box, start_button, stop_button
+    global window, mic_status_label, com_port_label, response_box, start_button, stop_button, metrics_label, dispatcher
     window = tk.Tk()
     window.title("USB Busy Light")
 
@@ -191,15 +129,27 @@ def create_window():
     if not SHOW_ARDUINO_RESPONSE:
         response_box.pack_forget()  # Hide the response box initially if SHOW_ARDUINO_RESPONSE is False
 
+    metrics_label = tk.Label(window, text="", font=("Consolas", 9), justify=tk.LEFT)
+    if SHOW_METRICS:
+        metrics_label.pack(pady=5)
+
+    dispatcher = UiDispatcher(window, render=push_status, snapshot=status_snapshot)
+    light.listeners.append(on_light_change)
+    if SHOW_ARDUINO_RESPONSE:
+        log_pipeline.ring.on_add = dispatcher.request_redraw
+
     # Bind minimize event to hide the window
     window.protocol("WM_DELETE_WINDOW", minimize_to_tray)
 
     window.withdraw()
-    tray_thread = threading.Thread(target=create_tray_icon)
+    tray_thread = threading.Thread(target=create_tray_icon, args=(icon_cache.get(*light_state(light)),))
     tray_thread.daemon = True
     tray_thread.start()
 
-    window.after(1000, update_status)
+    dispatcher.redraw()
+    light.scheduler.watch_power()  # Polls, link checks and the metrics refresh back off on battery and while away
+    if SHOW_METRICS:
+        light.scheduler.every("metrics-refresh", METRICS_REFRESH_MS / 1000, refresh_metrics)
     window.mainloop()
 
 def minimize_to_tray():
@@ -208,35 +158,19 @@ def minimize_to_tray():
     logging.debug("Window minimized to tray.")
 
 def start_microphone_identification():
-    global running, serial_connection
-    running = True
     logging.debug("Starting microphone identification.")
-    detect_esp32c6()
-
-    try:
-        serial_connection = serial.Serial(esp_port, 115200, timeout=1)
-        logging.debug(f"Successfully opened serial port: {esp_port}")
-    except Exception as e:
-        logging.error(f"Error opening serial port: {e}")
-        return
-
-    global microphone_thread
-    microphone_thread = threading.Thread(target=check_microphone_usage)
-    microphone_thread.daemon = True
-    microphone_thread.start()
+    # Opening the port happens on the event loop; push_status shows the result
+    light.submit(light.connect())
+    light.start_monitoring()
 
     # Update button states
     start_button.config(state=tk.DISABLED)
     stop_button.config(state=tk.NORMAL)
 
 def stop_microphone_identification():
-    global running, serial_connection
-    running = False
     logging.debug("Stopping microphone identification.")
-
-    if serial_connection is not None:
-        serial_connection.close()
-        logging.debug(f"Serial port {esp_port} closed.")
+    light.stop_monitoring()
+    light.submit(light.disconnect())
 
     # Update button states
     start_button.config(state=tk.NORMAL)